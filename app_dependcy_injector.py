@@ -2,6 +2,7 @@ from injector import Module, provider, singleton
 from database import Database
 from services.file_service import FileService
 from services.folder_service import FolderService
+from services.change_service import ChangeService
 from controllers.file_controller import FileController
 from controllers.folder_controller import FolderController
 
@@ -26,6 +27,12 @@ class AppInjector(Module):
         """Provides a singleton instance of FolderService."""
         return FolderService(db)
 
+    @singleton
+    @provider
+    def provide_change_service(self, db: Database) -> ChangeService:
+        """Provides a singleton instance of ChangeService."""
+        return ChangeService(db)
+
     @singleton
     @provider
     def provide_file_controller(self, file_service: FileService) -> FileController:
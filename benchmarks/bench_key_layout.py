@@ -0,0 +1,101 @@
+"""
+Compare upload throughput of the S3 key layouts against a local stand-in for S3 request partitioning.
+
+S3 serves a bucket's key space from partitions of lexicographic key ranges, each with a limited
+request rate, and splits a partition that stays hot; LocalObjectStore models this. Timestamp keys
+written at the same time share their leading characters, so they keep landing in one partition
+that is new every second; hashed keys spread over 16 prefixes per split level. Uploads go through
+the same TransferScheduler as S3Utils, so the report also shows how it reacts to the throttling.
+
+Usage:
+    python -m benchmarks.bench_key_layout --uploads 5000 --workers 64 --rate 300
+    python -m benchmarks.bench_key_layout --layouts hashed --buckets 1,2,4 --prefix-length 2
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from botocore.exceptions import ClientError
+from benchmarks.local_object_store import LocalObjectStore
+from utils.key_utils import KEY_LAYOUTS, make_s3_key, pick_bucket
+from utils.transfer_utils import TransferScheduler
+
+
+def run_uploads(layout: str, buckets: int, uploads: int, workers: int, body_size: int, prefix_length: int,
+                rate: float, split_after: float, latency: float, max_attempts: int) -> dict:
+    """
+    Upload a number of objects with one key layout and report the throughput.
+
+    Args:
+        layout (str): The key layout, see utils.key_utils.KEY_LAYOUTS.
+        buckets (int): The number of buckets objects are sharded across.
+        uploads (int): The number of objects to upload.
+        workers (int): The number of uploading threads.
+        body_size (int): The bytes of each object.
+        prefix_length (int): Hex digits of the hashed prefix.
+        rate (float): Requests per second each partition admits.
+        split_after (float): Seconds a partition must stay throttled before it is split.
+        latency (float): Seconds each request takes.
+        max_attempts (int): Attempts per upload, including the first.
+
+    Returns:
+        dict: The results of the run.
+    """
+    store = LocalObjectStore(rate, split_after, latency, keep_bodies=False)
+    scheduler = TransferScheduler(max_concurrency=workers, max_attempts=max_attempts, retry_budget=uploads)
+    bucket_names = [f"bucket-{index}" for index in range(buckets)]
+    body = b'x' * body_size
+
+    def upload(index):
+        key = make_s3_key(f"file_{index}.bin", layout, prefix_length)
+        try:
+            scheduler.call('put', store.put_object, nbytes=body_size, Bucket=pick_bucket(key, bucket_names), Key=key, Body=body)
+            return True
+        except ClientError:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        completed = sum(pool.map(upload, range(uploads)))
+    elapsed = time.perf_counter() - started
+    stats = scheduler.stats()
+    return {
+        'layout': layout,
+        'buckets': buckets,
+        'uploads_per_s': completed / elapsed,
+        'seconds': elapsed,
+        'completed': completed,
+        'failed': uploads - completed,
+        'throttles': stats['throttles'],
+        'retries': stats['retries'],
+        'final_concurrency': stats['concurrency_limit'],
+        'partitions': store.partitions()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare upload throughput of the S3 key layouts")
+    parser.add_argument('--layouts', default=','.join(KEY_LAYOUTS), help="Comma separated key layouts")
+    parser.add_argument('--buckets', default='1', help="Comma separated numbers of shard buckets")
+    parser.add_argument('--uploads', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--body-size', type=int, default=1024)
+    parser.add_argument('--prefix-length', type=int, default=4, help="Hex digits of the hashed prefix")
+    parser.add_argument('--rate', type=float, default=300.0, help="Requests per second per partition")
+    parser.add_argument('--split-after', type=float, default=0.5, help="Seconds of throttling before a partition splits")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Milliseconds per request")
+    parser.add_argument('--max-attempts', type=int, default=10)
+    parser.add_argument('--csv', help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    rows = [run_uploads(layout, int(buckets), args.uploads, args.workers, args.body_size, args.prefix_length,
+                        args.rate, args.split_after, args.latency_ms / 1000, args.max_attempts)
+            for layout in args.layouts.split(',') for buckets in args.buckets.split(',')]
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    if args.csv:
+        results.to_csv(args.csv, index=False)
+
+
+if __name__ == '__main__':
+    main()
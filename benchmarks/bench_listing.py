@@ -0,0 +1,212 @@
+"""
+Compare the time and memory of listing a large subtree through the ORM and through the read-only
+listing APIs of FolderService, which select plain rows with Core.
+
+Modes:
+    orm_nested    The ORM listing list_files_and_subfolders used before: every folder and file loaded
+                  as an instance into the identity map, level by level, then converted to nested dicts.
+    orm_entities  The files of the subtree selected as File instances.
+    nested        list_files_and_subfolders: the same nested dicts, built from Core rows.
+    rows          list_subtree_rows: FolderRow and FileRow named tuples.
+    columns       list_file_columns: int64 arrays for the IDs and sizes, an object array for the names.
+
+Each mode is timed --repeat times; one more run under tracemalloc measures the peak memory of the
+call and the memory its result still holds. The tree is seeded under the root folder with Core
+inserts and removed afterwards unless --keep is given.
+
+Usage:
+    python -m benchmarks.bench_listing --files 1000000 --folders 1000
+    python -m benchmarks.bench_listing --config config/config.ini --files 200000 --modes nested,rows,columns
+"""
+import argparse
+import gc
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from sqlalchemy import select, insert, delete
+from sqlalchemy.orm import joinedload, with_loader_criteria
+from benchmarks.load_generator import sqlite_config
+from database import Database
+from models.file import File
+from models.folder import Folder
+from services.folder_service import FolderService
+from utils.query_utils import subtree_folder_ids
+
+MODES = ('orm_nested', 'orm_entities', 'nested', 'rows', 'columns')
+
+
+def seed(db: Database, folders: int, files: int, fanout: int, batch_size: int = 50000) -> list:
+    """
+    Create a tree of folders with files spread evenly over them, under the root folder.
+
+    Args:
+        db (Database): The database to seed.
+        folders (int): The number of folders below the benchmark folder.
+        files (int): The number of files.
+        fanout (int): Subfolders per folder.
+        batch_size (int, optional): Files inserted per statement. Defaults to 50000.
+
+    Returns:
+        list: The folder IDs, the benchmark folder first.
+    """
+    with db.engine.begin() as connection:
+        root_id = connection.execute(
+            select(Folder.folder_id).where(Folder.folder_parent_id.is_(None), Folder.folder_deleted_at.is_(None))
+        ).scalar()
+        if root_id is None:
+            root_id = connection.execute(insert(Folder).values(folder_name='root').returning(Folder.folder_id)).scalar()
+        folder_ids = [connection.execute(
+            insert(Folder).values(folder_name=f"bench_listing_{time.strftime('%Y%m%d%H%M%S')}", folder_parent_id=root_id)
+            .returning(Folder.folder_id)
+        ).scalar()]
+        for index in range(folders):
+            folder_ids.append(connection.execute(
+                insert(Folder).values(folder_name=f"folder{index:06d}", folder_parent_id=folder_ids[index // fanout])
+                .returning(Folder.folder_id)
+            ).scalar())
+
+    for start in range(0, files, batch_size):
+        with db.engine.begin() as connection:
+            connection.execute(insert(File), [
+                {'file_name': f"file{index:08d}.bin", 'file_size': random.randint(1, 1 << 20),
+                 'folder_id': folder_ids[index % len(folder_ids)], 'file_s3_key': f"bench-listing/{folder_ids[0]}/{index}"}
+                for index in range(start, min(files, start + batch_size))
+            ])
+    return folder_ids
+
+
+def remove(db: Database, folder_ids: list, batch_size: int = 500):
+    """
+    Delete the seeded files and folders, the deepest folders first.
+    """
+    with db.engine.begin() as connection:
+        for start in range(0, len(folder_ids), batch_size):
+            connection.execute(delete(File).where(File.folder_id.in_(folder_ids[start:start + batch_size])))
+        for folder_id in reversed(folder_ids):
+            connection.execute(delete(Folder).where(Folder.folder_id == folder_id))
+
+
+def orm_nested(db: Database, folder_id: int) -> dict:
+    with db.get_db_session(read_only=True) as session:
+        folder = session.query(Folder).options(
+            joinedload(Folder.children), joinedload(Folder.files),
+            with_loader_criteria(Folder, Folder.folder_deleted_at.is_(None))
+        ).filter_by(folder_id=folder_id).first()
+
+        def nest(folder):
+            return {
+                'Folder ID': folder.folder_id,
+                'Folder Name': folder.folder_name,
+                'Files': [{'File ID': file.file_id, 'File Name': file.file_name, 'File Size': file.file_size} for file in folder.files],
+                'Subfolders': [nest(child) for child in folder.children]
+            }
+        return nest(folder)
+
+
+def orm_entities(db: Database, folder_id: int) -> list:
+    with db.get_db_session(read_only=True) as session:
+        subtree = subtree_folder_ids(folder_id)
+        return session.execute(select(File).where(File.folder_id.in_(select(subtree.c.folder_id)))).scalars().all()
+
+
+def listing_functions(db: Database, service: FolderService) -> dict:
+    """
+    Returns:
+        dict: A function of the subtree root per mode, see MODES.
+    """
+    return {
+        'orm_nested': lambda folder_id: orm_nested(db, folder_id),
+        'orm_entities': lambda folder_id: orm_entities(db, folder_id),
+        'nested': service.list_files_and_subfolders,
+        'rows': service.list_subtree_rows,
+        'columns': service.list_file_columns
+    }
+
+
+def measure(listing, folder_id: int, files: int, repeat: int) -> dict:
+    """
+    Time a listing and measure its memory.
+
+    Args:
+        listing (callable): Lists the subtree of a folder.
+        folder_id (int): The subtree root.
+        files (int): The number of files in the subtree.
+        repeat (int): Timed runs; the fastest counts.
+
+    Returns:
+        dict: The fastest time, files per second, and the peak and retained memory of one call.
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = listing(folder_id)
+        timings.append(time.perf_counter() - started)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = listing(folder_id)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    seconds = min(timings)
+    return {
+        'seconds': seconds,
+        'files_per_s': files / seconds,
+        'peak_mib': (peak - baseline) / 1024 ** 2,
+        'retained_mib': (current - baseline) / 1024 ** 2,
+        'retained_bytes_per_file': (current - baseline) / max(files, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ORM and Core listings of a large subtree")
+    parser.add_argument('--config', help="Run against the database of this configuration instead of a scratch SQLite file")
+    parser.add_argument('--sqlite', help="Path of the scratch SQLite file (default: a temporary file)")
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--folders', type=int, default=1000, help="Folders below the benchmark folder")
+    parser.add_argument('--fanout', type=int, default=10, help="Subfolders per folder")
+    parser.add_argument('--modes', default=','.join(MODES), help="Comma separated modes")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per mode")
+    parser.add_argument('--keep', action='store_true', help="Keep the seeded tree")
+    parser.add_argument('--csv', help="Also write the results to this CSV file")
+    args = parser.parse_args()
+    modes = args.modes.split(',')
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(unknown)}. Expected some of {', '.join(MODES)}")
+
+    work_dir = tempfile.mkdtemp(prefix='bench_listing_')
+    try:
+        config_path = args.config or sqlite_config(args.sqlite or os.path.join(work_dir, 'listing.sqlite'), work_dir)
+        db = Database(config_path=config_path)
+        service = FolderService(db)
+
+        started = time.perf_counter()
+        folder_ids = seed(db, args.folders, args.files, args.fanout)
+        print(f"Seeded {len(folder_ids)} folders and {args.files} files in {time.perf_counter() - started:.1f}s")
+        try:
+            listings = listing_functions(db, service)
+            rows = [{'mode': mode, 'files': args.files, **measure(listings[mode], folder_ids[0], args.files, args.repeat)}
+                    for mode in modes]
+        finally:
+            if not args.keep:
+                remove(db, folder_ids)
+        results = pd.DataFrame(rows)
+        print(results.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+        if args.csv:
+            results.to_csv(args.csv, index=False)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
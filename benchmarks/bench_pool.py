@@ -0,0 +1,131 @@
+"""
+Sweep connection pool sizes under concurrent load to tune the [pool] section of config.ini.
+
+For every pool size, a fixed number of worker threads repeatedly check out a connection, run a
+query, hold the connection for a while (standing in for application work inside a transaction)
+and return it. The report shows throughput, query latency percentiles, checkout waits, timeouts
+and connection churn, as collected by PoolMetrics.
+
+Usage:
+    python -m benchmarks.bench_pool --sizes 2,5,10,20 --threads 32 --duration 10 --hold-ms 5
+    python -m benchmarks.bench_pool --url sqlite:////tmp/bench.db --sizes 1,2,4
+"""
+import argparse
+import configparser
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from database import Database, PoolMetrics, TimedQueuePool
+
+
+def run_load(engine, threads: int, duration: float, hold_seconds: float, query: str) -> dict:
+    """
+    Run the workload against an engine for a fixed time.
+
+    Args:
+        engine (Engine): The engine under test.
+        threads (int): The number of concurrent workers.
+        duration (float): The run time in seconds.
+        hold_seconds (float): How long each worker keeps its connection after the query.
+        query (str): The SQL statement each iteration executes.
+
+    Returns:
+        dict: The number of completed and failed iterations and the latencies of completed ones.
+    """
+    stop = time.monotonic() + duration
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    statement = text(query)
+
+    def worker(index):
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(statement).fetchall()
+                    if hold_seconds:
+                        time.sleep(hold_seconds)
+                latencies[index].append(time.perf_counter() - start)
+            except Exception:
+                errors[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    all_latencies = np.concatenate([np.asarray(values) for values in latencies]) if any(latencies) else np.array([])
+    return {'completed': len(all_latencies), 'errors': sum(errors), 'latencies': all_latencies}
+
+
+def sweep(url: str, sizes: list, max_overflow: int, pool_timeout: float, threads: int, duration: float,
+          hold_seconds: float, query: str, pre_ping: bool) -> pd.DataFrame:
+    """
+    Run the workload once per pool size.
+
+    Returns:
+        pd.DataFrame: One row of results per pool size.
+    """
+    rows = []
+    for size in sizes:
+        engine = create_engine(url, poolclass=TimedQueuePool, pool_size=size, max_overflow=max_overflow,
+                               pool_timeout=pool_timeout, pool_pre_ping=pre_ping)
+        metrics = PoolMetrics(engine)
+        # Open the pool's connections before measuring so that the first checkouts are not penalised
+        run_load(engine, min(size, threads), 0.2, 0, query)
+        metrics.reset()
+
+        result = run_load(engine, threads, duration, hold_seconds, query)
+        snapshot = metrics.snapshot()
+        latencies = result['latencies']
+        percentiles = np.percentile(latencies, [50, 95, 99]) * 1000 if len(latencies) else [np.nan] * 3
+        rows.append({
+            'pool_size': size,
+            'max_overflow': max_overflow,
+            'throughput_per_s': result['completed'] / duration,
+            'p50_ms': percentiles[0],
+            'p95_ms': percentiles[1],
+            'p99_ms': percentiles[2],
+            'wait_mean_ms': snapshot['wait_mean'] * 1000,
+            'wait_p95_ms': snapshot['wait_p95'] * 1000,
+            'wait_max_ms': snapshot['wait_max'] * 1000,
+            'timeouts': snapshot['timeout'],
+            'errors': result['errors'],
+            'connects': snapshot['connect'],
+            'closes': snapshot['close']
+        })
+        engine.dispose()
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep connection pool sizes under concurrent load")
+    parser.add_argument('--url', help="Database URL, defaults to the [database] section of config/config.ini")
+    parser.add_argument('--sizes', default='2,5,10,20', help="Comma separated pool sizes")
+    parser.add_argument('--max-overflow', type=int, default=0)
+    parser.add_argument('--pool-timeout', type=float, default=30.0)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per pool size")
+    parser.add_argument('--hold-ms', type=float, default=5.0, help="Milliseconds a connection is held after the query")
+    parser.add_argument('--query', default='SELECT 1')
+    parser.add_argument('--no-pre-ping', action='store_true')
+    parser.add_argument('--csv', help="Also write the results to this CSV file")
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        config = configparser.ConfigParser()
+        config.read('config/config.ini')
+        url = Database._build_database_url(config['database'])
+
+    results = sweep(url, [int(size) for size in args.sizes.split(',')], args.max_overflow, args.pool_timeout,
+                    args.threads, args.duration, args.hold_ms / 1000, args.query, not args.no_pre_ping)
+    print(results.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    if args.csv:
+        results.to_csv(args.csv, index=False)
+
+
+if __name__ == '__main__':
+    main()
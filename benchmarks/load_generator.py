@@ -0,0 +1,363 @@
+"""
+Drive a weighted mix of FileController and FolderController operations from many threads and report
+throughput, latency percentiles and error rates per operation, together with connection pool waits.
+
+A seed tree of folders and files is created under the root folder through the controllers, so it
+goes through the same transactions, quotas and changelog as real traffic. S3 is replaced by an
+in-memory LocalObjectStore, optionally with a request latency, so the run measures the metadata
+database and the application rather than the network. Each worker repeatedly picks an operation by
+weight and a random target among the seeded and created folders and files; operations that remove
+a target take it out of the shared pool first, so workers do not race on the same file. A copy or
+move now and then meets a file of the same name in its destination; such conflicts count as errors.
+
+Usage:
+    python -m benchmarks.load_generator --sqlite /tmp/load.sqlite --threads 16 --duration 30
+    python -m benchmarks.load_generator --threads 64 --mix get_file=50,list_children=30,create_file=20
+"""
+import argparse
+import configparser
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from benchmarks.local_object_store import LocalObjectStore
+from database import Database
+from models.folder import Folder
+from services.file_service import FileService
+from services.folder_service import FolderService
+from controllers.file_controller import FileController
+from controllers.folder_controller import FolderController
+from utils.s3_utils import S3Utils
+
+DEFAULT_MIX = ('get_file=25,list_children=20,get_folder=10,create_file=15,download_file=10,search_files=5,'
+               'move_file=5,delete_file=4,copy_file=3,create_folder=2,folder_size=1')
+
+
+class TargetPool:
+    """
+    A thread-safe set of folder or file IDs that operations pick their targets from.
+    """
+
+    def __init__(self, ids=()):
+        self._ids = list(ids)
+        self._lock = threading.Lock()
+
+    def add(self, target_id: int):
+        with self._lock:
+            self._ids.append(target_id)
+
+    def pick(self):
+        with self._lock:
+            return random.choice(self._ids) if self._ids else None
+
+    def take(self):
+        with self._lock:
+            if not self._ids:
+                return None
+            index = random.randrange(len(self._ids))
+            self._ids[index], self._ids[-1] = self._ids[-1], self._ids[index]
+            return self._ids.pop()
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class LoadContext:
+    """
+    The controllers and shared targets the operations work on.
+    """
+
+    def __init__(self, file_controller: FileController, folder_controller: FolderController, file_size: int,
+                 download_dir: str):
+        self.file_controller = file_controller
+        self.folder_controller = folder_controller
+        self.file_size = file_size
+        self.download_dir = download_dir
+        self.folders = TargetPool()
+        self.files = TargetPool()
+        self._names = itertools.count()
+
+    def unique_name(self, kind: str) -> str:
+        return f"{kind}_{next(self._names)}"
+
+    def content(self) -> bytes:
+        return os.urandom(self.file_size)
+
+
+# Each operation returns False when there was no target to act on, which is not counted
+def create_file(ctx: LoadContext):
+    folder_id = ctx.folders.pick()
+    ctx.files.add(ctx.file_controller.create_file(f"{ctx.unique_name('file')}.bin", folder_id, ctx.content()).file_id)
+
+
+def get_file(ctx: LoadContext):
+    file_id = ctx.files.pick()
+    if file_id is None:
+        return False
+    ctx.file_controller.get_file_details(file_id)
+
+
+def move_file(ctx: LoadContext):
+    file_id = ctx.files.take()
+    if file_id is None:
+        return False
+    try:
+        ctx.file_controller.move_file(file_id, ctx.folders.pick())
+    finally:
+        ctx.files.add(file_id)
+
+
+def copy_file(ctx: LoadContext):
+    file_id = ctx.files.pick()
+    if file_id is None:
+        return False
+    ctx.files.add(ctx.file_controller.copy_file(file_id, ctx.folders.pick()).file_id)
+
+
+def delete_file(ctx: LoadContext):
+    file_id = ctx.files.take()
+    if file_id is None:
+        return False
+    ctx.file_controller.delete_file(file_id)
+
+
+def download_file(ctx: LoadContext):
+    file_id = ctx.files.pick()
+    if file_id is None:
+        return False
+    local_path = ctx.file_controller.download_file(file_id, os.path.join(ctx.download_dir, ctx.unique_name('download')))
+    os.remove(local_path)
+
+
+def search_files(ctx: LoadContext):
+    ctx.file_controller.search_files(f"file_{random.randrange(10)}", mode='prefix', limit=50)
+
+
+def create_folder(ctx: LoadContext):
+    ctx.folders.add(ctx.folder_controller.create_folder(ctx.unique_name('folder'), ctx.folders.pick()).folder_id)
+
+
+def get_folder(ctx: LoadContext):
+    ctx.folder_controller.get_folder_details(ctx.folders.pick())
+
+
+def list_children(ctx: LoadContext):
+    ctx.folder_controller.list_children(ctx.folders.pick(), limit=100)
+
+
+def folder_size(ctx: LoadContext):
+    ctx.folder_controller.calculate_folder_size(ctx.folders.pick())
+
+
+OPERATIONS = {operation.__name__: operation for operation in (
+    create_file, get_file, move_file, copy_file, delete_file, download_file, search_files,
+    create_folder, get_folder, list_children, folder_size
+)}
+
+
+def parse_mix(mix: str) -> dict:
+    """
+    Parse an operation mix such as 'get_file=70,create_file=30'.
+
+    Args:
+        mix (str): Comma separated operation=weight pairs.
+
+    Returns:
+        dict: The weight of each operation.
+
+    Raises:
+        ValueError: If an operation is unknown or a weight is not a positive number.
+    """
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name}. Expected one of {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+        if weights[name] <= 0:
+            raise ValueError(f"The weight of {name} must be positive")
+    return weights
+
+
+def seed(ctx: LoadContext, db: Database, folders: int, files: int, threads: int):
+    """
+    Create the seed tree under the root folder through the controllers.
+
+    Args:
+        ctx (LoadContext): The context whose target pools receive the seeded IDs.
+        db (Database): The database, used to find the root folder.
+        folders (int): The number of seed folders below the load test folder.
+        files (int): The number of seed files, spread over the seed folders.
+        threads (int): The number of threads creating files.
+
+    Returns:
+        int: The ID of the load test folder holding the seed tree.
+    """
+    with db.get_db_session(read_only=True) as session:
+        root_id = session.execute(
+            select(Folder.folder_id).where(Folder.folder_parent_id.is_(None), Folder.folder_deleted_at.is_(None))
+        ).scalar()
+    if root_id is None:
+        root_id = ctx.folder_controller.create_folder('root', None).folder_id
+    load_folder_id = ctx.folder_controller.create_folder(f"loadtest_{time.strftime('%Y%m%d%H%M%S')}", root_id).folder_id
+    ctx.folders.add(load_folder_id)
+    for _ in range(folders):
+        ctx.folders.add(ctx.folder_controller.create_folder(ctx.unique_name('folder'), load_folder_id).folder_id)
+
+    workers = [threading.Thread(target=lambda count: [create_file(ctx) for _ in range(count)],
+                                args=(files // threads + (1 if index < files % threads else 0),))
+               for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return load_folder_id
+
+
+def run_load(ctx: LoadContext, weights: dict, threads: int, duration: float, warmup: float) -> dict:
+    """
+    Run the operation mix from a number of threads for a fixed time.
+
+    Args:
+        ctx (LoadContext): The seeded context.
+        weights (dict): The weight of each operation, see parse_mix.
+        threads (int): The number of concurrent workers.
+        duration (float): The measured run time in seconds.
+        warmup (float): Seconds of load before measuring starts.
+
+    Returns:
+        dict: Per operation, the latencies of completed calls and the number of errors.
+    """
+    names = list(weights)
+    cumulative = list(itertools.accumulate(weights[name] for name in names))
+    measure_from = time.monotonic() + warmup
+    stop = measure_from + duration
+    results = [{name: ([], [0]) for name in names} for _ in range(threads)]
+
+    def worker(index):
+        local = results[index]
+        while True:
+            now = time.monotonic()
+            if now >= stop:
+                break
+            name = random.choices(names, cum_weights=cumulative)[0]
+            start = time.perf_counter()
+            try:
+                acted = OPERATIONS[name](ctx)
+                elapsed = time.perf_counter() - start
+                if acted is not False and now >= measure_from:
+                    local[name][0].append(elapsed)
+            except Exception:
+                if now >= measure_from:
+                    local[name][1][0] += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return {name: (np.concatenate([np.asarray(result[name][0]) for result in results]),
+                   sum(result[name][1][0] for result in results)) for name in names}
+
+
+def summarize(results: dict, duration: float) -> pd.DataFrame:
+    """
+    Build the report with one row per operation and a total row.
+
+    Returns:
+        pd.DataFrame: Throughput, latency percentiles and error rates.
+    """
+    rows = []
+    everything = [(name, latencies, errors) for name, (latencies, errors) in results.items()]
+    everything.append(('TOTAL', np.concatenate([latencies for _, latencies, _ in everything]),
+                       sum(errors for _, _, errors in everything)))
+    for name, latencies, errors in everything:
+        percentiles = np.percentile(latencies, [50, 95, 99]) * 1000 if len(latencies) else [np.nan] * 3
+        calls = len(latencies) + errors
+        rows.append({
+            'operation': name,
+            'calls': calls,
+            'ops_per_s': len(latencies) / duration,
+            'p50_ms': percentiles[0],
+            'p95_ms': percentiles[1],
+            'p99_ms': percentiles[2],
+            'max_ms': latencies.max() * 1000 if len(latencies) else np.nan,
+            'errors': errors,
+            'error_rate': errors / calls if calls else 0.0
+        })
+    return pd.DataFrame(rows)
+
+
+def sqlite_config(path: str, directory: str) -> str:
+    """
+    Write a copy of config/config.ini that points the database at a SQLite file.
+
+    Returns:
+        str: The path of the written configuration.
+    """
+    config = configparser.ConfigParser()
+    config.read('config/config.ini')
+    config['database'] = {'dialect': 'sqlite', 'path': path}
+    config_path = os.path.join(directory, 'config.ini')
+    with open(config_path, 'w') as config_file:
+        config.write(config_file)
+    return config_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent controller operations and report latency percentiles")
+    parser.add_argument('--config', default='config/config.ini', help="Configuration of the database under test")
+    parser.add_argument('--sqlite', help="Run against this SQLite file instead of the configured database")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help="Measured seconds")
+    parser.add_argument('--warmup', type=float, default=3.0, help="Seconds of load before measuring")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Comma separated operation=weight pairs")
+    parser.add_argument('--seed-folders', type=int, default=50)
+    parser.add_argument('--seed-files', type=int, default=2000)
+    parser.add_argument('--file-size', type=int, default=4096, help="Bytes per created file")
+    parser.add_argument('--s3-latency-ms', type=float, default=0.0, help="Milliseconds per request to the storage stand-in")
+    parser.add_argument('--keep', action='store_true', help="Keep the seed tree instead of deleting it afterwards")
+    parser.add_argument('--csv', help="Also write the results to this CSV file")
+    args = parser.parse_args()
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    work_dir = tempfile.mkdtemp(prefix='loadgen_')
+    try:
+        config_path = sqlite_config(args.sqlite, work_dir) if args.sqlite else args.config
+        db = Database(config_path=config_path)
+        S3Utils.s3_client = LocalObjectStore(latency=args.s3_latency_ms / 1000)
+        ctx = LoadContext(FileController(FileService(db)), FolderController(FolderService(db)), args.file_size, work_dir)
+
+        started = time.perf_counter()
+        load_folder_id = seed(ctx, db, args.seed_folders, args.seed_files, args.threads)
+        print(f"Seeded {len(ctx.folders)} folders and {len(ctx.files)} files in {time.perf_counter() - started:.1f}s")
+
+        db.pool_metrics.reset()
+        results = run_load(ctx, weights, args.threads, args.duration, args.warmup)
+        pool = db.pool_metrics.snapshot()
+        report = summarize(results, args.duration)
+        print(report.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+        print(f"Pool: size {pool['size']}, overflow {pool['overflow']}, checkout waits {pool['waits']}, "
+              f"mean {pool['wait_mean'] * 1000:.2f}ms, p95 {pool['wait_p95'] * 1000:.2f}ms, "
+              f"max {pool['wait_max'] * 1000:.2f}ms, timeouts {pool['timeout']}")
+        if args.csv:
+            report.to_csv(args.csv, index=False)
+
+        if not args.keep:
+            ctx.folder_controller.delete_folder(load_folder_id)
+        db.engine.dispose()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
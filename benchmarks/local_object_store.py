@@ -0,0 +1,122 @@
+"""
+An in-memory stand-in for the S3 client, for benchmarks that must run offline.
+
+It implements the client calls S3Utils makes and can model S3's request partitioning: S3 serves a
+bucket's key space from partitions of lexicographic key ranges, each with a limited request rate,
+and splits a partition that stays hot. With a rate set, every partition admits `rate` requests per
+second, answers SlowDown beyond it, and is split on the next character of the key once it has been
+throttled for `split_after` seconds.
+"""
+import io
+import threading
+import time
+from botocore.exceptions import ClientError
+
+
+class LocalObjectStore:
+    """
+    An in-memory object store with the interface of the boto3 S3 client methods used by S3Utils.
+
+    Attributes:
+        rate (float): Requests per second each partition admits, None for no limit.
+        split_after (float): Seconds a partition must stay throttled before it is split.
+        latency (float): Seconds each request takes.
+        keep_bodies (bool): Whether object bodies are stored; otherwise only their size is.
+    """
+
+    def __init__(self, rate: float = None, split_after: float = 0.5, latency: float = 0.0, keep_bodies: bool = True):
+        self.rate = rate
+        self.split_after = split_after
+        self.latency = latency
+        self.keep_bodies = keep_bodies
+        self._lock = threading.Lock()
+        self._split = set()
+        self._partitions = {}
+        self._objects = {}
+
+    def _partition_of(self, bucket: str, key: str) -> tuple:
+        prefix = ''
+        while (bucket, prefix) in self._split and len(prefix) < len(key):
+            prefix = key[:len(prefix) + 1]
+        return bucket, prefix
+
+    def _request(self, bucket: str, key: str, operation: str):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            partition = self._partition_of(bucket, key)
+            # A token bucket holding a tenth of a second of requests
+            state = self._partitions.setdefault(partition, {'tokens': self.rate / 10, 'time': now, 'hot_since': None})
+            state['tokens'] = min(self.rate / 10, state['tokens'] + (now - state['time']) * self.rate)
+            state['time'] = now
+            if state['tokens'] >= 1:
+                state['tokens'] -= 1
+                return
+            if state['hot_since'] is None:
+                state['hot_since'] = now
+            elif now - state['hot_since'] >= self.split_after:
+                self._split.add(partition)
+        raise ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'},
+                           'ResponseMetadata': {'HTTPStatusCode': 503}}, operation)
+
+    def put_object(self, Bucket, Key, Body):
+        self._request(Bucket, Key, 'PutObject')
+        body = bytes(Body)
+        with self._lock:
+            self._objects[(Bucket, Key)] = body if self.keep_bodies else len(body)
+        return {}
+
+    def get_object(self, Bucket, Key):
+        self._request(Bucket, Key, 'GetObject')
+        with self._lock:
+            body = self._objects.get((Bucket, Key))
+        if body is None:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'The specified key does not exist.'},
+                               'ResponseMetadata': {'HTTPStatusCode': 404}}, 'GetObject')
+        if isinstance(body, int):
+            body = bytes(body)
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    def copy(self, CopySource, Bucket, Key):
+        self._request(Bucket, Key, 'CopyObject')
+        with self._lock:
+            source = self._objects.get((CopySource['Bucket'], CopySource['Key']))
+            if source is None:
+                raise ClientError({'Error': {'Code': 'NoSuchKey'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}, 'CopyObject')
+            self._objects[(Bucket, Key)] = source
+
+    def delete_object(self, Bucket, Key):
+        self._request(Bucket, Key, 'DeleteObject')
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {'DeleteMarker': True}
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [item['Key'] for item in Delete['Objects']]
+        self._request(Bucket, keys[0] if keys else '', 'DeleteObjects')
+        with self._lock:
+            for key in keys:
+                self._objects.pop((Bucket, key), None)
+        return {'Errors': []}
+
+    def list_objects_v2(self, Bucket, **kwargs):
+        with self._lock:
+            return {'KeyCount': sum(1 for bucket, _ in self._objects if bucket == Bucket)}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn=3600):
+        return f"memory://{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+    def object_count(self) -> int:
+        with self._lock:
+            return len(self._objects)
+
+    def partitions(self) -> int:
+        """
+        Returns:
+            int: The number of partitions that served requests and have not been split.
+        """
+        with self._lock:
+            return len([partition for partition in self._partitions if partition not in self._split])
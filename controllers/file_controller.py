@@ -1,9 +1,12 @@
 from logger import Logger
 from services.file_service import FileService
+from utils.tracing import trace_class
 from models.file import File
+from typing import List
 
 logger = Logger.get_logger()
 
+@trace_class('controller')
 class FileController:
     def __init__(self, file_service: FileService):
         """
@@ -154,4 +157,53 @@ class FileController:
         except Exception as e:
             logger.error(f"Error creating file from local path: {str(e)}", exc_info=True)
             print("Something went wrong while creating the file from the local path. Please check the log file for details.")
-            raise
\ No newline at end of file
+            raise
+
+    def search_files(self, pattern: str, mode: str = 'substring', folder_id: int = None,
+                     limit: int = 100, offset: int = 0) -> List[File]:
+        """
+        Search files by name, optionally within the subtree of a folder.
+
+        Args:
+            pattern (str): The text to search for.
+            mode (str, optional): 'prefix', 'substring', 'glob' or 'extension'. Defaults to 'substring'.
+            folder_id (int, optional): Restrict the search to this folder and its subfolders. Defaults to None.
+            limit (int, optional): The maximum number of files to return. Defaults to 100.
+            offset (int, optional): The number of matching files to skip. Defaults to 0.
+
+        Returns:
+            List[File]: The matching File objects.
+
+        Raises:
+            Exception: If an error occurs during the search.
+        """
+        try:
+            files = self.file_service.search_files(pattern, mode, folder_id, limit, offset)
+            logger.info(f"File Controller was called to search files: {pattern} ({mode})")
+            return files
+        except Exception as e:
+            logger.error(f"Error searching files: {str(e)}", exc_info=True)
+            raise
+
+
+    def copy_file(self, file_id: int, dest_folder_id: int) -> File:
+        """
+        Copy a file into another folder.
+
+        Args:
+            file_id (int): The ID of the file to copy.
+            dest_folder_id (int): The ID of the folder receiving the copy.
+
+        Returns:
+            File: The File object of the copy.
+
+        Raises:
+            Exception: If an error occurs during the copy.
+        """
+        try:
+            file = self.file_service.copy_file(file_id, dest_folder_id)
+            logger.info(f"Copied file ID: {file_id} to folder ID: {dest_folder_id}")
+            return file
+        except Exception as e:
+            logger.error(f"Error copying file: {str(e)}", exc_info=True)
+            raise
@@ -1,10 +1,13 @@
 from services.folder_service import FolderService
+from utils.tracing import trace_class
 from models.folder import Folder
-from typing import Dict
+from models.rows import FileRow, FolderRow
+from typing import Dict, List, Tuple
 from logger import Logger
 
 logger = Logger.get_logger()
 
+@trace_class('controller')
 class FolderController:
     """
     A controller class to handle folder-related operations.
@@ -65,13 +68,16 @@ class FolderController:
             logger.error(f"Error retrieving folder details: {str(e)}", exc_info=True)
             raise
 
-    def delete_folder(self, folder_id: int):
+    def delete_folder(self, folder_id: int) -> Dict:
         """
-        Deletes a folder by its ID.
+        Deletes a folder by its ID. Its contents are purged in the background.
 
         Parameters:
         folder_id (int): The ID of the folder to delete.
 
+        Returns:
+        Dict: The ID, name and deletion time of the deleted folder.
+
         Raises:
         Exception: If there is an error during folder deletion.
         """
@@ -126,6 +132,68 @@ class FolderController:
             logger.error(f"Error listing files and subfolders: {str(e)}", exc_info=True)
             raise
 
+    def list_subtree_rows(self, folder_id: int) -> Tuple[List[FolderRow], List[FileRow]]:
+        """
+        Lists the folders and files of a folder's subtree as read-only rows.
+
+        Parameters:
+        folder_id (int): The ID of the subtree root.
+
+        Returns:
+        Tuple[List[FolderRow], List[FileRow]]: The folders and the files of the subtree.
+
+        Raises:
+        Exception: If there is an error during the listing.
+        """
+        try:
+            return self.folder_service.list_subtree_rows(folder_id)
+        except Exception as e:
+            logger.error(f"Error listing subtree rows: {str(e)}", exc_info=True)
+            raise
+
+    def list_file_columns(self, folder_id: int, chunk_size: int = 50000) -> Dict:
+        """
+        Lists the files of a folder's subtree as column arrays.
+
+        Parameters:
+        folder_id (int): The ID of the subtree root.
+        chunk_size (int): The number of rows fetched per round trip.
+
+        Returns:
+        Dict: The file_id, file_name, file_size and folder_id arrays.
+
+        Raises:
+        Exception: If there is an error during the listing.
+        """
+        try:
+            return self.folder_service.list_file_columns(folder_id, chunk_size)
+        except Exception as e:
+            logger.error(f"Error listing file columns: {str(e)}", exc_info=True)
+            raise
+
+    def list_children(self, folder_id: int = None, limit: int = 500, folders_after: str = None,
+                      files_after: str = None) -> Dict:
+        """
+        Lists one page of the direct subfolders and files of a folder.
+
+        Parameters:
+        folder_id (int): The ID of the folder, None for the root folders.
+        limit (int): The maximum number of subfolders and of files per page.
+        folders_after (str): Return subfolders named after this name.
+        files_after (str): Return files named after this name.
+
+        Returns:
+        Dict: The subfolders and files of the page and whether more pages follow.
+
+        Raises:
+        Exception: If there is an error during the listing.
+        """
+        try:
+            return self.folder_service.list_children(folder_id, limit, folders_after, files_after)
+        except Exception as e:
+            logger.error(f"Error listing children of folder: {str(e)}", exc_info=True)
+            raise
+
     def calculate_folder_size(self, folder_id: int) -> int:
         """
         Calculate the total size of all files within a folder and its subfolders.
@@ -145,4 +213,216 @@ class FolderController:
             return size
         except Exception as e:
             logger.error(f"Error calculating folder size: {str(e)}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
+
+    def set_folder_quota(self, folder_id: int, max_bytes: int = None, max_files: int = None) -> Dict:
+        """
+        Sets or removes the byte and file limits of a folder's subtree.
+
+        Parameters:
+        folder_id (int): The ID of the folder.
+        max_bytes (int): The byte limit, None for no limit. Default is None.
+        max_files (int): The file count limit, None for no limit. Default is None.
+
+        Returns:
+        Dict: The folder's limits, usage and remaining room.
+
+        Raises:
+        Exception: If there is an error setting the quota.
+        """
+        try:
+            quota = self.folder_service.set_folder_quota(folder_id, max_bytes, max_files)
+            logger.info(f"Folder Controller was called to set the quota of folder ID: {folder_id}")
+            return quota
+        except Exception as e:
+            logger.error(f"Error setting folder quota: {str(e)}", exc_info=True)
+            raise
+
+    def get_folder_quota(self, folder_id: int) -> List[Dict]:
+        """
+        Retrieves the quotas that apply to a folder, its own first and then those of its ancestors.
+
+        Parameters:
+        folder_id (int): The ID of the folder.
+
+        Returns:
+        List[Dict]: The limits, usage and remaining room of each quota.
+
+        Raises:
+        Exception: If there is an error reading the quotas.
+        """
+        try:
+            quotas = self.folder_service.get_folder_quota(folder_id)
+            logger.info(f"Folder Controller was called to get the quotas of folder ID: {folder_id}")
+            return quotas
+        except Exception as e:
+            logger.error(f"Error reading folder quota: {str(e)}", exc_info=True)
+            raise
+
+    def search_folders(self, pattern: str, mode: str = 'substring', folder_id: int = None,
+                       limit: int = 100, offset: int = 0) -> List[Folder]:
+        """
+        Search folders by name, optionally within the subtree of a folder.
+
+        Parameters:
+        pattern (str): The text to search for.
+        mode (str): 'prefix', 'substring', 'glob' or 'extension'. Default is 'substring'.
+        folder_id (int): Restrict the search to the descendants of this folder. Default is None.
+        limit (int): The maximum number of folders to return. Default is 100.
+        offset (int): The number of matching folders to skip. Default is 0.
+
+        Returns:
+        List[Folder]: The matching folder instances.
+
+        Raises:
+        Exception: If there is an error during the search.
+        """
+        try:
+            folders = self.folder_service.search_folders(pattern, mode, folder_id, limit, offset)
+            logger.info(f"Folder Controller was called to search folders: {pattern} ({mode})")
+            return folders
+        except Exception as e:
+            logger.error(f"Error searching folders: {str(e)}", exc_info=True)
+            raise
+
+
+    def generate_tree_report(self, output_path: str, fmt: str = 'csv') -> str:
+        """
+        Writes a du-style size and file count report for the whole folder hierarchy.
+
+        Parameters:
+        output_path (str): The path of the report file.
+        fmt (str): 'csv' or 'json'. Default is 'csv'.
+
+        Returns:
+        str: The path of the written report.
+
+        Raises:
+        Exception: If there is an error generating the report.
+        """
+        try:
+            path = self.folder_service.generate_tree_report(output_path, fmt)
+            logger.info(f"Folder Controller was called to generate a tree report: {output_path} ({fmt})")
+            return path
+        except Exception as e:
+            logger.error(f"Error generating tree report: {str(e)}", exc_info=True)
+            raise
+
+
+    def export_metadata(self, output_dir: str, fmt: str = 'csv', folder_id: int = None,
+                        extra_columns: bool = False) -> Dict[str, str]:
+        """
+        Exports the folder and file metadata, optionally for a single subtree.
+
+        Parameters:
+        output_dir (str): The directory to write folders.<fmt> and files.<fmt> to.
+        fmt (str): 'csv' or 'parquet'. Default is 'csv'.
+        folder_id (int): Export only this folder's subtree. Default is None.
+        extra_columns (bool): Also export the columns outside the datagen layout. Default is False.
+
+        Returns:
+        Dict[str, str]: The paths of the written exports.
+
+        Raises:
+        Exception: If there is an error during the export.
+        """
+        try:
+            paths = self.folder_service.export_metadata(output_dir, fmt, folder_id, extra_columns=extra_columns)
+            logger.info(f"Folder Controller was called to export metadata to: {output_dir} ({fmt})")
+            return paths
+        except Exception as e:
+            logger.error(f"Error exporting metadata: {str(e)}", exc_info=True)
+            raise
+
+
+    def sync_directory(self, local_dir: str, folder_id: int, compare: str = 'metadata',
+                       delete_extras: bool = False) -> Dict[str, int]:
+        """
+        Mirrors a local directory tree into a folder, uploading only new or changed files.
+
+        Parameters:
+        local_dir (str): The local directory to mirror.
+        folder_id (int): The ID of the target folder.
+        compare (str): 'metadata' (size and modification time) or 'hash'. Default is 'metadata'.
+        delete_extras (bool): Delete files and folders that do not exist locally. Default is False.
+
+        Returns:
+        Dict[str, int]: Counts of created folders and uploaded, updated, unchanged, deleted and failed files.
+
+        Raises:
+        Exception: If there is an error during the sync.
+        """
+        try:
+            summary = self.folder_service.sync_directory(local_dir, folder_id, compare, delete_extras)
+            logger.info(f"Folder Controller was called to sync {local_dir} into folder ID: {folder_id}")
+            return summary
+        except Exception as e:
+            logger.error(f"Error syncing directory: {str(e)}", exc_info=True)
+            raise
+
+
+    def download_folder(self, folder_id: int, dest: str, archive: str = None) -> Dict:
+        """
+        Downloads a folder and its subtree to a local directory or into a tar or zip archive.
+
+        Parameters:
+        folder_id (int): The ID of the folder to download.
+        dest (str): The local directory, or for archives the archive path or '-' for stdout.
+        archive (str): None to write a directory tree, 'tar' or 'zip'. Default is None.
+
+        Returns:
+        Dict: The destination and the number of folders, files and bytes written.
+
+        Raises:
+        Exception: If there is an error during the download.
+        """
+        try:
+            summary = self.folder_service.download_folder(folder_id, dest, archive)
+            logger.info(f"Folder Controller was called to download folder ID: {folder_id} to {dest}")
+            return summary
+        except Exception as e:
+            logger.error(f"Error downloading folder: {str(e)}", exc_info=True)
+            raise
+
+
+    def purge_deleted_folders(self, batch_size: int = 1000):
+        """
+        Purges the contents of deleted folders now, chunk by chunk.
+
+        Parameters:
+        batch_size (int): The number of folders and of files removed per chunk.
+
+        Yields:
+        Dict: The summary of each purged chunk.
+
+        Raises:
+        Exception: If there is an error during the purge.
+        """
+        try:
+            logger.info(f"Folder Controller was called to purge deleted folders, chunk size: {batch_size}")
+            yield from self.folder_service.purge_deleted_folders(batch_size)
+        except Exception as e:
+            logger.error(f"Error purging deleted folders: {str(e)}", exc_info=True)
+            raise
+
+    def copy_folder(self, src_id: int, dest_parent_id: int) -> Folder:
+        """
+        Copies a folder and its subtree under another parent folder.
+
+        Parameters:
+        src_id (int): The ID of the folder to copy.
+        dest_parent_id (int): The ID of the folder receiving the copy.
+
+        Returns:
+        Folder: The root folder instance of the copy.
+
+        Raises:
+        Exception: If there is an error during the copy.
+        """
+        try:
+            folder = self.folder_service.copy_folder(src_id, dest_parent_id)
+            logger.info(f"Folder Controller was called to copy folder ID: {src_id} to parent ID: {dest_parent_id}")
+            return folder
+        except Exception as e:
+            logger.error(f"Error copying folder: {str(e)}", exc_info=True)
+            raise
@@ -1,8 +1,16 @@
 import os
+import time
+import threading
+import bisect
+import itertools
 import configparser
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, scoped_session, declarative_base
+from sqlalchemy import create_engine, text, event, make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError, OperationalError
+from sqlalchemy.orm import Session, sessionmaker, scoped_session, declarative_base
 from logger import Logger
+from utils import tracing
+from utils.metrics import registry
 
 # Configure logging
 logger = Logger.get_logger()
@@ -10,6 +18,253 @@ logger = Logger.get_logger()
 # Define the Base class for model definitions
 Base = declarative_base()
 
+# Prefix of the config.ini sections describing read replicas, e.g. [database_replica_1]
+REPLICA_SECTION_PREFIX = 'database_replica'
+
+# Connection pool defaults, overridden by the [pool] section of config.ini
+POOL_DEFAULTS = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30.0,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+    'pool_use_lifo': False
+}
+
+# PRAGMA defaults for SQLite connections, overridden by the [sqlite] section of config.ini
+SQLITE_PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY'
+}
+
+# Upper bounds in seconds of the checkout wait histogram buckets
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class PoolMetrics:
+    """
+    Live statistics of an engine's connection pool: checkout wait times, timeouts and connection churn.
+
+    Wait times are measured by TimedQueuePool around the blocking part of a checkout; connection
+    churn is counted from the pool events. The current checked out, checked in and overflow counts
+    are read from the pool itself when a snapshot is taken.
+
+    Attributes:
+    engine (Engine): The engine whose pool is observed.
+    wait_buckets (tuple): Upper bounds in seconds of the wait histogram buckets.
+    """
+
+    def __init__(self, engine, wait_buckets: tuple = POOL_WAIT_BUCKETS):
+        self.engine = engine
+        self.wait_buckets = wait_buckets
+        self._lock = threading.Lock()
+        self.reset()
+        engine.pool.metrics = self
+        for name in ('connect', 'checkout', 'checkin', 'close', 'invalidate', 'soft_invalidate'):
+            event.listen(engine, name, self._counter(name))
+
+    def reset(self):
+        """
+        Clear the accumulated counters and the wait histogram.
+        """
+        with self._lock:
+            self.counts = dict.fromkeys(('connect', 'checkout', 'checkin', 'close', 'invalidate', 'soft_invalidate', 'timeout'), 0)
+            self.wait_counts = [0] * (len(self.wait_buckets) + 1)
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def _counter(self, name: str):
+        def count(*args):
+            with self._lock:
+                self.counts[name] += 1
+        return count
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        """
+        Record how long a checkout waited for a connection.
+
+        Parameters:
+        seconds (float): The wait time.
+        timed_out (bool): The checkout gave up after pool_timeout.
+        """
+        with self._lock:
+            self.wait_counts[bisect.bisect_left(self.wait_buckets, seconds)] += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.counts['timeout'] += 1
+
+    def wait_percentile(self, fraction: float) -> float:
+        """
+        Estimate a checkout wait percentile from the histogram.
+
+        Parameters:
+        fraction (float): The percentile as a fraction, e.g. 0.95.
+
+        Returns:
+        float: The upper bound of the bucket holding the percentile (wait_max for the overflow bucket).
+        """
+        with self._lock:
+            total = sum(self.wait_counts)
+            if total == 0:
+                return 0.0
+            rank = fraction * total
+            seen = 0
+            for bound, count in zip(self.wait_buckets + (self.wait_max,), self.wait_counts):
+                seen += count
+                if seen >= rank:
+                    return min(bound, self.wait_max)
+            return self.wait_max
+
+    def snapshot(self) -> dict:
+        """
+        Take a snapshot of the pool state and the accumulated statistics.
+
+        Returns:
+        dict: The pool size, checked out, checked in and overflow connections, the event counters,
+        the wait histogram (bucket upper bound to count, 'inf' for the last bucket) and wait summary.
+        """
+        pool = self.engine.pool
+        # Pools without a queue (e.g. StaticPool for in-memory SQLite) have no size or overflow counts
+        live = {name: getattr(pool, name)() if hasattr(pool, name) else 0 for name in ('size', 'checkedout', 'checkedin', 'overflow')}
+        with self._lock:
+            waits = sum(self.wait_counts)
+            snapshot = {
+                'size': live['size'],
+                'checked_out': live['checkedout'],
+                'checked_in': live['checkedin'],
+                'overflow': max(live['overflow'], 0),
+                **self.counts,
+                'waits': waits,
+                'wait_mean': self.wait_total / waits if waits else 0.0,
+                'wait_max': self.wait_max,
+                'wait_histogram': dict(zip([str(bound) for bound in self.wait_buckets] + ['inf'], self.wait_counts))
+            }
+        snapshot['wait_p95'] = self.wait_percentile(0.95)
+        return snapshot
+
+
+class TimedQueuePool(QueuePool):
+    """
+    A QueuePool that reports how long each checkout waited to its PoolMetrics.
+    """
+
+    metrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() replaces the pool; keep reporting to the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class ReplicaRouter:
+    """
+    Round-robin selection over read replica engines that skips replicas which recently failed.
+
+    A replica is marked unhealthy when a connection to it fails or is lost and is retried
+    after retry_seconds.
+
+    Attributes:
+    engines (list): The replica Engine objects.
+    retry_seconds (float): How long a failed replica is skipped.
+    """
+
+    def __init__(self, engines: list, retry_seconds: float = 30.0):
+        self.engines = engines
+        self.retry_seconds = retry_seconds
+        self._cycle = itertools.cycle(range(len(engines)))
+        self._unhealthy_until = {}
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, 'handle_error', self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect or context.connection is None:
+            self.mark_unhealthy(context.engine)
+
+    def mark_unhealthy(self, engine):
+        """
+        Skip a replica until its retry interval has passed.
+
+        Parameters:
+        engine (Engine): The failed replica engine.
+        """
+        with self._lock:
+            self._unhealthy_until[engine] = time.monotonic() + self.retry_seconds
+        logger.warning(f"Read replica marked unhealthy for {self.retry_seconds}s: {engine.url.host}")
+
+    def choose(self):
+        """
+        Pick the next healthy replica.
+
+        Returns:
+        Engine: A replica engine, or None if every replica is currently unhealthy.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[next(self._cycle)]
+                if self._unhealthy_until.get(engine, 0) <= now:
+                    return engine
+        return None
+
+
+class ReplicaSession(Session):
+    """
+    A read-only session on a replica that moves to the primary when a statement fails on the replica.
+
+    A replica can fail in the middle of a read, e.g. when its connection is lost or it cancels a query
+    that conflicts with recovery. The failed statement is then repeated once on the primary, which
+    also serves the rest of the session; reads are safe to repeat. A lost connection also marks the
+    replica unhealthy, see ReplicaRouter.
+
+    Attributes:
+    primary (Engine): The engine of the primary database.
+    """
+
+    def __init__(self, *args, primary=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.primary = primary
+
+    def _read(self, method, statement, *args, **kwargs):
+        try:
+            return method(statement, *args, **kwargs)
+        except OperationalError as e:
+            if self.primary is None or self.bind is self.primary:
+                raise
+            logger.warning(f"Read on replica {self.bind.url.host or self.bind.url.database} failed, "
+                           f"repeating it on the primary: {e.orig}")
+            self.rollback()
+            self.bind = self.primary
+            return method(statement, *args, **kwargs)
+
+    def execute(self, statement, *args, **kwargs):
+        return self._read(super().execute, statement, *args, **kwargs)
+
+    def scalar(self, statement, *args, **kwargs):
+        return self._read(super().scalar, statement, *args, **kwargs)
+
+    def scalars(self, statement, *args, **kwargs):
+        return self._read(super().scalars, statement, *args, **kwargs)
+
+
 class Database:
     """
     A class to handle database connections and operations using SQLAlchemy.
@@ -19,8 +274,18 @@ class Database:
     config (ConfigParser): ConfigParser object to read the configuration file.
     DATABASE_URL (str): Database connection URL.
     engine (Engine): SQLAlchemy Engine object.
+    write_engine (Engine): The engine of sessions that write; on SQLite their transactions begin IMMEDIATE.
     SessionLocal (scoped_session): SQLAlchemy scoped session factory.
     Base (declarative_base): SQLAlchemy base class for models.
+    replica_urls (list): Connection URLs of the configured read replicas.
+    replica_router (ReplicaRouter): Selects the replica serving a read-only session, None without replicas.
+    read_your_writes_seconds (float): How long a thread's reads stay on the primary after it wrote.
+    query_cache_size (int): Number of compiled statements each engine keeps in its cache.
+    prepare_threshold (int): Executions after which psycopg 3 prepares a statement server side.
+    is_sqlite (bool): The metadata store is an embedded SQLite database.
+    sqlite_pragmas (dict): The PRAGMAs applied to every SQLite connection.
+    pool_options (dict): The connection pool settings passed to create_engine.
+    pool_metrics (PoolMetrics): Live statistics of the primary's connection pool.
     _active_session (Session): Tracker for the active session.
     """
 
@@ -44,12 +309,18 @@ class Database:
         logger.info("Configuration file read successfully.")
         
         self._setup_database_url()
+        self._setup_pool_options()
         self._setup_engine_and_session()
         
         self._active_session = None
+        registry.register_collector('database', self.collect_pool_metrics)
 
         self._check_database_existence()
 
+        # An embedded database has no separate provisioning step, create missing tables on startup
+        if self.is_sqlite and self.config.getboolean('sqlite', 'create_tables', fallback=True):
+            self.init_db()
+
     def _setup_database_url(self):
         """
         Sets up the database connection URL from the configuration file.
@@ -59,18 +330,170 @@ class Database:
         """
         try:
             db_config = self.config['database']
-            self.DATABASE_URL = (
-                f"{db_config['dialect']}+{db_config['driver']}://"
-                f"{db_config['user']}:{db_config['password']}@"
-                f"{db_config['host']}:{db_config.get('port', '5432')}/"
-                f"{db_config['dbname']}"
-            )
+            self.DATABASE_URL = self._build_database_url(db_config)
+            self.is_sqlite = db_config['dialect'] == 'sqlite'
             self.async_mode = db_config.getboolean('ASYNC_MODE', fallback=False)
-            logger.info("Database URL setup successfully.")
+            self.read_your_writes_seconds = db_config.getfloat('read_your_writes_seconds', fallback=5.0)
+            self.replica_retry_seconds = db_config.getfloat('replica_retry_seconds', fallback=30.0)
+            self.query_cache_size = db_config.getint('query_cache_size', fallback=500)
+            self.prepare_threshold = db_config.getint('prepare_threshold', fallback=5)
+
+            # Replica sections only need the settings that differ from the primary, usually the host
+            self.replica_urls = []
+            for section in self.config.sections():
+                if section.startswith(REPLICA_SECTION_PREFIX) and self.is_sqlite:
+                    logger.warning(f"Ignoring [{section}]: read replicas are not supported with SQLite")
+                elif section.startswith(REPLICA_SECTION_PREFIX):
+                    replica_config = {**db_config, **self.config[section]}
+                    self.replica_urls.append(self._build_database_url(replica_config))
+            logger.info(f"Database URL setup successfully with {len(self.replica_urls)} read replica(s).")
         except KeyError as e:
             logger.error(f"Missing required configuration: {e}")
             raise
 
+    def _setup_pool_options(self):
+        """
+        Reads the connection pool settings from the [pool] section of the configuration file.
+
+        pool_recycle = -1 disables recycling. Missing settings keep the defaults in POOL_DEFAULTS.
+        """
+        self.pool_options = {
+            'pool_size': self.config.getint('pool', 'pool_size', fallback=POOL_DEFAULTS['pool_size']),
+            'max_overflow': self.config.getint('pool', 'max_overflow', fallback=POOL_DEFAULTS['max_overflow']),
+            'pool_timeout': self.config.getfloat('pool', 'pool_timeout', fallback=POOL_DEFAULTS['pool_timeout']),
+            'pool_recycle': self.config.getint('pool', 'pool_recycle', fallback=POOL_DEFAULTS['pool_recycle']),
+            'pool_pre_ping': self.config.getboolean('pool', 'pool_pre_ping', fallback=POOL_DEFAULTS['pool_pre_ping']),
+            'pool_use_lifo': self.config.getboolean('pool', 'pool_use_lifo', fallback=POOL_DEFAULTS['pool_use_lifo'])
+        }
+        logger.info(f"Connection pool settings: {self.pool_options}")
+
+        self.sqlite_pragmas = {
+            name: self.config.get('sqlite', name, fallback=str(default))
+            for name, default in SQLITE_PRAGMA_DEFAULTS.items()
+        }
+
+    def _create_engine(self, url: str):
+        """
+        Creates an engine with the configured connection pool and attaches pool metrics to it.
+
+        With the psycopg (version 3) driver, statements executed prepare_threshold times on a
+        connection are prepared server side; psycopg2 has no server-side prepared statements.
+        SQLite connections get the configured PRAGMAs when they are opened. An in-memory SQLite
+        database lives in a single connection, so it is shared by all threads through a StaticPool
+        and the pool settings do not apply.
+
+        Parameters:
+        url (str): The database connection URL.
+
+        Returns:
+        Engine: The SQLAlchemy engine, with its PoolMetrics as engine.pool.metrics and its statements traced.
+        """
+        connect_args = {}
+        driver_name = make_url(url).drivername
+        if driver_name == 'postgresql+psycopg':
+            connect_args['prepare_threshold'] = self.prepare_threshold
+
+        if driver_name.startswith('sqlite') and make_url(url).database in (None, '', ':memory:'):
+            engine = create_engine(url, poolclass=StaticPool, query_cache_size=self.query_cache_size,
+                                   connect_args={'check_same_thread': False})
+        else:
+            engine = create_engine(url, poolclass=TimedQueuePool, query_cache_size=self.query_cache_size,
+                                   connect_args=connect_args, **self.pool_options)
+        if driver_name.startswith('sqlite'):
+            event.listen(engine, 'connect', self._apply_sqlite_pragmas)
+            event.listen(engine, 'begin', self._begin_sqlite_transaction)
+        PoolMetrics(engine)
+        tracing.instrument_engine(engine)
+        return engine
+
+    def _apply_sqlite_pragmas(self, dbapi_connection, connection_record):
+        """
+        Applies the configured PRAGMAs to a new SQLite connection.
+
+        Foreign keys are always enforced, since the cascades between folders and files depend on them.
+        WAL lets readers proceed while a write is in progress, and synchronous = NORMAL only syncs at
+        checkpoints, which is durable against application crashes in WAL mode.
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA foreign_keys = ON")
+            for name, value in self.sqlite_pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+        # The driver only opens a transaction before statements starting with INSERT, UPDATE or DELETE, so a
+        # statement led by a CTE (WITH ... UPDATE) would autocommit; transactions are begun explicitly instead
+        dbapi_connection.isolation_level = None
+
+    def _begin_sqlite_transaction(self, connection):
+        """
+        Begins the transaction of a SQLite connection, see _apply_sqlite_pragmas.
+
+        Sessions that write begin with BEGIN IMMEDIATE (see write_engine), which waits busy_timeout
+        for the write lock up front. A deferred transaction that read first cannot wait for it: if
+        another writer committed meanwhile, its first write fails at once with 'database is locked'.
+        """
+        connection.exec_driver_sql(f"BEGIN {connection.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+
+    def pool_statistics(self) -> dict:
+        """
+        Returns live statistics of the primary and replica connection pools.
+
+        Returns:
+        dict: A PoolMetrics snapshot for 'primary' and for each replica by host.
+        """
+        statistics = {'primary': self.pool_metrics.snapshot()}
+        if self.replica_router is not None:
+            for engine in self.replica_router.engines:
+                statistics[f"replica:{engine.url.host}"] = engine.pool.metrics.snapshot()
+        return statistics
+
+    def collect_pool_metrics(self) -> list:
+        """
+        Reports the pool statistics as metric families, see MetricsRegistry.register_collector.
+
+        Returns:
+        list: The (name, kind, help, samples) tuples, labelled by pool as in pool_statistics.
+        """
+        sizes, connections, events, waits = [], [], [], []
+        for pool, snapshot in self.pool_statistics().items():
+            sizes.append(({'pool': pool}, snapshot['size']))
+            for state in ('checked_out', 'checked_in', 'overflow'):
+                connections.append(({'pool': pool, 'state': state}, snapshot[state]))
+            for name in ('connect', 'checkout', 'checkin', 'close', 'invalidate', 'soft_invalidate', 'timeout'):
+                events.append(({'pool': pool, 'event': name}, snapshot[name]))
+            waits.append(({'pool': pool}, (POOL_WAIT_BUCKETS, list(snapshot['wait_histogram'].values()),
+                                           snapshot['wait_mean'] * snapshot['waits'])))
+        return [
+            ('db_pool_size', 'gauge', "Configured size of the connection pool.", sizes),
+            ('db_pool_connections', 'gauge', "Connections of the pool by state.", connections),
+            ('db_pool_events_total', 'counter', "Connection pool events, including checkout timeouts.", events),
+            ('db_pool_wait_seconds', 'histogram', "Time checkouts waited for a connection.", waits)
+        ]
+
+    @staticmethod
+    def _build_database_url(db_config) -> str:
+        """
+        Builds a connection URL from a database config section.
+
+        SQLite only needs a path to the database file (':memory:' for a transient in-memory database).
+
+        Parameters:
+        db_config (Mapping): The dialect, driver, user, password, host, port and dbname settings, or
+        the dialect and path settings for SQLite.
+
+        Returns:
+        str: The database connection URL.
+        """
+        if db_config['dialect'] == 'sqlite':
+            return f"sqlite:///{db_config.get('path', 'clientfiledb.sqlite')}"
+        return (
+            f"{db_config['dialect']}+{db_config['driver']}://"
+            f"{db_config['user']}:{db_config['password']}@"
+            f"{db_config['host']}:{db_config.get('port', '5432')}/"
+            f"{db_config['dbname']}"
+        )
+
     def _setup_engine_and_session(self):
         """
         Sets up the SQLAlchemy engine and session factory.
@@ -79,9 +502,24 @@ class Database:
         Exception: If there is an error in setting up the engine and session.
         """
         try:
-            self.engine = create_engine(self.DATABASE_URL, pool_size=10, max_overflow=20)
-            self.SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=self.engine))
+            self.engine = self._create_engine(self.DATABASE_URL)
+            self.pool_metrics = self.engine.pool.metrics
+            # Shares the engine's pool; on SQLite its transactions take the write lock when they begin
+            self.write_engine = self.engine.execution_options(sqlite_begin='IMMEDIATE') if self.is_sqlite else self.engine
+            session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+            self.SessionLocal = scoped_session(session_factory)
             self.Base = Base
+
+            # Remember when each thread last wrote so that its reads can be pinned to the primary
+            self._write_tracker = threading.local()
+            event.listen(session_factory, 'after_flush', self._record_write)
+            event.listen(session_factory, 'do_orm_execute', self._record_bulk_write)
+
+            self.replica_router = None
+            if self.replica_urls:
+                replica_engines = [self._create_engine(url) for url in self.replica_urls]
+                self.replica_router = ReplicaRouter(replica_engines, self.replica_retry_seconds)
+                self.ReplicaSession = sessionmaker(class_=ReplicaSession, autocommit=False, autoflush=False)
             logger.info("Engine and session setup successfully.")
         except Exception as e:
             logger.error(f"Error setting up engine and session: {e}")
@@ -116,20 +554,50 @@ class Database:
         try:
             from models.file import File
             from models.folder import Folder
+            from models.change import Change
             self.Base.metadata.create_all(bind=self.engine)
             logger.info("Database tables created successfully.")
         except Exception as e:
             logger.error(f"Error initializing the database: {e}")
             raise
 
-    def get_db_session(self):
+    def _record_write(self, session, flush_context=None):
+        self._write_tracker.last_write = time.monotonic()
+
+    def _record_bulk_write(self, orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            self._record_write(orm_execute_state.session)
+
+    def _recently_wrote(self) -> bool:
+        last_write = getattr(self._write_tracker, 'last_write', None)
+        return last_write is not None and time.monotonic() - last_write < self.read_your_writes_seconds
+
+    def get_db_session(self, read_only: bool = False):
         """
         Starts a new database session.
 
+        Read-only sessions are served by a read replica when replicas are configured, unless the
+        calling thread wrote within the last read_your_writes_seconds or no replica is healthy.
+        A statement that fails on the replica is repeated once on the primary, see ReplicaSession.
+
+        Parameters:
+        read_only (bool): The session will only be used for reads. Default is False.
+
         Returns:
         Session: A new SQLAlchemy session.
         """
+        if read_only and self.replica_router is not None and not self._recently_wrote():
+            engine = self.replica_router.choose()
+            if engine is not None:
+                session = self.ReplicaSession(bind=engine, primary=self.engine)
+                logger.info(f"Read-only database session started on replica: {engine.url.host}")
+                return session
         session = self.SessionLocal()
+        # The thread's session is shared, so its engine follows the caller until a transaction has begun
+        if self.is_sqlite and not session.in_transaction():
+            engine = self.engine if read_only else self.write_engine
+            if session.bind is not engine:
+                session.bind = engine
         logger.info("Database session started.")
         return session
 
@@ -3,7 +3,10 @@ import tkinter as tk
 from injector import Injector
 from controllers.file_controller import FileController
 from controllers.folder_controller import FolderController
+from services.folder_service import FolderService, PURGE_ENABLED
 from utils.s3_utils import S3Utils
+from utils import metrics
+from utils.profile_utils import ActionProfiler, PROFILE_DIRECTORY
 from logger import Logger
 from app_dependcy_injector import AppInjector
 from views.cli_view import CLIView
@@ -15,8 +18,11 @@ def main():
     """Main function to run the application."""
     parser = argparse.ArgumentParser(description="Choose between CLI and GUI")
     parser.add_argument('--mode', choices=['cli', 'gui'], required=True, help="Choose the interface mode: cli or gui")
+    parser.add_argument('--profile', nargs='?', const=PROFILE_DIRECTORY, metavar='DIRECTORY',
+                        help=f"Write a cProfile and tracemalloc report per action to DIRECTORY (default: {PROFILE_DIRECTORY})")
     args = parser.parse_args()
 
+    metrics.start_exposition()
     injector = Injector([AppInjector])
 
     if not S3Utils.check_s3_connection():
@@ -25,14 +31,25 @@ def main():
 
     file_controller = injector.get(FileController)
     folder_controller = injector.get(FolderController)
+    profiler = ActionProfiler(args.profile) if args.profile else None
+    if profiler is not None:
+        logger.info(f"Profiling every action to {args.profile}")
 
-    if args.mode == 'cli':
-        view = CLIView(file_controller, folder_controller)
-        view.run()
-    elif args.mode == 'gui':
-        root = tk.Tk()
-        app = GUIView(root, file_controller, folder_controller)
-        root.mainloop()
+    # Deleted folders are only marked as deleted, their contents are removed in the background
+    folder_service = injector.get(FolderService)
+    if PURGE_ENABLED:
+        folder_service.start_purger()
+
+    try:
+        if args.mode == 'cli':
+            view = CLIView(file_controller, folder_controller, profiler)
+            view.run()
+        elif args.mode == 'gui':
+            root = tk.Tk()
+            app = GUIView(root, file_controller, folder_controller, profiler)
+            root.mainloop()
+    finally:
+        folder_service.stop_purger(timeout=5)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,43 @@
+from sqlalchemy import (Column,
+                        Integer,
+                        BigInteger,
+                        String,
+                        TIMESTAMP)
+from database import Base
+
+
+class Change(Base):
+    """
+    A SQLAlchemy ORM class representing the 'changes' table in the database, the changelog of every
+    mutation made through FileService and FolderService.
+
+    Rows are appended in the transaction of the change, in commit order, so a consumer that remembers
+    the last change_id it processed can read everything that happened since.
+
+    Attributes:
+    change_id (int): Primary key, increasing in commit order; doubles as the resume token of changes_since.
+    change_time (timestamp): When the change was committed.
+    change_operation (str): 'create', 'update', 'move' or 'delete'. Deleting a folder deletes its whole subtree.
+    change_entity (str): 'folder' or 'file'.
+    change_entity_id (int): The ID of the changed folder or file.
+    change_folder_id (int): The parent folder of the folder, or the folder of the file, after the change
+    (before it for deletes).
+    change_previous_folder_id (int): For moves, the parent folder or folder before the change.
+    change_name (str): The name of the folder or file.
+    """
+
+    __tablename__ = 'changes'
+
+    # SQLite only assigns rowid aliases to INTEGER PRIMARY KEY columns
+    change_id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    change_time = Column(TIMESTAMP, nullable=False)
+    change_operation = Column(String(16), nullable=False)
+    change_entity = Column(String(16), nullable=False)
+    change_entity_id = Column(Integer, nullable=False)
+    change_folder_id = Column(Integer, nullable=True)
+    change_previous_folder_id = Column(Integer, nullable=True)
+    change_name = Column(String(255), nullable=True)
+
+    def __repr__(self):
+        return (f"<Change(change_id={self.change_id}, change_operation={self.change_operation}, "
+                f"change_entity={self.change_entity}, change_entity_id={self.change_entity_id})>")
@@ -5,8 +5,35 @@ from sqlalchemy import (Column,
                         Index, 
                         UniqueConstraint,
                         TIMESTAMP, 
+                        DDL,
+                        event,
                         func)
+import configparser
 from database import Base
+from utils.partition_utils import (PARTITION_SCHEMES,
+                                   DEFAULT_HASH_PARTITIONS,
+                                   partition_by_clause,
+                                   create_partitions_sql,
+                                   uniqueness_trigger_sql)
+
+# Read configuration
+config = configparser.ConfigParser()
+config.read('config/config.ini')
+
+# Optional declarative partitioning of the files table, PostgreSQL only
+FILES_PARTITIONING = config.get('database', 'files_partitioning', fallback='none')
+FILES_PARTITIONS = config.getint('database', 'files_partitions', fallback=DEFAULT_HASH_PARTITIONS)
+if config.get('database', 'dialect', fallback='postgresql') != 'postgresql':
+    FILES_PARTITIONING = 'none'
+if FILES_PARTITIONING not in PARTITION_SCHEMES:
+    raise ValueError(f"Unknown files_partitioning: {FILES_PARTITIONING}. Expected one of {', '.join(PARTITION_SCHEMES)}")
+
+# Trigram indexes on file and folder names need the pg_trgm extension
+event.listen(
+    Base.metadata,
+    'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql')
+)
 
 class File(Base):
     """
@@ -15,28 +42,59 @@ class File(Base):
     Attributes:
     file_id (int): Primary key of the file.
     file_name (str): Name of the file, cannot be null.
-    file_size (int): Size of the file in bytes, cannot be null.
+    file_size (int): Size of the file's content in bytes, cannot be null.
     file_created_date (timestamp): Timestamp when the file was created, defaults to the current time.
     folder_id (int): ID of the folder containing this file, cannot be null.
     file_s3_key (str): Unique S3 key for the file, cannot be null and must be unique.
+    file_s3_bucket (str): Bucket holding the object, null for the default bucket.
+    With files_partitioning = hash or range, the partition key joins file_id in the primary key and the
+    uniqueness rules that cannot be declared on a partitioned table are enforced by a trigger.
+    file_codec (str): Compression codec of the stored object ('gzip' or 'zstd'), null if stored as is.
+    file_stored_size (int): Bytes stored in S3 when the object is compressed, null if stored as is.
+    file_content_hash (str): SHA-256 hex digest of the original content.
     """
 
     __tablename__ = 'files'
 
-    file_id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, primary_key=True, autoincrement=True)
     file_name = Column(String(255), nullable=False)
     file_size = Column(Integer, nullable=False)
-    file_created_date = Column(TIMESTAMP, server_default=func.current_timestamp())
-    folder_id = Column(Integer, ForeignKey('folders.folder_id'), nullable=False)
-    file_s3_key = Column(String(255), nullable=False, unique=True)
+    file_created_date = Column(TIMESTAMP, server_default=func.current_timestamp(), primary_key=FILES_PARTITIONING == 'range')
+    folder_id = Column(Integer, ForeignKey('folders.folder_id', ondelete='CASCADE'), nullable=False, primary_key=FILES_PARTITIONING == 'hash')
+    file_s3_key = Column(String(255), nullable=False, unique=FILES_PARTITIONING == 'none')
+    file_s3_bucket = Column(String(63), nullable=True)
+    file_codec = Column(String(16), nullable=True)
+    file_stored_size = Column(Integer, nullable=True)
+    file_content_hash = Column(String(64), nullable=True)
 
     __table_args__ = (
-        UniqueConstraint('folder_id', 'file_name', name='unique_file_name_per_folder'),
-        Index('idx_file_folder_id', 'folder_id'),
-        Index('idx_file_s3_key', 'file_s3_key')
+        # Folder lookups use unique_file_name_per_folder (or idx_file_folder_name), whose leading column is folder_id.
+        # This index covers the per-folder size aggregation so it never visits the table
+        Index('idx_file_folder_size', 'folder_id', postgresql_include=['file_size']).ddl_if(dialect='postgresql'),
+        Index('idx_file_folder_size', 'folder_id', 'file_size').ddl_if(dialect='sqlite'),
+        # file_s3_key lookups use the unique constraint's index, partitioned tables have no such constraint
+        *([Index('idx_file_s3_key', 'file_s3_key')] if FILES_PARTITIONING != 'none' else []),
+        Index('idx_file_name_pattern', 'file_name',
+              postgresql_ops={'file_name': 'text_pattern_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_file_name_trgm', 'file_name',
+              postgresql_using='gin',
+              postgresql_ops={'file_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        # Under range partitioning the name rule cannot be a constraint, the trigger enforces it
+        UniqueConstraint('folder_id', 'file_name', name='unique_file_name_per_folder')
+        if FILES_PARTITIONING != 'range' else Index('idx_file_folder_name', 'folder_id', 'file_name'),
+        {'postgresql_partition_by': partition_by_clause(FILES_PARTITIONING)} if FILES_PARTITIONING != 'none' else {}
     )
 
+    # Rows are still identified by file_id alone, so session.get(File, file_id) keeps working
+    __mapper_args__ = {'primary_key': [file_id]}
+
     def __repr__(self):
         return (f"<File(file_id={self.file_id}, file_name={self.file_name}, file_size={self.file_size}, "
                 f"file_created_date={self.file_created_date}, folder_id={self.folder_id}, "
-                f"file_s3_key={self.file_s3_key})>")
+                f"file_s3_key={self.file_s3_key}, file_s3_bucket={self.file_s3_bucket}, file_codec={self.file_codec})>")
+
+
+if FILES_PARTITIONING != 'none':
+    # create_all only creates the partitioned parent; add its partitions and the uniqueness trigger
+    for statement in create_partitions_sql(FILES_PARTITIONING, File.__tablename__, FILES_PARTITIONS) + uniqueness_trigger_sql(FILES_PARTITIONING, File.__tablename__):
+        event.listen(File.__table__, 'after_create', DDL(statement.replace('%', '%%')).execute_if(dialect='postgresql'))
@@ -1,9 +1,11 @@
 from sqlalchemy import (
     Column, 
     Integer,
+    BigInteger,
     String, 
     ForeignKey, 
     Index,
+    TIMESTAMP,
     UniqueConstraint, 
     CheckConstraint
 )
@@ -22,6 +24,12 @@ class Folder(Base):
     folder_id (int): Primary key of the folder.
     folder_name (str): Name of the folder, cannot be null.
     folder_parent_id (int): ID of the parent folder, can be null if it's a root folder.
+    folder_deleted_at (timestamp): When the folder was deleted, null for live folders. A deleted folder and
+    everything below it are hidden from reads until the purger removes them.
+    folder_quota_bytes (int): The most bytes the folder and its subtree may store, null for no byte limit.
+    folder_quota_files (int): The most files the folder and its subtree may hold, null for no file limit.
+    folder_used_bytes (int): Bytes stored in the subtree, maintained only for folders with a quota (null otherwise).
+    folder_used_files (int): Files in the subtree, maintained only for folders with a quota (null otherwise).
     children (relationship): Relationship to child folders.
     files (relationship): Relationship to files within the folder.
     """
@@ -31,6 +39,11 @@ class Folder(Base):
     folder_id = Column(Integer, primary_key=True)
     folder_name = Column(String(255), nullable=False)
     folder_parent_id = Column(Integer, ForeignKey('folders.folder_id', ondelete='CASCADE'), nullable=True)
+    folder_deleted_at = Column(TIMESTAMP, nullable=True)
+    folder_quota_bytes = Column(BigInteger, nullable=True)
+    folder_quota_files = Column(Integer, nullable=True)
+    folder_used_bytes = Column(BigInteger, nullable=True)
+    folder_used_files = Column(Integer, nullable=True)
 
     children = relationship(
         "Folder",
@@ -42,9 +55,27 @@ class Folder(Base):
     files = relationship("File", backref='folder', cascade='all, delete-orphan')
 
     __table_args__ = (
+        # Its (folder_parent_id, folder_name) index also serves parent lookups and child listings ordered by name
         UniqueConstraint('folder_parent_id', 'folder_name', name='unique_folder_name_per_parent'),
         CheckConstraint('folder_id <> folder_parent_id', name='no_self_reference'),
-        Index('idx_folder_parent_id', 'folder_parent_id')
+        # Only one root folder: NULL parents are distinct for the unique constraint above, so a partial
+        # unique index over the constant expression allows a single row with folder_parent_id IS NULL
+        Index('unique_root_folder', folder_parent_id.is_(None), unique=True,
+              postgresql_where=folder_parent_id.is_(None),
+              sqlite_where=folder_parent_id.is_(None)),
+        # Finds the pending tombstones without scanning, stays empty while nothing awaits purging
+        Index('idx_folder_deleted_at', 'folder_deleted_at',
+              postgresql_where=folder_deleted_at.is_not(None),
+              sqlite_where=folder_deleted_at.is_not(None)),
+        # Lists the folders with a quota without scanning, usually a handful of rows
+        Index('idx_folder_quota', 'folder_id',
+              postgresql_where=folder_used_bytes.is_not(None),
+              sqlite_where=folder_used_bytes.is_not(None)),
+        Index('idx_folder_name_pattern', 'folder_name',
+              postgresql_ops={'folder_name': 'text_pattern_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_folder_name_trgm', 'folder_name',
+              postgresql_using='gin',
+              postgresql_ops={'folder_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
     )
 
     def __repr__(self):
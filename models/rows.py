@@ -0,0 +1,34 @@
+from typing import NamedTuple
+
+
+class FileRow(NamedTuple):
+    """
+    A read-only row of the 'files' table, returned by the listing APIs instead of a File instance.
+
+    Rows are plain tuples: they are not tracked by a session, hold no loader state and stay usable
+    after the session is closed.
+
+    Attributes:
+    file_id (int): Primary key of the file.
+    file_name (str): Name of the file.
+    file_size (int): Size of the file in bytes.
+    folder_id (int): ID of the folder containing the file.
+    """
+    file_id: int
+    file_name: str
+    file_size: int
+    folder_id: int
+
+
+class FolderRow(NamedTuple):
+    """
+    A read-only row of the 'folders' table, returned by the listing APIs instead of a Folder instance.
+
+    Attributes:
+    folder_id (int): Primary key of the folder.
+    folder_name (str): Name of the folder.
+    folder_parent_id (int): ID of the parent folder, None for a root folder.
+    """
+    folder_id: int
+    folder_name: str
+    folder_parent_id: int
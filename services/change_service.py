@@ -0,0 +1,93 @@
+from sqlalchemy import select, delete
+from models.change import Change
+from database import Database
+from utils.change_feed import change_feed, change_to_dict
+from utils.tracing import trace_class
+from datetime import datetime
+from logger import Logger
+from typing import Dict
+
+logger = Logger.get_logger()
+
+@trace_class('service')
+class ChangeService:
+    def __init__(self, db: Database):
+        """
+        Initialize the ChangeService with a Database instance.
+
+        Args:
+            db (Database): The database instance.
+        """
+        self.db = db
+
+    def changes_since(self, token: int = 0, limit: int = 1000) -> Dict:
+        """
+        Read the changes committed after a token, oldest first.
+
+        A consumer starts from 0 (or the 'Next Token' of a snapshot it already holds) and passes the
+        returned 'Next Token' to the next call until 'More' is False. The token is the ID of the last
+        change returned, so a page is a range scan of the primary key however long the changelog is.
+
+        Args:
+            token (int, optional): The 'Next Token' of the previous call. Defaults to 0, the beginning.
+            limit (int, optional): The maximum number of changes returned. Defaults to 1000.
+
+        Returns:
+            Dict: The 'Changes', the 'Next Token' to resume from and whether 'More' changes follow.
+
+        Raises:
+            Exception: If a database error occurs.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                rows = session.execute(
+                    select(Change).where(Change.change_id > token).order_by(Change.change_id).limit(limit + 1)
+                ).scalars().all()
+                changes = [change_to_dict(row) for row in rows[:limit]]
+                return {
+                    'Changes': changes,
+                    'Next Token': changes[-1]['Change ID'] if changes else token,
+                    'More': len(rows) > limit
+                }
+            except Exception as e:
+                logger.error(f"Error in changes_since: {e}", exc_info=True)
+                raise Exception("An error occurred while reading the changes. Please check the logs for details.") from e
+
+    def subscribe(self, callback, entity: str = None):
+        """
+        Receive every change as soon as it is committed by this process.
+
+        Args:
+            callback (callable): Called with the dictionary of each change, on the committing thread.
+            entity (str, optional): Only deliver changes of 'folder' or 'file'. Defaults to every change.
+
+        Returns:
+            callable: A function that removes the subscription.
+        """
+        return change_feed.subscribe(callback, entity)
+
+    def prune_changes(self, before: datetime) -> int:
+        """
+        Delete the changes committed before a point in time.
+
+        Consumers whose token is older than the pruned range have to start again from a full listing.
+
+        Args:
+            before (datetime): Changes with an earlier change_time are deleted.
+
+        Returns:
+            int: The number of changes deleted.
+
+        Raises:
+            Exception: If a database error occurs.
+        """
+        with self.db.get_db_session() as session:
+            try:
+                deleted = session.execute(delete(Change).where(Change.change_time < before)).rowcount
+                session.commit()
+                logger.info(f"Pruned {deleted} changes committed before {before}")
+                return deleted
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error in prune_changes: {e}", exc_info=True)
+                raise Exception("An error occurred while pruning the changes. Please check the logs for details.") from e
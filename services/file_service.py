@@ -1,12 +1,24 @@
+from sqlalchemy import select, update, lambda_stmt
 from sqlalchemy.exc import IntegrityError
 from models.file import File
 from utils.s3_utils import S3Utils
+from utils.query_utils import name_filter, subtree_folder_ids, deleted_folder_ids, folder_is_live
+from utils.change_feed import record_change
+from utils.quota_utils import quota_folder_ids, charge_folder, charge_move
+from utils import compression_utils
+from utils.tracing import trace_class
+from utils.metrics import measure_class
 from database import Database
 from datetime import datetime, timezone
 from logger import Logger
+from typing import List
+import os
+import hashlib
 
 logger = Logger.get_logger()
 
+@trace_class('service')
+@measure_class()
 class FileService:
     def __init__(self, db: Database):
         """
@@ -31,26 +43,39 @@ class FileService:
 
         Raises:
             IntegrityError: If a database integrity error occurs.
-            Exception: If any other error occurs during file creation.
+            Exception: If the file would exceed the quota of its folder or an ancestor, or any other error
+                occurs during file creation.
         """
         s3_key = S3Utils.generate_s3_key(name)
-        size = len(file_content)
+        s3_bucket = S3Utils.bucket_for_key(s3_key)
+        body, codec = compression_utils.compress(name, file_content)
 
         with self.db.get_db_session() as session:
             try:
+                if not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+                charge_folder(session, folder_id, len(body), 1)
+
                 file = File(
                     file_name=name,
-                    file_size=size,
+                    file_size=len(file_content),
                     folder_id=folder_id,
                     file_created_date=datetime.now(timezone.utc),
-                    file_s3_key=s3_key
+                    file_s3_key=s3_key,
+                    file_s3_bucket=s3_bucket,
+                    file_codec=codec,
+                    file_stored_size=len(body) if codec else None,
+                    file_content_hash=hashlib.sha256(file_content).hexdigest()
                 )
                 session.add(file)
+                session.flush()
+                record_change(session, 'create', 'file', file.file_id, folder_id, name=name)
                 session.commit()
                 logger.info(f"File record created in the database: {name}, File ID: {file.file_id}")
 
                 # Upload the file to S3 after committing to avoid rollback issues if upload fails
-                if not S3Utils.upload_file_to_s3(file_content, name, s3_key):
+                if not S3Utils.upload_file_to_s3(body, name, s3_key, s3_bucket):
                     raise Exception(f"Failed to upload file to S3: {name}")
 
                 return file
@@ -73,10 +98,12 @@ class FileService:
         Raises:
             Exception: If the file is not found in the database or any other error occurs during retrieval.
         """
-        with self.db.get_db_session() as session:
+        with self.db.get_db_session(read_only=True) as session:
             try:
-                file = session.query(File).filter_by(file_id=file_id).first()
-                if not file:
+                # A lambda statement is analysed once per call site, later calls only bind the new ID
+                file = session.execute(lambda_stmt(lambda: select(File).where(File.file_id == file_id))).scalar_one_or_none()
+                # Files of deleted folders stay hidden until the purger removes them
+                if not file or not folder_is_live(session, file.folder_id):
                     logger.error(f"File not found: File ID: {file_id}")
                     raise Exception("File not found in the database")
                 return file
@@ -98,15 +125,17 @@ class FileService:
         with self.db.get_db_session() as session:
             try:
                 file = session.query(File).filter_by(file_id=file_id).first()
-                if not file:
+                if not file or not folder_is_live(session, file.folder_id):
                     logger.error(f"File not found in the database: File ID: {file_id}")
                     raise Exception(f"File not found in the database: File ID: {file_id}")
 
                 # Delete the file from S3 before removing the record from the database
-                if file.file_s3_key and not S3Utils.delete_file_from_s3(file.file_s3_key):
+                if file.file_s3_key and not S3Utils.delete_file_from_s3(file.file_s3_key, file.file_s3_bucket):
                     logger.warning(f"File not found in S3: {file.file_s3_key}")
                 
                 session.delete(file)
+                charge_folder(session, file.folder_id, -(file.file_stored_size or file.file_size), -1)
+                record_change(session, 'delete', 'file', file_id, file.folder_id, name=file.file_name)
                 session.commit()
                 logger.info(f"File deleted successfully from database: File ID: {file_id}")
                 return file
@@ -132,14 +161,32 @@ class FileService:
         """
         with self.db.get_db_session() as session:
             try:
-                # Query the file within the active session
-                file = session.query(File).filter_by(file_id=file_id).first()
+                if not folder_is_live(session, new_folder_id):
+                    logger.error(f"Folder not found: Folder ID: {new_folder_id}")
+                    raise Exception(f"Folder not found: Folder ID: {new_folder_id}")
+
+                previous_folder_id = session.execute(
+                    lambda_stmt(lambda: select(File.folder_id).where(File.file_id == file_id))
+                ).scalar_one_or_none()
+
+                # Update and read back the file in one cached, parameterized statement; files of deleted folders are not moved
+                file = session.execute(
+                    lambda_stmt(lambda: update(File)
+                                .where(File.file_id == file_id, File.folder_id.not_in(select(deleted_folder_ids().c.folder_id)))
+                                .values(folder_id=new_folder_id).returning(File)),
+                    execution_options={'synchronize_session': False}
+                ).scalar_one_or_none()
                 if not file:
                     logger.error(f"File not found: File ID: {file_id}")
                     raise Exception(f"File not found: File ID: {file_id}")
 
-                # Perform the move operation within the same session
-                file.folder_id = new_folder_id
+                if previous_folder_id != new_folder_id:
+                    charge_move(session, quota_folder_ids(session, previous_folder_id, lock=True),
+                                quota_folder_ids(session, new_folder_id, lock=True), file.file_stored_size or file.file_size, 1)
+
+                # Detach the loaded file so the commit does not expire it before it is returned
+                session.expunge(file)
+                record_change(session, 'move', 'file', file_id, new_folder_id, previous_folder_id, file.file_name)
                 session.commit()
                 logger.info(f"File moved successfully: File ID: {file_id} to Folder ID: {new_folder_id}")
 
@@ -149,4 +196,134 @@ class FileService:
             except Exception as e:
                 session.rollback()
                 logger.error(f"Error in move_file: {e}", exc_info=True)
-                raise
\ No newline at end of file
+                raise
+
+    def download_file(self, file_id: int, local_path: str) -> str:
+        """
+        Download a file to a local path, decompressing it while it streams from S3.
+
+        Args:
+            file_id (int): The ID of the file to download.
+            local_path (str): The local file path, or a directory to save the file under its own name.
+
+        Returns:
+            str: The local path where the file was saved.
+
+        Raises:
+            PermissionError: If the local path cannot be written.
+            Exception: If the file is not found or the download fails.
+        """
+        file = self.get_file(file_id)
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, file.file_name)
+
+        body = S3Utils.download_fileobj_from_s3(file.file_s3_key, file.file_stored_size or file.file_size, file.file_s3_bucket)
+        if body is None:
+            raise Exception(f"Failed to download file from S3: {file.file_s3_key}")
+
+        try:
+            with open(local_path, 'wb') as destination:
+                written = compression_utils.decompress_stream(body, destination, file.file_codec)
+        finally:
+            body.close()
+        logger.info(f"File downloaded successfully: File ID: {file_id} to {local_path} ({written} bytes)")
+        return local_path
+
+    def copy_file(self, file_id: int, dest_folder_id: int) -> File:
+        """
+        Copy a file into another folder. The object is copied inside S3, so no content is downloaded.
+
+        Args:
+            file_id (int): The ID of the file to copy.
+            dest_folder_id (int): The ID of the folder receiving the copy.
+
+        Returns:
+            File: The File object of the copy.
+
+        Raises:
+            IntegrityError: If the destination folder already has a file with the same name.
+            Exception: If the file is not found or the copy fails.
+        """
+        with self.db.get_db_session() as session:
+            try:
+                source = session.query(File).filter_by(file_id=file_id).first()
+                if not source or not folder_is_live(session, source.folder_id):
+                    logger.error(f"File not found: File ID: {file_id}")
+                    raise Exception(f"File not found: File ID: {file_id}")
+                if not folder_is_live(session, dest_folder_id):
+                    logger.error(f"Folder not found: Folder ID: {dest_folder_id}")
+                    raise Exception(f"Folder not found: Folder ID: {dest_folder_id}")
+
+                s3_key = S3Utils.generate_s3_key(source.file_name)
+                s3_bucket = S3Utils.bucket_for_key(s3_key)
+                if not S3Utils.copy_file_in_s3(source.file_s3_key, s3_key, source.file_s3_bucket, s3_bucket):
+                    raise Exception(f"Failed to copy file in S3: {source.file_s3_key}")
+
+                copy = File(
+                    file_name=source.file_name,
+                    file_size=source.file_size,
+                    folder_id=dest_folder_id,
+                    file_created_date=datetime.now(timezone.utc),
+                    file_s3_key=s3_key,
+                    file_s3_bucket=s3_bucket,
+                    file_codec=source.file_codec,
+                    file_stored_size=source.file_stored_size,
+                    file_content_hash=source.file_content_hash
+                )
+                session.add(copy)
+                try:
+                    charge_folder(session, dest_folder_id, copy.file_stored_size or copy.file_size, 1)
+                    session.flush()
+                    record_change(session, 'create', 'file', copy.file_id, dest_folder_id, name=copy.file_name)
+                    session.commit()
+                except Exception:
+                    S3Utils.delete_file_from_s3(s3_key, s3_bucket)
+                    raise
+                session.refresh(copy)
+                logger.info(f"File copied successfully: File ID: {file_id} to Folder ID: {dest_folder_id}, new File ID: {copy.file_id}")
+                return copy
+
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error in copy_file: {e}", exc_info=True)
+                raise
+
+    def search_files(self, pattern: str, mode: str = 'substring', folder_id: int = None,
+                     limit: int = 100, offset: int = 0, case_sensitive: bool = True) -> List[File]:
+        """
+        Search files by name, optionally restricted to the subtree of a folder.
+
+        Args:
+            pattern (str): The text to search for.
+            mode (str, optional): 'prefix', 'substring', 'glob' or 'extension'. Defaults to 'substring'.
+            folder_id (int, optional): Restrict the search to this folder and its subfolders. Defaults to None.
+            limit (int, optional): The maximum number of files to return. Defaults to 100.
+            offset (int, optional): The number of matching files to skip. Defaults to 0.
+            case_sensitive (bool, optional): Match the name case sensitively. Defaults to True.
+
+        Returns:
+            List[File]: The matching File objects ordered by name.
+
+        Raises:
+            ValueError: If the search mode is unknown or the pattern is empty.
+            Exception: If any other error occurs during the search.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                query = select(File).where(name_filter(File.file_name, pattern, mode, case_sensitive))
+                if folder_id:
+                    if not folder_is_live(session, folder_id):
+                        logger.error(f"Folder not found: Folder ID: {folder_id}")
+                        raise Exception("Folder not found in the database")
+                    subtree = subtree_folder_ids(folder_id)
+                    query = query.where(File.folder_id.in_(select(subtree.c.folder_id)))
+                else:
+                    query = query.where(File.folder_id.not_in(select(deleted_folder_ids().c.folder_id)))
+                query = query.order_by(File.file_name, File.file_id).limit(limit).offset(offset)
+
+                files = session.execute(query).scalars().all()
+                logger.info(f"Searched files ({mode}: {pattern}, Folder ID: {folder_id}): {len(files)} matches")
+                return files
+            except Exception as e:
+                logger.error(f"Error in search_files: {e}", exc_info=True)
+                raise
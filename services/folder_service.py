@@ -1,17 +1,60 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, update, delete, insert, exists, or_, func, literal, lambda_stmt
+from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import IntegrityError
 from models.folder import Folder
 from database import Database
 from utils.s3_utils import S3Utils
+from utils.query_utils import (name_filter, subtree_folder_ids, subtree_folder_paths, deleted_folder_ids,
+                               folder_is_live, folder_is_inside, fetch_columns, MAX_FOLDER_DEPTH)
+from utils.export_utils import export_table, export_columns, FOLDER_EXPORT_COLUMNS, FILE_EXPORT_COLUMNS
+from utils.report_utils import compute_subtree_aggregates, size_histogram, created_date_distribution, write_report
+from utils.sync_utils import hash_file, walk_directory, split_path, changed_by_metadata, is_safe_name, contained_path
+from utils.change_feed import record_change, record_changes
+from utils.quota_utils import (quota_folder_ids, add_usage, charge_quotas, charge_folder, charge_move, subtree_usage,
+                               quota_to_dict, STORED_SIZE)
+from utils import compression_utils
+from utils.tracing import trace_class, propagate
+from utils.metrics import measure_class
+from models.file import File
+from models.rows import FileRow, FolderRow
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque
+from datetime import datetime, timezone
+import configparser
+import hashlib
+import os
+import sys
+import tarfile
+import tempfile
+import threading
+import zipfile
+import pandas as pd
 from logger import Logger
-from typing import List , Dict
+from typing import List , Dict, Iterator, Tuple
 
 
 logger = Logger.get_logger()
 
+# Read configuration
+config = configparser.ConfigParser()
+config.read('config/config.ini')
+
+# Background purge of deleted folders
+PURGE_ENABLED = config.getboolean('purge', 'enabled', fallback=True)
+PURGE_INTERVAL_SECONDS = config.getfloat('purge', 'interval_seconds', fallback=60)
+PURGE_BATCH_SIZE = config.getint('purge', 'batch_size', fallback=1000)
+
+# Appended to the name of a deleted folder so a new folder can take its name right away
+DELETED_NAME_SUFFIX = '~deleted~'
+
+@trace_class('service')
+@measure_class()
 class FolderService:
     def __init__(self, db: Database):
         self.db = db
+        self._purge_wakeup = threading.Event()
+        self._purge_stop = threading.Event()
+        self._purge_thread = None
 
     def create_folder(self, name: str, parent_id: int = None) -> Folder:
         """
@@ -31,9 +74,14 @@ class FolderService:
             try:
                 if parent_id == 0:
                     parent_id = None
+                if parent_id is not None and not folder_is_live(session, parent_id):
+                    logger.error(f"Parent folder not found: Folder ID: {parent_id}")
+                    raise Exception("Parent folder not found in the database")
 
                 folder = Folder(folder_name=name, folder_parent_id=parent_id)
                 session.add(folder)
+                session.flush()
+                record_change(session, 'create', 'folder', folder.folder_id, parent_id, name=name)
                 session.commit()
                 session.refresh(folder)
                 logger.info(f"Folder created successfully: {name}, Folder ID: {folder.folder_id}")
@@ -60,9 +108,15 @@ class FolderService:
         Raises:
             Exception: If the folder is not found or another error occurs.
         """
-        with self.db.get_db_session() as session:
+        with self.db.get_db_session(read_only=True) as session:
             try:
-                folder = session.query(Folder).options(joinedload(Folder.children), joinedload(Folder.files)).filter_by(folder_id=folder_id).first()
+                if not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+                folder = session.execute(lambda_stmt(
+                    lambda: select(Folder).options(joinedload(Folder.children.and_(Folder.folder_deleted_at.is_(None))), joinedload(Folder.files))
+                    .where(Folder.folder_id == folder_id)
+                )).unique().scalar_one_or_none()
                 if not folder:
                     logger.error(f"Folder not found: Folder ID: {folder_id}")
                     raise Exception("Folder not found in the database")
@@ -75,6 +129,11 @@ class FolderService:
         """
         Move a folder to a new parent folder.
 
+        The folder is locked FOR UPDATE and the ancestor chains of its old and new parents FOR KEY
+        SHARE, so writes below the folder wait for the move and the usage moved between quotas is exact.
+        A folder with a quota of its own moves its counters; any other folder moving between quotas
+        has its subtree summed once, see subtree_usage.
+
         Args:
             folder_id (int): The ID of the folder to move.
             new_parent_id (int): The ID of the new parent folder.
@@ -83,16 +142,34 @@ class FolderService:
             Folder: The moved Folder object.
 
         Raises:
-            Exception: If the folder is not found or another error occurs.
+            Exception: If the folder is not found, the new parent is inside the folder, or another error occurs.
         """
         with self.db.get_db_session() as session:
             try:
-                folder = session.query(Folder).filter_by(folder_id=folder_id).first()
-                if not folder:
+                folder = session.query(Folder).filter_by(folder_id=folder_id).with_for_update().first()
+                if not folder or not folder_is_live(session, folder_id):
                     logger.error(f"Folder not found: Folder ID: {folder_id}")
                     raise Exception("Folder not found in the database")
+                if new_parent_id is not None and not folder_is_live(session, new_parent_id):
+                    logger.error(f"Parent folder not found: Folder ID: {new_parent_id}")
+                    raise Exception("Parent folder not found in the database")
 
+                previous_parent_id = folder.folder_parent_id
+                old_quota_ids = quota_folder_ids(session, previous_parent_id, lock=True)
+                new_quota_ids = quota_folder_ids(session, new_parent_id, lock=True)
+                # The new parent's chain is locked now, so a concurrent move cannot put the folder on it after this check
+                if new_parent_id is not None and folder_is_inside(session, new_parent_id, folder_id):
+                    logger.error(f"Folder ID: {new_parent_id} is inside the moved folder ID: {folder_id}")
+                    raise Exception("A folder cannot be moved into its own subtree")
+                if old_quota_ids != new_quota_ids:
+                    # Only a move between quotas needs the subtree's usage, which a folder with its own quota already keeps
+                    if folder.folder_used_bytes is not None:
+                        size, count = folder.folder_used_bytes, folder.folder_used_files
+                    else:
+                        size, count = subtree_usage(session, folder_id)
+                    charge_move(session, old_quota_ids, new_quota_ids, size, count)
                 folder.folder_parent_id = new_parent_id
+                record_change(session, 'move', 'folder', folder_id, new_parent_id, previous_parent_id, folder.folder_name)
                 session.commit()
                 session.refresh(folder)
                 logger.info(f"Folder moved successfully: Folder ID: {folder_id} to Parent ID: {new_parent_id}")
@@ -106,33 +183,47 @@ class FolderService:
                 logger.error(f"Error in move_folder: {e}", exc_info=True)
                 raise Exception("An error occurred while moving the folder. Please check the logs for details.") from e
 
-    def delete_folder(self, folder_id: int) -> List[dict]:
+    def delete_folder(self, folder_id: int) -> Dict:
         """
-        Delete a folder and all its subfolders and files, returning a list of deleted items.
+        Delete a folder with all its subfolders and files.
+
+        Only the folder itself is marked as deleted (a tombstone), which takes constant time however
+        large the subtree is. From then on reads no longer see the folder or anything below it, and
+        its name is free for a new folder. The rows and S3 objects are removed later in small chunks
+        by purge_deleted_folders, run by the background purger.
 
         Args:
             folder_id (int): The ID of the folder to delete.
 
         Returns:
-            List[Dict]: A list of dictionaries representing the deleted folders and files.
+            Dict: The 'Folder ID', 'Folder Name' and 'Deleted At' of the deleted folder.
 
         Raises:
             Exception: If the folder is not found or another error occurs.
         """
-        deleted_items = []
-
         with self.db.get_db_session() as session:
             try:
-                folder = session.query(Folder).options(joinedload(Folder.files)).filter_by(folder_id=folder_id).first()
-                if not folder:
+                row = session.execute(
+                    select(Folder.folder_name, Folder.folder_parent_id).where(Folder.folder_id == folder_id)
+                ).one_or_none()
+                if row is None or not folder_is_live(session, folder_id):
                     logger.error(f"Folder not found: Folder ID: {folder_id}")
                     raise Exception("Folder not found in the database")
+                folder_name = row.folder_name
 
-                self._delete_folder_recursive(session, folder, deleted_items)
-
+                deleted_at = datetime.now(timezone.utc)
+                suffix = f"{DELETED_NAME_SUFFIX}{folder_id}"
+                session.execute(
+                    update(Folder)
+                    .where(Folder.folder_id == folder_id)
+                    .values(folder_name=folder_name[:255 - len(suffix)] + suffix, folder_deleted_at=deleted_at)
+                )
+                # A single event stands for the whole subtree, like the tombstone itself
+                record_change(session, 'delete', 'folder', folder_id, row.folder_parent_id, name=folder_name)
                 session.commit()
-                logger.info(f"Folder and all subfolders/files deleted successfully: Folder ID: {folder_id}")
-                return deleted_items
+                self._purge_wakeup.set()
+                logger.info(f"Folder marked as deleted: {folder_name}, Folder ID: {folder_id}")
+                return {'Folder ID': folder_id, 'Folder Name': folder_name, 'Deleted At': deleted_at}
             except IntegrityError as e:
                 session.rollback()
                 logger.error(f"Database error occurred: {str(e)}", exc_info=True)
@@ -142,33 +233,163 @@ class FolderService:
                 logger.error(f"Error in delete_folder: {e}", exc_info=True)
                 raise Exception("An error occurred while deleting the folder. Please check the logs for details.") from e
 
-    def _delete_folder_recursive(self, session: Session, folder: Folder, deleted_items: list):
+    def purge_deleted_folders(self, batch_size: int = PURGE_BATCH_SIZE) -> Iterator[Dict]:
         """
-        Recursively delete a folder and its subfolders and files.
+        Remove the rows and S3 objects of deleted subtrees in small chunks, yielding a summary per chunk.
+
+        The folders of each deleted subtree are processed deepest first, batch_size at a time: their
+        files' objects are deleted with batched S3 requests, then the file rows, then the folders, each
+        chunk in its own short transaction. Nothing else is kept between chunks, so an interrupted purge
+        simply continues with the remaining rows on the next run. A subtree whose objects could not all
+        be deleted is left for the next run without removing the rows that still point at them.
+
+        Args:
+            batch_size (int, optional): The number of folders and of files removed per chunk. Defaults to
+                the [purge] batch_size setting.
+
+        Yields:
+            Dict: The 'Folder ID' of the deleted subtree root and the 'Folders Deleted', 'Files Deleted',
+            'Bytes Freed' and 'Failed Objects' of one chunk, and whether the subtree is 'Done'.
+
+        Raises:
+            Exception: If a database error occurs.
+        """
+        with self.db.get_db_session() as session:
+            try:
+                roots = session.execute(
+                    select(Folder.folder_id)
+                    .where(Folder.folder_deleted_at.is_not(None))
+                    .order_by(Folder.folder_deleted_at, Folder.folder_id)
+                ).scalars().all()
+                session.commit()
+
+                for root_id in roots:
+                    # Only the folder IDs are loaded, with descendants before their parents
+                    folder_ids = self._purge_order(session, root_id)
+                    # The subtree's usage stays charged to the quotas above it until its files are purged
+                    parent_id = session.execute(select(Folder.folder_parent_id).where(Folder.folder_id == root_id)).scalar()
+                    quota_ids = quota_folder_ids(session, parent_id)
+                    session.commit()
+                    for start in range(0, len(folder_ids), batch_size):
+                        chunk = folder_ids[start:start + batch_size]
+                        summary = {'Folder ID': root_id, 'Folders Deleted': 0, 'Files Deleted': 0, 'Bytes Freed': 0,
+                                   'Failed Objects': 0, 'Done': False}
+                        while True:
+                            files = session.execute(
+                                select(File.file_id, File.file_s3_key, File.file_s3_bucket, STORED_SIZE.label('stored_size'))
+                                .where(File.folder_id.in_(chunk))
+                                .limit(batch_size)
+                            ).all()
+                            if not files:
+                                break
+                            failed = set(S3Utils.delete_files_from_s3([row.file_s3_key for row in files],
+                                                                      buckets=[row.file_s3_bucket for row in files]))
+                            purged = [row for row in files if row.file_s3_key not in failed]
+                            if purged:
+                                session.execute(delete(File).where(File.file_id.in_([row.file_id for row in purged])))
+                                usage = {}
+                                add_usage(usage, quota_ids, -sum(row.stored_size for row in purged), -len(purged))
+                                charge_quotas(session, usage)
+                            session.commit()
+                            summary['Files Deleted'] += len(purged)
+                            summary['Bytes Freed'] += sum(row.stored_size for row in purged)
+                            summary['Failed Objects'] += len(failed)
+                            if failed:
+                                break
+                        if summary['Failed Objects']:
+                            logger.warning(f"Purge of Folder ID: {root_id} postponed, {summary['Failed Objects']} object(s) could not be deleted")
+                            yield summary
+                            break
+
+                        try:
+                            summary['Folders Deleted'] = session.execute(delete(Folder).where(Folder.folder_id.in_(chunk))).rowcount
+                            session.commit()
+                        except IntegrityError:
+                            # A folder was added to the subtree meanwhile; the next run picks it up
+                            session.rollback()
+                            logger.warning(f"Purge of Folder ID: {root_id} postponed, its subtree changed", exc_info=True)
+                            yield summary
+                            break
+                        summary['Done'] = start + batch_size >= len(folder_ids)
+                        logger.info(f"Purged deleted Folder ID: {root_id}: {summary}")
+                        yield summary
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error in purge_deleted_folders: {e}", exc_info=True)
+                raise Exception("An error occurred while purging deleted folders. Please check the logs for details.") from e
+
+    def _purge_order(self, session, root_id: int) -> List[int]:
+        """
+        List the IDs of a deleted subtree with every folder before its parent.
 
         Args:
             session (Session): The current database session.
-            folder (Folder): The folder to delete.
-            deleted_items (list): The list to store information about deleted items.
+            root_id (int): The ID of the deleted subtree root.
+
+        Returns:
+            List[int]: The folder IDs, deepest first, ending with root_id.
+        """
+        depths = select(Folder.folder_id, literal(0).label('depth')).where(Folder.folder_id == root_id).cte('depths', recursive=True)
+        depths = depths.union_all(
+            select(Folder.folder_id, (depths.c.depth + 1).label('depth')).join(depths, Folder.folder_parent_id == depths.c.folder_id)
+            .where(depths.c.depth < MAX_FOLDER_DEPTH)
+        )
+        return session.execute(select(depths.c.folder_id).order_by(depths.c.depth.desc())).scalars().all()
+
+    def start_purger(self, interval_seconds: float = PURGE_INTERVAL_SECONDS, batch_size: int = PURGE_BATCH_SIZE) -> threading.Thread:
         """
-        for file in folder.files:
-            S3Utils.delete_file_from_s3(file.file_s3_key)
-            session.delete(file)
-            logger.info(f"Deleted file from S3 and database: File ID: {file.file_id}, S3 Key: {file.file_s3_key}")
-            deleted_items.append({'type': 'file', 'id': file.file_id, 'name': file.file_name, 's3_key': file.file_s3_key})
+        Start a daemon thread that purges deleted folders every interval_seconds, and right after a delete.
+
+        Args:
+            interval_seconds (float, optional): The pause between purge runs. Defaults to the [purge] setting.
+            batch_size (int, optional): The chunk size of purge_deleted_folders. Defaults to the [purge] setting.
+
+        Returns:
+            threading.Thread: The purger thread, or the running one if it was already started.
+        """
+        if self._purge_thread is not None and self._purge_thread.is_alive():
+            return self._purge_thread
+        self._purge_stop.clear()
+
+        def run():
+            while not self._purge_stop.is_set():
+                self._purge_wakeup.clear()
+                try:
+                    for _ in self.purge_deleted_folders(batch_size):
+                        if self._purge_stop.is_set():
+                            break
+                except Exception:
+                    # Already logged, try again on the next run
+                    pass
+                self._purge_wakeup.wait(interval_seconds)
 
-        children = session.query(Folder).filter_by(folder_parent_id=folder.folder_id).all()
-        for subfolder in children:
-            self._delete_folder_recursive(session, subfolder, deleted_items)
+        self._purge_thread = threading.Thread(target=run, name='folder-purger', daemon=True)
+        self._purge_thread.start()
+        logger.info(f"Folder purger started, interval: {interval_seconds}s, batch size: {batch_size}")
+        return self._purge_thread
 
-        session.delete(folder)
-        logger.info(f"Deleted folder from database: Folder ID: {folder.folder_id}")
-        deleted_items.append({'type': 'folder', 'id': folder.folder_id, 'name': folder.folder_name})
+    def stop_purger(self, timeout: float = None):
+        """
+        Stop the purger thread after its current chunk.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the thread to finish. Defaults to None (no limit).
+        """
+        if self._purge_thread is None:
+            return
+        self._purge_stop.set()
+        self._purge_wakeup.set()
+        self._purge_thread.join(timeout)
+        self._purge_thread = None
+        logger.info("Folder purger stopped")
 
     def list_files_and_subfolders(self, folder_id: int) -> Dict:
         """
         List all files and subfolders within a specified folder.
 
+        The subtree is read as compact rows by two Core selects (see list_subtree_rows) and nested
+        in one pass, instead of loading every folder and file as ORM instances level by level.
+
         Args:
             folder_id (int): The ID of the folder to list contents for.
 
@@ -178,28 +399,19 @@ class FolderService:
         Raises:
             Exception: If the folder is not found or another error occurs.
         """
-        with self.db.get_db_session() as session:
+        with self.db.get_db_session(read_only=True) as session:
             try:
-                folder = session.query(Folder).options(joinedload(Folder.children), joinedload(Folder.files)).filter_by(folder_id=folder_id).first()
-                if not folder:
-                    logger.error(f"Folder not found: Folder ID: {folder_id}")
-                    raise Exception("Folder not found in the database")
-
-                # Recursive function to fetch all subfolders and files
-                def get_subfolders_and_files(folder):
-                    result = {
-                        'Folder ID': folder.folder_id,
-                        'Folder Name': folder.folder_name,
-                        'Files': [{'File ID': file.file_id, 'File Name': file.file_name, 'File Size': file.file_size} for file in folder.files],
-                        'Subfolders': []
-                    }
-
-                    for child in folder.children:
-                        result['Subfolders'].append(get_subfolders_and_files(child))
+                folders, files = self._subtree_rows(session, folder_id)
 
-                    return result
+                nodes = {row.folder_id: {'Folder ID': row.folder_id, 'Folder Name': row.folder_name, 'Files': [], 'Subfolders': []}
+                         for row in folders}
+                for row in files:
+                    nodes[row.folder_id]['Files'].append({'File ID': row.file_id, 'File Name': row.file_name, 'File Size': row.file_size})
+                for row in folders:
+                    if row.folder_id != folder_id:
+                        nodes[row.folder_parent_id]['Subfolders'].append(nodes[row.folder_id])
 
-                output = get_subfolders_and_files(folder)
+                output = nodes[folder_id]
                 logger.info(f"Listed files and subfolders for folder ID: {folder_id}")
                 return output
             except Exception as e:
@@ -207,10 +419,144 @@ class FolderService:
                 print("Something went wrong while listing files and subfolders. Please check the log file for details.")
                 raise
 
+    def list_subtree_rows(self, folder_id: int) -> Tuple[List[FolderRow], List[FileRow]]:
+        """
+        List a folder's subtree as read-only rows: the folder, every live folder below it and their files.
+
+        The rows come from Core selects, so nothing enters the session's identity map and each row
+        is a single named tuple that stays usable after the session is closed.
+
+        Args:
+            folder_id (int): The ID of the subtree root.
+
+        Returns:
+            Tuple[List[FolderRow], List[FileRow]]: The folders and the files of the subtree, in no particular order.
+
+        Raises:
+            Exception: If the folder is not found or another error occurs.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                folders, files = self._subtree_rows(session, folder_id)
+                logger.info(f"Listed {len(folders)} folders and {len(files)} files of folder ID: {folder_id}")
+                return folders, files
+            except Exception as e:
+                logger.error(f"Error in list_subtree_rows: {e}", exc_info=True)
+                raise Exception("An error occurred while listing the folder. Please check the logs for details.") from e
+
+    def list_file_columns(self, folder_id: int, chunk_size: int = 50000) -> Dict:
+        """
+        List the files of a folder's subtree as column arrays, the most compact form for large listings.
+
+        Rows are streamed through a server-side cursor and converted a chunk at a time, so IDs and
+        sizes cost 8 bytes each and no per-row object outlives its chunk.
+
+        Args:
+            folder_id (int): The ID of the subtree root.
+            chunk_size (int, optional): The number of rows fetched per round trip. Defaults to 50000.
+
+        Returns:
+            Dict: 'file_id', 'file_size' and 'folder_id' as int64 arrays and 'file_name' as an object
+            array, index-aligned, in no particular order.
+
+        Raises:
+            Exception: If the folder is not found or another error occurs.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                if not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+
+                subtree = subtree_folder_ids(folder_id)
+                query = select(File.file_id, File.file_name, File.file_size, File.folder_id).where(
+                    File.folder_id.in_(select(subtree.c.folder_id)))
+                columns = fetch_columns(session, query, chunk_size, dtypes=['int64', None, 'int64', 'int64'])
+                logger.info(f"Listed {len(columns[0])} files of folder ID: {folder_id} as columns")
+                return dict(zip(('file_id', 'file_name', 'file_size', 'folder_id'), columns))
+            except Exception as e:
+                logger.error(f"Error in list_file_columns: {e}", exc_info=True)
+                raise Exception("An error occurred while listing the folder. Please check the logs for details.") from e
+
+    def _subtree_rows(self, session, folder_id: int) -> Tuple[List[FolderRow], List[FileRow]]:
+        if not folder_is_live(session, folder_id):
+            logger.error(f"Folder not found: Folder ID: {folder_id}")
+            raise Exception("Folder not found in the database")
+
+        subtree = subtree_folder_ids(folder_id)
+        folders = session.execute(
+            select(Folder.folder_id, Folder.folder_name, Folder.folder_parent_id).join(subtree, Folder.folder_id == subtree.c.folder_id)
+        )
+        folders = list(map(FolderRow._make, folders))
+        # Fetched in chunks so only one chunk of result rows exists besides the named tuples
+        files = session.execute(
+            select(File.file_id, File.file_name, File.file_size, File.folder_id).where(File.folder_id.in_(select(subtree.c.folder_id))),
+            execution_options={'yield_per': 10000}
+        )
+        return folders, list(map(FileRow._make, files))
+
+    def list_children(self, folder_id: int = None, limit: int = 500, folders_after: str = None,
+                      files_after: str = None) -> Dict:
+        """
+        List one page of the direct subfolders and files of a folder, for lazily expanded tree views.
+
+        Only one level is loaded, and pages are selected by name (keyset pagination) so that each page
+        of a very large folder costs the same index range scan.
+
+        Args:
+            folder_id (int, optional): The ID of the folder, None for the root folders. Defaults to None.
+            limit (int, optional): The maximum number of subfolders and of files per page. Defaults to 500.
+            folders_after (str, optional): Return subfolders named after this name. Defaults to None.
+            files_after (str, optional): Return files named after this name. Defaults to None.
+
+        Returns:
+            Dict: The 'Subfolders' (with a 'Has Children' flag) and 'Files' of the page, and the
+            'More Subfolders' and 'More Files' flags telling whether another page follows.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                if folder_id is not None and not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+
+                child = Folder.__table__.alias('child')
+                has_children = or_(
+                    exists().where(child.c.folder_parent_id == Folder.folder_id, child.c.folder_deleted_at.is_(None)),
+                    exists().where(File.folder_id == Folder.folder_id)
+                )
+                folder_query = select(Folder.folder_id, Folder.folder_name, has_children.label('has_children'))
+                folder_query = folder_query.where(Folder.folder_parent_id.is_(None) if folder_id is None else Folder.folder_parent_id == folder_id,
+                                                  Folder.folder_deleted_at.is_(None))
+                if folders_after is not None:
+                    folder_query = folder_query.where(Folder.folder_name > folders_after)
+                folders = session.execute(folder_query.order_by(Folder.folder_name).limit(limit + 1)).all()
+
+                files = []
+                if folder_id is not None:
+                    file_query = select(File.file_id, File.file_name, File.file_size).where(File.folder_id == folder_id)
+                    if files_after is not None:
+                        file_query = file_query.where(File.file_name > files_after)
+                    files = session.execute(file_query.order_by(File.file_name).limit(limit + 1)).all()
+
+                logger.info(f"Listed children of folder ID: {folder_id}")
+                return {
+                    'Subfolders': [{'Folder ID': row.folder_id, 'Folder Name': row.folder_name, 'Has Children': bool(row.has_children)}
+                                   for row in folders[:limit]],
+                    'Files': [{'File ID': row.file_id, 'File Name': row.file_name, 'File Size': row.file_size} for row in files[:limit]],
+                    'More Subfolders': len(folders) > limit,
+                    'More Files': len(files) > limit
+                }
+            except Exception as e:
+                logger.error(f"Error in list_children: {e}", exc_info=True)
+                raise Exception("An error occurred while listing the folder. Please check the logs for details.") from e
+
     def calculate_folder_size(self, folder_id: int) -> int:
         """
         Calculate the total size of all files within a folder and its subfolders.
 
+        The whole subtree is summed by one query, which the covering idx_file_folder_size index
+        answers without reading the files table.
+
         Args:
             folder_id (int): The ID of the folder for which to calculate the total size.
 
@@ -220,23 +566,856 @@ class FolderService:
         Raises:
             Exception: If the folder is not found in the database or if any other error occurs during calculation.
         """
-        with self.db.get_db_session() as session:
+        with self.db.get_db_session(read_only=True) as session:
             try:
-                folder = session.query(Folder).options(joinedload(Folder.files)).filter_by(folder_id=folder_id).first()
-                if not folder:
+                folder_name = session.execute(select(Folder.folder_name).where(Folder.folder_id == folder_id)).scalar_one_or_none()
+                if folder_name is None or not folder_is_live(session, folder_id):
                     logger.error(f"Folder not found: Folder ID: {folder_id}")
                     raise Exception("Folder not found in the database")
 
-                total_size = sum(file.file_size for file in folder.files)
-                
-                # Fetch and iterate over children explicitly
-                children = session.query(Folder).filter_by(folder_parent_id=folder_id).all()
-                for child in children:
-                    total_size += self.calculate_folder_size(child.folder_id)
-                    
-                logger.info(f"Calculated size for folder ID({folder.folder_name}): {folder_id} is {total_size} bytes")
+                subtree = subtree_folder_ids(folder_id)
+                total_size = session.execute(
+                    select(func.coalesce(func.sum(File.file_size), 0)).where(File.folder_id.in_(select(subtree.c.folder_id)))
+                ).scalar()
+
+                logger.info(f"Calculated size for folder ID({folder_name}): {folder_id} is {total_size} bytes")
                 return total_size
             except Exception as e:
                 logger.error(f"Error in calculate_folder_size: {e}", exc_info=True)
                 print("Something went wrong while calculating the folder size. Please check the log file for details.")
                 raise
+
+    def set_folder_quota(self, folder_id: int, max_bytes: int = None, max_files: int = None) -> Dict:
+        """
+        Limit the bytes and files a folder's subtree may hold, or remove its limits.
+
+        Setting the first limit of a folder sums its subtree once to start the usage counters; from then
+        on create_file, copy_file, move_file, move_folder, copy_folder, sync_directory and the purger keep
+        them up to date in the transaction of each change, and checking a quota reads only the counters
+        of the folder's ancestors. Usage is the stored (compressed) size, and files of deleted folders
+        count until they are purged. A limit below the current usage only blocks further growth.
+
+        Args:
+            folder_id (int): The ID of the folder.
+            max_bytes (int, optional): The byte limit, None for no limit. Defaults to None.
+            max_files (int, optional): The file count limit, None for no limit. Defaults to None.
+                With neither limit the quota is removed.
+
+        Returns:
+            Dict: The folder's limits, usage and remaining room.
+
+        Raises:
+            Exception: If the folder is not found or another error occurs.
+        """
+        with self.db.get_db_session() as session:
+            try:
+                # The row lock keeps concurrent charges out until the counters are set up
+                folder = session.execute(
+                    select(Folder.folder_id, Folder.folder_name, Folder.folder_parent_id, Folder.folder_used_bytes,
+                           Folder.folder_used_files)
+                    .where(Folder.folder_id == folder_id).with_for_update()
+                ).one_or_none()
+                if not folder or not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+
+                values = {'folder_quota_bytes': max_bytes, 'folder_quota_files': max_files,
+                          'folder_used_bytes': folder.folder_used_bytes, 'folder_used_files': folder.folder_used_files}
+                if max_bytes is None and max_files is None:
+                    values['folder_used_bytes'] = values['folder_used_files'] = None
+                elif folder.folder_used_bytes is None:
+                    values['folder_used_bytes'], values['folder_used_files'] = subtree_usage(session, folder_id)
+                session.execute(update(Folder).where(Folder.folder_id == folder_id).values(**values),
+                                execution_options={'synchronize_session': False})
+                record_change(session, 'update', 'folder', folder_id, folder.folder_parent_id, name=folder.folder_name)
+                quota = quota_to_dict(self._quota_row(session, folder_id))
+                session.commit()
+                logger.info(f"Quota set for Folder ID: {folder_id}: {max_bytes} bytes, {max_files} files")
+                return quota
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error in set_folder_quota: {e}", exc_info=True)
+                raise Exception("An error occurred while setting the folder quota. Please check the logs for details.") from e
+
+    def get_folder_quota(self, folder_id: int) -> List[Dict]:
+        """
+        List the quotas that apply to a folder: its own and those of its ancestors.
+
+        Args:
+            folder_id (int): The ID of the folder.
+
+        Returns:
+            List[Dict]: The limits, usage and remaining room of each quota, nearest first. Empty if no quota applies.
+
+        Raises:
+            Exception: If the folder is not found or another error occurs.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                if not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+                quota_ids = quota_folder_ids(session, folder_id)
+                return [quota_to_dict(self._quota_row(session, quota_id)) for quota_id in quota_ids]
+            except Exception as e:
+                logger.error(f"Error in get_folder_quota: {e}", exc_info=True)
+                raise Exception("An error occurred while reading the folder quota. Please check the logs for details.") from e
+
+    def _quota_row(self, session, folder_id: int, for_update: bool = False):
+        """
+        Read the quota columns of a folder.
+
+        Args:
+            session (Session): The current database session.
+            folder_id (int): The ID of the folder.
+            for_update (bool, optional): Lock the row until the transaction ends. Defaults to False.
+
+        Returns:
+            Row: The folder ID, name, limits and usage, or None if the folder does not exist.
+        """
+        query = select(Folder.folder_id, Folder.folder_name, Folder.folder_quota_bytes, Folder.folder_quota_files,
+                       Folder.folder_used_bytes, Folder.folder_used_files).where(Folder.folder_id == folder_id)
+        return session.execute(query.with_for_update() if for_update else query).one_or_none()
+
+    def list_quotas(self) -> List[Dict]:
+        """
+        List every live folder with a quota, read through the partial idx_folder_quota index.
+
+        Returns:
+            List[Dict]: The limits, usage and remaining room of each quota, ordered by folder ID.
+
+        Raises:
+            Exception: If a database error occurs.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                rows = session.execute(
+                    select(Folder.folder_id, Folder.folder_name, Folder.folder_quota_bytes, Folder.folder_quota_files,
+                           Folder.folder_used_bytes, Folder.folder_used_files)
+                    .where(Folder.folder_used_bytes.is_not(None),
+                           Folder.folder_id.not_in(select(deleted_folder_ids().c.folder_id)))
+                    .order_by(Folder.folder_id)
+                ).all()
+                return [quota_to_dict(row) for row in rows]
+            except Exception as e:
+                logger.error(f"Error in list_quotas: {e}", exc_info=True)
+                raise Exception("An error occurred while listing the quotas. Please check the logs for details.") from e
+
+    def recalculate_usage(self, folder_id: int = None) -> List[Dict]:
+        """
+        Recount the usage of quota folders from their subtrees and correct the counters.
+
+        The counters are exact as long as every change goes through the services; this repairs them after
+        changes made directly in the database, or after a file landed in a folder while its quota was
+        being set. Each folder is recounted under a row lock in its own transaction.
+
+        Args:
+            folder_id (int, optional): The quota folder to recount. Defaults to every folder with a quota.
+
+        Returns:
+            List[Dict]: The quotas whose counters changed, with the corrected usage.
+
+        Raises:
+            Exception: If a database error occurs.
+        """
+        with self.db.get_db_session() as session:
+            try:
+                query = select(Folder.folder_id).where(Folder.folder_used_bytes.is_not(None)).order_by(Folder.folder_id)
+                if folder_id is not None:
+                    query = query.where(Folder.folder_id == folder_id)
+                quota_ids = session.execute(query).scalars().all()
+                session.commit()
+
+                corrected = []
+                for quota_id in quota_ids:
+                    folder = self._quota_row(session, quota_id, for_update=True)
+                    if folder is None or folder.folder_used_bytes is None:
+                        session.commit()
+                        continue
+                    size, count = subtree_usage(session, quota_id)
+                    if (size, count) != (folder.folder_used_bytes, folder.folder_used_files):
+                        logger.warning(f"Usage of Folder ID: {quota_id} corrected from {folder.folder_used_bytes} bytes, "
+                                       f"{folder.folder_used_files} files to {size} bytes, {count} files")
+                        session.execute(
+                            update(Folder).where(Folder.folder_id == quota_id).values(folder_used_bytes=size, folder_used_files=count),
+                            execution_options={'synchronize_session': False}
+                        )
+                        corrected.append(quota_to_dict(self._quota_row(session, quota_id)))
+                    session.commit()
+                return corrected
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error in recalculate_usage: {e}", exc_info=True)
+                raise Exception("An error occurred while recalculating the quota usage. Please check the logs for details.") from e
+
+
+    def search_folders(self, pattern: str, mode: str = 'substring', folder_id: int = None,
+                       limit: int = 100, offset: int = 0, case_sensitive: bool = True) -> List[Folder]:
+        """
+        Search folders by name, optionally restricted to the subtree of a folder.
+
+        Args:
+            pattern (str): The text to search for.
+            mode (str, optional): 'prefix', 'substring', 'glob' or 'extension'. Defaults to 'substring'.
+            folder_id (int, optional): Restrict the search to the descendants of this folder. Defaults to None.
+            limit (int, optional): The maximum number of folders to return. Defaults to 100.
+            offset (int, optional): The number of matching folders to skip. Defaults to 0.
+            case_sensitive (bool, optional): Match the name case sensitively. Defaults to True.
+
+        Returns:
+            List[Folder]: The matching Folder objects ordered by name.
+
+        Raises:
+            ValueError: If the search mode is unknown or the pattern is empty.
+            Exception: If any other error occurs during the search.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                query = select(Folder).where(name_filter(Folder.folder_name, pattern, mode, case_sensitive))
+                if folder_id:
+                    if not folder_is_live(session, folder_id):
+                        logger.error(f"Folder not found: Folder ID: {folder_id}")
+                        raise Exception("Folder not found in the database")
+                    subtree = subtree_folder_ids(folder_id)
+                    query = query.where(Folder.folder_id.in_(select(subtree.c.folder_id)), Folder.folder_id != folder_id)
+                else:
+                    query = query.where(Folder.folder_id.not_in(select(deleted_folder_ids().c.folder_id)))
+                query = query.order_by(Folder.folder_name, Folder.folder_id).limit(limit).offset(offset)
+
+                folders = session.execute(query).scalars().all()
+                logger.info(f"Searched folders ({mode}: {pattern}, Folder ID: {folder_id}): {len(folders)} matches")
+                return folders
+            except ValueError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in search_folders: {e}", exc_info=True)
+                raise Exception("An error occurred while searching folders. Please check the logs for details.") from e
+
+
+    def generate_tree_report(self, output_path: str, fmt: str = 'csv', chunk_size: int = 50000) -> str:
+        """
+        Write a du-style report of the whole hierarchy: per-folder and per-subtree sizes and file counts,
+        a file size histogram and the distribution of file creation dates.
+
+        Folders and files are pulled in bulk through server-side cursors into column arrays and every
+        subtree aggregate is computed in one vectorized bottom-up pass instead of one query per folder.
+
+        Args:
+            output_path (str): The path of the report file.
+            fmt (str, optional): 'csv' or 'json'. Defaults to 'csv'.
+            chunk_size (int, optional): The number of rows fetched per round trip. Defaults to 50000.
+
+        Returns:
+            str: The path of the written report.
+
+        Raises:
+            Exception: If an error occurs while reading the hierarchy or writing the report.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                # Subtrees awaiting purge are left out
+                deleted = select(deleted_folder_ids().c.folder_id)
+                folder_ids, folder_names, parent_ids = fetch_columns(
+                    session, select(Folder.folder_id, Folder.folder_name, Folder.folder_parent_id).where(Folder.folder_id.not_in(deleted)), chunk_size)
+                file_folder_ids, file_sizes, file_dates = fetch_columns(
+                    session, select(File.folder_id, File.file_size, File.file_created_date).where(File.folder_id.not_in(deleted)), chunk_size)
+
+                parent_ids = pd.to_numeric(pd.Series(parent_ids)).fillna(-1).to_numpy(dtype='int64')
+                folders = compute_subtree_aggregates(folder_ids, parent_ids, file_folder_ids, file_sizes, folder_names)
+                histogram = size_histogram(file_sizes)
+                dates = created_date_distribution(file_dates)
+
+                write_report(output_path, fmt, folders, histogram, dates)
+                logger.info(f"Tree report written to {output_path}: {len(folders)} folders, {len(file_sizes)} files")
+                return output_path
+            except ValueError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in generate_tree_report: {e}", exc_info=True)
+                raise Exception("An error occurred while generating the tree report. Please check the logs for details.") from e
+
+
+    def export_metadata(self, output_dir: str, fmt: str = 'csv', folder_id: int = None,
+                        chunk_size: int = 50000, extra_columns: bool = False) -> Dict[str, str]:
+        """
+        Export the folders and files tables to folders.<fmt> and files.<fmt>, with the columns of the
+        layout written by utils/datagen_utils.py, so that exports can be reloaded the same way.
+
+        Rows are streamed through server-side cursors and written chunk by chunk, so memory use is
+        bounded by chunk_size rather than by the size of the tree.
+
+        Args:
+            output_dir (str): The directory to write the export files to.
+            fmt (str, optional): 'csv' or 'parquet'. Defaults to 'csv'.
+            folder_id (int, optional): Export only this folder's subtree; its parent ID is written as empty
+                so the export is a self-contained tree. Defaults to None.
+            chunk_size (int, optional): The number of rows fetched and written at a time. Defaults to 50000.
+            extra_columns (bool, optional): Also export the columns outside the datagen layout, such as the
+                compression codec and S3 bucket of each file, after the layout columns. Defaults to False.
+
+        Returns:
+            Dict[str, str]: The paths of the written 'folders' and 'files' exports.
+
+        Raises:
+            Exception: If an error occurs during the export.
+        """
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                # Exported folders are all live, so the tombstone column is left out
+                folder_columns = export_columns(Folder.__table__, FOLDER_EXPORT_COLUMNS, extra_columns, ('folder_deleted_at',))
+                file_columns = export_columns(File.__table__, FILE_EXPORT_COLUMNS, extra_columns)
+                folders_query = select(*folder_columns).order_by(Folder.folder_id)
+                files_query = select(*file_columns).order_by(File.file_id)
+                transform = None
+                if not folder_id:
+                    folders_query = folders_query.where(Folder.folder_id.not_in(select(deleted_folder_ids().c.folder_id)))
+                    files_query = files_query.where(File.folder_id.not_in(select(deleted_folder_ids().c.folder_id)))
+                elif not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+                else:
+                    subtree = subtree_folder_ids(folder_id)
+                    folders_query = folders_query.where(Folder.folder_id.in_(select(subtree.c.folder_id)))
+                    files_query = files_query.where(File.folder_id.in_(select(subtree.c.folder_id)))
+                    parent_index = folder_columns.index(Folder.__table__.c.folder_parent_id)
+                    id_index = folder_columns.index(Folder.__table__.c.folder_id)
+
+                    def transform(rows):
+                        return [tuple(None if i == parent_index and row[id_index] == folder_id else value
+                                      for i, value in enumerate(row)) for row in rows]
+
+                paths = {
+                    'folders': os.path.join(output_dir, f"folders.{fmt}"),
+                    'files': os.path.join(output_dir, f"files.{fmt}")
+                }
+                folder_count = export_table(session, folders_query, folder_columns, paths['folders'], fmt, chunk_size, transform)
+                file_count = export_table(session, files_query, file_columns, paths['files'], fmt, chunk_size)
+                logger.info(f"Exported {folder_count} folders and {file_count} files to {output_dir} ({fmt}, Folder ID: {folder_id})")
+                return paths
+            except (ValueError, ImportError):
+                raise
+            except Exception as e:
+                logger.error(f"Error in export_metadata: {e}", exc_info=True)
+                raise Exception("An error occurred while exporting the metadata. Please check the logs for details.") from e
+
+
+    def _folder_paths(self, folder_rows: list, root_id: int) -> Dict[int, str]:
+        """
+        Compute the path of every folder of a subtree relative to its root.
+
+        Args:
+            folder_rows (list): Rows with folder_id, folder_parent_id and folder_name covering the subtree.
+            root_id (int): The ID of the subtree root.
+
+        Returns:
+            Dict[int, str]: The relative '/' separated path of each folder, '' for the root.
+        """
+        children = {}
+        for row in folder_rows:
+            children.setdefault(row.folder_parent_id, []).append(row)
+        paths = {root_id: ''}
+        stack = [root_id]
+        while stack:
+            parent_id = stack.pop()
+            for child in children.get(parent_id, []):
+                parent_path = paths[parent_id]
+                paths[child.folder_id] = f"{parent_path}/{child.folder_name}" if parent_path else child.folder_name
+                stack.append(child.folder_id)
+        return paths
+
+    def sync_directory(self, local_dir: str, folder_id: int, compare: str = 'metadata', delete_extras: bool = False,
+                       workers: int = 8, batch_size: int = 500) -> Dict[str, int]:
+        """
+        Mirror a local directory tree into a folder, uploading only new or changed files.
+
+        The remote subtree is loaded with two queries and diffed against the local tree by relative path.
+        With compare='metadata' a file is changed if its size differs or it was modified after its last
+        upload; with compare='hash' same-size files are compared by SHA-256, computed in a process pool.
+        New and changed files are uploaded in parallel and their metadata is committed in batches.
+
+        A file that cannot be read or uploaded is counted as failed and the sync goes on. If the sync
+        fails, batches committed before are kept and the objects uploaded for the uncommitted batch,
+        or by uploads still running, are deleted again.
+
+        Args:
+            local_dir (str): The local directory to mirror.
+            folder_id (int): The ID of the target folder.
+            compare (str, optional): 'metadata' or 'hash'. Defaults to 'metadata'.
+            delete_extras (bool, optional): Delete files and folders that do not exist locally. Defaults to False.
+            workers (int, optional): The number of parallel uploads and hashing processes. Defaults to 8.
+            batch_size (int, optional): The number of file records committed per transaction. Defaults to 500.
+
+        Returns:
+            Dict[str, int]: Counts of created folders and uploaded, updated, unchanged, deleted and failed files.
+
+        Raises:
+            ValueError: If the local directory does not exist or the compare mode is unknown.
+            Exception: If the folder is not found or another error occurs.
+        """
+        if compare not in ('metadata', 'hash'):
+            raise ValueError(f"Unknown compare mode: {compare}. Expected 'metadata' or 'hash'")
+        if not os.path.isdir(local_dir):
+            raise ValueError(f"Local directory does not exist: {local_dir}")
+
+        directories, local_files = walk_directory(local_dir)
+        summary = {'folders_created': 0, 'uploaded': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'failed': 0}
+        extra_folder_ids = []
+        # The S3 bucket of each uploaded object whose record is not committed yet, by key
+        uncommitted = {}
+        uncommitted_lock = threading.Lock()
+        aborted = threading.Event()
+
+        with self.db.get_db_session() as session:
+            try:
+                subtree = subtree_folder_ids(folder_id)
+                folder_rows = session.execute(
+                    select(Folder.folder_id, Folder.folder_parent_id, Folder.folder_name)
+                    .where(Folder.folder_id.in_(select(subtree.c.folder_id)))
+                ).all()
+                if not any(row.folder_id == folder_id for row in folder_rows) or not folder_is_live(session, folder_id):
+                    logger.error(f"Folder not found: Folder ID: {folder_id}")
+                    raise Exception("Folder not found in the database")
+                folder_paths = self._folder_paths(folder_rows, folder_id)
+                path_to_folder = {path: path_folder_id for path_folder_id, path in folder_paths.items()}
+
+                # Create missing folders, parents before children
+                for path in sorted(directories - path_to_folder.keys(), key=lambda path: path.count('/')):
+                    parent_path, name = split_path(path)
+                    folder = Folder(folder_name=name, folder_parent_id=path_to_folder[parent_path])
+                    session.add(folder)
+                    session.flush()
+                    record_change(session, 'create', 'folder', folder.folder_id, folder.folder_parent_id, name=name)
+                    path_to_folder[path] = folder.folder_id
+                    summary['folders_created'] += 1
+                session.commit()
+
+                stored = {}
+                stored_rows = session.execute(
+                    select(File.file_id, File.folder_id, File.file_name, File.file_size, STORED_SIZE.label('stored_size'),
+                           File.file_created_date, File.file_content_hash, File.file_s3_key, File.file_s3_bucket)
+                    .where(File.folder_id.in_(select(subtree_folder_ids(folder_id).c.folder_id)))
+                )
+                for row in stored_rows:
+                    folder_path = folder_paths[row.folder_id]
+                    stored[f"{folder_path}/{row.file_name}" if folder_path else row.file_name] = row
+
+                to_upload, to_hash = [], []
+                for path, (local_path, size, modified) in local_files.items():
+                    row = stored.get(path)
+                    if row is None:
+                        to_upload.append((path, None))
+                        continue
+                    if compare == 'hash' and size == row.file_size and row.file_content_hash:
+                        to_hash.append(path)
+                    elif compare == 'hash' or changed_by_metadata(size, modified, row.file_size, row.file_created_date):
+                        to_upload.append((path, row))
+                    else:
+                        summary['unchanged'] += 1
+
+                if to_hash:
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        digests = pool.map(hash_file, [local_files[path][0] for path in to_hash], chunksize=64)
+                        for path, digest in zip(to_hash, digests):
+                            if digest == stored[path].file_content_hash.strip():
+                                summary['unchanged'] += 1
+                            else:
+                                to_upload.append((path, stored[path]))
+
+                def upload(item):
+                    path, _ = item
+                    if aborted.is_set():
+                        return item, None
+                    parent_path, name = split_path(path)
+                    try:
+                        with open(local_files[path][0], 'rb') as local_file:
+                            content = local_file.read()
+                        body, codec = compression_utils.compress(name, content)
+                        s3_key = S3Utils.generate_s3_key(name)
+                        s3_bucket = S3Utils.bucket_for_key(s3_key)
+                        if not S3Utils.upload_file_to_s3(body, name, s3_key, s3_bucket):
+                            return item, None
+                    except Exception as e:
+                        logger.error(f"Error uploading {path} during sync: {e}", exc_info=True)
+                        return item, None
+                    with uncommitted_lock:
+                        uncommitted[s3_key] = s3_bucket
+                    return item, {
+                        'file_name': name,
+                        'file_size': len(content),
+                        'folder_id': path_to_folder[parent_path],
+                        'file_created_date': datetime.now(timezone.utc),
+                        'file_s3_key': s3_key,
+                        'file_s3_bucket': s3_bucket,
+                        'file_codec': codec,
+                        'file_stored_size': len(body) if codec else None,
+                        'file_content_hash': hashlib.sha256(content).hexdigest()
+                    }
+
+                replaced = []
+                created = []
+                batch_keys = []
+                usage = {}
+                folder_quotas = {}
+                pending = 0
+
+                # Quota chains are locked per transaction, so they are looked up again after every commit
+                def quotas_of(target_id):
+                    if target_id not in folder_quotas:
+                        folder_quotas[target_id] = quota_folder_ids(session, target_id, lock=True)
+                    return folder_quotas[target_id]
+
+                def commit_batch():
+                    # A batch exceeding a quota fails the sync; batches committed before it are kept
+                    charge_quotas(session, usage)
+                    usage.clear()
+                    # New files get their IDs from the flush, in time for their changelog rows
+                    session.flush()
+                    record_changes(session, [
+                        {'change_operation': 'create', 'change_entity': 'file', 'change_entity_id': file.file_id,
+                         'change_folder_id': file.folder_id, 'change_previous_folder_id': None, 'change_name': file.file_name}
+                        for file in created
+                    ])
+                    created.clear()
+                    session.commit()
+                    folder_quotas.clear()
+                    with uncommitted_lock:
+                        for s3_key in batch_keys:
+                            uncommitted.pop(s3_key, None)
+                    batch_keys.clear()
+                    # Objects of replaced files are only removed once the new records are committed
+                    S3Utils.delete_files_from_s3([row.file_s3_key for row in replaced],
+                                                 buckets=[row.file_s3_bucket for row in replaced])
+                    replaced.clear()
+
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    try:
+                        for (path, row), values in pool.map(propagate(upload), to_upload):
+                            if values is None:
+                                logger.error(f"Failed to upload file during sync: {path}")
+                                summary['failed'] += 1
+                                continue
+                            batch_keys.append(values['file_s3_key'])
+                            add_usage(usage, quotas_of(values['folder_id']),
+                                      (values['file_stored_size'] or values['file_size']) - (row.stored_size if row else 0),
+                                      0 if row else 1)
+                            if row is None:
+                                created.append(File(**values))
+                                session.add(created[-1])
+                                summary['uploaded'] += 1
+                            else:
+                                session.execute(update(File).where(File.file_id == row.file_id).values(**values))
+                                record_change(session, 'update', 'file', row.file_id, row.folder_id, name=row.file_name)
+                                replaced.append(row)
+                                summary['updated'] += 1
+                            pending += 1
+                            if pending >= batch_size:
+                                commit_batch()
+                                pending = 0
+                    except BaseException:
+                        # Uploads that have not started yet are skipped
+                        aborted.set()
+                        raise
+                commit_batch()
+
+                if delete_extras:
+                    extra_files = [row for path, row in stored.items()
+                                   if path not in local_files and split_path(path)[0] in directories]
+                    for start in range(0, len(extra_files), batch_size):
+                        batch = extra_files[start:start + batch_size]
+                        session.execute(delete(File).where(File.file_id.in_([row.file_id for row in batch])))
+                        for row in batch:
+                            add_usage(usage, quotas_of(row.folder_id), -row.stored_size, -1)
+                        charge_quotas(session, usage)
+                        usage.clear()
+                        record_changes(session, [
+                            {'change_operation': 'delete', 'change_entity': 'file', 'change_entity_id': row.file_id,
+                             'change_folder_id': row.folder_id, 'change_previous_folder_id': None, 'change_name': row.file_name}
+                            for row in batch
+                        ])
+                        session.commit()
+                        folder_quotas.clear()
+                        S3Utils.delete_files_from_s3([row.file_s3_key for row in batch],
+                                                     buckets=[row.file_s3_bucket for row in batch])
+                        summary['deleted'] += len(batch)
+                    extra_folder_ids = [path_folder_id for path, path_folder_id in path_to_folder.items()
+                                        if path not in directories and split_path(path)[0] in directories]
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error in sync_directory: {e}", exc_info=True)
+                if uncommitted:
+                    S3Utils.delete_files_from_s3(list(uncommitted), buckets=list(uncommitted.values()))
+                raise Exception("An error occurred while syncing the directory. Please check the logs for details.") from e
+
+        # Whole folders that no longer exist locally are removed with their contents
+        for extra_folder_id in extra_folder_ids:
+            self.delete_folder(extra_folder_id)
+            summary['deleted'] += 1
+
+        logger.info(f"Synced {local_dir} into Folder ID: {folder_id}: {summary}")
+        return summary
+
+
+    def download_folder(self, folder_id: int, dest: str, archive: str = None, workers: int = 8,
+                        spool_bytes: int = 8 * 1024 * 1024) -> Dict:
+        """
+        Download a folder and everything below it, recreating the directory layout locally or
+        writing a streaming tar or zip archive.
+
+        The subtree with every file's relative path is resolved in one query. Objects are fetched by
+        a pool of workers and decompressed chunk by chunk; for archives, at most `workers` objects are
+        prefetched ahead of the archive writer, each spooled to disk beyond spool_bytes, so memory
+        stays bounded regardless of object sizes.
+
+        Names are checked before anything is written: a folder or file name that is empty, '.', '..' or
+        contains a path separator fails the download, and every local path must resolve inside dest.
+
+        Args:
+            folder_id (int): The ID of the folder to download.
+            dest (str): The local directory, or for archives the archive path or '-' for stdout.
+            archive (str, optional): None to write a directory tree, 'tar' or 'zip'. Defaults to None.
+            workers (int, optional): The number of concurrent object downloads. Defaults to 8.
+            spool_bytes (int, optional): In-memory limit per prefetched archive member. Defaults to 8 MiB.
+
+        Returns:
+            Dict: The destination and the number of folders, files and bytes written.
+
+        Raises:
+            ValueError: If the archive format is unknown.
+            Exception: If the folder is not found, contains unsafe names, or a download fails.
+        """
+        if archive not in (None, 'tar', 'zip'):
+            raise ValueError(f"Unknown archive format: {archive}. Expected 'tar' or 'zip'")
+
+        with self.db.get_db_session(read_only=True) as session:
+            try:
+                paths = subtree_folder_paths(folder_id)
+                rows = [] if not folder_is_live(session, folder_id) else session.execute(
+                    select(paths.c.path, Folder.folder_name, File.file_name, File.file_s3_key, File.file_s3_bucket,
+                           File.file_codec, STORED_SIZE.label('stored_size'))
+                    .select_from(paths)
+                    .join(Folder, Folder.folder_id == paths.c.folder_id)
+                    .outerjoin(File, File.folder_id == paths.c.folder_id)
+                    .order_by(paths.c.path, File.file_name)
+                ).all()
+            except Exception as e:
+                logger.error(f"Error in download_folder: {e}", exc_info=True)
+                raise Exception("An error occurred while resolving the folder. Please check the logs for details.") from e
+        if not rows:
+            logger.error(f"Folder not found: Folder ID: {folder_id}")
+            raise Exception("Folder not found in the database")
+
+        folder_paths = sorted({row.path for row in rows})
+        files = [row for row in rows if row.file_s3_key is not None]
+        # Paths are built from the names below the root, so checking each name covers every path
+        unsafe = sorted({row.folder_name for row in rows if row.path and not is_safe_name(row.folder_name)} |
+                        {row.file_name for row in files if not is_safe_name(row.file_name)})
+        if unsafe:
+            logger.error(f"Unsafe folder or file names below Folder ID: {folder_id}: {unsafe}")
+            raise Exception("The folder contains names that cannot be written safely. Please check the logs for details.")
+        summary = {'destination': dest, 'folders': len(folder_paths), 'files': len(files), 'bytes': 0}
+
+        def fetch(row, destination):
+            body = S3Utils.download_fileobj_from_s3(row.file_s3_key, row.stored_size, row.file_s3_bucket)
+            if body is None:
+                raise Exception(f"Failed to download file from S3: {row.file_s3_key}")
+            try:
+                return compression_utils.decompress_stream(body, destination, row.file_codec)
+            finally:
+                body.close()
+
+        def member_name(row):
+            return f"{row.path}/{row.file_name}" if row.path else row.file_name
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            if archive is None:
+                for path in folder_paths:
+                    os.makedirs(contained_path(dest, path), exist_ok=True)
+
+                def fetch_to_disk(row):
+                    with open(contained_path(dest, member_name(row)), 'wb') as local_file:
+                        return fetch(row, local_file)
+
+                summary['bytes'] = sum(pool.map(propagate(fetch_to_disk), files))
+            else:
+                def fetch_to_spool(row):
+                    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+                    size = fetch(row, spool)
+                    spool.seek(0)
+                    return spool, size
+
+                output = sys.stdout.buffer if dest == '-' else open(dest, 'wb')
+                try:
+                    writer = tarfile.open(fileobj=output, mode='w|') if archive == 'tar' else zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+                    with writer:
+                        for path in folder_paths:
+                            if path:
+                                self._add_archive_directory(writer, path)
+                        # Keep a bounded window of prefetched members and write them in order
+                        window = deque()
+                        remaining = iter(files)
+                        for row in remaining:
+                            window.append((row, pool.submit(propagate(fetch_to_spool), row)))
+                            if len(window) >= workers:
+                                break
+                        while window:
+                            row, future = window.popleft()
+                            next_row = next(remaining, None)
+                            if next_row is not None:
+                                window.append((next_row, pool.submit(propagate(fetch_to_spool), next_row)))
+                            spool, size = future.result()
+                            with spool:
+                                self._add_archive_member(writer, member_name(row), spool, size)
+                            summary['bytes'] += size
+                finally:
+                    if output is not sys.stdout.buffer:
+                        output.close()
+                    else:
+                        output.flush()
+
+        logger.info(f"Folder downloaded: Folder ID: {folder_id} to {dest}: {summary}")
+        return summary
+
+    def _add_archive_directory(self, writer, path: str):
+        """
+        Add a directory entry to a tar or zip archive.
+        """
+        if isinstance(writer, tarfile.TarFile):
+            info = tarfile.TarInfo(path)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            writer.addfile(info)
+        else:
+            writer.writestr(zipfile.ZipInfo(f"{path}/"), b'')
+
+    def _add_archive_member(self, writer, name: str, source, size: int):
+        """
+        Stream a file into a tar or zip archive.
+        """
+        if isinstance(writer, tarfile.TarFile):
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mode = 0o644
+            writer.addfile(info, source)
+        else:
+            with writer.open(name, 'w', force_zip64=True) as member:
+                while chunk := source.read(1024 * 1024):
+                    member.write(chunk)
+
+
+    def copy_folder(self, src_id: int, dest_parent_id: int, workers: int = 16, batch_size: int = 5000) -> Folder:
+        """
+        Copy a folder and its whole subtree under another parent folder.
+
+        Objects are copied inside S3 in parallel (CopyObject, or UploadPartCopy for large objects), so no
+        content passes through this process. Folder records are inserted one tree level per statement and
+        file records in bulk batches, all in one transaction that is only committed once every object copy
+        succeeded; on failure the copied objects are removed again.
+
+        Args:
+            src_id (int): The ID of the folder to copy.
+            dest_parent_id (int): The ID of the folder receiving the copy.
+            workers (int, optional): The number of concurrent object copies. Defaults to 16.
+            batch_size (int, optional): The number of file records per insert statement. Defaults to 5000.
+
+        Returns:
+            Folder: The root Folder object of the copy.
+
+        Raises:
+            Exception: If the folder is not found, a folder with the same name exists under the destination,
+            or an object copy fails.
+        """
+        copied_keys, copied_buckets = [], []
+        with self.db.get_db_session() as session:
+            try:
+                subtree = subtree_folder_ids(src_id)
+                folder_rows = session.execute(
+                    select(Folder.folder_id, Folder.folder_parent_id, Folder.folder_name)
+                    .where(Folder.folder_id.in_(select(subtree.c.folder_id)))
+                ).all()
+                if not any(row.folder_id == src_id for row in folder_rows) or not folder_is_live(session, src_id):
+                    logger.error(f"Folder not found: Folder ID: {src_id}")
+                    raise Exception("Folder not found in the database")
+                if not folder_is_live(session, dest_parent_id):
+                    logger.error(f"Parent folder not found: Folder ID: {dest_parent_id}")
+                    raise Exception("Parent folder not found in the database")
+                if any(row.folder_id == dest_parent_id for row in folder_rows):
+                    raise Exception("A folder cannot be copied into its own subtree")
+
+                file_rows = session.execute(
+                    select(File.folder_id, File.file_name, File.file_size, File.file_s3_key, File.file_s3_bucket,
+                           File.file_codec, File.file_stored_size, File.file_content_hash)
+                    .where(File.folder_id.in_(select(subtree_folder_ids(src_id).c.folder_id)))
+                ).all()
+
+                # Copy the objects first so that no committed record ever points at a missing object
+                new_keys = [S3Utils.generate_s3_key(row.file_name) for row in file_rows]
+                new_buckets = [S3Utils.bucket_for_key(key) for key in new_keys]
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(propagate(S3Utils.copy_file_in_s3), [row.file_s3_key for row in file_rows], new_keys,
+                                            [row.file_s3_bucket for row in file_rows], new_buckets))
+                copied_keys = [key for key in results if key]
+                copied_buckets = [bucket for key, bucket in zip(results, new_buckets) if key]
+                if len(copied_keys) != len(file_rows):
+                    raise Exception(f"Failed to copy {len(file_rows) - len(copied_keys)} object(s) in S3")
+
+                # Insert the folders level by level so every parent has its new ID before its children
+                children = {}
+                for row in folder_rows:
+                    children.setdefault(row.folder_parent_id, []).append(row)
+                new_ids = {}
+                level = [row for row in folder_rows if row.folder_id == src_id]
+                while level:
+                    values = [{
+                        'folder_name': row.folder_name,
+                        'folder_parent_id': dest_parent_id if row.folder_id == src_id else new_ids[row.folder_parent_id]
+                    } for row in level]
+                    inserted = session.execute(
+                        insert(Folder).returning(Folder.folder_id, sort_by_parameter_order=True), values
+                    ).scalars().all()
+                    new_ids.update(zip((row.folder_id for row in level), inserted))
+                    record_changes(session, [
+                        {'change_operation': 'create', 'change_entity': 'folder', 'change_entity_id': new_id,
+                         'change_folder_id': value['folder_parent_id'], 'change_previous_folder_id': None,
+                         'change_name': value['folder_name']}
+                        for new_id, value in zip(inserted, values)
+                    ])
+                    level = [child for row in level for child in children.get(row.folder_id, [])]
+
+                created_date = datetime.now(timezone.utc)
+                for start in range(0, len(file_rows), batch_size):
+                    values = [{
+                        'file_name': row.file_name,
+                        'file_size': row.file_size,
+                        'folder_id': new_ids[row.folder_id],
+                        'file_created_date': created_date,
+                        'file_s3_key': new_key,
+                        'file_s3_bucket': new_bucket,
+                        'file_codec': row.file_codec,
+                        'file_stored_size': row.file_stored_size,
+                        'file_content_hash': row.file_content_hash
+                    } for row, new_key, new_bucket in zip(file_rows[start:start + batch_size],
+                                                          new_keys[start:start + batch_size],
+                                                          new_buckets[start:start + batch_size])]
+                    inserted = session.execute(
+                        insert(File).returning(File.file_id, sort_by_parameter_order=True), values
+                    ).scalars().all()
+                    record_changes(session, [
+                        {'change_operation': 'create', 'change_entity': 'file', 'change_entity_id': new_id,
+                         'change_folder_id': value['folder_id'], 'change_previous_folder_id': None,
+                         'change_name': value['file_name']}
+                        for new_id, value in zip(inserted, values)
+                    ])
+                charge_folder(session, dest_parent_id, sum(row.file_stored_size or row.file_size for row in file_rows), len(file_rows))
+
+                session.commit()
+                copy = session.get(Folder, new_ids[src_id])
+                logger.info(f"Folder copied successfully: Folder ID: {src_id} to Parent ID: {dest_parent_id}, "
+                            f"new Folder ID: {copy.folder_id} ({len(new_ids)} folders, {len(file_rows)} files)")
+                return copy
+            except Exception as e:
+                session.rollback()
+                S3Utils.delete_files_from_s3(copied_keys, buckets=copied_buckets)
+                logger.error(f"Error in copy_folder: {e}", exc_info=True)
+                if isinstance(e, IntegrityError):
+                    raise Exception("Database integrity error occurred. Please check the logs for details.") from e
+                raise Exception("An error occurred while copying the folder. Please check the logs for details.") from e
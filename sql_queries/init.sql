@@ -1,14 +1,26 @@
+-- Trigram operator classes used by the name search indexes
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Drop tables if they exist
+DROP TABLE IF EXISTS changes;
 DROP TABLE IF EXISTS files;
 DROP TABLE IF EXISTS folders;
 
 -- Create the folders table
 -- unique_folder_name_per_parent: Ensures that within the same parent folder, folder names are unique.
 -- no_self_reference: Prevents a folder from being its own parent.
+-- folder_deleted_at: Set when a folder is deleted; it and its subtree are hidden until purged in the background
+-- folder_quota_bytes, folder_quota_files: Optional limits for the folder's subtree (NULL for no limit)
+-- folder_used_bytes, folder_used_files: Usage of the subtree, kept up to date only for folders with a quota
 CREATE TABLE folders (
     folder_id SERIAL PRIMARY KEY,
     folder_name VARCHAR(255) NOT NULL,
     folder_parent_id INTEGER,
+    folder_deleted_at TIMESTAMP,
+    folder_quota_bytes BIGINT,
+    folder_quota_files INTEGER,
+    folder_used_bytes BIGINT,
+    folder_used_files INTEGER,
     FOREIGN KEY (folder_parent_id) REFERENCES folders (folder_id),
     CONSTRAINT unique_folder_name_per_parent UNIQUE (folder_parent_id, folder_name),
     CONSTRAINT no_self_reference CHECK (folder_id <> folder_parent_id)
@@ -20,6 +32,10 @@ CREATE UNIQUE INDEX unique_root_folder ON folders ((folder_parent_id IS NULL)) W
 
 -- Create the files table with ON DELETE CASCADE
 -- ON DELETE CASCADE: Ensures that when a folder is deleted, all files within that folder are also deleted.
+-- file_size: Number of bytes of the content; file_stored_size: Number of bytes stored in S3 if compressed, NULL if stored as is
+-- file_codec: Compression codec of the stored object ('gzip' or 'zstd'), NULL if stored as is
+-- file_content_hash: SHA-256 hex digest of the original content, used to detect changes when syncing
+-- file_s3_bucket: Bucket holding the object, NULL for the default bucket of config.ini
 CREATE TABLE files (
     file_id SERIAL PRIMARY KEY,
     file_name VARCHAR(255) NOT NULL,
@@ -27,16 +43,51 @@ CREATE TABLE files (
     file_created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     folder_id INTEGER NOT NULL,
     file_s3_key VARCHAR(255) NOT NULL UNIQUE,
+    file_s3_bucket VARCHAR(63),
+    file_codec VARCHAR(16),
+    file_stored_size INTEGER,
+    file_content_hash CHAR(64),
     CONSTRAINT unique_file_name_per_folder UNIQUE (folder_id, file_name),
     FOREIGN KEY (folder_id) REFERENCES folders (folder_id) ON DELETE CASCADE
 );
 
 -- Create indexes for the folders table
--- idx_folder_parent_id: Index on folder_parent_id to improve query performance when searching by parent folder
-CREATE INDEX idx_folder_parent_id ON folders (folder_parent_id);
+-- Lookups by parent folder and child listings ordered by name use the (folder_parent_id, folder_name)
+-- index of unique_folder_name_per_parent, so no separate folder_parent_id index is needed
+-- idx_folder_deleted_at: Partial index finding the deleted folders that still await purging
+-- idx_folder_quota: Partial index listing the folders with a quota
+CREATE INDEX idx_folder_deleted_at ON folders (folder_deleted_at) WHERE folder_deleted_at IS NOT NULL;
+CREATE INDEX idx_folder_quota ON folders (folder_id) WHERE folder_used_bytes IS NOT NULL;
+
+-- Name search indexes for the folders table
+-- idx_folder_name_pattern: Serves anchored prefix searches (LIKE 'abc%') independent of the collation
+-- idx_folder_name_trgm: Serves substring, glob and extension searches (LIKE '%abc%')
+CREATE INDEX idx_folder_name_pattern ON folders (folder_name text_pattern_ops);
+CREATE INDEX idx_folder_name_trgm ON folders USING gin (folder_name gin_trgm_ops);
 
 -- Create indexes for the files table
--- idx_file_folder_id: Index on folder_id to improve query performance when searching by folder
--- idx_file_s3_key: Index on file_s3_key to improve query performance when searching by S3 key
-CREATE INDEX idx_file_folder_id ON files (folder_id);
-CREATE INDEX idx_file_s3_key ON files (file_s3_key);
+-- Lookups by folder use the (folder_id, file_name) index of unique_file_name_per_folder and lookups by
+-- S3 key use the index of the UNIQUE constraint on file_s3_key
+-- idx_file_folder_size: Covers the per-folder size aggregation (SUM(file_size) ... WHERE/GROUP BY folder_id)
+-- with an index-only scan
+CREATE INDEX idx_file_folder_size ON files (folder_id) INCLUDE (file_size);
+
+-- Name search indexes for the files table
+-- idx_file_name_pattern: Serves anchored prefix searches (LIKE 'abc%') independent of the collation
+-- idx_file_name_trgm: Serves substring, glob and extension searches (LIKE '%abc%')
+CREATE INDEX idx_file_name_pattern ON files (file_name text_pattern_ops);
+CREATE INDEX idx_file_name_trgm ON files USING gin (file_name gin_trgm_ops);
+
+-- Create the changes table, the changelog of every mutation made through the services
+-- Rows are appended in the transaction of the change; change_id increases in commit order and is the
+-- resume token of changes_since. It has no foreign keys, so it outlives the rows it describes.
+CREATE TABLE changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    change_time TIMESTAMP NOT NULL,
+    change_operation VARCHAR(16) NOT NULL,
+    change_entity VARCHAR(16) NOT NULL,
+    change_entity_id INTEGER NOT NULL,
+    change_folder_id INTEGER,
+    change_previous_folder_id INTEGER,
+    change_name VARCHAR(255)
+);
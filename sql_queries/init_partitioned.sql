@@ -0,0 +1,114 @@
+-- Variant of init.sql with the files table hash partitioned by folder_id into 16 partitions
+-- (set files_partitioning = hash and files_partitions = 16 in config.ini). Requires PostgreSQL 13 or later.
+-- To partition an existing database online instead, run: python -m utils.partition_utils migrate --scheme hash
+--
+-- Why hash by folder_id: listings, per-folder size aggregation and folder deletes filter on folder_id, so
+-- they are pruned to one partition, and vacuum and index maintenance work on 16 smaller tables.
+-- Lookups by file_id alone (get_file) probe every partition's primary key index.
+-- For range partitioning by file_created_date use: python -m utils.partition_utils migrate --scheme range
+-- (monthly partitions plus a DEFAULT partition; create upcoming months with the 'extend' command).
+
+-- Trigram operator classes used by the name search indexes
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Drop tables if they exist
+DROP TABLE IF EXISTS changes;
+DROP TABLE IF EXISTS files;
+DROP TABLE IF EXISTS folders;
+
+-- Create the folders table (unchanged from init.sql)
+CREATE TABLE folders (
+    folder_id SERIAL PRIMARY KEY,
+    folder_name VARCHAR(255) NOT NULL,
+    folder_parent_id INTEGER,
+    folder_deleted_at TIMESTAMP,
+    folder_quota_bytes BIGINT,
+    folder_quota_files INTEGER,
+    folder_used_bytes BIGINT,
+    folder_used_files INTEGER,
+    FOREIGN KEY (folder_parent_id) REFERENCES folders (folder_id),
+    CONSTRAINT unique_folder_name_per_parent UNIQUE (folder_parent_id, folder_name),
+    CONSTRAINT no_self_reference CHECK (folder_id <> folder_parent_id)
+);
+
+CREATE UNIQUE INDEX unique_root_folder ON folders ((folder_parent_id IS NULL)) WHERE folder_parent_id IS NULL;
+CREATE INDEX idx_folder_deleted_at ON folders (folder_deleted_at) WHERE folder_deleted_at IS NOT NULL;
+CREATE INDEX idx_folder_quota ON folders (folder_id) WHERE folder_used_bytes IS NOT NULL;
+CREATE INDEX idx_folder_name_pattern ON folders (folder_name text_pattern_ops);
+CREATE INDEX idx_folder_name_trgm ON folders USING gin (folder_name gin_trgm_ops);
+
+-- Create the partitioned files table
+-- The primary key and unique constraints of a partitioned table must contain the partition key, so the primary
+-- key is (file_id, folder_id). unique_file_name_per_folder already contains folder_id and stays a constraint;
+-- the uniqueness of file_s3_key is enforced by the files_check_unique trigger below.
+CREATE TABLE files (
+    file_id SERIAL,
+    file_name VARCHAR(255) NOT NULL,
+    file_size INTEGER NOT NULL,
+    file_created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    folder_id INTEGER NOT NULL,
+    file_s3_key VARCHAR(255) NOT NULL,
+    file_s3_bucket VARCHAR(63),
+    file_codec VARCHAR(16),
+    file_stored_size INTEGER,
+    file_content_hash CHAR(64),
+    PRIMARY KEY (file_id, folder_id),
+    CONSTRAINT unique_file_name_per_folder UNIQUE (folder_id, file_name),
+    FOREIGN KEY (folder_id) REFERENCES folders (folder_id) ON DELETE CASCADE
+) PARTITION BY HASH (folder_id);
+
+-- Indexes created on the parent are created on every partition
+-- idx_file_folder_size: Covers the per-folder size aggregation with an index-only scan
+-- idx_file_s3_key: Without the unique constraint nothing else indexes file_s3_key, and the trigger looks it up
+CREATE INDEX idx_file_folder_size ON files (folder_id) INCLUDE (file_size);
+CREATE INDEX idx_file_s3_key ON files (file_s3_key);
+CREATE INDEX idx_file_name_pattern ON files (file_name text_pattern_ops);
+CREATE INDEX idx_file_name_trgm ON files USING gin (file_name gin_trgm_ops);
+
+-- Partitions
+CREATE TABLE IF NOT EXISTS files_p0 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 0);
+CREATE TABLE IF NOT EXISTS files_p1 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 1);
+CREATE TABLE IF NOT EXISTS files_p2 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 2);
+CREATE TABLE IF NOT EXISTS files_p3 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 3);
+CREATE TABLE IF NOT EXISTS files_p4 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 4);
+CREATE TABLE IF NOT EXISTS files_p5 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 5);
+CREATE TABLE IF NOT EXISTS files_p6 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 6);
+CREATE TABLE IF NOT EXISTS files_p7 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 7);
+CREATE TABLE IF NOT EXISTS files_p8 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 8);
+CREATE TABLE IF NOT EXISTS files_p9 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 9);
+CREATE TABLE IF NOT EXISTS files_p10 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 10);
+CREATE TABLE IF NOT EXISTS files_p11 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 11);
+CREATE TABLE IF NOT EXISTS files_p12 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 12);
+CREATE TABLE IF NOT EXISTS files_p13 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 13);
+CREATE TABLE IF NOT EXISTS files_p14 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 14);
+CREATE TABLE IF NOT EXISTS files_p15 PARTITION OF files FOR VALUES WITH (MODULUS 16, REMAINDER 15);
+
+-- Uniqueness of file_s3_key across partitions
+CREATE OR REPLACE FUNCTION files_check_unique() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.file_s3_key <> OLD.file_s3_key THEN
+        PERFORM pg_advisory_xact_lock(hashtext(NEW.file_s3_key));
+        IF EXISTS (SELECT 1 FROM files WHERE file_s3_key = NEW.file_s3_key AND file_id <> NEW.file_id) THEN
+            RAISE EXCEPTION 'duplicate key value violates unique constraint "files_file_s3_key_key"'
+                USING ERRCODE = 'unique_violation', CONSTRAINT = 'files_file_s3_key_key';
+        END IF;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS files_check_unique ON files;
+CREATE TRIGGER files_check_unique BEFORE INSERT OR UPDATE ON files FOR EACH ROW EXECUTE FUNCTION files_check_unique();
+
+-- Create the changes table, the changelog of every mutation made through the services
+-- Rows are appended in the transaction of the change; change_id increases in commit order and is the
+-- resume token of changes_since. It has no foreign keys, so it outlives the rows it describes.
+CREATE TABLE changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    change_time TIMESTAMP NOT NULL,
+    change_operation VARCHAR(16) NOT NULL,
+    change_entity VARCHAR(16) NOT NULL,
+    change_entity_id INTEGER NOT NULL,
+    change_folder_id INTEGER,
+    change_previous_folder_id INTEGER,
+    change_name VARCHAR(255)
+);
@@ -0,0 +1,79 @@
+-- Schema for the embedded SQLite backend ([database] dialect = sqlite)
+-- The application creates these tables itself on startup (see [sqlite] create_tables); this script
+-- is for provisioning a database file by hand: sqlite3 clientfiledb.sqlite < sql_queries/init_sqlite.sql
+
+-- WAL lets readers run while a write is in progress and is a persistent property of the database file
+PRAGMA journal_mode = WAL;
+-- Foreign keys (and therefore ON DELETE CASCADE) are off by default in SQLite and enabled per connection
+PRAGMA foreign_keys = ON;
+
+-- Drop tables if they exist
+DROP TABLE IF EXISTS changes;
+DROP TABLE IF EXISTS files;
+DROP TABLE IF EXISTS folders;
+
+-- Create the folders table
+-- INTEGER PRIMARY KEY: Aliases the rowid and is assigned automatically, the equivalent of SERIAL
+-- unique_folder_name_per_parent: Ensures that within the same parent folder, folder names are unique.
+-- no_self_reference: Prevents a folder from being its own parent.
+CREATE TABLE folders (
+    folder_id INTEGER PRIMARY KEY,
+    folder_name VARCHAR(255) NOT NULL,
+    folder_parent_id INTEGER,
+    folder_deleted_at TIMESTAMP,
+    folder_quota_bytes BIGINT,
+    folder_quota_files INTEGER,
+    folder_used_bytes BIGINT,
+    folder_used_files INTEGER,
+    FOREIGN KEY (folder_parent_id) REFERENCES folders (folder_id) ON DELETE CASCADE,
+    CONSTRAINT unique_folder_name_per_parent UNIQUE (folder_parent_id, folder_name),
+    CONSTRAINT no_self_reference CHECK (folder_id <> folder_parent_id)
+);
+
+-- Ensure only one root folder
+-- unique_root_folder: SQLite supports partial indexes on expressions, so this is the same index as in init.sql
+CREATE UNIQUE INDEX unique_root_folder ON folders (folder_parent_id IS NULL) WHERE folder_parent_id IS NULL;
+
+-- Create the files table with ON DELETE CASCADE
+-- file_size: Number of bytes of the content; file_stored_size: Number of bytes stored in S3 if compressed, NULL if stored as is
+-- file_codec: Compression codec of the stored object ('gzip' or 'zstd'), NULL if stored as is
+-- file_content_hash: SHA-256 hex digest of the original content, used to detect changes when syncing
+-- file_s3_bucket: Bucket holding the object, NULL for the default bucket of config.ini
+CREATE TABLE files (
+    file_id INTEGER PRIMARY KEY,
+    file_name VARCHAR(255) NOT NULL,
+    file_size INTEGER NOT NULL,
+    file_created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    folder_id INTEGER NOT NULL,
+    file_s3_key VARCHAR(255) NOT NULL UNIQUE,
+    file_s3_bucket VARCHAR(63),
+    file_codec VARCHAR(16),
+    file_stored_size INTEGER,
+    file_content_hash CHAR(64),
+    CONSTRAINT unique_file_name_per_folder UNIQUE (folder_id, file_name),
+    FOREIGN KEY (folder_id) REFERENCES folders (folder_id) ON DELETE CASCADE
+);
+
+-- Create indexes for the folders table
+-- Lookups by parent folder use the index of unique_folder_name_per_parent, as in init.sql
+CREATE INDEX idx_folder_deleted_at ON folders (folder_deleted_at) WHERE folder_deleted_at IS NOT NULL;
+CREATE INDEX idx_folder_quota ON folders (folder_id) WHERE folder_used_bytes IS NOT NULL;
+
+-- Create indexes for the files table
+-- The trigram and text_pattern_ops name indexes of init.sql are PostgreSQL only; SQLite name searches scan the table
+-- idx_file_folder_size: SQLite has no INCLUDE, so file_size is a second key column to cover the size aggregation
+CREATE INDEX idx_file_folder_size ON files (folder_id, file_size);
+
+-- Create the changes table, the changelog of every mutation made through the services
+-- Rows are appended in the transaction of the change; change_id increases in commit order and is the
+-- resume token of changes_since. It has no foreign keys, so it outlives the rows it describes.
+CREATE TABLE changes (
+    change_id INTEGER PRIMARY KEY,
+    change_time TIMESTAMP NOT NULL,
+    change_operation VARCHAR(16) NOT NULL,
+    change_entity VARCHAR(16) NOT NULL,
+    change_entity_id INTEGER NOT NULL,
+    change_folder_id INTEGER,
+    change_previous_folder_id INTEGER,
+    change_name VARCHAR(255)
+);
@@ -0,0 +1,66 @@
+-- Upgrade an existing database created from an older init.sql to the current schema.
+-- Every statement is idempotent, so the script can be run repeatedly.
+
+-- Name search indexes
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_folder_name_pattern ON folders (folder_name text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_folder_name_trgm ON folders USING gin (folder_name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_file_name_pattern ON files (file_name text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_file_name_trgm ON files USING gin (file_name gin_trgm_ops);
+
+-- Per-file compression codec and compressed size
+ALTER TABLE files ADD COLUMN IF NOT EXISTS file_codec VARCHAR(16);
+ALTER TABLE files ADD COLUMN IF NOT EXISTS file_stored_size INTEGER;
+-- Databases that kept the compressed size in file_size and the content size in file_original_size
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_schema = current_schema() AND table_name = 'files' AND column_name = 'file_original_size') THEN
+        UPDATE files SET file_stored_size = file_size, file_size = file_original_size
+        WHERE file_codec IS NOT NULL AND file_original_size IS NOT NULL;
+        ALTER TABLE files DROP COLUMN file_original_size;
+    END IF;
+END
+$$;
+
+-- SHA-256 of the original content, used by folder sync
+ALTER TABLE files ADD COLUMN IF NOT EXISTS file_content_hash CHAR(64);
+
+-- Revised index set: drop indexes duplicated by the leading columns of a unique constraint and
+-- cover the per-folder size aggregation. Under files_partitioning idx_file_s3_key is still needed.
+CREATE INDEX IF NOT EXISTS idx_file_folder_size ON files (folder_id) INCLUDE (file_size);
+DROP INDEX IF EXISTS idx_file_folder_id;
+DROP INDEX IF EXISTS idx_folder_parent_id;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'files'::regclass) THEN
+        DROP INDEX IF EXISTS idx_file_s3_key;
+    END IF;
+END
+$$;
+
+-- Tombstone deletes: deleted folders are hidden at once and purged in the background
+ALTER TABLE folders ADD COLUMN IF NOT EXISTS folder_deleted_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_folder_deleted_at ON folders (folder_deleted_at) WHERE folder_deleted_at IS NOT NULL;
+
+-- Changelog of every mutation, read with changes_since
+CREATE TABLE IF NOT EXISTS changes (
+    change_id BIGSERIAL PRIMARY KEY,
+    change_time TIMESTAMP NOT NULL,
+    change_operation VARCHAR(16) NOT NULL,
+    change_entity VARCHAR(16) NOT NULL,
+    change_entity_id INTEGER NOT NULL,
+    change_folder_id INTEGER,
+    change_previous_folder_id INTEGER,
+    change_name VARCHAR(255)
+);
+
+-- Per-folder quotas with usage counters maintained for the folders that have one
+ALTER TABLE folders ADD COLUMN IF NOT EXISTS folder_quota_bytes BIGINT;
+ALTER TABLE folders ADD COLUMN IF NOT EXISTS folder_quota_files INTEGER;
+ALTER TABLE folders ADD COLUMN IF NOT EXISTS folder_used_bytes BIGINT;
+ALTER TABLE folders ADD COLUMN IF NOT EXISTS folder_used_files INTEGER;
+CREATE INDEX IF NOT EXISTS idx_folder_quota ON folders (folder_id) WHERE folder_used_bytes IS NOT NULL;
+
+-- Bucket of each object when files are sharded across several buckets, NULL for the default bucket
+ALTER TABLE files ADD COLUMN IF NOT EXISTS file_s3_bucket VARCHAR(63);
@@ -0,0 +1,74 @@
+import io
+import os
+import time
+import tempfile
+import unittest
+from utils.cache_utils import ContentCache, copy_file_object
+
+class TestContentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = ContentCache(self.directory.name, max_bytes=1000)
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.cache.get('20240101_abc_report.txt'))
+        self.assertTrue(self.cache.put('20240101_abc_report.txt', b'hello'))
+        self.assertEqual(self.cache.get('20240101_abc_report.txt'), b'hello')
+        self.assertTrue(self.cache.put('streamed', io.BytesIO(b'x' * 300)))
+        with self.cache.open('streamed') as file:
+            self.assertEqual(file.read(), b'x' * 300)
+
+    def test_rejects_bodies_larger_than_budget(self):
+        self.assertFalse(self.cache.put('huge', io.BytesIO(b'x' * 2000)))
+        self.assertFalse(self.cache.contains('huge'))
+        self.assertEqual(os.listdir(os.path.dirname(self.cache._path('huge'))), [])
+
+    def test_evicts_least_recently_used(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, b'x' * 400)
+            past = time.time() - 100 + ord(key)
+            os.utime(self.cache._path(key), (past, past))
+            if key == 'b':
+                # Reading 'a' makes 'b' the least recently used entry
+                self.cache.get('a')
+        self.assertTrue(self.cache.contains('a'))
+        self.assertFalse(self.cache.contains('b'))
+        self.assertTrue(self.cache.contains('c'))
+
+    def test_discard(self):
+        self.cache.put('gone', b'data')
+        self.cache.discard('gone')
+        self.cache.discard('gone')
+        self.assertIsNone(self.cache.get('gone'))
+
+    def test_copy_file_object(self):
+        source_path = os.path.join(self.directory.name, 'source')
+        with open(source_path, 'wb') as file:
+            file.write(b'payload' * 1000)
+        destination_path = os.path.join(self.directory.name, 'destination')
+        with open(source_path, 'rb') as source, open(destination_path, 'wb') as destination:
+            self.assertEqual(copy_file_object(source, destination, chunk_size=512), 7000)
+        with open(destination_path, 'rb') as file:
+            self.assertEqual(file.read(), b'payload' * 1000)
+
+        with open(source_path, 'rb') as source:
+            buffer = io.BytesIO()
+            copy_file_object(source, buffer)
+            self.assertEqual(len(buffer.getvalue()), 7000)
+
+        # A spooled file stays in memory as either end of the copy
+        with open(source_path, 'rb') as source, tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spooled:
+            self.assertEqual(copy_file_object(source, spooled), 7000)
+            self.assertFalse(spooled._rolled)
+            spooled.seek(0)
+            with open(destination_path, 'wb') as destination:
+                self.assertEqual(copy_file_object(spooled, destination), 7000)
+            self.assertFalse(spooled._rolled)
+        with open(destination_path, 'rb') as file:
+            self.assertEqual(file.read(), b'payload' * 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
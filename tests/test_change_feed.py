@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from database import Database
+from services.change_service import ChangeService
+from utils.change_feed import ChangeFeed, change_feed, record_change
+
+
+class TestChangeFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        config_path = os.path.join(self.directory.name, 'config.ini')
+        with open(config_path, 'w') as config_file:
+            config_file.write(f"[database]\ndialect = sqlite\npath = {os.path.join(self.directory.name, 'metadata.sqlite')}\n")
+        self.db = Database(config_path=config_path)
+        self.change_service = ChangeService(self.db)
+        self.published = []
+        self.addCleanup(change_feed.subscribe(self.published.append))
+
+    def tearDown(self):
+        self.db.engine.dispose()
+        self.directory.cleanup()
+
+    def test_subscribers_are_filtered_and_isolated(self):
+        feed = ChangeFeed()
+        files, everything = [], []
+
+        def failing(change):
+            raise RuntimeError("subscriber failure")
+
+        feed.subscribe(failing)
+        feed.subscribe(files.append, entity='file')
+        unsubscribe = feed.subscribe(everything.append)
+        feed.publish([{'Change ID': 1, 'Entity': 'folder'}, {'Change ID': 2, 'Entity': 'file'}])
+        unsubscribe()
+        feed.publish([{'Change ID': 3, 'Entity': 'file'}])
+        self.assertEqual([change['Change ID'] for change in files], [2, 3])
+        self.assertEqual([change['Change ID'] for change in everything], [1, 2])
+
+    def test_changes_are_written_and_published_on_commit_only(self):
+        with self.db.get_db_session() as session:
+            record_change(session, 'create', 'folder', 7, None, name='discarded')
+            session.rollback()
+            record_change(session, 'create', 'folder', 1, None, name='root')
+            record_change(session, 'move', 'file', 2, 1, 3, 'a.txt')
+            session.commit()
+
+        page = self.change_service.changes_since()
+        self.assertEqual([(change['Operation'], change['Entity ID']) for change in page['Changes']],
+                         [('create', 1), ('move', 2)])
+        self.assertEqual(page['Changes'][1]['Previous Folder ID'], 3)
+        self.assertEqual(self.published, page['Changes'])
+
+    def test_changes_since_pages_by_token(self):
+        with self.db.get_db_session() as session:
+            for file_id in range(5):
+                record_change(session, 'delete', 'file', file_id, 1)
+            session.commit()
+
+        seen, token, more = [], 0, True
+        while more:
+            page = self.change_service.changes_since(token, limit=2)
+            seen.extend(change['Entity ID'] for change in page['Changes'])
+            token, more = page['Next Token'], page['More']
+        self.assertEqual(seen, list(range(5)))
+        self.assertEqual(self.change_service.changes_since(token)['Changes'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import io
+import unittest
+from unittest.mock import patch
+from utils import compression_utils
+
+class TestCompressionUtils(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.multiple(compression_utils, COMPRESSION_ENABLED=True, COMPRESSION_CODEC='gzip', COMPRESSION_MIN_SIZE=16)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.text = b"2024-01-01 INFO request handled in 12ms\n" * 2000
+
+    def test_round_trip_streams(self):
+        body, codec = compression_utils.compress('app.log', self.text)
+        self.assertEqual(codec, 'gzip')
+        self.assertLess(len(body), len(self.text))
+
+        destination = io.BytesIO()
+        written = compression_utils.decompress_stream(io.BytesIO(body), destination, codec, chunk_size=100)
+        self.assertEqual(destination.getvalue(), self.text)
+        self.assertEqual(written, len(self.text))
+
+    def test_skips_small_and_compressed_content(self):
+        self.assertEqual(compression_utils.compress('a.txt', b'short'), (b'short', None))
+        self.assertIsNone(compression_utils.compress('photo.jpg', self.text)[1])
+        self.assertIsNone(compression_utils.compress('blob', b'\x1f\x8b' + self.text)[1])
+
+    def test_disabled(self):
+        with patch.object(compression_utils, 'COMPRESSION_ENABLED', False):
+            self.assertEqual(compression_utils.compress('app.log', self.text), (self.text, None))
+
+    def test_decompressed_writes_stay_within_the_chunk_size(self):
+        body, codec = compression_utils.compress('zeros.bin', bytes(10 * 1024 * 1024))
+        self.assertLess(len(body), 64 * 1024)
+
+        class Recorder(io.BytesIO):
+            largest = 0
+
+            def write(self, data):
+                self.largest = max(self.largest, len(data))
+                return super().write(data)
+
+        destination = Recorder()
+        written = compression_utils.decompress_stream(io.BytesIO(body), destination, codec, chunk_size=64 * 1024)
+        self.assertEqual(written, 10 * 1024 * 1024)
+        self.assertEqual(destination.getvalue(), bytes(10 * 1024 * 1024))
+        self.assertLessEqual(destination.largest, 64 * 1024)
+
+    def test_uncompressed_stream_is_copied(self):
+        destination = io.BytesIO()
+        compression_utils.decompress_stream(io.BytesIO(self.text), destination, None)
+        self.assertEqual(destination.getvalue(), self.text)
+
+
+if __name__ == '__main__':
+    unittest.main()
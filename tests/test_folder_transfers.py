@@ -0,0 +1,338 @@
+import os
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest import mock
+from injector import Injector
+from sqlalchemy import event, insert, select
+from app_dependcy_injector import AppInjector
+from benchmarks.local_object_store import LocalObjectStore
+from database import Database
+from models.file import File
+from models.folder import Folder
+from services.file_service import FileService
+from services.folder_service import FolderService
+from utils import compression_utils
+from utils.query_utils import subtree_folder_paths
+from utils.s3_utils import S3Utils, S3_BUCKET_NAME
+
+
+class TestFolderTransfers(unittest.TestCase):
+    """
+    Downloads, syncs and copies of folders against the configured database, with S3 replaced by an
+    in-memory object store.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        injector = Injector([AppInjector])
+        cls.db = injector.get(Database)
+        cls.folder_service = injector.get(FolderService)
+        cls.file_service = injector.get(FileService)
+        cls.s3_client = S3Utils.s3_client
+
+    @classmethod
+    def tearDownClass(cls):
+        S3Utils.s3_client = cls.s3_client
+
+    def setUp(self):
+        self.store = LocalObjectStore()
+        S3Utils.s3_client = self.store
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def make_folder(self, name: str, parent_id: int = 1) -> Folder:
+        folder = self.folder_service.create_folder(name, parent_id)
+        self.addCleanup(self.folder_service.delete_folder, folder.folder_id)
+        return folder
+
+    def test_download_folder_to_directory_and_archives(self):
+        parent = self.make_folder('download_unique')
+        child = self.folder_service.create_folder('child', parent.folder_id)
+        self.folder_service.create_folder('empty', parent.folder_id)
+        self.file_service.create_file('top.txt', parent.folder_id, b'top')
+        self.file_service.create_file('nested.txt', child.folder_id, b'nested')
+
+        target = os.path.join(self.directory.name, 'tree')
+        summary = self.folder_service.download_folder(parent.folder_id, target)
+        self.assertEqual((summary['folders'], summary['files'], summary['bytes']), (3, 2, 9))
+        with open(os.path.join(target, 'child', 'nested.txt'), 'rb') as local_file:
+            self.assertEqual(local_file.read(), b'nested')
+        self.assertTrue(os.path.isdir(os.path.join(target, 'empty')))
+
+        tar_path = os.path.join(self.directory.name, 'tree.tar')
+        self.folder_service.download_folder(parent.folder_id, tar_path, archive='tar')
+        with tarfile.open(tar_path) as archive:
+            self.assertEqual(sorted(archive.getnames()), ['child', 'child/nested.txt', 'empty', 'top.txt'])
+            self.assertEqual(archive.extractfile('child/nested.txt').read(), b'nested')
+
+        zip_path = os.path.join(self.directory.name, 'tree.zip')
+        self.folder_service.download_folder(parent.folder_id, zip_path, archive='zip')
+        with zipfile.ZipFile(zip_path) as archive:
+            self.assertEqual(sorted(archive.namelist()), ['child/', 'child/nested.txt', 'empty/', 'top.txt'])
+            self.assertEqual(archive.read('top.txt'), b'top')
+
+    def test_download_folder_rejects_unsafe_names(self):
+        for folder_name, file_name in (('..', 'escape.txt'), ('a/b', 'escape.txt'), ('safe', '../escape.txt'), ('safe', '')):
+            parent = self.make_folder(f"hostile_unique_{len(folder_name)}_{len(file_name)}")
+            with self.db.engine.begin() as connection:
+                hostile_id = connection.execute(insert(Folder).values(folder_name=folder_name, folder_parent_id=parent.folder_id)
+                                                .returning(Folder.folder_id)).scalar()
+                connection.execute(insert(File).values(file_name=file_name, file_size=6, folder_id=hostile_id,
+                                                       file_s3_key=f"hostile-test/{hostile_id}"))
+            self.store.put_object(Bucket=S3_BUCKET_NAME, Key=f"hostile-test/{hostile_id}", Body=b'escape')
+
+            for archive, dest in ((None, os.path.join(self.directory.name, 'out', 'tree')),
+                                  ('tar', os.path.join(self.directory.name, 'out.tar')),
+                                  ('zip', os.path.join(self.directory.name, 'out.zip'))):
+                with self.subTest(folder_name=folder_name, file_name=file_name, archive=archive):
+                    with self.assertRaises(Exception):
+                        self.folder_service.download_folder(parent.folder_id, dest, archive=archive)
+                    self.assertFalse(os.path.exists(dest))
+                    self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'out', 'escape.txt')))
+                    self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'escape.txt')))
+
+    def test_download_folder_stays_inside_a_destination_with_symlinks(self):
+        parent = self.make_folder('symlink_unique')
+        child = self.folder_service.create_folder('child', parent.folder_id)
+        self.file_service.create_file('inside.txt', child.folder_id, b'inside')
+        target = os.path.join(self.directory.name, 'tree')
+        outside = os.path.join(self.directory.name, 'outside')
+        os.makedirs(target)
+        os.makedirs(outside)
+        os.symlink(outside, os.path.join(target, 'child'))
+
+        with self.assertRaises(ValueError):
+            self.folder_service.download_folder(parent.folder_id, target)
+        self.assertEqual(os.listdir(outside), [])
+
+    def test_compressed_files_keep_their_content_size(self):
+        folder = self.make_folder('compressed_unique')
+        self.folder_service.set_folder_quota(folder.folder_id, max_bytes=1 << 20)
+        content = b"2024-01-01 INFO request handled in 12ms\n" * 2000
+        with mock.patch.multiple(compression_utils, COMPRESSION_ENABLED=True, COMPRESSION_CODEC='gzip', COMPRESSION_MIN_SIZE=16):
+            file = self.file_service.create_file('app.log', folder.folder_id, content)
+        self.assertEqual(file.file_codec, 'gzip')
+        self.assertEqual(file.file_size, len(content))
+        self.assertLess(file.file_stored_size, len(content))
+
+        # Listings, reports and the file details agree; the quota counts the bytes stored in S3
+        self.assertEqual(self.file_service.get_file(file.file_id).file_size, len(content))
+        self.assertEqual(self.folder_service.calculate_folder_size(folder.folder_id), len(content))
+        self.assertEqual(int(self.folder_service.list_file_columns(folder.folder_id)['file_size'].sum()), len(content))
+        self.assertEqual(self.folder_service.get_folder_quota(folder.folder_id)[0]['Used Bytes'], file.file_stored_size)
+        local_path = self.file_service.download_file(file.file_id, self.directory.name)
+        with open(local_path, 'rb') as local_file:
+            self.assertEqual(local_file.read(), content)
+
+        self.file_service.delete_file(file.file_id)
+        self.assertEqual(self.folder_service.get_folder_quota(folder.folder_id)[0]['Used Bytes'], 0)
+
+    def write_local(self, relative_path: str, content: bytes, modified: float = None) -> str:
+        path = os.path.join(self.directory.name, 'local', *relative_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as local_file:
+            local_file.write(content)
+        if modified is not None:
+            os.utime(path, (modified, modified))
+        return path
+
+    def remote_files(self, folder_id: int) -> dict:
+        paths = subtree_folder_paths(folder_id)
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(select(paths.c.path, File.file_name, File.file_s3_key).join(File, File.folder_id == paths.c.folder_id))
+            return {f"{row.path}/{row.file_name}" if row.path else row.file_name: row for row in rows}
+
+    def test_sync_directory_uploads_new_and_changed_files(self):
+        local_dir = os.path.join(self.directory.name, 'local')
+        for compare in ('metadata', 'hash'):
+            with self.subTest(compare=compare):
+                target = self.make_folder(f"sync_unique_{compare}")
+                past = time.time() - 3600
+                self.write_local('a.txt', b'alpha', past)
+                self.write_local('sub/b.txt', b'bravo', past)
+
+                summary = self.folder_service.sync_directory(local_dir, target.folder_id, compare=compare, workers=2)
+                self.assertEqual((summary['folders_created'], summary['uploaded'], summary['failed']), (1, 2, 0))
+                self.assertEqual(sorted(self.remote_files(target.folder_id)), ['a.txt', 'sub/b.txt'])
+                self.assertEqual(self.folder_service.sync_directory(local_dir, target.folder_id, compare=compare)['unchanged'], 2)
+
+                # The same size, so only a hash comparison or a newer modification time reveals the change
+                old_key = self.remote_files(target.folder_id)['a.txt'].file_s3_key
+                self.write_local('a.txt', b'ALPHA', past if compare == 'hash' else time.time() + 60)
+                summary = self.folder_service.sync_directory(local_dir, target.folder_id, compare=compare)
+                self.assertEqual((summary['uploaded'], summary['updated'], summary['unchanged']), (0, 1, 1))
+                new_row = self.remote_files(target.folder_id)['a.txt']
+                self.assertNotEqual(new_row.file_s3_key, old_key)
+                self.assertEqual(self.store.object_count(), 2)
+                with self.assertRaises(Exception):
+                    self.store.get_object(Bucket=S3_BUCKET_NAME, Key=old_key)
+
+                # Extras are kept unless delete_extras is set
+                os.remove(os.path.join(local_dir, 'sub', 'b.txt'))
+                os.rmdir(os.path.join(local_dir, 'sub'))
+                self.assertEqual(self.folder_service.sync_directory(local_dir, target.folder_id, compare=compare)['deleted'], 0)
+                self.assertEqual(len(self.remote_files(target.folder_id)), 2)
+                self.write_local('c.txt', b'charlie', past)
+                os.remove(os.path.join(local_dir, 'a.txt'))
+                summary = self.folder_service.sync_directory(local_dir, target.folder_id, compare=compare, delete_extras=True)
+                self.assertEqual((summary['uploaded'], summary['deleted']), (1, 2))
+                self.assertEqual(sorted(self.remote_files(target.folder_id)), ['c.txt'])
+                folders, _ = self.folder_service.list_subtree_rows(target.folder_id)
+                self.assertEqual([row.folder_id for row in folders], [target.folder_id])
+                os.remove(os.path.join(local_dir, 'c.txt'))
+                self.store = LocalObjectStore()
+                S3Utils.s3_client = self.store
+
+    def test_sync_directory_counts_failed_files_and_goes_on(self):
+        target = self.make_folder('sync_failures_unique')
+        local_dir = os.path.join(self.directory.name, 'local')
+        for index in range(4):
+            self.write_local(f"file{index}.txt", b'content')
+        upload = S3Utils.upload_file_to_s3
+
+        def flaky_upload(file_content, file_name, file_s3_key, bucket=None):
+            if file_name == 'file1.txt':
+                raise OSError("connection reset")
+            return file_name != 'file2.txt' and upload(file_content, file_name, file_s3_key, bucket)
+
+        with mock.patch.object(S3Utils, 'upload_file_to_s3', flaky_upload):
+            summary = self.folder_service.sync_directory(local_dir, target.folder_id, workers=2)
+        self.assertEqual((summary['uploaded'], summary['failed']), (2, 2))
+        self.assertEqual(sorted(self.remote_files(target.folder_id)), ['file0.txt', 'file3.txt'])
+        self.assertEqual(self.store.object_count(), 2)
+
+    def test_sync_directory_deletes_uncommitted_objects_when_it_fails(self):
+        target = self.make_folder('sync_abort_unique')
+        local_dir = os.path.join(self.directory.name, 'local')
+        for index in range(5):
+            self.write_local(f"file{index}.txt", b'content')
+
+        # The changelog rows of the second batch fail, so that batch is rolled back
+        with mock.patch('services.folder_service.record_changes', side_effect=[None, Exception("changelog unavailable")]):
+            with self.assertRaises(Exception):
+                self.folder_service.sync_directory(local_dir, target.folder_id, workers=2, batch_size=2)
+        committed = self.remote_files(target.folder_id)
+        self.assertEqual(len(committed), 2)
+        self.assertEqual(self.store.object_count(), 2)
+        for row in committed.values():
+            self.store.get_object(Bucket=S3_BUCKET_NAME, Key=row.file_s3_key)
+
+    def test_sync_directory_deletes_the_objects_of_a_batch_over_quota(self):
+        target = self.make_folder('sync_quota_unique')
+        self.folder_service.set_folder_quota(target.folder_id, max_files=3)
+        local_dir = os.path.join(self.directory.name, 'local')
+        for index in range(5):
+            self.write_local(f"file{index}.txt", b'content')
+
+        with self.assertRaises(Exception):
+            self.folder_service.sync_directory(local_dir, target.folder_id, workers=2, batch_size=2)
+        self.assertEqual(len(self.remote_files(target.folder_id)), 2)
+        self.assertEqual(self.store.object_count(), 2)
+        self.assertEqual(self.folder_service.get_folder_quota(target.folder_id)[0]['Used Files'], 2)
+
+    def test_copy_file_copies_the_object_and_cleans_up_on_failure(self):
+        source = self.make_folder('copy_file_source_unique')
+        dest = self.make_folder('copy_file_dest_unique')
+        original = self.file_service.create_file('a.txt', source.folder_id, b'alpha')
+
+        copy = self.file_service.copy_file(original.file_id, dest.folder_id)
+        self.assertEqual((copy.folder_id, copy.file_name, copy.file_size), (dest.folder_id, 'a.txt', 5))
+        self.assertNotEqual(copy.file_s3_key, original.file_s3_key)
+        self.assertEqual(self.store.get_object(Bucket=S3_BUCKET_NAME, Key=copy.file_s3_key)['Body'].read(), b'alpha')
+        self.assertEqual(self.store.object_count(), 2)
+
+        # A name conflict under the destination removes the object that was already copied
+        with self.assertRaises(Exception):
+            self.file_service.copy_file(original.file_id, dest.folder_id)
+        self.assertEqual(self.store.object_count(), 2)
+        with mock.patch.object(S3Utils, 'copy_file_in_s3', return_value=None):
+            with self.assertRaises(Exception):
+                self.file_service.copy_file(original.file_id, source.folder_id)
+        self.assertEqual(sorted(self.remote_files(source.folder_id)), ['a.txt'])
+        self.assertEqual(sorted(self.remote_files(dest.folder_id)), ['a.txt'])
+
+    def make_copy_source(self, name: str) -> Folder:
+        source = self.make_folder(name)
+        child = self.folder_service.create_folder('child', source.folder_id)
+        grandchild = self.folder_service.create_folder('grandchild', child.folder_id)
+        self.folder_service.create_folder('empty', source.folder_id)
+        self.file_service.create_file('a.txt', source.folder_id, b'alpha')
+        self.file_service.create_file('b.txt', child.folder_id, b'bravo')
+        self.file_service.create_file('c.txt', grandchild.folder_id, b'charlie')
+        return source
+
+    def folder_paths(self, folder_id: int) -> dict:
+        paths = subtree_folder_paths(folder_id)
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(select(paths.c.path, Folder.folder_id, Folder.folder_parent_id)
+                                      .join(Folder, Folder.folder_id == paths.c.folder_id))
+            return {row.path: row for row in rows}
+
+    def test_copy_folder_inserts_each_level_and_maps_the_folder_ids(self):
+        source = self.make_copy_source('copy_folder_source_unique')
+        dest = self.make_folder('copy_folder_dest_unique')
+        folder_levels = []
+
+        def record_folder_inserts(orm_execute_state):
+            if orm_execute_state.is_insert and orm_execute_state.statement.table.name == Folder.__tablename__:
+                folder_levels.append(sorted(row['folder_name'] for row in orm_execute_state.parameters))
+
+        event.listen(self.db.SessionLocal.session_factory, 'do_orm_execute', record_folder_inserts)
+        try:
+            copy = self.folder_service.copy_folder(source.folder_id, dest.folder_id, workers=2)
+        finally:
+            event.remove(self.db.SessionLocal.session_factory, 'do_orm_execute', record_folder_inserts)
+        self.assertEqual(folder_levels, [[source.folder_name], ['child', 'empty'], ['grandchild']])
+        self.assertEqual((copy.folder_name, copy.folder_parent_id), (source.folder_name, dest.folder_id))
+
+        # The copy has the same shape, with every parent ID mapped to the copied parent
+        source_folders, copied_folders = self.folder_paths(source.folder_id), self.folder_paths(copy.folder_id)
+        self.assertEqual(sorted(copied_folders), ['', 'child', 'child/grandchild', 'empty'])
+        self.assertEqual(sorted(copied_folders), sorted(source_folders))
+        self.assertTrue(set(row.folder_id for row in copied_folders.values()).isdisjoint(
+            row.folder_id for row in source_folders.values()))
+        for path, row in copied_folders.items():
+            if path:
+                parent_path = path.rpartition('/')[0]
+                self.assertEqual(row.folder_parent_id, copied_folders[parent_path].folder_id)
+
+        source_files, copied_files = self.remote_files(source.folder_id), self.remote_files(copy.folder_id)
+        self.assertEqual(sorted(copied_files), ['a.txt', 'child/b.txt', 'child/grandchild/c.txt'])
+        self.assertEqual(self.store.object_count(), 6)
+        for path, row in copied_files.items():
+            self.assertNotEqual(row.file_s3_key, source_files[path].file_s3_key)
+            self.assertEqual(self.store.get_object(Bucket=S3_BUCKET_NAME, Key=row.file_s3_key)['Body'].read(),
+                             self.store.get_object(Bucket=S3_BUCKET_NAME, Key=source_files[path].file_s3_key)['Body'].read())
+
+    def test_copy_folder_rolls_back_and_deletes_the_copied_objects_on_failure(self):
+        source = self.make_copy_source('copy_conflict_unique')
+        dest = self.make_folder('copy_conflict_dest_unique')
+        self.folder_service.create_folder(source.folder_name, dest.folder_id)
+
+        # The folder name is taken under the destination, which only shows once the objects are copied
+        with self.assertRaises(Exception):
+            self.folder_service.copy_folder(source.folder_id, dest.folder_id, workers=2)
+        self.assertEqual(sorted(self.folder_paths(dest.folder_id)), ['', source.folder_name])
+        self.assertEqual(self.store.object_count(), 3)
+
+        # One object fails to copy, so the others are removed again
+        copy = S3Utils.copy_file_in_s3
+
+        def flaky_copy(source_s3_key, destination_s3_key, source_bucket=None, destination_bucket=None):
+            if source_s3_key == self.remote_files(source.folder_id)['child/b.txt'].file_s3_key:
+                return None
+            return copy(source_s3_key, destination_s3_key, source_bucket, destination_bucket)
+
+        other = self.make_folder('copy_failure_dest_unique')
+        with mock.patch.object(S3Utils, 'copy_file_in_s3', flaky_copy):
+            with self.assertRaises(Exception):
+                self.folder_service.copy_folder(source.folder_id, other.folder_id, workers=2)
+        self.assertEqual(sorted(self.folder_paths(other.folder_id)), [''])
+        self.assertEqual(self.store.object_count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,16 @@
+import os
+import tempfile
 import unittest
+import pandas as pd
 from database import Database
 from services.folder_service import FolderService
 from injector import Injector
 from app_dependcy_injector import AppInjector
 from sqlalchemy.orm import sessionmaker
 from models.file import File
+from models.folder import Folder
+from sqlalchemy import insert, select
+from utils.export_utils import FOLDER_EXPORT_COLUMNS, FILE_EXPORT_COLUMNS
 
 class TestFolderService(unittest.TestCase):
 
@@ -75,6 +81,146 @@ class TestFolderService(unittest.TestCase):
         self.folder_service.delete_folder(sub_folder.folder_id)
         self.folder_service.delete_folder( new_root_folder.folder_id)
 
+    def test_move_folder_rejects_its_own_subtree(self):
+        parent = self.folder_service.create_folder('move_cycle_unique', 1)
+        child = self.folder_service.create_folder('child', parent.folder_id)
+        for new_parent_id in (parent.folder_id, child.folder_id):
+            with self.assertRaises(Exception):
+                self.folder_service.move_folder(parent.folder_id, new_parent_id)
+        self.assertEqual(self.folder_service.get_folder(parent.folder_id).folder_parent_id, 1)
+        self.folder_service.delete_folder(parent.folder_id)
+
+    def test_list_children_pages(self):
+        parent = self.folder_service.create_folder('list_children_unique', 1)
+        for name in ('a', 'b', 'c'):
+            self.folder_service.create_folder(name, parent.folder_id)
+        first_page = self.folder_service.list_children(parent.folder_id, limit=2)
+        self.assertEqual([f['Folder Name'] for f in first_page['Subfolders']], ['a', 'b'])
+        self.assertTrue(first_page['More Subfolders'])
+        second_page = self.folder_service.list_children(parent.folder_id, limit=2, folders_after='b')
+        self.assertEqual([f['Folder Name'] for f in second_page['Subfolders']], ['c'])
+        self.assertFalse(second_page['More Subfolders'])
+        self.folder_service.delete_folder(parent.folder_id)
+
+    def test_delete_folder_hides_subtree_until_purged(self):
+        parent = self.folder_service.create_folder('tombstone_unique', 1)
+        child = self.folder_service.create_folder('child', parent.folder_id)
+        deleted = self.folder_service.delete_folder(parent.folder_id)
+        self.assertEqual(deleted['Folder Name'], 'tombstone_unique')
+        with self.assertRaises(Exception):
+            self.folder_service.get_folder(child.folder_id)
+        listed = self.folder_service.list_children(1)['Subfolders']
+        self.assertNotIn(parent.folder_id, [folder['Folder ID'] for folder in listed])
+
+        # The name is free again before the purge
+        recreated = self.folder_service.create_folder('tombstone_unique', 1)
+        chunks = list(self.folder_service.purge_deleted_folders(batch_size=1))
+        self.assertTrue(any(chunk['Folder ID'] == parent.folder_id and chunk['Done'] for chunk in chunks))
+        self.folder_service.delete_folder(recreated.folder_id)
+
+    def test_folder_quota_limits_moves(self):
+        limited = self.folder_service.create_folder('quota_limited_unique', 1)
+        source = self.folder_service.create_folder('quota_source_unique', 1)
+        with self.db.engine.begin() as connection:
+            connection.execute(insert(File), [
+                {'file_name': f"quota{index}.txt", 'file_size': 100, 'folder_id': source.folder_id,
+                 'file_s3_key': f"quota-test/{source.folder_id}/{index}"}
+                for index in range(2)
+            ])
+        quota = self.folder_service.set_folder_quota(limited.folder_id, max_bytes=150)
+        self.assertEqual((quota['Used Bytes'], quota['Used Files']), (0, 0))
+        with self.assertRaises(Exception):
+            self.folder_service.move_folder(source.folder_id, limited.folder_id)
+
+        self.folder_service.set_folder_quota(limited.folder_id, max_bytes=500)
+        self.folder_service.move_folder(source.folder_id, limited.folder_id)
+        quotas = self.folder_service.get_folder_quota(source.folder_id)
+        self.assertEqual([(quota['Folder ID'], quota['Used Bytes'], quota['Used Files']) for quota in quotas],
+                         [(limited.folder_id, 200, 2)])
+        self.assertEqual(self.folder_service.recalculate_usage(limited.folder_id), [])
+        self.folder_service.delete_folder(limited.folder_id)
+
+    def test_subtree_listings_agree(self):
+        parent = self.folder_service.create_folder('listing_unique', 1)
+        child = self.folder_service.create_folder('child', parent.folder_id)
+        hidden = self.folder_service.create_folder('hidden', child.folder_id)
+        with self.db.engine.begin() as connection:
+            connection.execute(insert(File), [
+                {'file_name': f"listing{index}.txt", 'file_size': index, 'folder_id': folder_id,
+                 'file_s3_key': f"listing-test/{folder_id}/{index}"}
+                for folder_id in (parent.folder_id, child.folder_id, hidden.folder_id) for index in range(2)
+            ])
+        self.folder_service.delete_folder(hidden.folder_id)
+
+        listing = self.folder_service.list_files_and_subfolders(parent.folder_id)
+        self.assertEqual(listing['Folder Name'], 'listing_unique')
+        self.assertEqual(sorted(file['File Name'] for file in listing['Files']), ['listing0.txt', 'listing1.txt'])
+        [subfolder] = listing['Subfolders']
+        self.assertEqual((subfolder['Folder ID'], subfolder['Subfolders'], len(subfolder['Files'])), (child.folder_id, [], 2))
+
+        folders, files = self.folder_service.list_subtree_rows(parent.folder_id)
+        self.assertEqual(sorted((row.folder_id, row.folder_parent_id) for row in folders),
+                         [(parent.folder_id, 1), (child.folder_id, parent.folder_id)])
+        self.assertEqual(sorted((row.folder_id, row.file_size) for row in files),
+                         [(parent.folder_id, 0), (parent.folder_id, 1), (child.folder_id, 0), (child.folder_id, 1)])
+
+        columns = self.folder_service.list_file_columns(parent.folder_id, chunk_size=3)
+        self.assertEqual(columns['file_id'].dtype, 'int64')
+        self.assertEqual(sorted(columns['file_id'].tolist()), sorted(row.file_id for row in files))
+        self.assertEqual(int(columns['file_size'].sum()), 2)
+        with self.assertRaises(Exception):
+            self.folder_service.list_subtree_rows(hidden.folder_id)
+        self.folder_service.delete_folder(parent.folder_id)
+
+    def test_export_reloads_with_the_datagen_layout(self):
+        parent = self.folder_service.create_folder('export_unique', 1)
+        child = self.folder_service.create_folder('child', parent.folder_id)
+        with self.db.engine.begin() as connection:
+            connection.execute(insert(File), [
+                {'file_name': f"export{index}.txt", 'file_size': 100, 'folder_id': folder_id,
+                 'file_s3_key': f"export-test/{folder_id}/{index}", 'file_codec': 'gzip', 'file_stored_size': 10 + index}
+                for folder_id in (parent.folder_id, child.folder_id) for index in range(2)
+            ])
+        self.addCleanup(self.folder_service.delete_folder, parent.folder_id)
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = self.folder_service.export_metadata(directory, folder_id=parent.folder_id)
+            folders = pd.read_csv(paths['folders'], dtype={'folder_parent_id': 'Int64'})
+            files = pd.read_csv(paths['files'], parse_dates=['file_created_date'])
+            self.assertEqual(tuple(folders.columns), FOLDER_EXPORT_COLUMNS)
+            self.assertEqual(tuple(files.columns), FILE_EXPORT_COLUMNS)
+
+            # Load the export into an empty database the way datagen CSVs are loaded
+            config_path = os.path.join(directory, 'config.ini')
+            with open(config_path, 'w') as config_file:
+                config_file.write(f"[database]\ndialect = sqlite\npath = {os.path.join(directory, 'reload.sqlite')}\n")
+            reloaded = Database(config_path=config_path)
+            self.addCleanup(reloaded.engine.dispose)
+            with reloaded.engine.begin() as connection:
+                for model, frame in ((Folder, folders), (File, files)):
+                    connection.execute(insert(model), frame.astype(object).where(frame.notna(), None).to_dict('records'))
+
+            def rows(db, columns, table, where):
+                with db.engine.connect() as connection:
+                    return sorted(tuple(row) for row in connection.execute(
+                        select(*(table.c[name] for name in columns)).where(where)))
+
+            folder_table, file_table = Folder.__table__, File.__table__
+            subtree = folder_table.c.folder_id.in_([parent.folder_id, child.folder_id])
+            source_folders = [(folder_id, name, None if folder_id == parent.folder_id else parent_id)
+                              for folder_id, name, parent_id in rows(self.db, FOLDER_EXPORT_COLUMNS, folder_table, subtree)]
+            self.assertEqual(rows(reloaded, FOLDER_EXPORT_COLUMNS, folder_table, subtree), source_folders)
+            in_subtree = file_table.c.folder_id.in_([parent.folder_id, child.folder_id])
+            self.assertEqual(rows(reloaded, FILE_EXPORT_COLUMNS, file_table, in_subtree),
+                             rows(self.db, FILE_EXPORT_COLUMNS, file_table, in_subtree))
+
+            paths = self.folder_service.export_metadata(os.path.join(directory, 'extra'), folder_id=parent.folder_id,
+                                                        extra_columns=True)
+            columns = tuple(pd.read_csv(paths['files']).columns)
+            self.assertEqual(columns[:len(FILE_EXPORT_COLUMNS)], FILE_EXPORT_COLUMNS)
+            self.assertIn('file_codec', columns)
+            self.assertNotIn('folder_deleted_at', tuple(pd.read_csv(paths['folders']).columns))
+
 
 if __name__ == '__main__':
     unittest.main()
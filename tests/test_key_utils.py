@@ -0,0 +1,33 @@
+import unittest
+from datetime import datetime, timezone
+from utils.key_utils import make_s3_key, pick_bucket
+
+
+class TestKeyUtils(unittest.TestCase):
+
+    def test_timestamp_layout(self):
+        key = make_s3_key('report.txt', now=datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+        self.assertTrue(key.startswith('20240102030405_'))
+        self.assertTrue(key.endswith('_report.txt'))
+
+    def test_hashed_layout_spreads_prefixes(self):
+        now = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        keys = [make_s3_key('report.txt', 'hashed', 2, now) for _ in range(200)]
+        prefixes = {key.split('/')[0] for key in keys}
+        self.assertTrue(all(len(prefix) == 2 for prefix in prefixes))
+        self.assertGreater(len(prefixes), 50)
+        self.assertTrue(all(key.split('/', 1)[1].startswith('20240102030405_') for key in keys))
+        with self.assertRaises(ValueError):
+            make_s3_key('report.txt', 'random')
+
+    def test_pick_bucket_is_stable_and_even(self):
+        buckets = ['a', 'b', 'c']
+        keys = [make_s3_key(f'file_{index}', 'hashed') for index in range(300)]
+        self.assertEqual([pick_bucket(key, buckets) for key in keys], [pick_bucket(key, buckets) for key in keys])
+        counts = {bucket: [pick_bucket(key, buckets) for key in keys].count(bucket) for bucket in buckets}
+        self.assertTrue(all(count > 50 for count in counts.values()))
+        self.assertIsNone(pick_bucket(keys[0], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
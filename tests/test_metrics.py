@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+import urllib.request
+from botocore.exceptions import ClientError
+from utils.metrics import MetricsRegistry, registry, measure_class, measured, start_http_server, dump
+from utils.transfer_utils import TransferScheduler
+
+
+@measure_class()
+class MeasuredService:
+    def work(self, fail: bool = False):
+        if fail:
+            raise ValueError("broken")
+        return 'done'
+
+    def items(self, count: int):
+        yield from range(count)
+
+    def _helper(self):
+        return 'not measured'
+
+
+@measured('MeasuredStorage', failed=lambda result: result is None)
+def fetch(key):
+    return None if key == 'missing' else key
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_render_counters_and_cumulative_histograms(self):
+        local = MetricsRegistry()
+        calls = local.counter('calls_total', "Calls.", ('operation',))
+        calls.labels('get').inc()
+        calls.labels(operation='get').inc(2)
+        latency = local.histogram('latency_seconds', "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            latency.observe(value)
+        local.register_collector('pool', lambda: [('pool_size', 'gauge', "Pool size.", [({'pool': 'primary'}, 10)])])
+
+        text = local.render()
+        self.assertIn('# TYPE clientfiledb_calls_total counter', text)
+        self.assertIn('clientfiledb_calls_total{operation="get"} 3', text)
+        self.assertIn('clientfiledb_latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('clientfiledb_latency_seconds_bucket{le="1.0"} 2', text)
+        self.assertIn('clientfiledb_latency_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('clientfiledb_latency_seconds_sum 5.55', text)
+        self.assertIn('clientfiledb_latency_seconds_count 3', text)
+        self.assertIn('clientfiledb_pool_size{pool="primary"} 10', text)
+        self.assertIs(local.counter('calls_total', "Calls.", ('operation',)), calls)
+        with self.assertRaises(ValueError):
+            local.histogram('calls_total', "Calls.", ('operation',))
+
+    def test_measured_counts_calls_errors_and_latency(self):
+        service = MeasuredService()
+        before = registry.value('operation_calls_total', component='MeasuredService', operation='work') or 0
+        service.work()
+        with self.assertRaises(ValueError):
+            service.work(fail=True)
+        self.assertEqual(list(service.items(3)), [0, 1, 2])
+        self.assertEqual(service._helper(), 'not measured')
+        fetch('present')
+        fetch('missing')
+
+        self.assertEqual(registry.value('operation_calls_total', component='MeasuredService', operation='work'), before + 2)
+        self.assertEqual(registry.value('operation_errors_total', component='MeasuredService', operation='work'), 1)
+        self.assertEqual(registry.value('operation_calls_total', component='MeasuredService', operation='items'), 1)
+        self.assertIsNone(registry.value('operation_calls_total', component='MeasuredService', operation='_helper'))
+        self.assertEqual(registry.value('operation_errors_total', component='MeasuredStorage', operation='fetch'), 1)
+        buckets, counts, total = registry.value('operation_duration_seconds', component='MeasuredService', operation='work')
+        self.assertEqual(sum(counts), before + 2)
+        self.assertGreaterEqual(total, 0.0)
+
+    def test_closing_a_measured_generator_early_is_not_an_error(self):
+        @measured('MeasuredStream')
+        def numbers():
+            yield from range(10)
+
+        stream = numbers()
+        self.assertEqual(next(stream), 0)
+        stream.close()
+        self.assertEqual(registry.value('operation_calls_total', component='MeasuredStream', operation='numbers'), 1)
+        self.assertEqual(registry.value('operation_errors_total', component='MeasuredStream', operation='numbers'), 0)
+
+    def test_scheduler_counts_requests_and_errors_by_type(self):
+        scheduler = TransferScheduler(base_delay=0, latency_tolerance=0)
+        before = registry.value('s3_requests_total', type='LIST') or 0
+        attempts = []
+
+        def throttled_once():
+            attempts.append(True)
+            if len(attempts) == 1:
+                raise ClientError({'Error': {'Code': 'SlowDown'}, 'ResponseMetadata': {'HTTPStatusCode': 503}}, 'ListObjectsV2')
+            return 'ok'
+
+        self.assertEqual(scheduler.call('list', throttled_once), 'ok')
+        self.assertEqual(registry.value('s3_requests_total', type='LIST'), before + 2)
+        self.assertGreaterEqual(registry.value('s3_request_errors_total', type='LIST', kind='throttle'), 1)
+        families = {name: samples for name, _, _, samples in scheduler.collect_metrics()}
+        self.assertEqual(families['s3_throttles_total'], [({}, 1)])
+        self.assertEqual(families['s3_requests_in_flight'], [({}, 0)])
+
+    def test_http_endpoint_and_dump(self):
+        registry.counter('test_exposed_total', "Exposed in tests.").inc()
+        server = start_http_server(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+            self.assertIn('clientfiledb_test_exposed_total 1', response.read().decode('utf-8'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = dump(os.path.join(directory, 'metrics', 'metrics.prom'))
+            with open(path, encoding='utf-8') as metrics_file:
+                self.assertIn('# TYPE clientfiledb_test_exposed_total counter', metrics_file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
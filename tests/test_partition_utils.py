@@ -0,0 +1,165 @@
+import configparser
+import random
+import threading
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, event, text
+from database import Database
+from utils.partition_utils import (partition_by_clause, create_partitions_sql, range_partition_sql,
+                                   uniqueness_trigger_sql, partitioned_table_sql, migrate_files_table)
+
+
+class TestPartitionUtils(unittest.TestCase):
+
+    def test_partition_by_clause(self):
+        self.assertEqual(partition_by_clause('hash'), 'HASH (folder_id)')
+        self.assertEqual(partition_by_clause('range'), 'RANGE (file_created_date)')
+        with self.assertRaises(ValueError):
+            partition_by_clause('list')
+
+    def test_hash_partitions_cover_every_remainder(self):
+        statements = create_partitions_sql('hash', 'files', 4)
+        self.assertEqual(len(statements), 4)
+        self.assertIn('files_p3 PARTITION OF files FOR VALUES WITH (MODULUS 4, REMAINDER 3)', statements[3])
+
+    def test_range_partitions_cross_year_and_end_with_default(self):
+        statements = create_partitions_sql('range', 'files', start=date(2024, 11, 15), months=3)
+        self.assertEqual(statements[0], range_partition_sql('files', date(2024, 11, 1)))
+        self.assertIn("files_2025_01 PARTITION OF files FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')", statements[2])
+        self.assertTrue(statements[-1].endswith('files_default PARTITION OF files DEFAULT'))
+
+    def test_primary_key_contains_partition_key(self):
+        self.assertIn('PRIMARY KEY (file_id, folder_id)', partitioned_table_sql('hash', 'files_new')[1])
+        self.assertIn('PRIMARY KEY (file_id, file_created_date)', partitioned_table_sql('range', 'files_new')[1])
+
+    def test_name_uniqueness_trigger_only_for_range(self):
+        self.assertNotIn('unique_file_name_per_folder', uniqueness_trigger_sql('hash')[0])
+        self.assertIn('unique_file_name_per_folder', uniqueness_trigger_sql('range')[0])
+
+
+
+class TestFilesTableMigration(unittest.TestCase):
+    """
+    Migrates a files table in a scratch schema of the configured PostgreSQL database while another
+    thread keeps updating, moving, deleting and inserting files.
+    """
+    schema = 'test_partition_migration'
+
+    @classmethod
+    def setUpClass(cls):
+        config = configparser.ConfigParser()
+        config.read('config/config.ini')
+        if 'database' not in config or config['database'].get('dialect') != 'postgresql':
+            raise unittest.SkipTest("The partition migration needs a PostgreSQL database")
+        url = Database._build_database_url(config['database'])
+        try:
+            cls.admin_engine = create_engine(url)
+            with cls.admin_engine.connect():
+                pass
+        except Exception as e:
+            raise unittest.SkipTest(f"The configured PostgreSQL database is not reachable: {e}")
+        cls.engine = create_engine(url, connect_args={'options': f"-csearch_path={cls.schema},public"})
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.admin_engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {cls.schema} CASCADE"))
+        cls.engine.dispose()
+        cls.admin_engine.dispose()
+
+    def setUp(self):
+        with self.admin_engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {self.schema} CASCADE"))
+            connection.execute(text(f"CREATE SCHEMA {self.schema}"))
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public"))
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE folders (folder_id SERIAL PRIMARY KEY, folder_name VARCHAR(255) NOT NULL, folder_parent_id INTEGER)"
+            ))
+            connection.execute(text(
+                "CREATE TABLE files (file_id SERIAL PRIMARY KEY, file_name VARCHAR(255) NOT NULL, file_size INTEGER NOT NULL, "
+                "file_created_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+                "folder_id INTEGER NOT NULL REFERENCES folders (folder_id) ON DELETE CASCADE, "
+                "file_s3_key VARCHAR(255) NOT NULL UNIQUE, CONSTRAINT unique_file_name_per_folder UNIQUE (folder_id, file_name))"
+            ))
+            connection.execute(text("INSERT INTO folders (folder_name, folder_parent_id) VALUES ('root', NULL), ('a', 1), ('b', 1)"))
+            connection.execute(text(
+                "INSERT INTO files (file_name, file_size, folder_id, file_s3_key) "
+                "SELECT 'file' || g, g, 2 + g % 2, 'key-' || g FROM generate_series(1, 3000) AS g"
+            ))
+
+    def rows(self, table: str) -> dict:
+        with self.engine.connect() as connection:
+            return {row.file_id: tuple(row[1:]) for row in connection.execute(text(
+                f"SELECT file_id, file_name, file_size, folder_id, file_s3_key FROM {table}"
+            ))}
+
+    def write_concurrently(self, writer: int, stop: threading.Event, errors: list):
+        """
+        Update, move, delete and insert random files until stop is set.
+        """
+        generator = random.Random(writer)
+        inserted = 0
+        try:
+            while not stop.is_set():
+                file_id = generator.randint(1, 3000)
+                operation = generator.choice(('rename', 'resize', 'move', 'delete', 'insert'))
+                with self.engine.begin() as connection:
+                    if operation == 'rename':
+                        connection.execute(text("UPDATE files SET file_name = 'renamed' || file_id WHERE file_id = :id"),
+                                           {'id': file_id})
+                    elif operation == 'resize':
+                        connection.execute(text("UPDATE files SET file_size = file_size + 1 WHERE file_id = :id"),
+                                           {'id': file_id})
+                    elif operation == 'move':
+                        # Changes the partition key of the hash scheme
+                        connection.execute(text("UPDATE files SET folder_id = 5 - folder_id, file_name = 'moved' || file_id "
+                                                "WHERE file_id = :id"), {'id': file_id})
+                    elif operation == 'delete':
+                        connection.execute(text("DELETE FROM files WHERE file_id = :id"), {'id': file_id})
+                    else:
+                        inserted += 1
+                        connection.execute(text("INSERT INTO files (file_name, file_size, folder_id, file_s3_key) "
+                                                "VALUES (:name, 1, 2, :name)"), {'name': f"new{writer}-{inserted}"})
+        except Exception as e:
+            errors.append(e)
+
+    def migrate_while_writing(self, scheme: str):
+        stop, errors = threading.Event(), []
+        writers = [threading.Thread(target=self.write_concurrently, args=(writer, stop, errors)) for writer in range(4)]
+
+        def stop_writers_before_the_swap(connection, cursor, statement, *args):
+            # Later writes would only reach the new table, the old one is compared with it below
+            if statement.startswith('LOCK TABLE') and not stop.is_set():
+                stop.set()
+                for writer in writers:
+                    writer.join()
+
+        event.listen(self.engine, 'before_cursor_execute', stop_writers_before_the_swap)
+        for writer in writers:
+            writer.start()
+        try:
+            summary = migrate_files_table(self.engine, scheme, partitions=4, batch_size=25, months=2)
+        finally:
+            stop.set()
+            for writer in writers:
+                writer.join()
+            event.remove(self.engine, 'before_cursor_execute', stop_writers_before_the_swap)
+        self.assertEqual(errors, [])
+        self.assertGreater(summary['batches'], 1)
+
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT relkind FROM pg_class WHERE oid = CAST('files' AS regclass)")).scalar(), 'p')
+            duplicates = connection.execute(text("SELECT COUNT(*) - COUNT(DISTINCT file_id) FROM files")).scalar()
+        self.assertEqual(duplicates, 0)
+        # No deleted rows and no stale versions survive in the partitioned table
+        self.assertEqual(self.rows('files'), self.rows('files_unpartitioned'))
+
+    def test_hash_migration_with_concurrent_writers(self):
+        self.migrate_while_writing('hash')
+
+    def test_range_migration_with_concurrent_writers(self):
+        self.migrate_while_writing('range')
+
+if __name__ == '__main__':
+    unittest.main()
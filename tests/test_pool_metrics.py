@@ -0,0 +1,58 @@
+import os
+import tempfile
+import threading
+import unittest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from database import PoolMetrics, TimedQueuePool
+
+
+class TestPoolMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(self.directory.name, 'pool.db')}"
+        self.engine = create_engine(url, poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.2)
+        self.metrics = PoolMetrics(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_counts_checkouts_and_connections(self):
+        for _ in range(3):
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['checkout'], 3)
+        self.assertEqual(snapshot['checkin'], 3)
+        self.assertEqual(snapshot['connect'], 1)
+        self.assertEqual(snapshot['waits'], 3)
+        self.assertEqual(snapshot['checked_out'], 0)
+
+    def test_records_wait_and_timeout_when_exhausted(self):
+        held = self.engine.connect()
+        try:
+            with self.assertRaises(PoolTimeoutError):
+                self.engine.connect()
+        finally:
+            held.close()
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['timeout'], 1)
+        self.assertGreaterEqual(snapshot['wait_max'], 0.2)
+        self.assertGreaterEqual(self.metrics.wait_percentile(0.99), 0.2)
+
+    def test_waiting_checkout_is_timed(self):
+        held = self.engine.connect()
+        threading.Timer(0.05, held.close).start()
+        with self.engine.connect():
+            pass
+        self.assertGreaterEqual(self.metrics.snapshot()['wait_max'], 0.04)
+
+    def test_metrics_survive_dispose(self):
+        self.engine.dispose()
+        self.assertIs(self.engine.pool.metrics, self.metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import glob
+import os
+import pstats
+import tempfile
+import unittest
+from utils.profile_utils import ActionProfiler
+
+
+def build_records(count: int) -> list:
+    return [bytearray(1024) for _ in range(count)]
+
+
+def report_progress(chunks: int):
+    for index in range(chunks):
+        yield {'chunk': index, 'rows': build_records(10)}
+
+
+class TestActionProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.profiler = ActionProfiler(os.path.join(self.directory.name, 'profiles'), top_functions=10, top_allocations=5)
+
+    def reports(self) -> list:
+        return sorted(glob.glob(os.path.join(self.profiler.directory, '*.txt')))
+
+    def read(self, path: str) -> str:
+        with open(path, encoding='utf-8') as report:
+            return report.read()
+
+    def test_report_lists_functions_and_allocation_sites(self):
+        records = self.profiler.wrap('Create file', build_records)(500)
+        self.assertEqual(len(records), 500)
+
+        [path] = self.reports()
+        self.assertTrue(path.endswith('_create_file.txt'))
+        report = self.read(path)
+        self.assertIn('Action: Create file', report)
+        self.assertIn('Outcome: completed', report)
+        self.assertIn('build_records', report)
+        self.assertIn(f"{os.path.basename(__file__)}:", report.split('allocation sites')[1])
+        stats = pstats.Stats(path[:-len('.txt')] + '.prof')
+        self.assertTrue(any(function == 'build_records' for _, _, function in stats.stats))
+
+    def test_failed_and_generator_actions(self):
+        def fail():
+            raise ValueError("no such folder")
+
+        with self.assertRaises(ValueError):
+            self.profiler.wrap('Delete folder', fail)()
+        # A generator is profiled until it is exhausted
+        progress = self.profiler.wrap('Purge deleted folders', report_progress)(3)
+        self.assertEqual([summary['chunk'] for summary in progress], [0, 1, 2])
+        self.assertEqual(len(self.reports()), 2)
+        # An abandoned generator ends its profile instead of blocking the next action
+        abandoned = self.profiler.wrap('Purge deleted folders', report_progress)(3)
+        next(abandoned)
+        del abandoned
+        self.profiler.wrap('Create file', build_records)(1)
+
+        reports = [self.read(path) for path in self.reports()]
+        self.assertEqual(len(reports), 4)
+        self.assertIn('Outcome: failed: ValueError: no such folder', reports[0])
+        self.assertIn('report_progress', reports[1])
+        self.assertIn('Action: Create file', reports[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
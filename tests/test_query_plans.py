@@ -0,0 +1,152 @@
+import re
+import unittest
+from sqlalchemy import event, insert, select
+from injector import Injector
+from app_dependcy_injector import AppInjector
+from database import Database
+from models.file import File
+from models.folder import Folder
+from services.file_service import FileService
+from services.folder_service import FolderService
+
+SEED_FOLDERS = 50
+SEED_FILES_PER_FOLDER = 40
+HOT_TABLES = ('folders', 'files')
+
+
+class TestQueryPlans(unittest.TestCase):
+    """
+    Run the queries of the hot service methods against a seeded database and fail if the plan of any
+    of them reads the folders or files table with a sequential scan.
+
+    The statements are captured from the engine as the services issue them and explained with their
+    parameters: EXPLAIN (FORMAT JSON) with enable_seqscan off on PostgreSQL, so the planner only falls
+    back to a sequential scan when no index can serve the query, and EXPLAIN QUERY PLAN on SQLite.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        injector = Injector([AppInjector])
+        cls.db = injector.get(Database)
+        cls.folder_service = injector.get(FolderService)
+        cls.file_service = injector.get(FileService)
+        cls.engines = [cls.db.engine] + (cls.db.replica_router.engines if cls.db.replica_router else [])
+
+        with cls.db.engine.begin() as connection:
+            root_id = connection.execute(select(Folder.folder_id).where(Folder.folder_parent_id.is_(None))).scalar()
+            if root_id is None:
+                root_id = connection.execute(insert(Folder).values(folder_name='root').returning(Folder.folder_id)).scalar()
+            cls.seed_id = connection.execute(
+                insert(Folder).values(folder_name='query_plan_seed', folder_parent_id=root_id).returning(Folder.folder_id)
+            ).scalar()
+            cls.folder_ids = [
+                connection.execute(
+                    insert(Folder).values(folder_name=f"folder{index:03d}", folder_parent_id=cls.seed_id).returning(Folder.folder_id)
+                ).scalar()
+                for index in range(SEED_FOLDERS)
+            ]
+            connection.execute(insert(File), [
+                {'file_name': f"file{index:03d}.txt", 'file_size': index * 10, 'folder_id': folder_id,
+                 'file_s3_key': f"query-plan-seed/{folder_id}/{index}"}
+                for folder_id in cls.folder_ids for index in range(SEED_FILES_PER_FOLDER)
+            ])
+            cls.file_id = connection.execute(
+                select(File.file_id).where(File.folder_id == cls.folder_ids[0]).limit(1)
+            ).scalar()
+        with cls.db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql("ANALYZE")
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.db.engine.begin() as connection:
+            connection.execute(File.__table__.delete().where(File.folder_id.in_(cls.folder_ids + [cls.seed_id])))
+            connection.execute(Folder.__table__.delete().where(Folder.folder_id.in_(cls.folder_ids)))
+            connection.execute(Folder.__table__.delete().where(Folder.folder_id == cls.seed_id))
+
+    def capture_statements(self, action) -> list:
+        statements = []
+
+        def capture(connection, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+                statements.append((statement, parameters))
+
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            action()
+        finally:
+            for engine in self.engines:
+                event.remove(engine, 'before_cursor_execute', capture)
+        self.assertTrue(statements, "The action issued no statement")
+        return statements
+
+    def full_scans(self, statement: str, parameters) -> list:
+        with self.db.engine.connect() as connection:
+            if self.db.engine.dialect.name == 'postgresql':
+                connection.exec_driver_sql("SET enable_seqscan = off")
+                plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+                nodes, scans = [plan[0]['Plan']], []
+                while nodes:
+                    node = nodes.pop()
+                    nodes.extend(node.get('Plans', []))
+                    if node['Node Type'] == 'Seq Scan' and node['Relation Name'].startswith(HOT_TABLES):
+                        scans.append(node['Relation Name'])
+                return scans
+
+            # SQLite reports a table by its alias, so collect the aliases of the hot tables first
+            names = set()
+            for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+AS\s+(\w+))?', statement):
+                if table in HOT_TABLES:
+                    names.add(alias or table)
+            rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            return [row[3] for row in rows
+                    if row[3].startswith('SCAN ') and 'USING' not in row[3] and row[3].split()[1] in names]
+
+    def assertUsesIndexes(self, action):
+        for statement, parameters in self.capture_statements(action):
+            scans = self.full_scans(statement, parameters)
+            self.assertFalse(scans, f"Query plan reads a whole table ({'; '.join(scans)}):\n{statement}")
+
+    def test_get_file(self):
+        self.assertUsesIndexes(lambda: self.file_service.get_file(self.file_id))
+
+    def test_get_folder(self):
+        self.assertUsesIndexes(lambda: self.folder_service.get_folder(self.seed_id))
+
+    def test_list_files_and_subfolders(self):
+        self.assertUsesIndexes(lambda: self.folder_service.list_files_and_subfolders(self.folder_ids[0]))
+
+    def test_list_children(self):
+        self.assertUsesIndexes(lambda: self.folder_service.list_children(self.seed_id, limit=10, folders_after='folder010'))
+        self.assertUsesIndexes(lambda: self.folder_service.list_children(self.folder_ids[0], limit=10, files_after='file010.txt'))
+
+    def test_list_root_folders(self):
+        self.assertUsesIndexes(lambda: self.folder_service.list_children(None))
+
+    def test_calculate_folder_size(self):
+        self.assertUsesIndexes(lambda: self.folder_service.calculate_folder_size(self.seed_id))
+
+    def test_search_within_folder(self):
+        self.assertUsesIndexes(lambda: self.file_service.search_files('file01', mode='prefix', folder_id=self.seed_id))
+
+    def test_prefix_search(self):
+        if self.db.engine.dialect.name != 'postgresql':
+            self.skipTest("Name search indexes are PostgreSQL only")
+        self.assertUsesIndexes(lambda: self.file_service.search_files('file01', mode='prefix'))
+        self.assertUsesIndexes(lambda: self.folder_service.search_folders('folder01', mode='prefix'))
+
+    def test_move_file(self):
+        self.assertUsesIndexes(lambda: self.file_service.move_file(self.file_id, self.seed_id))
+        self.file_service.move_file(self.file_id, self.folder_ids[0])
+
+    def test_folder_quota(self):
+        self.assertUsesIndexes(lambda: self.folder_service.get_folder_quota(self.folder_ids[0]))
+        self.assertUsesIndexes(lambda: self.folder_service.list_quotas())
+
+    def test_move_folder(self):
+        self.assertUsesIndexes(lambda: self.folder_service.move_folder(self.folder_ids[1], self.folder_ids[2]))
+        self.folder_service.move_folder(self.folder_ids[1], self.seed_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
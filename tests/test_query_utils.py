@@ -0,0 +1,73 @@
+import unittest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from database import Base
+from models.file import File
+from models.folder import Folder
+from utils.query_utils import build_like_pattern, glob_to_like, name_filter, subtree_folder_ids, folder_is_live, folder_is_inside
+
+class TestQueryUtils(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=cls.engine)
+        with Session(cls.engine) as session:
+            session.add_all([
+                Folder(folder_id=1, folder_name='/', folder_parent_id=None),
+                Folder(folder_id=2, folder_name='home', folder_parent_id=1),
+                Folder(folder_id=3, folder_name='user1', folder_parent_id=2),
+                Folder(folder_id=4, folder_name='tmp', folder_parent_id=1),
+                # A cycle cut off from the root
+                Folder(folder_id=5, folder_name='loop_a', folder_parent_id=6),
+                Folder(folder_id=6, folder_name='loop_b', folder_parent_id=5),
+                File(file_id=1, file_name='report_2024.csv', file_size=10, folder_id=3, file_s3_key='k1'),
+                File(file_id=2, file_name='report%final.txt', file_size=20, folder_id=2, file_s3_key='k2'),
+                File(file_id=3, file_name='notes.txt', file_size=30, folder_id=4, file_s3_key='k3'),
+            ])
+            session.commit()
+
+    def search(self, pattern, mode, folder_id=None):
+        query = select(File.file_id).where(name_filter(File.file_name, pattern, mode))
+        if folder_id:
+            subtree = subtree_folder_ids(folder_id)
+            query = query.where(File.folder_id.in_(select(subtree.c.folder_id)))
+        with Session(self.engine) as session:
+            return sorted(session.execute(query).scalars().all())
+
+    def test_glob_to_like_escapes_wildcards(self):
+        self.assertEqual(glob_to_like('a_b*.c?'), 'a\\_b%.c_')
+        self.assertEqual(glob_to_like('100%'), '100\\%')
+
+    def test_build_like_pattern_rejects_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            build_like_pattern('abc', 'regex')
+        with self.assertRaises(ValueError):
+            build_like_pattern('', 'prefix')
+
+    def test_prefix_and_substring(self):
+        self.assertEqual(self.search('report', 'prefix'), [1, 2])
+        self.assertEqual(self.search('%', 'substring'), [2])
+
+    def test_glob_and_extension(self):
+        self.assertEqual(self.search('report_????.*', 'glob'), [1])
+        self.assertEqual(self.search('.txt', 'extension'), [2, 3])
+
+    def test_subtree_scope(self):
+        self.assertEqual(self.search('.txt', 'extension', folder_id=2), [2])
+        self.assertEqual(self.search('report', 'prefix', folder_id=3), [1])
+
+    def test_ancestor_walks_end_on_a_cycle(self):
+        with Session(self.engine) as session:
+            self.assertTrue(folder_is_live(session, 3))
+            self.assertFalse(folder_is_live(session, 5))
+            self.assertFalse(folder_is_live(session, 99))
+            self.assertTrue(folder_is_inside(session, 3, 2))
+            self.assertTrue(folder_is_inside(session, 3, 3))
+            self.assertFalse(folder_is_inside(session, 2, 3))
+            self.assertTrue(folder_is_inside(session, 5, 6))
+            self.assertFalse(folder_is_inside(session, 5, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from sqlalchemy import create_engine, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from database import Base
+from models.folder import Folder
+from utils.quota_utils import quota_folder_ids
+
+
+class RecordingSession:
+    """
+    Passes statements on to a session and records them; before_lock runs before the first locking read.
+    """
+
+    def __init__(self, session, before_lock=None):
+        self.session = session
+        self.before_lock = before_lock
+        self.statements = []
+
+    def execute(self, statement, *args, **kwargs):
+        self.statements.append(statement)
+        if self.before_lock is not None and getattr(statement, '_for_update_arg', None) is not None:
+            before_lock, self.before_lock = self.before_lock, None
+            before_lock(self.session)
+        return self.session.execute(statement, *args, **kwargs)
+
+
+class TestQuotaUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(bind=self.engine)
+        self.session = Session(self.engine)
+        self.addCleanup(self.session.close)
+        self.session.add_all([
+            Folder(folder_id=1, folder_name='root', folder_parent_id=None),
+            Folder(folder_id=2, folder_name='home', folder_parent_id=1, folder_used_bytes=0, folder_used_files=0),
+            Folder(folder_id=3, folder_name='user1', folder_parent_id=2),
+            Folder(folder_id=4, folder_name='shared', folder_parent_id=1, folder_used_bytes=0, folder_used_files=0),
+        ])
+        self.session.commit()
+
+    def test_locked_chain_matches_and_locks_for_key_share(self):
+        recording = RecordingSession(self.session)
+        self.assertEqual(quota_folder_ids(recording, 3, lock=True), quota_folder_ids(self.session, 3))
+        self.assertEqual(quota_folder_ids(recording, 3, lock=True), [2])
+        locking = [str(statement.compile(dialect=postgresql.dialect())) for statement in recording.statements
+                   if statement._for_update_arg is not None]
+        self.assertTrue(locking)
+        self.assertTrue(all(sql.endswith('FOR KEY SHARE') for sql in locking))
+        self.assertEqual(quota_folder_ids(self.session, None, lock=True), [])
+
+    def test_locked_chain_is_walked_again_after_a_concurrent_move(self):
+        def move(session):
+            session.execute(update(Folder).where(Folder.folder_id == 3).values(folder_parent_id=4))
+
+        recording = RecordingSession(self.session, before_lock=move)
+        self.assertEqual(quota_folder_ids(recording, 3, lock=True), [4])
+        self.assertIsNone(recording.before_lock)
+
+    def test_chain_walk_ends_on_a_cycle(self):
+        self.session.add_all([
+            Folder(folder_id=5, folder_name='loop_a', folder_parent_id=6, folder_used_bytes=0, folder_used_files=0),
+            Folder(folder_id=6, folder_name='loop_b', folder_parent_id=5),
+        ])
+        self.session.commit()
+        self.assertEqual(quota_folder_ids(self.session, 6), [5])
+        self.assertEqual(quota_folder_ids(self.session, 6, lock=True), [5])
+
+
+if __name__ == '__main__':
+    unittest.main()
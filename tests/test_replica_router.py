@@ -0,0 +1,102 @@
+import os
+import tempfile
+import time
+import unittest
+from sqlalchemy import event, insert, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database import Base, Database, ReplicaRouter, ReplicaSession
+from models.folder import Folder
+
+
+class TestReplicaRouter(unittest.TestCase):
+    """
+    Read routing over two SQLite replicas. Each database has a root folder named after it, so a read
+    shows which database served it.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        config_path = os.path.join(self.directory.name, 'config.ini')
+        with open(config_path, 'w') as config_file:
+            config_file.write(f"[database]\ndialect = sqlite\npath = {os.path.join(self.directory.name, 'primary.sqlite')}\n")
+        self.db = Database(config_path=config_path)
+        self.addCleanup(self.db.engine.dispose)
+        self.name_root(self.db.engine, 'primary')
+
+        self.replicas = []
+        for name in ('replica1', 'replica2'):
+            engine = self.db._create_engine(f"sqlite:///{os.path.join(self.directory.name, name + '.sqlite')}")
+            self.addCleanup(engine.dispose)
+            Base.metadata.create_all(bind=engine)
+            self.name_root(engine, name)
+            self.replicas.append(engine)
+        self.db.replica_router = ReplicaRouter(self.replicas, retry_seconds=0.2)
+        self.db.ReplicaSession = sessionmaker(class_=ReplicaSession, autocommit=False, autoflush=False)
+
+    @staticmethod
+    def name_root(engine, name: str):
+        with engine.begin() as connection:
+            connection.execute(insert(Folder).values(folder_name=name))
+
+    def read_root(self) -> tuple:
+        session = self.db.get_db_session(read_only=True)
+        try:
+            return session.scalar(select(Folder.folder_name)), session.bind
+        finally:
+            self.db.close_db_session(session)
+
+    def test_reads_alternate_between_replicas(self):
+        self.assertEqual([self.read_root()[0] for _ in range(4)], ['replica1', 'replica2', 'replica1', 'replica2'])
+
+    def test_unhealthy_replica_is_skipped_until_its_retry_interval_passes(self):
+        self.db.replica_router.mark_unhealthy(self.replicas[0])
+        self.assertEqual([self.read_root()[0] for _ in range(3)], ['replica2'] * 3)
+        self.db.replica_router.mark_unhealthy(self.replicas[1])
+        self.assertEqual(self.read_root(), ('primary', self.db.engine))
+
+        time.sleep(0.25)
+        self.assertEqual(sorted(self.read_root()[0] for _ in range(2)), ['replica1', 'replica2'])
+
+    def test_reads_stay_on_the_primary_after_a_write(self):
+        self.db.read_your_writes_seconds = 0.2
+        session = self.db.get_db_session()
+        try:
+            session.add(Folder(folder_name='written', folder_parent_id=1))
+            session.commit()
+        finally:
+            self.db.close_db_session(session)
+
+        self.assertEqual([self.read_root()[0] for _ in range(2)], ['primary', 'primary'])
+        time.sleep(0.25)
+        self.assertEqual(self.read_root()[0], 'replica1')
+
+    def test_failed_replica_read_is_repeated_once_on_the_primary(self):
+        with self.replicas[0].begin() as connection:
+            connection.execute(text("DROP TABLE files"))
+        session = self.db.get_db_session(read_only=True)
+        try:
+            self.assertIs(session.bind, self.replicas[0])
+            self.assertEqual(session.execute(text("SELECT COUNT(*) FROM files")).scalar(), 0)
+            self.assertIs(session.bind, self.db.engine)
+            self.assertEqual(session.scalar(select(Folder.folder_name)), 'primary')
+        finally:
+            self.db.close_db_session(session)
+
+        # A statement that fails on the primary as well is not repeated again
+        on_primary = []
+        event.listen(self.db.engine, 'before_cursor_execute', lambda *args: on_primary.append(args[2]))
+        session = self.db.get_db_session(read_only=True)
+        try:
+            self.assertIs(session.bind, self.replicas[1])
+            with self.assertRaises(OperationalError):
+                session.scalars(text("SELECT missing_column FROM folders")).all()
+            self.assertIs(session.bind, self.db.engine)
+            self.assertEqual([sql for sql in on_primary if not sql.startswith('BEGIN')], ['SELECT missing_column FROM folders'])
+        finally:
+            self.db.close_db_session(session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from utils.report_utils import compute_subtree_aggregates, size_histogram, created_date_distribution
+
+class TestReportUtils(unittest.TestCase):
+
+    def setUp(self):
+        # /(1) -> home(2) -> user1(3), /(1) -> tmp(4); folder IDs deliberately unsorted
+        self.folder_ids = np.array([3, 1, 4, 2])
+        self.parent_ids = np.array([2, -1, 1, 1])
+        self.file_folder_ids = np.array([3, 3, 2, 4, 99])
+        self.file_sizes = np.array([10, 20, 5, 1, 1000])
+
+    def test_subtree_aggregates(self):
+        report = compute_subtree_aggregates(self.folder_ids, self.parent_ids, self.file_folder_ids,
+                                            self.file_sizes, np.array(['user1', '/', 'tmp', 'home']))
+        by_id = report.set_index('folder_id')
+        self.assertEqual(list(report['folder_id']), [1, 2, 3, 4])
+        self.assertEqual(by_id.loc[1, 'folder_name'], '/')
+        self.assertEqual(list(by_id['depth']), [0, 1, 2, 1])
+        self.assertEqual(list(by_id['size']), [0, 5, 30, 1])
+        self.assertEqual(list(by_id['subtree_size']), [36, 35, 30, 1])
+        self.assertEqual(list(by_id['subtree_file_count']), [4, 3, 2, 1])
+        self.assertTrue(report['folder_parent_id'].isna().iloc[0])
+
+    def test_cycle_is_rejected(self):
+        with self.assertRaises(ValueError):
+            compute_subtree_aggregates(np.array([1, 2]), np.array([2, 1]), np.array([]), np.array([]))
+
+    def test_size_histogram(self):
+        histogram = size_histogram(np.array([0, 1, 2, 3, 1024]))
+        self.assertEqual(list(histogram['min_bytes']), [0, 1, 2, 1024])
+        self.assertEqual(list(histogram['count']), [1, 1, 2, 1])
+
+    def test_created_date_distribution(self):
+        dates = np.array(['2024-01-03', '2024-02-01', '2024-01-09'], dtype='datetime64[ns]')
+        distribution = created_date_distribution(dates)
+        self.assertEqual(list(distribution['period']), ['2024-01', '2024-02'])
+        self.assertEqual(list(distribution['count']), [2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
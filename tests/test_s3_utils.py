@@ -0,0 +1,65 @@
+import unittest
+from botocore.exceptions import ClientError
+from benchmarks.local_object_store import LocalObjectStore
+from utils.metrics import registry
+from utils.s3_utils import S3Utils, S3_BUCKET_NAME
+from utils.transfer_utils import TransferScheduler
+
+
+class FlakyObjectStore(LocalObjectStore):
+    """
+    Answers the first DeleteObjects request with per-key errors and the first ListObjectsV2 with SlowDown.
+    """
+
+    def __init__(self, key_errors: dict):
+        super().__init__()
+        self.key_errors = key_errors
+        self.delete_requests = []
+        self.list_requests = 0
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [item['Key'] for item in Delete['Objects']]
+        self.delete_requests.append(keys)
+        response = super().delete_objects(Bucket, Delete)
+        if len(self.delete_requests) == 1:
+            response['Errors'] = [{'Key': key, 'Code': code, 'Message': code} for key, code in self.key_errors.items()]
+            for key in self.key_errors:
+                self.put_object(Bucket, key, b'kept')
+        return response
+
+    def list_objects_v2(self, Bucket, **kwargs):
+        self.list_requests += 1
+        if self.list_requests == 1:
+            raise ClientError({'Error': {'Code': 'SlowDown'}, 'ResponseMetadata': {'HTTPStatusCode': 503}}, 'ListObjectsV2')
+        return super().list_objects_v2(Bucket, **kwargs)
+
+
+class TestS3Utils(unittest.TestCase):
+
+    def setUp(self):
+        client = S3Utils.s3_client
+        self.addCleanup(setattr, S3Utils, 's3_client', client)
+        self.store = FlakyObjectStore({'throttled': 'SlowDown', 'transient': 'InternalError', 'denied': 'AccessDenied'})
+        S3Utils.s3_client = self.store
+        # Earlier tests may have spent the shared scheduler's retry budget
+        self.addCleanup(setattr, S3Utils, 'scheduler', S3Utils.scheduler)
+        S3Utils.scheduler = TransferScheduler(base_delay=0.01, max_delay=0.05)
+
+    def test_delete_retries_throttled_and_transient_keys(self):
+        keys = ['kept-1', 'throttled', 'transient', 'denied', 'kept-2']
+        for key in keys:
+            self.store.put_object(S3_BUCKET_NAME, key, b'body')
+
+        self.assertEqual(S3Utils.delete_files_from_s3(keys), ['denied'])
+        self.assertEqual(self.store.delete_requests, [keys, ['throttled', 'transient']])
+        self.assertEqual(self.store.object_count(), 1)
+
+    def test_connection_check_goes_through_the_scheduler(self):
+        before = registry.value('s3_requests_total', type='LIST') or 0
+        self.assertTrue(S3Utils.check_s3_connection())
+        self.assertEqual(self.store.list_requests, 2)
+        self.assertEqual(registry.value('s3_requests_total', type='LIST'), before + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
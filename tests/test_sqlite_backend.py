@@ -0,0 +1,120 @@
+import os
+import tempfile
+import threading
+import unittest
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+from database import Database
+
+
+class TestSQLiteBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_database(self, path: str) -> Database:
+        config_path = os.path.join(self.directory.name, 'config.ini')
+        with open(config_path, 'w') as config_file:
+            config_file.write(f"[database]\ndialect = sqlite\npath = {path}\n\n[sqlite]\nbusy_timeout = 1000\n")
+        db = Database(config_path=config_path)
+        self.addCleanup(db.engine.dispose)
+        return db
+
+    def test_url_and_pragmas(self):
+        path = os.path.join(self.directory.name, 'metadata.sqlite')
+        db = self.make_database(path)
+        self.assertEqual(db.DATABASE_URL, f"sqlite:///{path}")
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute(text("PRAGMA journal_mode")).scalar(), 'wal')
+            self.assertEqual(connection.execute(text("PRAGMA foreign_keys")).scalar(), 1)
+            self.assertEqual(connection.execute(text("PRAGMA busy_timeout")).scalar(), 1000)
+
+    def test_tables_created_and_single_root_enforced(self):
+        db = self.make_database(os.path.join(self.directory.name, 'metadata.sqlite'))
+        with db.engine.connect() as connection:
+            connection.execute(text("INSERT INTO folders (folder_name) VALUES ('root')"))
+            with self.assertRaises(IntegrityError):
+                connection.execute(text("INSERT INTO folders (folder_name) VALUES ('second_root')"))
+
+    def test_cascade_delete(self):
+        db = self.make_database(os.path.join(self.directory.name, 'metadata.sqlite'))
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO folders (folder_id, folder_name) VALUES (1, 'root')"))
+            connection.execute(text("INSERT INTO files (file_name, file_size, folder_id, file_s3_key) VALUES ('a', 1, 1, 'k')"))
+            connection.execute(text("DELETE FROM folders WHERE folder_id = 1"))
+            self.assertEqual(connection.execute(text("SELECT COUNT(*) FROM files")).scalar(), 0)
+
+    def test_memory_database_is_shared_between_threads(self):
+        db = self.make_database(':memory:')
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO folders (folder_name) VALUES ('root')"))
+        counts = []
+
+        def count_folders():
+            with db.engine.connect() as connection:
+                counts.append(connection.execute(text("SELECT COUNT(*) FROM folders")).scalar())
+
+        thread = threading.Thread(target=count_folders)
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [1])
+        self.assertEqual(db.pool_statistics()['primary']['checked_out'], 0)
+
+    def test_statements_led_by_a_cte_roll_back(self):
+        db = self.make_database(os.path.join(self.directory.name, 'metadata.sqlite'))
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO folders (folder_id, folder_name) VALUES (1, 'root')"))
+        with db.get_db_session() as session:
+            session.execute(text("WITH target AS (SELECT 1 AS folder_id) "
+                                 "UPDATE folders SET folder_name = 'renamed' WHERE folder_id IN (SELECT folder_id FROM target)"))
+            session.rollback()
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT folder_name FROM folders")).scalar(), 'root')
+
+    def test_write_sessions_begin_immediate(self):
+        db = self.make_database(os.path.join(self.directory.name, 'metadata.sqlite'))
+        begins = []
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def record_begin(connection, cursor, statement, parameters, context, executemany):
+            if statement.startswith('BEGIN'):
+                begins.append(statement)
+
+        for read_only in (True, False):
+            with db.get_db_session(read_only=read_only) as session:
+                session.execute(text("SELECT COUNT(*) FROM folders")).scalar()
+        self.assertEqual(begins, ['BEGIN DEFERRED', 'BEGIN IMMEDIATE'])
+
+    def test_concurrent_read_then_write_sessions_wait_for_the_lock(self):
+        db = self.make_database(os.path.join(self.directory.name, 'metadata.sqlite'))
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO folders (folder_id, folder_name) VALUES (1, 'root')"))
+        errors = []
+
+        def write(worker):
+            try:
+                for index in range(10):
+                    with db.get_db_session() as session:
+                        # Reads first, so a deferred transaction would hold a stale snapshot when it writes
+                        session.execute(text("SELECT COUNT(*) FROM folders")).scalar()
+                        session.execute(text("INSERT INTO folders (folder_name, folder_parent_id) VALUES (:name, 1)"),
+                                        {'name': f"folder_{worker}_{index}"})
+                        session.commit()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with db.get_db_session(read_only=True) as session:
+            self.assertEqual(session.execute(text("SELECT COUNT(*) FROM folders")).scalar(), 41)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import threading
+import unittest
+from sqlalchemy import create_engine, text
+from utils import tracing
+from utils.tracing import configure, load_trace, propagate, span, trace_class
+
+
+@trace_class('service')
+class Greeter:
+    def greet(self, name: str, content: bytes = b'', parent_id: int = None):
+        with span('inner', 'app', size=len(content)):
+            return f"hello {name}"
+
+    def names(self, count: int):
+        for index in range(count):
+            yield f"name_{index}"
+
+    def fail(self):
+        raise ValueError("broken")
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'traces', 'trace.json')
+        configure(self.path)
+        self.addCleanup(configure, None)
+
+    def events(self):
+        return {event['name']: event for event in load_trace(self.path)}
+
+    def test_disabled_tracer_records_nothing(self):
+        configure(None)
+        with span('nothing') as current:
+            current.set(size=1)
+        self.assertEqual(Greeter().greet('ada'), 'hello ada')
+        self.assertIsNone(tracing.current_span())
+
+    def test_nested_spans_and_simple_arguments(self):
+        with span('request', 'controller'):
+            Greeter().greet('ada', content=b'abc', parent_id=7)
+        with self.assertRaises(ValueError):
+            Greeter().fail()
+        self.assertEqual(list(Greeter().names(2)), ['name_0', 'name_1'])
+
+        events = self.events()
+        request, greet, inner = events['request'], events['Greeter.greet'], events['inner']
+        self.assertEqual(greet['args']['parent_span_id'], request['args']['span_id'])
+        self.assertEqual(inner['args']['parent_span_id'], greet['args']['span_id'])
+        self.assertEqual(inner['args']['trace_id'], request['args']['span_id'])
+        self.assertEqual(greet['args']['name'], 'ada')
+        self.assertEqual(greet['args']['parent_id'], 7)
+        self.assertNotIn('content', greet['args'])
+        self.assertEqual(inner['args']['size'], 3)
+        self.assertGreaterEqual(request['dur'], greet['dur'])
+        self.assertEqual(events['Greeter.fail']['args']['error'], 'ValueError: broken')
+        self.assertEqual(events['Greeter.names']['args']['count'], 2)
+
+    def test_sql_and_propagated_spans(self):
+        engine = create_engine('sqlite://')
+        tracing.instrument_engine(engine)
+        self.addCleanup(engine.dispose)
+
+        def query():
+            with engine.connect() as connection:
+                return connection.execute(text("SELECT 1")).scalar()
+
+        with span('request', 'controller') as request:
+            thread = threading.Thread(target=propagate(query))
+            thread.start()
+            thread.join()
+        configure(None)
+
+        events = self.events()
+        self.assertEqual(events['sql.SELECT']['args']['parent_span_id'], request.span_id)
+        self.assertEqual(events['sql.SELECT']['args']['statement'], 'SELECT 1')
+        self.assertNotEqual(events['sql.SELECT']['tid'], events['request']['tid'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import io
+import threading
+import time
+import unittest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from utils.transfer_utils import TransferScheduler, ScheduledStream, classify_error, classify_error_code, size_class
+
+
+def client_error(code, status=400):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'PutObject')
+
+
+class TestTransferScheduler(unittest.TestCase):
+
+    def test_classify_error(self):
+        self.assertEqual(classify_error(client_error('SlowDown', 503)), 'throttle')
+        self.assertEqual(classify_error(client_error('InternalError', 500)), 'transient')
+        self.assertEqual(classify_error(EndpointConnectionError(endpoint_url='http://s3')), 'transient')
+        self.assertEqual(classify_error(client_error('NoSuchKey', 404)), 'fatal')
+        self.assertEqual(classify_error(ValueError('bad')), 'fatal')
+
+    def test_classify_error_code_and_size_class(self):
+        self.assertEqual(classify_error_code('SlowDown'), 'throttle')
+        self.assertEqual(classify_error_code('InternalError'), 'transient')
+        self.assertEqual(classify_error_code('AccessDenied'), 'fatal')
+        self.assertEqual(classify_error_code('', 502), 'transient')
+        self.assertEqual([size_class(nbytes) for nbytes in (0, 64 * 1024, 64 * 1024 + 1, 256 * 1024 + 1)], [0, 0, 1, 2])
+
+    def test_slower_large_transfers_do_not_lower_the_limit(self):
+        scheduler = TransferScheduler(initial_concurrency=4, max_concurrency=64, base_delay=0, latency_tolerance=3)
+        for _ in range(30):
+            scheduler.call('put', lambda: None, nbytes=1024)
+        limit = scheduler.stats()['concurrency_limit']
+        for _ in range(30):
+            scheduler.call('put', lambda: time.sleep(0.002), nbytes=64 * 1024 * 1024)
+        self.assertGreater(scheduler.stats()['concurrency_limit'], limit)
+
+    def test_limit_recovers_after_a_lasting_rise_in_latency(self):
+        scheduler = TransferScheduler(initial_concurrency=16, max_concurrency=64, latency_tolerance=3)
+        for _ in range(30):
+            scheduler._on_success(('get', 0), 0.001)
+        before = scheduler.stats()['concurrency_limit']
+
+        limits = []
+        for _ in range(300):
+            scheduler._on_success(('get', 0), 0.05)
+            limits.append(scheduler.stats()['concurrency_limit'])
+        lowest = min(limits)
+        self.assertLess(lowest, before)
+        self.assertGreater(limits[-1], lowest)
+        self.assertEqual(limits[-1], max(limits[limits.index(lowest):]))
+
+    def test_interrupted_request_releases_its_slot(self):
+        scheduler = TransferScheduler(base_delay=0)
+
+        def interrupted():
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            scheduler.call('put', interrupted, nbytes=10)
+        stats = scheduler.stats()
+        self.assertEqual((stats['in_flight'], stats['bytes_in_flight'], stats['retries']), (0, 0, 0))
+
+    def test_limit_grows_on_success_and_halves_on_throttle(self):
+        scheduler = TransferScheduler(initial_concurrency=4, max_concurrency=8, base_delay=0, latency_tolerance=0)
+        for _ in range(40):
+            scheduler.call('put', lambda: None)
+        self.assertEqual(scheduler.stats()['concurrency_limit'], 8)
+
+        attempts = []
+
+        def throttled_once():
+            attempts.append(True)
+            if len(attempts) == 1:
+                raise client_error('SlowDown', 503)
+            return 'done'
+
+        self.assertEqual(scheduler.call('put', throttled_once), 'done')
+        stats = scheduler.stats()
+        self.assertEqual(stats['concurrency_limit'], 4)
+        self.assertEqual((stats['throttles'], stats['retries'], stats['failures']), (1, 1, 0))
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_fatal_errors_and_exhausted_attempts_are_raised(self):
+        scheduler = TransferScheduler(max_attempts=3, base_delay=0)
+        attempts = []
+
+        def missing():
+            attempts.append(True)
+            raise client_error('NoSuchKey', 404)
+
+        with self.assertRaises(ClientError):
+            scheduler.call('get', missing)
+        self.assertEqual(len(attempts), 1)
+
+        def failing():
+            attempts.append(True)
+            raise client_error('InternalError', 500)
+
+        with self.assertRaises(ClientError):
+            scheduler.call('get', failing)
+        self.assertEqual(len(attempts), 4)
+        self.assertEqual(scheduler.stats()['failures'], 2)
+
+    def test_retry_budget_limits_retries(self):
+        scheduler = TransferScheduler(max_attempts=10, base_delay=0, retry_budget=2)
+        attempts = []
+
+        def failing():
+            attempts.append(True)
+            raise client_error('InternalError', 500)
+
+        with self.assertRaises(ClientError):
+            scheduler.call('get', failing)
+        self.assertEqual(len(attempts), 3)
+
+    def test_bytes_in_flight_are_capped(self):
+        scheduler = TransferScheduler(initial_concurrency=4, max_bytes_in_flight=100)
+        first, release_first = scheduler.hold('get', lambda: 'first', nbytes=80)
+        # A request larger than the cap still runs when nothing else is in flight
+        self.assertEqual(scheduler.call('put', lambda: 'alone', nbytes=0), 'alone')
+
+        started = threading.Event()
+        thread = threading.Thread(target=lambda: scheduler.call('put', started.set, nbytes=50))
+        thread.start()
+        self.assertFalse(started.wait(0.2))
+        release_first()
+        release_first()
+        thread.join(5)
+        self.assertTrue(started.is_set())
+        self.assertEqual(scheduler.stats()['bytes_in_flight'], 0)
+
+    def test_scheduled_stream_releases_on_close(self):
+        scheduler = TransferScheduler()
+        body, release = scheduler.hold('get', lambda: io.BytesIO(b'content'), nbytes=7)
+        with ScheduledStream(body, release) as stream:
+            self.assertEqual(stream.read(3), b'con')
+            self.assertEqual(scheduler.stats()['in_flight'], 1)
+        self.assertEqual(scheduler.stats()['in_flight'], 0)
+        self.assertEqual(scheduler.stats()['bytes_in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
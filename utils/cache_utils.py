@@ -0,0 +1,235 @@
+import os
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from logger import Logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = Logger.get_logger()
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+class ContentCache:
+    """
+    A local on-disk read-through cache of S3 object bodies with a byte budget and LRU eviction.
+
+    S3 keys are unique per upload, so a cached body never goes stale and entries only leave the
+    cache through eviction or deletion. Entries are written to a temporary file and renamed into
+    place, so readers in any process see either the whole body or nothing. A hit refreshes the
+    entry's mtime, and eviction removes the least recently used entries under an exclusive file
+    lock shared by all processes using the same directory.
+
+    Attributes:
+        cache_dir (str): The directory holding the cached bodies.
+        max_bytes (int): The byte budget of the cache.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Initialize the cache, creating its directory if needed.
+
+        Args:
+            cache_dir (str): The directory holding the cached bodies.
+            max_bytes (int): The byte budget of the cache.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_path = os.path.join(cache_dir, '.lock')
+        self._thread_lock = threading.Lock()
+        self._approx_bytes = self._scan_size()
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest)
+
+    def _entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if not entry.name.startswith('.'):
+                        yield entry
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    @contextmanager
+    def _exclusive(self):
+        with self._thread_lock, open(self._lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def contains(self, key: str) -> bool:
+        """
+        Check whether a body is cached.
+        """
+        return os.path.exists(self._path(key))
+
+    def open(self, key: str):
+        """
+        Open a cached body for reading and mark it as recently used.
+
+        Args:
+            key (str): The S3 key.
+
+        Returns:
+            file: A binary file object, or None on a cache miss.
+        """
+        path = self._path(key)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return file
+
+    def get(self, key: str) -> bytes:
+        """
+        Read a whole cached body into memory; use open to stream large bodies instead.
+
+        Args:
+            key (str): The S3 key.
+
+        Returns:
+            bytes: The cached body, or None on a cache miss.
+        """
+        file = self.open(key)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def put(self, key: str, source) -> bool:
+        """
+        Store a body atomically, then evict least recently used entries if the budget is exceeded.
+
+        Args:
+            key (str): The S3 key.
+            source (bytes or file): The body, or a readable binary stream of it.
+
+        Returns:
+            bool: True if the body was cached, False if it is larger than the whole budget.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                if isinstance(source, (bytes, bytearray, memoryview)):
+                    temp_file.write(source)
+                    size = len(source)
+                else:
+                    while chunk := source.read(STREAM_CHUNK_SIZE):
+                        temp_file.write(chunk)
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            break
+            if size > self.max_bytes:
+                os.remove(temp_path)
+                return False
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self._approx_bytes += size
+        if self._approx_bytes > self.max_bytes:
+            self.evict()
+        return True
+
+    def discard(self, key: str):
+        """
+        Remove a body from the cache, e.g. after the object was deleted.
+        """
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, target_ratio: float = 0.9) -> int:
+        """
+        Remove least recently used entries until the cache fits in target_ratio of its budget.
+
+        Args:
+            target_ratio (float, optional): The fill level to evict down to. Defaults to 0.9.
+
+        Returns:
+            int: The number of bytes freed.
+        """
+        with self._exclusive():
+            entries = []
+            total = 0
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            freed = 0
+            target = self.max_bytes * target_ratio
+            for _, size, path in sorted(entries):
+                if total - freed <= target:
+                    break
+                try:
+                    os.remove(path)
+                    freed += size
+                except FileNotFoundError:
+                    pass
+            self._approx_bytes = total - freed
+        if freed:
+            logger.info(f"Content cache evicted {freed} bytes, {self._approx_bytes} bytes cached")
+        return freed
+
+
+def copy_file_object(source, destination, chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Copy a binary stream to another, with os.sendfile when both ends are regular files. A
+    SpooledTemporaryFile is copied through its read and write methods, as asking for its file
+    descriptor would move it to disk.
+
+    Args:
+        source: A readable binary stream.
+        destination: A writable binary stream.
+        chunk_size (int, optional): The number of bytes copied at a time. Defaults to 1 MiB.
+
+    Returns:
+        int: The number of bytes copied.
+    """
+    if hasattr(os, 'sendfile') and not any(isinstance(stream, tempfile.SpooledTemporaryFile)
+                                           for stream in (source, destination)):
+        try:
+            source_fd, destination_fd = source.fileno(), destination.fileno()
+        except (AttributeError, OSError, ValueError):
+            source_fd = destination_fd = None
+        if source_fd is not None and destination.seekable():
+            destination.flush()
+            offset = source.tell()
+            copied = 0
+            while sent := os.sendfile(destination_fd, source_fd, offset + copied, chunk_size):
+                copied += sent
+            destination.seek(0, os.SEEK_END)
+            return copied
+
+    copied = 0
+    while chunk := source.read(chunk_size):
+        destination.write(chunk)
+        copied += len(chunk)
+    return copied
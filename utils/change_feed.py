@@ -0,0 +1,178 @@
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import event, insert, text
+from sqlalchemy.orm import Session
+from models.change import Change
+from logger import Logger
+
+logger = Logger.get_logger()
+
+CHANGE_OPERATIONS = ('create', 'update', 'move', 'delete')
+CHANGE_ENTITIES = ('folder', 'file')
+
+# Key of the transaction level advisory lock that serializes changelog appends on PostgreSQL
+CHANGELOG_LOCK_KEY = 0x636c6462
+
+# Keys of the changes a session holds in Session.info until its transaction ends
+PENDING_CHANGES_KEY = 'pending_changes'
+COMMITTED_CHANGES_KEY = 'committed_changes'
+
+
+def change_to_dict(change) -> dict:
+    """
+    Convert a changelog row into the dictionary returned by changes_since and published to subscribers.
+
+    Args:
+        change: A Change object or a row with the columns of the changes table.
+
+    Returns:
+        dict: The change keyed like the other service results.
+    """
+    return {
+        'Change ID': change.change_id,
+        'Change Time': change.change_time,
+        'Operation': change.change_operation,
+        'Entity': change.change_entity,
+        'Entity ID': change.change_entity_id,
+        'Folder ID': change.change_folder_id,
+        'Previous Folder ID': change.change_previous_folder_id,
+        'Name': change.change_name
+    }
+
+
+class ChangeFeed:
+    """
+    An in-process publish/subscribe hub for committed changes.
+
+    Subscribers are called on the thread that committed the change, after the commit, once per change
+    and in changelog order. A subscriber that raises is logged and does not affect the others or the
+    committing call, so subscribers should hand slow work to their own thread or queue.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, entity: str = None):
+        """
+        Register a callback for committed changes.
+
+        Args:
+            callback (callable): Called with the dictionary of each change.
+            entity (str, optional): Only deliver changes of 'folder' or 'file'. Defaults to every change.
+
+        Returns:
+            callable: A function that removes the subscription.
+        """
+        if entity is not None and entity not in CHANGE_ENTITIES:
+            raise ValueError(f"Unknown change entity: {entity}. Use one of {', '.join(CHANGE_ENTITIES)}")
+        subscription = (callback, entity)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscription]
+        return lambda: self.unsubscribe(callback)
+
+    def unsubscribe(self, callback):
+        """
+        Remove every subscription of a callback.
+
+        Args:
+            callback (callable): The callback passed to subscribe.
+        """
+        with self._lock:
+            self._subscribers = [subscription for subscription in self._subscribers if subscription[0] is not callback]
+
+    def publish(self, changes: list):
+        """
+        Deliver committed changes to the subscribers.
+
+        Args:
+            changes (list): The change dictionaries, in changelog order.
+        """
+        # The list is replaced rather than mutated, so it can be iterated without holding the lock
+        subscribers = self._subscribers
+        for change in changes:
+            for callback, entity in subscribers:
+                if entity is not None and entity != change['Entity']:
+                    continue
+                try:
+                    callback(change)
+                except Exception as e:
+                    logger.error(f"Change subscriber failed on Change ID: {change['Change ID']}, Error: {e}", exc_info=True)
+
+
+change_feed = ChangeFeed()
+
+
+def record_change(session: Session, operation: str, entity: str, entity_id: int, folder_id: int = None,
+                  previous_folder_id: int = None, name: str = None):
+    """
+    Queue a change to be appended to the changelog when the session commits.
+
+    The row is written in the same transaction as the change itself, so a rollback discards both.
+
+    Args:
+        session (Session): The session making the change.
+        operation (str): 'create', 'update', 'move' or 'delete'.
+        entity (str): 'folder' or 'file'.
+        entity_id (int): The ID of the changed folder or file.
+        folder_id (int, optional): The parent folder of the folder, or the folder of the file.
+        previous_folder_id (int, optional): For moves, the folder before the change.
+        name (str, optional): The name of the folder or file.
+    """
+    record_changes(session, [{
+        'change_operation': operation,
+        'change_entity': entity,
+        'change_entity_id': entity_id,
+        'change_folder_id': folder_id,
+        'change_previous_folder_id': previous_folder_id,
+        'change_name': name
+    }])
+
+
+def record_changes(session: Session, changes: list):
+    """
+    Queue many changes at once, e.g. the rows of a bulk insert.
+
+    Args:
+        session (Session): The session making the changes.
+        changes (list): Dictionaries with the columns of the changes table, without change_id and change_time.
+    """
+    # Begin the transaction if nothing ran yet, so its rollback discards the changes as well
+    if not session.in_transaction():
+        session.begin()
+    session.info.setdefault(PENDING_CHANGES_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, 'before_commit')
+def _append_pending_changes(session):
+    pending = session.info.pop(PENDING_CHANGES_KEY, None)
+    if not pending:
+        return
+    if session.get_bind().dialect.name == 'postgresql':
+        # Writers queue on the lock until the holder commits, so change IDs become visible in increasing
+        # order and a reader resuming after an ID can never miss a smaller one committed later
+        session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CHANGELOG_LOCK_KEY})
+    # The column has no time zone, so subscribers get the same naive UTC time changes_since reads back
+    change_time = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [dict(change, change_time=change_time) for change in pending]
+    change_ids = session.execute(
+        insert(Change).returning(Change.change_id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    session.info[COMMITTED_CHANGES_KEY] = [
+        change_to_dict(Change(change_id=change_id, **row)) for change_id, row in zip(change_ids, rows)
+    ]
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed_changes(session):
+    committed = session.info.pop(COMMITTED_CHANGES_KEY, None)
+    if committed:
+        change_feed.publish(committed)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_uncommitted_changes(session, transaction):
+    # Sessions are reused per thread, so changes of a rolled back or abandoned transaction must not leak into the next one
+    if transaction.parent is None:
+        session.info.pop(PENDING_CHANGES_KEY, None)
+        session.info.pop(COMMITTED_CHANGES_KEY, None)
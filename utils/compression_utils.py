@@ -0,0 +1,153 @@
+import os
+import zlib
+import gzip
+import configparser
+from logger import Logger
+from utils.cache_utils import copy_file_object
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Initialize logger
+logger = Logger.get_logger()
+
+# Read configuration
+config = configparser.ConfigParser()
+config.read('config/config.ini')
+
+# Compression configuration, disabled unless a [compression] section enables it
+COMPRESSION_ENABLED = config.getboolean('compression', 'enabled', fallback=False)
+COMPRESSION_CODEC = config.get('compression', 'codec', fallback='gzip')
+COMPRESSION_LEVEL = config.getint('compression', 'level', fallback=6)
+COMPRESSION_MIN_SIZE = config.getint('compression', 'min_size', fallback=1024)
+SKIP_EXTENSIONS = {
+    extension.strip().lower().lstrip('.')
+    for extension in config.get(
+        'compression', 'skip_extensions',
+        fallback='gz,tgz,zst,zip,bz2,xz,7z,rar,jar,png,jpg,jpeg,gif,webp,mp3,mp4,mkv,mov,avi,pdf,docx,xlsx,pptx'
+    ).split(',')
+    if extension.strip()
+}
+
+CODECS = ('gzip', 'zstd')
+
+# Magic numbers of formats that are already compressed
+COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b',                # gzip
+    b'\x28\xb5\x2f\xfd',        # zstd
+    b'PK\x03\x04',              # zip, jar, docx, xlsx
+    b'BZh',                     # bzip2
+    b'\xfd7zXZ\x00',            # xz
+    b'7z\xbc\xaf\x27\x1c',      # 7z
+    b'Rar!',                    # rar
+    b'\x89PNG',                 # png
+    b'\xff\xd8\xff',            # jpeg
+    b'GIF8',                    # gif
+    b'ID3',                     # mp3
+)
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def _configured_codec() -> str:
+    if COMPRESSION_CODEC == 'zstd' and zstandard is None:
+        logger.warning("zstd compression requested but the 'zstandard' package is not installed, using gzip")
+        return 'gzip'
+    if COMPRESSION_CODEC not in CODECS:
+        logger.warning(f"Unknown compression codec '{COMPRESSION_CODEC}', using gzip")
+        return 'gzip'
+    return COMPRESSION_CODEC
+
+
+def is_compressed(file_name: str, file_content: bytes) -> bool:
+    """
+    Check whether content is already compressed, by file extension or by its leading magic bytes.
+
+    Args:
+        file_name (str): The name of the file.
+        file_content (bytes): The content of the file.
+
+    Returns:
+        bool: True if compressing the content again would not pay off.
+    """
+    extension = os.path.splitext(file_name)[1].lower().lstrip('.')
+    if extension in SKIP_EXTENSIONS:
+        return True
+    if file_content.startswith(COMPRESSED_SIGNATURES):
+        return True
+    # ISO media (mp4, mov) and RIFF containers (webp, avi) carry their signature after a size field
+    return file_content[4:8] == b'ftyp' or (file_content[:4] == b'RIFF' and file_content[8:12] in (b'WEBP', b'AVI '))
+
+
+def compress(file_name: str, file_content: bytes):
+    """
+    Compress file content for storage when compression is enabled and worthwhile.
+
+    Args:
+        file_name (str): The name of the file.
+        file_content (bytes): The content of the file.
+
+    Returns:
+        tuple: The bytes to store and the codec used ('gzip', 'zstd' or None when stored as is).
+    """
+    if not COMPRESSION_ENABLED or len(file_content) < COMPRESSION_MIN_SIZE or is_compressed(file_name, file_content):
+        return file_content, None
+
+    codec = _configured_codec()
+    if codec == 'zstd':
+        body = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(file_content)
+    else:
+        body = gzip.compress(file_content, compresslevel=COMPRESSION_LEVEL, mtime=0)
+
+    if len(body) >= len(file_content):
+        return file_content, None
+    logger.info(f"Compressed {file_name} with {codec}: {len(file_content)} -> {len(body)} bytes")
+    return body, codec
+
+
+def decompress_stream(source, destination, codec: str, chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Copy a stored object stream to a destination, decompressing it chunk by chunk.
+
+    Args:
+        source: A readable binary stream, e.g. the S3 response body.
+        destination: A writable binary stream.
+        codec (str): The codec the object was stored with, None for uncompressed objects.
+        chunk_size (int, optional): The number of bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        int: The number of bytes written to the destination.
+
+    Raises:
+        ValueError: If the codec is unknown or not available.
+    """
+    if codec is None:
+        return copy_file_object(source, destination, chunk_size)
+
+    written = 0
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Object is zstd compressed but the 'zstandard' package is not installed")
+        # The stream reader returns at most chunk_size decompressed bytes per read
+        reader = zstandard.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+        while data := reader.read(chunk_size):
+            destination.write(data)
+            written += len(data)
+        return written
+    if codec != 'gzip':
+        raise ValueError(f"Unknown compression codec: {codec}")
+
+    # Output is capped at chunk_size per call, so a small, highly compressed chunk cannot expand in memory;
+    # the input left over is decompressed from unconsumed_tail
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    while chunk := source.read(chunk_size):
+        while chunk:
+            data = decompressor.decompress(chunk, chunk_size)
+            destination.write(data)
+            written += len(data)
+            chunk = decompressor.unconsumed_tail
+    data = decompressor.flush()
+    destination.write(data)
+    return written + len(data)
@@ -0,0 +1,141 @@
+import os
+import pandas as pd
+from sqlalchemy import Boolean, DateTime, Integer, BigInteger
+
+EXPORT_FORMATS = ('csv', 'parquet')
+# The column layout of folders.csv and files.csv written by utils/datagen_utils.py
+FOLDER_EXPORT_COLUMNS = ('folder_id', 'folder_name', 'folder_parent_id')
+FILE_EXPORT_COLUMNS = ('file_id', 'file_name', 'file_size', 'file_created_date', 'folder_id', 'file_s3_key')
+
+
+def export_columns(table, layout: tuple, extra_columns: bool = False, excluded: tuple = ()) -> list:
+    """
+    Select the exported columns of a table: the layout columns in order, then optionally the others.
+
+    Args:
+        table (Table): The exported table.
+        layout (tuple): The names of the columns that are always exported, in output order.
+        extra_columns (bool, optional): Append the table's other columns in table order. Defaults to False.
+        excluded (tuple, optional): Names of columns never exported. Defaults to ().
+
+    Returns:
+        list: The SQLAlchemy columns to select.
+    """
+    columns = [table.c[name] for name in layout]
+    if extra_columns:
+        columns += [column for column in table.columns if column.name not in layout and column.name not in excluded]
+    return columns
+
+
+class ChunkedTableWriter:
+    """
+    Append query result chunks to a CSV or Parquet file without holding more than one chunk in memory.
+
+    Integer columns are written as nullable integers so that NULL parent IDs come out as empty
+    fields instead of turning the whole column into floats, matching utils/datagen_utils.py.
+
+    Attributes:
+        path (str): The path of the output file.
+        fmt (str): 'csv' or 'parquet'.
+        columns (list): The SQLAlchemy columns being exported, in output order.
+        rows_written (int): The number of rows written so far.
+    """
+
+    def __init__(self, path: str, fmt: str, columns: list):
+        """
+        Initialize the writer. The output file is created on the first write.
+
+        Args:
+            path (str): The path of the output file.
+            fmt (str): 'csv' or 'parquet'.
+            columns (list): The SQLAlchemy columns being exported.
+
+        Raises:
+            ValueError: If the format is not supported.
+            ImportError: If Parquet output is requested and pyarrow is not installed.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}. Expected one of {', '.join(EXPORT_FORMATS)}")
+        self.path = path
+        self.fmt = fmt
+        self.columns = columns
+        self.rows_written = 0
+        self._parquet_writer = None
+        self._schema = None
+        if fmt == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError as e:
+                raise ImportError("Parquet export requires the 'pyarrow' package") from e
+            self._pa = pyarrow
+            self._pq = pyarrow.parquet
+            self._schema = pyarrow.schema([(column.name, self._arrow_type(column)) for column in columns])
+
+    def _arrow_type(self, column):
+        if isinstance(column.type, (Integer, BigInteger)):
+            return self._pa.int64()
+        if isinstance(column.type, DateTime):
+            return self._pa.timestamp('us')
+        if isinstance(column.type, Boolean):
+            return self._pa.bool_()
+        return self._pa.string()
+
+    def write(self, rows: list):
+        """
+        Append a chunk of rows.
+
+        Args:
+            rows (list): Row tuples in the order of the exported columns.
+        """
+        frame = pd.DataFrame(rows, columns=[column.name for column in self.columns])
+        for column in self.columns:
+            if isinstance(column.type, (Integer, BigInteger)):
+                frame[column.name] = frame[column.name].astype(pd.Int64Dtype())
+        if self.fmt == 'csv':
+            frame.to_csv(self.path, mode='w' if self.rows_written == 0 else 'a', header=self.rows_written == 0, index=False)
+        else:
+            if self._parquet_writer is None:
+                self._parquet_writer = self._pq.ParquetWriter(self.path, self._schema)
+            self._parquet_writer.write_table(self._pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False))
+        self.rows_written += len(frame)
+
+    def close(self):
+        """
+        Finish the file. An export without rows still produces a file with the header or schema.
+        """
+        if self.rows_written == 0:
+            self.write([])
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+def export_table(session, query, columns: list, path: str, fmt: str, chunk_size: int = 50000,
+                 transform=None) -> int:
+    """
+    Stream a query through a server-side cursor into a CSV or Parquet file chunk by chunk.
+
+    Args:
+        session (Session): The database session to execute the query on.
+        query (Select): A Core select of the exported columns.
+        columns (list): The SQLAlchemy columns selected by the query.
+        path (str): The path of the output file.
+        fmt (str): 'csv' or 'parquet'.
+        chunk_size (int, optional): The number of rows fetched and written at a time. Defaults to 50000.
+        transform (callable, optional): Called with each chunk's rows and returns the rows to write. Defaults to None.
+
+    Returns:
+        int: The number of exported rows.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    writer = ChunkedTableWriter(path, fmt, columns)
+    try:
+        result = session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+        for partition in result.partitions():
+            writer.write(transform(partition) if transform else partition)
+    finally:
+        writer.close()
+    return writer.rows_written
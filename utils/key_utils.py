@@ -0,0 +1,55 @@
+import hashlib
+import uuid
+from datetime import datetime, timezone
+
+# Layouts of new S3 keys; existing objects keep the key recorded on their file
+KEY_LAYOUTS = ('timestamp', 'hashed')
+
+
+def make_s3_key(file_name: str, layout: str = 'timestamp', prefix_length: int = 4, now: datetime = None) -> str:
+    """
+    Build a unique S3 key for a new object.
+
+    The 'timestamp' layout is YYYYmmddHHMMSS_uuid_name, so keys written at the same time share their
+    leading characters and S3 serves them from one partition of the bucket's key space. The 'hashed'
+    layout puts prefix_length hex digits of a hash of that key in front, e.g. 3fa9/20240101120000_uuid_name,
+    which spreads concurrent writes over 16 ** prefix_length prefixes that S3 can partition independently.
+
+    Args:
+        file_name (str): The name of the file.
+        layout (str, optional): 'timestamp' or 'hashed'. Defaults to 'timestamp'.
+        prefix_length (int, optional): Hex digits of the hashed prefix. Defaults to 4.
+        now (datetime, optional): The time to embed in the key. Defaults to the current UTC time.
+
+    Returns:
+        str: The S3 key.
+
+    Raises:
+        ValueError: If the layout is unknown.
+    """
+    if layout not in KEY_LAYOUTS:
+        raise ValueError(f"Unknown key layout: {layout}. Expected one of {', '.join(KEY_LAYOUTS)}")
+    timestamp = (now or datetime.now(timezone.utc)).strftime('%Y%m%d%H%M%S')
+    key = f"{timestamp}_{uuid.uuid4()}_{file_name}"
+    if layout == 'hashed':
+        key = f"{hashlib.sha256(key.encode('utf-8')).hexdigest()[:prefix_length]}/{key}"
+    return key
+
+
+def pick_bucket(s3_key: str, buckets: list) -> str:
+    """
+    Choose the bucket of a new object by hashing its key, so objects spread evenly over the buckets.
+
+    The choice is recorded on the file, so adding or removing buckets later never moves existing objects.
+
+    Args:
+        s3_key (str): The key of the new object.
+        buckets (list): The bucket names new objects are spread over.
+
+    Returns:
+        str: The bucket name, None if no buckets are given.
+    """
+    if not buckets:
+        return None
+    digest = hashlib.sha256(s3_key.encode('utf-8')).hexdigest()
+    return buckets[int(digest[-8:], 16) % len(buckets)]
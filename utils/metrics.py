@@ -0,0 +1,443 @@
+import atexit
+import bisect
+import configparser
+import functools
+import inspect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger import Logger
+
+logger = Logger.get_logger()
+
+# Read configuration
+config = configparser.ConfigParser()
+config.read('config/config.ini')
+
+# Metrics are always collected; exposing them is enabled by the [metrics] section
+METRICS_HOST = config.get('metrics', 'host', fallback='127.0.0.1')
+# Port of the /metrics endpoint, 0 for no endpoint
+METRICS_PORT = config.getint('metrics', 'port', fallback=0)
+# File the metrics are written to when the process exits, empty for none
+METRICS_DUMP_PATH = config.get('metrics', 'dump_path', fallback='')
+
+# Prefix of every metric name
+NAMESPACE = 'clientfiledb'
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', 'buckets', 'counts', 'total')
+
+    def __init__(self, buckets: tuple):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        # One count per bucket plus the overflow bucket; made cumulative when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+
+
+class _Family:
+    """
+    A named metric with one child per combination of label values.
+    """
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values, **labels):
+        """
+        Return the child for a combination of label values, to be kept by callers on a hot path.
+
+        Args:
+            *values: The label values in the order of labelnames.
+            **labels: The label values by name.
+        """
+        key = tuple(str(value) for value in values) if values else tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> list:
+        with self._lock:
+            children = list(self._children.items())
+        return [(dict(zip(self.labelnames, key)), self._value(child)) for key, child in children]
+
+
+class Counter(_Family):
+    """
+    A value that only goes up, such as calls, errors or bytes transferred.
+    """
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _value(self, child):
+        return child.value
+
+    def inc(self, amount=1):
+        """
+        Increase the counter without labels.
+        """
+        self.labels().inc(amount)
+
+
+class Histogram(_Family):
+    """
+    Observations such as latencies counted into fixed buckets, with their sum.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _value(self, child):
+        with child._lock:
+            return self.buckets, list(child.counts), child.total
+
+    def observe(self, value: float):
+        """
+        Record an observation without labels.
+        """
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    """
+    The counters and histograms of the process, and collectors that report state owned elsewhere
+    (connection pools, the transfer scheduler) when the metrics are rendered.
+
+    Updating a metric takes one uncontended lock; callers on a hot path resolve their labelled
+    child once with labels() and keep it, so no label lookup happens per call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}
+        self._collectors = {}
+
+    def _family(self, cls, name: str, help_text: str, labelnames: tuple, **kwargs):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(family, cls) or family.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with other labels or type")
+            return family
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        """
+        Get or create a counter.
+
+        Args:
+            name (str): The metric name, without the namespace prefix.
+            help_text (str): What the metric counts.
+            labelnames (tuple, optional): The names of its labels. Defaults to none.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self._family(Counter, f"{NAMESPACE}_{name}", help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        """
+        Get or create a histogram.
+
+        Args:
+            name (str): The metric name, without the namespace prefix.
+            help_text (str): What the metric observes.
+            labelnames (tuple, optional): The names of its labels. Defaults to none.
+            buckets (tuple, optional): Upper bounds of the buckets. Defaults to LATENCY_BUCKETS.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self._family(Histogram, f"{NAMESPACE}_{name}", help_text, labelnames, buckets=buckets)
+
+    def register_collector(self, key: str, collector):
+        """
+        Add a function called on every render that reports state owned elsewhere. A collector
+        registered under an existing key replaces it.
+
+        Args:
+            key (str): Identifies the collector, e.g. 'database'.
+            collector (callable): Returns a list of (name, kind, help, samples) tuples, where name is
+                without the namespace prefix, kind is 'counter', 'gauge' or 'histogram', and samples is a
+                list of (labels, value) pairs. A histogram value is (bucket bounds, per-bucket counts
+                with the overflow bucket last, sum).
+        """
+        with self._lock:
+            self._collectors[key] = collector
+
+    def unregister_collector(self, key: str):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def collect(self) -> list:
+        """
+        Returns:
+            list: (name, kind, help, samples) for every metric and collected family, see register_collector.
+        """
+        with self._lock:
+            families = list(self._families.values())
+            collectors = list(self._collectors.items())
+        collected = [(family.name, family.kind, family.help, family.samples()) for family in families]
+        for key, collector in collectors:
+            try:
+                collected.extend((f"{NAMESPACE}_{name}", kind, help_text, samples)
+                                 for name, kind, help_text, samples in collector())
+            except Exception as e:
+                logger.error(f"Error collecting {key} metrics: {str(e)}")
+        return collected
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for name, kind, help_text, samples in self.collect():
+            lines.append(f"# HELP {name} {_escape_help(help_text)}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                buckets, counts, total = value
+                cumulative = 0
+                for bound, count in zip(tuple(buckets) + (float('inf'),), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+    def value(self, name: str, **labels):
+        """
+        Read one sample, mainly for tests and reports.
+
+        Args:
+            name (str): The metric name, without the namespace prefix.
+            **labels: The labels of the sample.
+
+        Returns:
+            The value of the sample, None if there is none; for a histogram (bucket bounds, counts, sum).
+        """
+        wanted = {key: str(label) for key, label in labels.items()}
+        for family_name, _, _, samples in self.collect():
+            if family_name == f"{NAMESPACE}_{name}":
+                for sample_labels, value in samples:
+                    if {key: str(label) for key, label in sample_labels.items()} == wanted:
+                        return value
+        return None
+
+
+registry = MetricsRegistry()
+
+OPERATION_CALLS = registry.counter('operation_calls_total', "Calls of service and storage operations.", ('component', 'operation'))
+OPERATION_ERRORS = registry.counter('operation_errors_total', "Service and storage operations that raised or failed.",
+                                    ('component', 'operation'))
+OPERATION_DURATION = registry.histogram('operation_duration_seconds', "Duration of service and storage operations.",
+                                        ('component', 'operation'))
+
+
+def measured(component: str, operation: str = None, failed=None):
+    """
+    Decorate a function so every call counts towards the operation metrics: calls, errors and a latency histogram.
+
+    A call is an error when it raises, or when failed returns True for its result. Generator
+    functions are timed until the generator is exhausted or closed; closing one early is not an error.
+
+    Args:
+        component (str): The component label, e.g. 'FileService'.
+        operation (str, optional): The operation label. Defaults to the function's name.
+        failed (callable, optional): Tells from a result that the call failed without raising. Defaults to None.
+    """
+    def decorator(function):
+        labels = (component, operation or function.__name__)
+        calls = OPERATION_CALLS.labels(*labels)
+        errors = OPERATION_ERRORS.labels(*labels)
+        duration = OPERATION_DURATION.labels(*labels)
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return (yield from function(*args, **kwargs))
+                except GeneratorExit:
+                    # The consumer closed the generator early, which is not a failure
+                    raise
+                except BaseException:
+                    errors.inc()
+                    raise
+                finally:
+                    calls.inc()
+                    duration.observe(time.perf_counter() - started)
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                errors.inc()
+                raise
+            finally:
+                calls.inc()
+                duration.observe(time.perf_counter() - started)
+            if failed is not None and failed(result):
+                errors.inc()
+            return result
+        return wrapper
+    return decorator
+
+
+def measure_class(component: str = None):
+    """
+    Class decorator that measures every public method defined on the class, see measured.
+
+    Args:
+        component (str, optional): The component label. Defaults to the class name.
+    """
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if not attribute.startswith('_') and inspect.isfunction(value):
+                setattr(cls, attribute, measured(component or cls.__name__, attribute)(value))
+        return cls
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """
+    Serve the metrics in the Prometheus text format at /metrics from a daemon thread.
+
+    Args:
+        port (int): The port to listen on, 0 for any free port.
+        host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+
+    Returns:
+        ThreadingHTTPServer: The server; server.server_address holds the bound address and shutdown() stops it.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Serving metrics at http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+    return server
+
+
+def dump(path: str) -> str:
+    """
+    Write the metrics in the Prometheus text format to a file.
+
+    Args:
+        path (str): The file to write.
+
+    Returns:
+        str: The path of the file.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as metrics_file:
+        metrics_file.write(registry.render())
+    return path
+
+
+def start_exposition(port: int = METRICS_PORT, host: str = METRICS_HOST, dump_path: str = METRICS_DUMP_PATH):
+    """
+    Expose the metrics as configured: serve them on a port and/or write them to a file on exit.
+
+    Args:
+        port (int, optional): The port of the /metrics endpoint, 0 for none. Defaults to the [metrics] port.
+        host (str, optional): The address of the endpoint. Defaults to the [metrics] host.
+        dump_path (str, optional): The file written on exit, empty for none. Defaults to the [metrics] dump_path.
+
+    Returns:
+        ThreadingHTTPServer: The server, None without an endpoint.
+    """
+    server = None
+    if port:
+        try:
+            server = start_http_server(port, host)
+        except OSError as e:
+            logger.error(f"Error starting the metrics endpoint on {host}:{port}: {str(e)}")
+    if dump_path:
+        atexit.register(dump, dump_path)
+    return server
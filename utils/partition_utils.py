@@ -0,0 +1,392 @@
+import time
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from logger import Logger
+
+logger = Logger.get_logger()
+
+# 'none' keeps files as a single heap table
+PARTITION_SCHEMES = ('none', 'hash', 'range')
+
+DEFAULT_HASH_PARTITIONS = 16
+DEFAULT_RANGE_MONTHS = 24
+
+DEADLOCK_DETECTED = '40P01'
+MAX_BATCH_DEADLOCKS = 10
+
+
+def partition_by_clause(scheme: str) -> str:
+    """
+    Build the PARTITION BY clause of the files table.
+
+    Hash partitioning by folder_id keeps every folder's files in one partition, so listings,
+    per-folder aggregates and folder deletes touch a single small table and index. Range
+    partitioning by file_created_date keeps recent files together and lets old months be
+    detached or dropped as a whole.
+
+    Args:
+        scheme (str): 'hash' or 'range'.
+
+    Returns:
+        str: The clause body, e.g. 'HASH (folder_id)'.
+
+    Raises:
+        ValueError: If the scheme is unknown.
+    """
+    if scheme == 'hash':
+        return 'HASH (folder_id)'
+    if scheme == 'range':
+        return 'RANGE (file_created_date)'
+    raise ValueError(f"Unknown partitioning scheme: {scheme}. Expected 'hash' or 'range'")
+
+
+def partition_key(scheme: str) -> str:
+    """
+    Return the column the files table is partitioned on; PostgreSQL requires it in every unique constraint.
+    """
+    return 'folder_id' if scheme == 'hash' else 'file_created_date'
+
+
+def _add_months(month_start: date, months: int) -> date:
+    index = month_start.year * 12 + month_start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def range_partition_sql(table: str, month_start: date) -> str:
+    """
+    Build the statement creating the monthly range partition starting at month_start.
+    """
+    month_start = month_start.replace(day=1)
+    return (f"CREATE TABLE IF NOT EXISTS {table}_{month_start:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month_start:%Y-%m-%d}') TO ('{_add_months(month_start, 1):%Y-%m-%d}')")
+
+
+def create_partitions_sql(scheme: str, table: str = 'files', partitions: int = DEFAULT_HASH_PARTITIONS,
+                          start: date = None, months: int = DEFAULT_RANGE_MONTHS) -> list:
+    """
+    Build the statements creating the partitions of a partitioned files table.
+
+    Args:
+        scheme (str): 'hash' or 'range'.
+        table (str, optional): The partitioned table. Defaults to 'files'.
+        partitions (int, optional): The number of hash partitions. Defaults to 16.
+        start (date, optional): The first month of range partitions. Defaults to the current month.
+        months (int, optional): The number of monthly range partitions. Defaults to 24.
+
+    Returns:
+        list: SQL statements. Range schemes also get a DEFAULT partition for rows outside the months.
+    """
+    if scheme == 'hash':
+        return [f"CREATE TABLE IF NOT EXISTS {table}_p{remainder} PARTITION OF {table} "
+                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                for remainder in range(partitions)]
+    if scheme == 'range':
+        first = (start or date.today()).replace(day=1)
+        statements = [range_partition_sql(table, _add_months(first, offset)) for offset in range(months)]
+        statements.append(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+        return statements
+    raise ValueError(f"Unknown partitioning scheme: {scheme}. Expected 'hash' or 'range'")
+
+
+def uniqueness_trigger_sql(scheme: str, table: str = 'files') -> list:
+    """
+    Build a trigger enforcing the uniqueness rules a partitioned table cannot declare.
+
+    Unique constraints on a partitioned table must contain the partition key, so the global
+    UNIQUE (file_s3_key) is lost under both schemes and UNIQUE (folder_id, file_name) under range
+    partitioning. The trigger checks them instead, serialized per value with a transaction-scoped
+    advisory lock, and raises unique_violation so callers still see an IntegrityError.
+
+    Args:
+        scheme (str): 'hash' or 'range'.
+        table (str, optional): The partitioned table. Defaults to 'files'.
+
+    Returns:
+        list: SQL statements creating the trigger function and the trigger.
+    """
+    name_check = ""
+    if scheme == 'range':
+        name_check = f"""
+    IF TG_OP = 'INSERT' OR NEW.folder_id <> OLD.folder_id OR NEW.file_name <> OLD.file_name THEN
+        PERFORM pg_advisory_xact_lock(NEW.folder_id, hashtext(NEW.file_name));
+        IF EXISTS (SELECT 1 FROM {table} WHERE folder_id = NEW.folder_id AND file_name = NEW.file_name AND file_id <> NEW.file_id) THEN
+            RAISE EXCEPTION 'duplicate key value violates unique constraint "unique_file_name_per_folder"'
+                USING ERRCODE = 'unique_violation', CONSTRAINT = 'unique_file_name_per_folder';
+        END IF;
+    END IF;"""
+    return [
+        f"""CREATE OR REPLACE FUNCTION {table}_check_unique() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' OR NEW.file_s3_key <> OLD.file_s3_key THEN
+        PERFORM pg_advisory_xact_lock(hashtext(NEW.file_s3_key));
+        IF EXISTS (SELECT 1 FROM {table} WHERE file_s3_key = NEW.file_s3_key AND file_id <> NEW.file_id) THEN
+            RAISE EXCEPTION 'duplicate key value violates unique constraint "{table}_file_s3_key_key"'
+                USING ERRCODE = 'unique_violation', CONSTRAINT = '{table}_file_s3_key_key';
+        END IF;
+    END IF;{name_check}
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS {table}_check_unique ON {table}",
+        f"CREATE TRIGGER {table}_check_unique BEFORE INSERT OR UPDATE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION {table}_check_unique()"
+    ]
+
+
+def partitioned_table_sql(scheme: str, table: str, source: str = 'files', partitions: int = DEFAULT_HASH_PARTITIONS,
+                          start: date = None, months: int = DEFAULT_RANGE_MONTHS, index_suffix: str = '') -> list:
+    """
+    Build the statements creating a partitioned copy of the files table's structure.
+
+    Args:
+        scheme (str): 'hash' or 'range'.
+        table (str): The name of the new partitioned table.
+        source (str, optional): The existing table whose columns and defaults are copied. Defaults to 'files'.
+        partitions (int, optional): The number of hash partitions. Defaults to 16.
+        start (date, optional): The first month of range partitions. Defaults to the current month.
+        months (int, optional): The number of monthly range partitions. Defaults to 24.
+        index_suffix (str, optional): Appended to constraint and index names that already exist on the source.
+
+    Returns:
+        list: SQL statements; the uniqueness trigger is not included.
+    """
+    key = partition_key(scheme)
+    statements = [
+        # LIKE copies the columns, their defaults (including the file_id sequence) and CHECK constraints
+        f"CREATE TABLE {table} (LIKE {source} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY {partition_by_clause(scheme)}",
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (file_id, {key})",
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_folder_id_fkey FOREIGN KEY (folder_id) REFERENCES folders (folder_id) ON DELETE CASCADE",
+        # Covers the per-folder size aggregation with an index-only scan
+        f"CREATE INDEX idx_file_folder_size{index_suffix} ON {table} (folder_id) INCLUDE (file_size)",
+        # Without the unique constraint nothing else indexes file_s3_key, and the trigger looks it up
+        f"CREATE INDEX idx_file_s3_key{index_suffix} ON {table} (file_s3_key)",
+        f"CREATE INDEX idx_file_name_pattern{index_suffix} ON {table} (file_name text_pattern_ops)",
+        f"CREATE INDEX idx_file_name_trgm{index_suffix} ON {table} USING gin (file_name gin_trgm_ops)",
+    ]
+    if scheme == 'hash':
+        # Contains the partition key, so it can stay a real constraint
+        statements.append(f"ALTER TABLE {table} ADD CONSTRAINT unique_file_name_per_folder{index_suffix} UNIQUE (folder_id, file_name)")
+    else:
+        statements.append(f"CREATE INDEX idx_file_folder_name{index_suffix} ON {table} (folder_id, file_name)")
+    return statements + create_partitions_sql(scheme, table, partitions, start, months)
+
+
+def ensure_range_partitions(connection, table: str = 'files', months_ahead: int = 3) -> int:
+    """
+    Create the monthly partitions of a range partitioned table up to months_ahead months from now.
+
+    Run it periodically (e.g. daily from cron) so new files never land in the DEFAULT partition.
+    Months that already have rows in the DEFAULT partition cannot be attached and are skipped.
+
+    Args:
+        connection (Connection): A connection in a transaction.
+        table (str, optional): The partitioned table. Defaults to 'files'.
+        months_ahead (int, optional): The number of future months to cover. Defaults to 3.
+
+    Returns:
+        int: The number of partitions created.
+    """
+    existing = set(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {'table': table}).scalars())
+    created = 0
+    month_start = date.today().replace(day=1)
+    for offset in range(months_ahead + 1):
+        month = _add_months(month_start, offset)
+        if f"{table}_{month:%Y_%m}" in existing:
+            continue
+        rows_in_default = connection.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE file_created_date >= :start AND file_created_date < :end)"
+        ), {'start': month, 'end': _add_months(month, 1)}).scalar()
+        if rows_in_default:
+            logger.warning(f"Skipping partition {table}_{month:%Y_%m}: matching rows are in {table}_default")
+            continue
+        connection.execute(text(range_partition_sql(table, month)))
+        created += 1
+    logger.info(f"Created {created} range partition(s) of {table}")
+    return created
+
+
+def _sqlstate(error) -> str:
+    # psycopg2 names the SQLSTATE pgcode, psycopg 3 sqlstate
+    return getattr(error.orig, 'pgcode', None) or getattr(error.orig, 'sqlstate', None)
+
+
+def _mirror_trigger_sql(source: str, target: str, key: str) -> list:
+    # Replays writes made to the source during the copy. The copy locks its rows, so a write to a row
+    # is either replayed after the row was copied or copied in its new version
+    return [
+        f"""CREATE OR REPLACE FUNCTION {source}_mirror_to_{target}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO {target} SELECT NEW.* ON CONFLICT (file_id, {key}) DO NOTHING;
+    ELSIF TG_OP = 'UPDATE' THEN
+        DELETE FROM {target} WHERE file_id = OLD.file_id;
+        INSERT INTO {target} SELECT NEW.* ON CONFLICT (file_id, {key}) DO NOTHING;
+    ELSE
+        DELETE FROM {target} WHERE file_id = OLD.file_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql""",
+        f"CREATE TRIGGER {source}_mirror_to_{target} AFTER INSERT OR UPDATE OR DELETE ON {source} "
+        f"FOR EACH ROW EXECUTE FUNCTION {source}_mirror_to_{target}()"
+    ]
+
+
+def migrate_files_table(engine, scheme: str, partitions: int = DEFAULT_HASH_PARTITIONS, batch_size: int = 10000,
+                        pause_seconds: float = 0.0, start: date = None, months: int = DEFAULT_RANGE_MONTHS,
+                        table: str = 'files') -> dict:
+    """
+    Move an existing files table into a partitioned table while the application keeps running.
+
+    1. A partitioned table '<table>_partitioned' with the same columns is created, and a trigger on
+       the old table mirrors every insert, update and delete into it from then on.
+    2. Existing rows are copied in file_id order, batch_size rows per short transaction, so locks
+       are held briefly and the copy can be throttled with pause_seconds or resumed after a crash
+       (already copied rows are skipped). Each batch locks its source rows FOR SHARE, so a concurrent
+       update or delete of a row cannot be mirrored before the batch copies the row's old version,
+       which would leave a deleted or stale row in the new table.
+    3. After the row counts match, one short transaction locks both tables, renames the old table
+       to '<table>_unpartitioned' and the new one to '<table>', and installs the uniqueness trigger.
+       The old table is kept for verification and can be dropped afterwards.
+
+    Args:
+        engine (Engine): A PostgreSQL engine.
+        scheme (str): 'hash' or 'range'.
+        partitions (int, optional): The number of hash partitions. Defaults to 16.
+        batch_size (int, optional): The number of rows copied per transaction. Defaults to 10000.
+        pause_seconds (float, optional): Sleep between batches to limit the load. Defaults to 0.
+        start (date, optional): The first month of range partitions. Defaults to the month of the oldest file.
+        months (int, optional): The number of monthly range partitions. Defaults to 24.
+        table (str, optional): The table to migrate. Defaults to 'files'.
+
+    Returns:
+        dict: The number of copied rows and batches and the final row count.
+
+    Raises:
+        RuntimeError: If the row counts differ before the swap.
+    """
+    target = f"{table}_partitioned"
+    key = partition_key(scheme)
+
+    with engine.begin() as connection:
+        exists = connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': target}).scalar()
+        if not exists:
+            if scheme == 'range' and start is None:
+                oldest = connection.execute(text(f"SELECT MIN(file_created_date) FROM {table}")).scalar()
+                start = (oldest or date.today()).replace(day=1)
+                if hasattr(start, 'date'):
+                    start = start.date()
+            for statement in partitioned_table_sql(scheme, target, table, partitions, start, months, index_suffix='_partitioned'):
+                connection.execute(text(statement))
+            for statement in _mirror_trigger_sql(table, target, key):
+                connection.execute(text(statement))
+            logger.info(f"Created {target} partitioned by {partition_by_clause(scheme)} and the mirror trigger on {table}")
+
+    copied = 0
+    batches = 0
+    last_id = 0
+    deadlocks = 0
+    while True:
+        try:
+            with engine.begin() as connection:
+                batch_end = connection.execute(text(
+                    f"SELECT MAX(file_id) FROM (SELECT file_id FROM {table} WHERE file_id > :last_id ORDER BY file_id LIMIT :limit) AS batch"
+                ), {'last_id': last_id, 'limit': batch_size}).scalar()
+                if batch_end is None:
+                    break
+                # FOR SHARE makes concurrent updates and deletes of these rows wait until the batch is committed,
+                # so their mirrored writes land after the copy. A row changed just before is read in its new version
+                result = connection.execute(text(
+                    f"INSERT INTO {target} SELECT * FROM {table} WHERE file_id > :last_id AND file_id <= :batch_end "
+                    f"ORDER BY file_id FOR SHARE ON CONFLICT (file_id, {key}) DO NOTHING"
+                ), {'last_id': last_id, 'batch_end': batch_end})
+        except OperationalError as e:
+            # A writer locking several files in another order can deadlock with the batch, which is then repeated
+            if _sqlstate(e) != DEADLOCK_DETECTED or deadlocks >= MAX_BATCH_DEADLOCKS:
+                raise
+            deadlocks += 1
+            logger.warning(f"Partition migration: batch after file_id {last_id} deadlocked with a writer, repeating it")
+            continue
+        copied += result.rowcount
+        batches += 1
+        last_id = batch_end
+        if batches % 100 == 0:
+            logger.info(f"Partition migration: {copied} rows copied up to file_id {last_id}")
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    with engine.begin() as connection:
+        connection.execute(text(f"LOCK TABLE {table}, {target} IN ACCESS EXCLUSIVE MODE"))
+        source_count = connection.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+        target_count = connection.execute(text(f"SELECT COUNT(*) FROM {target}")).scalar()
+        if source_count != target_count:
+            raise RuntimeError(f"Row counts differ ({table}: {source_count}, {target}: {target_count}), run the migration again")
+
+        connection.execute(text(f"DROP TRIGGER {table}_mirror_to_{target} ON {table}"))
+        connection.execute(text(f"DROP FUNCTION {table}_mirror_to_{target}()"))
+        # Free the index and constraint names for the new table
+        for (name,) in connection.execute(text(
+            "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = CAST(:table AS regclass)"
+        ), {'table': table}).all():
+            connection.execute(text(f"ALTER INDEX {name} RENAME TO {name}_unpartitioned"))
+        connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned"))
+        connection.execute(text(f"ALTER TABLE {target} RENAME TO {table}"))
+        connection.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {target}_pkey TO {table}_pkey"))
+        connection.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {target}_folder_id_fkey TO {table}_folder_id_fkey"))
+        for (name,) in connection.execute(text(
+            "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = CAST(:table AS regclass) AND indexrelid::regclass::text LIKE '%\\_partitioned'"
+        ), {'table': table}).all():
+            connection.execute(text(f"ALTER INDEX {name} RENAME TO {name[:-len('_partitioned')]}"))
+        for (name,) in connection.execute(text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)"
+        ), {'table': table}).all():
+            connection.execute(text(f"ALTER TABLE {name} RENAME TO {table}{name[len(target):]}"))
+        for statement in uniqueness_trigger_sql(scheme, table):
+            connection.execute(text(statement))
+        # The sequence keeps feeding file_id, make it belong to the new table so it survives dropping the old one
+        connection.execute(text(
+            f"ALTER SEQUENCE {table}_file_id_seq OWNED BY {table}.file_id"
+        ))
+
+    logger.info(f"Partition migration of {table} finished: {copied} rows copied in {batches} batches")
+    return {'copied': copied, 'batches': batches, 'rows': target_count}
+
+
+def main():
+    import argparse
+    import configparser
+    from sqlalchemy import create_engine
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Partition the files table or maintain its range partitions")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help="Move the files table into a partitioned table online")
+    migrate.add_argument('--scheme', choices=['hash', 'range'], required=True)
+    migrate.add_argument('--partitions', type=int, default=DEFAULT_HASH_PARTITIONS, help="Number of hash partitions")
+    migrate.add_argument('--months', type=int, default=DEFAULT_RANGE_MONTHS, help="Number of monthly range partitions")
+    migrate.add_argument('--batch-size', type=int, default=10000)
+    migrate.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between batches")
+    extend = subparsers.add_parser('extend', help="Create upcoming monthly partitions of a range partitioned files table")
+    extend.add_argument('--months-ahead', type=int, default=3)
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('config/config.ini')
+    engine = create_engine(Database._build_database_url(config['database']))
+    if args.command == 'migrate':
+        print(migrate_files_table(engine, args.scheme, args.partitions, args.batch_size, args.pause, months=args.months))
+        print("Set files_partitioning in the [database] section of config.ini to match, then restart the application.")
+    else:
+        with engine.begin() as connection:
+            print(f"Created {ensure_range_partitions(connection, months_ahead=args.months_ahead)} partition(s)")
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
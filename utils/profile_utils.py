@@ -0,0 +1,232 @@
+import configparser
+import cProfile
+import functools
+import inspect
+import io
+import itertools
+import linecache
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from logger import Logger
+
+logger = Logger.get_logger()
+
+# Read configuration
+config = configparser.ConfigParser()
+config.read('config/config.ini')
+
+# Profiling configuration, used when the application is started with --profile
+PROFILE_DIRECTORY = config.get('profiling', 'directory', fallback='profiles')
+PROFILE_TOP_FUNCTIONS = config.getint('profiling', 'top_functions', fallback=30)
+PROFILE_TOP_ALLOCATIONS = config.getint('profiling', 'top_allocations', fallback=20)
+# Stack frames kept per allocation; more frames show the callers of an allocation site but cost more
+PROFILE_TRACEBACK_FRAMES = config.getint('profiling', 'traceback_frames', fallback=1)
+
+# Allocations of the profilers themselves are left out of the report
+_ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>')
+)
+
+
+class ActionProfiler:
+    """
+    Profiles user actions one at a time and writes one report per action.
+
+    Each action runs under cProfile, which records the functions called on the action's thread,
+    and tracemalloc, which records the Python memory allocated anywhere in the process. The report
+    lists the wall and CPU time, the peak and retained memory, the top functions by cumulative time
+    and the top allocation sites of memory still held when the action ended. The raw cProfile data
+    is written next to it as a .prof file, for pstats or snakeviz.
+
+    Actions are profiled one at a time, as only one cProfile profiler can be active; an action
+    started while another is profiled waits for it. Work the action hands to other threads counts
+    towards its memory but not its function timings.
+
+    Attributes:
+        directory (str): The directory the reports are written to.
+        top_functions (int): The number of functions listed in a report.
+        top_allocations (int): The number of allocation sites listed in a report.
+        traceback_frames (int): The stack frames kept per allocation.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIRECTORY, top_functions: int = PROFILE_TOP_FUNCTIONS,
+                 top_allocations: int = PROFILE_TOP_ALLOCATIONS, traceback_frames: int = PROFILE_TRACEBACK_FRAMES):
+        """
+        Initialize the profiler.
+
+        Args:
+            directory (str, optional): The directory of the reports. Defaults to the [profiling] directory.
+            top_functions (int, optional): Functions listed per report. Defaults to the [profiling] top_functions.
+            top_allocations (int, optional): Allocation sites listed per report. Defaults to the [profiling] top_allocations.
+            traceback_frames (int, optional): Stack frames kept per allocation. Defaults to the [profiling] traceback_frames.
+        """
+        self.directory = directory
+        self.top_functions = top_functions
+        self.top_allocations = top_allocations
+        self.traceback_frames = max(1, traceback_frames)
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+        os.makedirs(directory, exist_ok=True)
+
+    def wrap(self, label: str, method):
+        """
+        Wrap a controller method so every call is profiled as one action.
+
+        A method returning a generator, such as a purge reporting its progress, is profiled until
+        the generator is exhausted or closed, including the work of the caller consuming it.
+
+        Args:
+            label (str): The name of the action in the report, e.g. 'Create file'.
+            method (callable): The controller method.
+
+        Returns:
+            callable: The profiled method.
+        """
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            session = _ProfileSession(self, label)
+            try:
+                result = method(*args, **kwargs)
+            except BaseException as e:
+                session.finish(e)
+                raise
+            if inspect.isgenerator(result):
+                return session.follow(result)
+            session.finish()
+            return result
+        return profiled
+
+    def _start(self):
+        self._lock.acquire()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(self.traceback_frames)
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except BaseException:
+            if started_tracing:
+                tracemalloc.stop()
+            self._lock.release()
+            raise
+        return profiler, started_tracing
+
+    def _stop(self, profiler, started_tracing: bool):
+        try:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_ALLOCATION_FILTERS)
+            current, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+        finally:
+            self._lock.release()
+        return snapshot, current, peak
+
+    def _write_report(self, label: str, profiler, snapshot, peak: int, wall: float, cpu: float, error) -> str:
+        slug = re.sub(r'[^a-z0-9]+', '_', label.lower()).strip('_') or 'action'
+        base = os.path.join(self.directory, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{next(self._sequence):04d}_{slug}")
+        profiler.dump_stats(f"{base}.prof")
+
+        retained = snapshot.statistics('traceback' if self.traceback_frames > 1 else 'lineno')
+        outcome = f"failed: {type(error).__name__}: {error}" if error is not None else 'completed'
+        lines = [
+            f"Action: {label}",
+            f"Outcome: {outcome}",
+            f"Wall time: {wall:.3f} s",
+            f"CPU time (process): {cpu:.3f} s",
+            f"Peak traced memory: {peak / 1024:.1f} KiB",
+            f"Retained at the end: {sum(stat.size for stat in retained) / 1024:.1f} KiB in {sum(stat.count for stat in retained)} blocks",
+            "",
+            f"Top {self.top_functions} functions by cumulative time",
+            ""
+        ]
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_functions)
+        lines.append(stream.getvalue().strip('\n'))
+        lines += ["", f"Top {self.top_allocations} allocation sites of memory retained at the end", ""]
+        for stat in retained[:self.top_allocations]:
+            # The allocation site first, then its callers
+            site, *callers = reversed(stat.traceback)
+            source = linecache.getline(site.filename, site.lineno).strip()
+            lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {site.filename}:{site.lineno}  {source}")
+            lines.extend(f"{'':36}called from {frame.filename}:{frame.lineno}" for frame in callers)
+        if not retained:
+            lines.append("(none)")
+
+        with open(f"{base}.txt", 'w', encoding='utf-8') as report:
+            report.write('\n'.join(lines) + '\n')
+        return f"{base}.txt"
+
+
+class _ProfileSession:
+    """
+    The profiling of one action, from the controller call until its result is complete.
+    """
+
+    def __init__(self, owner: ActionProfiler, label: str):
+        self.owner = owner
+        self.label = label
+        self.profiler, self.started_tracing = owner._start()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.finished = False
+
+    def follow(self, generator):
+        return _ProfiledIterator(generator, self)
+
+    def finish(self, error: BaseException = None):
+        if self.finished:
+            return
+        self.finished = True
+        wall = time.perf_counter() - self.started
+        cpu = time.process_time() - self.cpu_started
+        snapshot, _, peak = self.owner._stop(self.profiler, self.started_tracing)
+        try:
+            path = self.owner._write_report(self.label, self.profiler, snapshot, peak, wall, cpu, error)
+            logger.info(f"Profile of '{self.label}' ({wall:.3f}s, peak {peak / 1024:.0f} KiB) written to {path}")
+        except Exception as e:
+            logger.error(f"Error writing the profile of '{self.label}': {str(e)}")
+
+
+class _ProfiledIterator:
+    """
+    Iterates a generator returned by a profiled action and ends the profile when the generator is
+    exhausted, fails, is closed or is discarded, so an abandoned generator never blocks later actions.
+    """
+
+    def __init__(self, generator, session: _ProfileSession):
+        self._generator = generator
+        self._session = session
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._generator)
+        except StopIteration:
+            self._session.finish()
+            raise
+        except BaseException as e:
+            self._session.finish(e)
+            raise
+
+    def close(self):
+        try:
+            self._generator.close()
+        finally:
+            self._session.finish()
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,229 @@
+import numpy as np
+from sqlalchemy import select, literal, case, cast, func, Text
+from models.folder import Folder
+
+SEARCH_MODES = ('prefix', 'substring', 'glob', 'extension')
+
+LIKE_ESCAPE = '\\'
+
+# Bounds every walk up the tree, so a cycle left in the folders table cannot make a query run forever
+MAX_FOLDER_DEPTH = 10000
+
+
+def escape_like(value: str) -> str:
+    """
+    Escape the LIKE wildcards of a literal string.
+
+    Args:
+        value (str): The literal text to match.
+
+    Returns:
+        str: The text with '%', '_' and the escape character escaped.
+    """
+    return (value.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2)
+                 .replace('%', LIKE_ESCAPE + '%')
+                 .replace('_', LIKE_ESCAPE + '_'))
+
+
+def glob_to_like(pattern: str) -> str:
+    """
+    Translate a shell glob ('*' and '?') into a LIKE pattern.
+
+    Args:
+        pattern (str): The glob pattern, e.g. 'report_*.csv'.
+
+    Returns:
+        str: The equivalent LIKE pattern, e.g. 'report\\_%.csv'.
+    """
+    return ''.join('%' if char == '*' else '_' if char == '?' else escape_like(char) for char in pattern)
+
+
+def build_like_pattern(pattern: str, mode: str) -> str:
+    """
+    Build the LIKE pattern for a name search.
+
+    The patterns are anchored so that PostgreSQL can answer prefix searches from a
+    text_pattern_ops index and substring, glob and extension searches from a trigram index.
+
+    Args:
+        pattern (str): The user supplied search text.
+        mode (str): One of 'prefix', 'substring', 'glob' or 'extension'.
+
+    Returns:
+        str: The LIKE pattern.
+
+    Raises:
+        ValueError: If the mode is unknown or the pattern is empty.
+    """
+    if not pattern:
+        raise ValueError("Search pattern must not be empty")
+    if mode == 'prefix':
+        return f"{escape_like(pattern)}%"
+    if mode == 'substring':
+        return f"%{escape_like(pattern)}%"
+    if mode == 'glob':
+        return glob_to_like(pattern)
+    if mode == 'extension':
+        return f"%.{escape_like(pattern.lstrip('.'))}"
+    raise ValueError(f"Unknown search mode: {mode}. Expected one of {', '.join(SEARCH_MODES)}")
+
+
+def name_filter(column, pattern: str, mode: str, case_sensitive: bool = True):
+    """
+    Build a SQL filter expression matching a name column against a search pattern.
+
+    Args:
+        column: The name column to filter, e.g. File.file_name.
+        pattern (str): The user supplied search text.
+        mode (str): One of 'prefix', 'substring', 'glob' or 'extension'.
+        case_sensitive (bool, optional): Use LIKE instead of ILIKE. Defaults to True.
+
+    Returns:
+        ColumnElement: The filter expression.
+    """
+    like_pattern = build_like_pattern(pattern, mode)
+    if case_sensitive:
+        return column.like(like_pattern, escape=LIKE_ESCAPE)
+    return column.ilike(like_pattern, escape=LIKE_ESCAPE)
+
+
+def subtree_folder_ids(folder_id: int):
+    """
+    Build a recursive CTE selecting the IDs of a folder and all of its descendants.
+
+    Deleted folders and everything below them are left out. Whether an ancestor of the root is
+    deleted is not checked, see folder_is_live.
+
+    Args:
+        folder_id (int): The ID of the subtree root.
+
+    Returns:
+        CTE: A CTE with a single 'folder_id' column.
+    """
+    subtree = select(Folder.folder_id).where(Folder.folder_id == folder_id, Folder.folder_deleted_at.is_(None)).cte('subtree', recursive=True)
+    children = select(Folder.folder_id).join(subtree, Folder.folder_parent_id == subtree.c.folder_id).where(Folder.folder_deleted_at.is_(None))
+    return subtree.union_all(children)
+
+
+def subtree_folder_paths(folder_id: int):
+    """
+    Build a recursive CTE selecting every folder of a subtree with its path relative to the subtree root.
+    Deleted folders and everything below them are left out.
+
+    Args:
+        folder_id (int): The ID of the subtree root.
+
+    Returns:
+        CTE: A CTE with the columns 'folder_id' and 'path', where the root's path is '' and
+        descendants have '/' separated paths such as 'src/utils'.
+    """
+    # Both terms are cast to TEXT because PostgreSQL requires matching column types in recursive CTEs
+    paths = select(Folder.folder_id, cast(literal(''), Text).label('path')).where(
+        Folder.folder_id == folder_id, Folder.folder_deleted_at.is_(None)).cte('subtree_paths', recursive=True)
+    child_path = case((paths.c.path == '', Folder.folder_name), else_=paths.c.path + '/' + Folder.folder_name)
+    children = select(Folder.folder_id, cast(child_path, Text).label('path')).join(
+        paths, Folder.folder_parent_id == paths.c.folder_id).where(Folder.folder_deleted_at.is_(None))
+    return paths.union_all(children)
+
+
+def deleted_folder_ids():
+    """
+    Build a recursive CTE selecting every folder inside a deleted subtree, i.e. the deleted folders
+    and all of their descendants.
+
+    Reads over the whole tree exclude these folders. The CTE only visits subtrees awaiting purge,
+    so it is empty and cheap while nothing is pending.
+
+    Returns:
+        CTE: A CTE with a single 'folder_id' column.
+    """
+    deleted = select(Folder.folder_id).where(Folder.folder_deleted_at.is_not(None)).cte('deleted_subtrees', recursive=True)
+    children = select(Folder.folder_id).join(deleted, Folder.folder_parent_id == deleted.c.folder_id)
+    return deleted.union_all(children)
+
+
+def ancestor_chain(folder_id: int, name: str = 'ancestors'):
+    """
+    Build a recursive CTE walking from a folder up to its root by primary key.
+
+    The walk stops after MAX_FOLDER_DEPTH levels, so it also ends on a cycle.
+
+    Args:
+        folder_id (int): The ID of the folder to start from.
+        name (str, optional): The name of the CTE. Defaults to 'ancestors'.
+
+    Returns:
+        CTE: A CTE with the columns 'folder_id', 'folder_parent_id', 'folder_deleted_at' and 'depth',
+        where the folder itself has depth 0.
+    """
+    ancestors = select(Folder.folder_id, Folder.folder_parent_id, Folder.folder_deleted_at, literal(0).label('depth')).where(
+        Folder.folder_id == folder_id).cte(name, recursive=True)
+    parents = select(Folder.folder_id, Folder.folder_parent_id, Folder.folder_deleted_at, (ancestors.c.depth + 1).label('depth')).join(
+        ancestors, Folder.folder_id == ancestors.c.folder_parent_id).where(ancestors.c.depth < MAX_FOLDER_DEPTH)
+    return ancestors.union_all(parents)
+
+
+def folder_is_live(session, folder_id: int) -> bool:
+    """
+    Check that a folder exists, neither it nor any of its ancestors is deleted, and it is connected to the root.
+
+    Walks from the folder up to its root by primary key, so the cost is bounded by the folder's depth.
+
+    Args:
+        session (Session): The database session to execute the query on.
+        folder_id (int): The ID of the folder.
+
+    Returns:
+        bool: True if the folder is visible to reads and writes.
+    """
+    ancestors = ancestor_chain(folder_id)
+    found, deleted, roots = session.execute(select(
+        func.count(), func.count(ancestors.c.folder_deleted_at), func.count(case((ancestors.c.folder_parent_id.is_(None), 1)))
+    )).one()
+    return found > 0 and deleted == 0 and roots == 1
+
+
+def folder_is_inside(session, folder_id: int, ancestor_id: int) -> bool:
+    """
+    Check whether a folder is an ancestor_id itself or lies in its subtree.
+
+    Walks up from folder_id, so the cost is bounded by the folder's depth and not by the size of the subtree.
+
+    Args:
+        session (Session): The database session to execute the query on.
+        folder_id (int): The ID of the folder to locate.
+        ancestor_id (int): The ID of the subtree root.
+
+    Returns:
+        bool: True if ancestor_id is on the path from folder_id to the root.
+    """
+    ancestors = ancestor_chain(folder_id)
+    return session.execute(select(func.count()).where(ancestors.c.folder_id == ancestor_id)).scalar() > 0
+
+
+def fetch_columns(session, query, chunk_size: int = 50000, dtypes: list = None) -> list:
+    """
+    Stream the result of a query through a server-side cursor into one array per column.
+
+    Rows are fetched chunk_size at a time and converted column-wise, so no ORM objects or
+    per-row Python tuples outlive a single chunk.
+
+    Args:
+        session (Session): The database session to execute the query on.
+        query (Select): A Core select of plain columns.
+        chunk_size (int, optional): The number of rows fetched per round trip. Defaults to 50000.
+        dtypes (list, optional): The NumPy dtype of each column, e.g. 'int64' for a NOT NULL integer
+            column, None for object arrays. Defaults to object arrays for every column.
+
+    Returns:
+        list: One np.ndarray per selected column, in select order.
+    """
+    dtypes = dtypes or [None] * len(query.selected_columns)
+    dtypes = [np.dtype(dtype) if dtype is not None else np.dtype(object) for dtype in dtypes]
+    result = session.execute(query, execution_options={'stream_results': True, 'yield_per': chunk_size})
+    chunks = [[] for _ in query.selected_columns]
+    for partition in result.partitions():
+        for column_chunks, values, dtype in zip(chunks, zip(*partition), dtypes):
+            column_chunks.append(np.asarray(values, dtype=dtype))
+    return [np.concatenate(column_chunks) if column_chunks else np.array([], dtype=dtype)
+            for column_chunks, dtype in zip(chunks, dtypes)]
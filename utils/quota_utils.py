@@ -0,0 +1,206 @@
+from sqlalchemy import select, update, func, and_, literal
+from models.file import File
+from models.folder import Folder
+from utils.query_utils import MAX_FOLDER_DEPTH
+
+# Quotas count the bytes stored in S3, which for a compressed file is its compressed size
+STORED_SIZE = func.coalesce(File.file_stored_size, File.file_size)
+
+
+def quota_folder_ids(session, folder_id: int, lock: bool = False) -> list:
+    """
+    List the folders with a quota among a folder and its ancestors.
+
+    Walks from the folder up to its root by primary key, so the cost is bounded by the folder's depth
+    (at most MAX_FOLDER_DEPTH levels) and independent of the size of any subtree. Deleted ancestors are walked through: their usage
+    stays charged until the purger removes their contents.
+
+    With lock, every folder of the chain is locked FOR KEY SHARE until the transaction ends, so no
+    folder on it can be moved (move_folder locks the moved folder FOR UPDATE) and no quota can be
+    set up or removed on it while the caller charges the quotas. Unlike FOR SHARE, the lock does not
+    conflict with the counter updates of charge_quotas, so concurrent writers charging the same
+    quota do not deadlock. If a move committed between the walk and the lock, the chain is walked again.
+
+    Args:
+        session (Session): The database session to execute the query on.
+        folder_id (int): The ID of the folder, None for the level above the root.
+        lock (bool, optional): Lock the chain for the rest of the transaction. Defaults to False.
+
+    Returns:
+        list: The IDs of the folders whose quota covers the folder, nearest first.
+    """
+    if folder_id is None:
+        return []
+    ancestors = select(Folder.folder_id, Folder.folder_parent_id, Folder.folder_used_bytes, literal(0).label('depth')).where(
+        Folder.folder_id == folder_id).cte('quota_ancestors', recursive=True)
+    parents = select(Folder.folder_id, Folder.folder_parent_id, Folder.folder_used_bytes, (ancestors.c.depth + 1).label('depth')).join(
+        ancestors, Folder.folder_id == ancestors.c.folder_parent_id).where(ancestors.c.depth < MAX_FOLDER_DEPTH)
+    ancestors = ancestors.union_all(parents)
+    # On a cycle the bounded walk repeats folders, each quota is still charged once
+    if not lock:
+        return list(dict.fromkeys(session.execute(
+            select(ancestors.c.folder_id).where(ancestors.c.folder_used_bytes.is_not(None)).order_by(ancestors.c.depth)
+        ).scalars()))
+
+    while True:
+        chain = session.execute(select(ancestors.c.folder_id, ancestors.c.folder_parent_id).order_by(ancestors.c.depth)).all()
+        # Locking reads return the latest committed version of each row
+        locked = {row.folder_id: row for row in session.execute(
+            select(Folder.folder_id, Folder.folder_parent_id, Folder.folder_used_bytes)
+            .where(Folder.folder_id.in_({row.folder_id for row in chain}))
+            .with_for_update(read=True, key_share=True)
+        )}
+        if all(row.folder_id in locked and locked[row.folder_id].folder_parent_id == row.folder_parent_id for row in chain):
+            return list(dict.fromkeys(row.folder_id for row in chain if locked[row.folder_id].folder_used_bytes is not None))
+
+
+def add_usage(usage: dict, quota_ids: list, size: int, count: int):
+    """
+    Add a usage change to every quota in a list, to be applied with charge_quotas.
+
+    Args:
+        usage (dict): Maps quota folder IDs to [bytes, files] changes, updated in place.
+        quota_ids (list): The quota folder IDs affected, see quota_folder_ids.
+        size (int): The change in bytes, negative for removals.
+        count (int): The change in files, negative for removals.
+    """
+    for quota_id in quota_ids:
+        totals = usage.setdefault(quota_id, [0, 0])
+        totals[0] += size
+        totals[1] += count
+
+
+def charge_quotas(session, usage: dict):
+    """
+    Apply usage changes to the counters of quota folders, failing if a limit would be exceeded.
+
+    Each counter is changed by one conditional UPDATE of the quota folder's row, so concurrent writers
+    serialize on that row only and a limit can never be overshot. Increases are checked against the
+    limit; decreases always succeed, even when the usage is above a limit that was lowered later.
+    Rows are updated in ID order so transactions charging the same quotas cannot deadlock.
+
+    Args:
+        session (Session): The database session of the transaction making the change.
+        usage (dict): Maps quota folder IDs to (bytes, files) changes, see add_usage.
+
+    Raises:
+        Exception: If a change would exceed the byte or file limit of a quota; the caller rolls back.
+    """
+    for quota_id, (size, count) in sorted(usage.items()):
+        if not size and not count:
+            continue
+        conditions = [Folder.folder_id == quota_id, Folder.folder_used_bytes.is_not(None)]
+        if size > 0:
+            conditions.append(
+                (Folder.folder_quota_bytes.is_(None)) | (Folder.folder_used_bytes + size <= Folder.folder_quota_bytes))
+        if count > 0:
+            conditions.append(
+                (Folder.folder_quota_files.is_(None)) | (Folder.folder_used_files + count <= Folder.folder_quota_files))
+        updated = session.execute(
+            update(Folder).where(and_(*conditions)).values(
+                folder_used_bytes=Folder.folder_used_bytes + size,
+                folder_used_files=Folder.folder_used_files + count
+            ),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not updated:
+            # Either the limit is reached or the quota was removed meanwhile, which needs no charge
+            quota = session.execute(
+                select(Folder.folder_quota_bytes, Folder.folder_quota_files, Folder.folder_used_bytes, Folder.folder_used_files)
+                .where(Folder.folder_id == quota_id)
+            ).one_or_none()
+            if quota is not None and quota.folder_used_bytes is not None:
+                raise Exception(
+                    f"Quota exceeded for Folder ID: {quota_id}: adding {size} bytes and {count} file(s) to "
+                    f"{quota.folder_used_bytes} of {quota.folder_quota_bytes} bytes and "
+                    f"{quota.folder_used_files} of {quota.folder_quota_files} files"
+                )
+
+
+def charge_folder(session, folder_id: int, size: int, count: int):
+    """
+    Charge a change of the files in one folder to every quota covering it. The folder's ancestor
+    chain stays locked until the transaction ends, see quota_folder_ids.
+
+    Args:
+        session (Session): The database session of the transaction making the change.
+        folder_id (int): The folder whose files change.
+        size (int): The change in bytes, negative for removals.
+        count (int): The change in files, negative for removals.
+
+    Raises:
+        Exception: If a quota would be exceeded.
+    """
+    usage = {}
+    add_usage(usage, quota_folder_ids(session, folder_id, lock=True), size, count)
+    charge_quotas(session, usage)
+
+
+def charge_move(session, old_quota_ids: list, new_quota_ids: list, size: int, count: int):
+    """
+    Move usage from the quotas of a previous location to those of a new one.
+
+    Quotas covering both locations, such as the home folder of both, are left untouched.
+
+    Args:
+        session (Session): The database session of the transaction making the move.
+        old_quota_ids (list): The quota folder IDs covering the previous location.
+        new_quota_ids (list): The quota folder IDs covering the new location.
+        size (int): The bytes moved.
+        count (int): The files moved.
+
+    Raises:
+        Exception: If a quota of the new location would be exceeded.
+    """
+    usage = {}
+    add_usage(usage, [quota_id for quota_id in old_quota_ids if quota_id not in new_quota_ids], -size, -count)
+    add_usage(usage, [quota_id for quota_id in new_quota_ids if quota_id not in old_quota_ids], size, count)
+    charge_quotas(session, usage)
+
+
+def subtree_usage(session, folder_id: int) -> tuple:
+    """
+    Sum the bytes and files stored in a folder's subtree.
+
+    Deleted descendants are included, as their usage stays charged until they are purged. The sum
+    reads the covering idx_file_folder_size index, but its cost grows with the subtree, so it is only
+    used when setting up or repairing a quota and when a folder without a quota of its own moves
+    between quotas. Keeping a usage counter on every folder would make such moves O(depth), but
+    every file write would then update each of its ancestors, serializing all writes on the root.
+
+    Args:
+        session (Session): The database session to execute the query on.
+        folder_id (int): The ID of the subtree root.
+
+    Returns:
+        tuple: The total bytes and the number of files.
+    """
+    subtree = select(Folder.folder_id).where(Folder.folder_id == folder_id).cte('usage_subtree', recursive=True)
+    subtree = subtree.union_all(select(Folder.folder_id).join(subtree, Folder.folder_parent_id == subtree.c.folder_id))
+    size, count = session.execute(
+        select(func.coalesce(func.sum(STORED_SIZE), 0), func.count())
+        .where(File.folder_id.in_(select(subtree.c.folder_id)))
+    ).one()
+    return int(size), int(count)
+
+
+def quota_to_dict(folder) -> dict:
+    """
+    Convert a folder row with quota columns into the dictionary returned by the quota queries.
+
+    Args:
+        folder: A Folder object or a row with the folder_id, folder_name and quota columns.
+
+    Returns:
+        dict: The limits, the usage and the remaining room, None where there is no limit.
+    """
+    return {
+        'Folder ID': folder.folder_id,
+        'Folder Name': folder.folder_name,
+        'Quota Bytes': folder.folder_quota_bytes,
+        'Quota Files': folder.folder_quota_files,
+        'Used Bytes': folder.folder_used_bytes,
+        'Used Files': folder.folder_used_files,
+        'Free Bytes': None if folder.folder_quota_bytes is None else folder.folder_quota_bytes - folder.folder_used_bytes,
+        'Free Files': None if folder.folder_quota_files is None else folder.folder_quota_files - folder.folder_used_files
+    }
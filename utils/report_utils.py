@@ -0,0 +1,176 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+def compute_subtree_aggregates(folder_ids: np.ndarray, parent_ids: np.ndarray,
+                               file_folder_ids: np.ndarray, file_sizes: np.ndarray,
+                               folder_names: np.ndarray = None) -> pd.DataFrame:
+    """
+    Compute per-folder and per-subtree file counts and sizes in one vectorized bottom-up pass.
+
+    Folders are mapped to array positions, their depth is found by pointer jumping over the
+    parent array, and the totals are then pushed to the parents one depth level at a time, so
+    the work is O(folders + files) array operations with only O(depth) Python iterations.
+
+    Args:
+        folder_ids (np.ndarray): IDs of all folders.
+        parent_ids (np.ndarray): Parent ID of every folder, -1 for the root.
+        file_folder_ids (np.ndarray): Folder ID of every file.
+        file_sizes (np.ndarray): Size of every file in bytes.
+        folder_names (np.ndarray, optional): Name of every folder, added as a folder_name column. Defaults to None.
+
+    Returns:
+        pd.DataFrame: One row per folder with the columns folder_id, folder_name (if given),
+        folder_parent_id, depth, file_count, size, subtree_file_count and subtree_size, ordered by folder_id.
+
+    Raises:
+        ValueError: If the parent pointers contain a cycle.
+    """
+    folder_ids = np.asarray(folder_ids, dtype=np.int64)
+    parent_ids = np.asarray(parent_ids, dtype=np.int64)
+    file_folder_ids = np.asarray(file_folder_ids, dtype=np.int64)
+    file_sizes = np.asarray(file_sizes, dtype=np.int64)
+
+    order = np.argsort(folder_ids, kind='stable')
+    folder_ids = folder_ids[order]
+    parent_ids = parent_ids[order]
+    num_folders = len(folder_ids)
+
+    parent_pos = _positions(folder_ids, parent_ids)
+
+    # Own counts and sizes; files pointing at unknown folders are ignored
+    file_pos = _positions(folder_ids, file_folder_ids)
+    known = file_pos >= 0
+    file_count = np.bincount(file_pos[known], minlength=num_folders).astype(np.int64)
+    size = np.zeros(num_folders, dtype=np.int64)
+    np.add.at(size, file_pos[known], file_sizes[known])
+
+    depth = np.zeros(num_folders, dtype=np.int64)
+    ancestor = parent_pos.copy()
+    while (ancestor >= 0).any():
+        active = ancestor >= 0
+        depth[active] += 1
+        if depth.max() > num_folders:
+            raise ValueError("Folder hierarchy contains a cycle")
+        ancestor[active] = parent_pos[ancestor[active]]
+
+    subtree_file_count = file_count.copy()
+    subtree_size = size.copy()
+    for level in range(int(depth.max(initial=0)), 0, -1):
+        at_level = np.flatnonzero(depth == level)
+        np.add.at(subtree_file_count, parent_pos[at_level], subtree_file_count[at_level])
+        np.add.at(subtree_size, parent_pos[at_level], subtree_size[at_level])
+
+    report = pd.DataFrame({
+        'folder_id': folder_ids,
+        'folder_parent_id': pd.Series(parent_ids).where(parent_ids >= 0).astype(pd.Int64Dtype()),
+        'depth': depth,
+        'file_count': file_count,
+        'size': size,
+        'subtree_file_count': subtree_file_count,
+        'subtree_size': subtree_size
+    })
+    if folder_names is not None:
+        report.insert(1, 'folder_name', np.asarray(folder_names, dtype=object)[order])
+    return report
+
+
+def _positions(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """
+    Map IDs to their positions in a sorted ID array, -1 where an ID is not present.
+    """
+    if len(sorted_ids) == 0:
+        return np.full(len(ids), -1, dtype=np.int64)
+    pos = np.searchsorted(sorted_ids, ids)
+    pos = np.clip(pos, 0, len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == ids, pos, -1).astype(np.int64)
+
+
+def size_histogram(file_sizes: np.ndarray) -> pd.DataFrame:
+    """
+    Bucket file sizes into power-of-two ranges.
+
+    Args:
+        file_sizes (np.ndarray): Size of every file in bytes.
+
+    Returns:
+        pd.DataFrame: The columns min_bytes, max_bytes and count, one row per non-empty bucket.
+    """
+    file_sizes = np.asarray(file_sizes, dtype=np.int64)
+    if len(file_sizes) == 0:
+        return pd.DataFrame({'min_bytes': [], 'max_bytes': [], 'count': []}, dtype=np.int64)
+    # Bucket b holds sizes in [2**(b-1), 2**b), bucket 0 holds empty files
+    buckets = np.zeros(len(file_sizes), dtype=np.int64)
+    positive = file_sizes > 0
+    buckets[positive] = np.floor(np.log2(file_sizes[positive])).astype(np.int64) + 1
+    counts = np.bincount(buckets)
+    present = np.flatnonzero(counts)
+    return pd.DataFrame({
+        'min_bytes': np.where(present == 0, 0, 2 ** np.maximum(present - 1, 0)),
+        'max_bytes': np.where(present == 0, 0, 2 ** present - 1),
+        'count': counts[present]
+    })
+
+
+def created_date_distribution(created_dates: np.ndarray, freq: str = 'M') -> pd.DataFrame:
+    """
+    Count files per creation period.
+
+    Args:
+        created_dates (np.ndarray): Creation timestamp of every file.
+        freq (str, optional): A pandas period frequency. Defaults to 'M' (months).
+
+    Returns:
+        pd.DataFrame: The columns period and count, ordered by period.
+    """
+    dates = pd.Series(pd.to_datetime(created_dates)).dropna()
+    counts = dates.dt.to_period(freq).value_counts().sort_index()
+    return pd.DataFrame({'period': counts.index.astype(str), 'count': counts.to_numpy()})
+
+
+def write_report(output_path: str, fmt: str, folders: pd.DataFrame,
+                 histogram: pd.DataFrame, dates: pd.DataFrame) -> str:
+    """
+    Write a tree report as CSV or JSON.
+
+    CSV reports write the per-folder table to output_path and the size histogram and date
+    distribution next to it, suffixed with '_size_histogram' and '_created_dates'.
+
+    Args:
+        output_path (str): The path of the report file.
+        fmt (str): 'csv' or 'json'.
+        folders (pd.DataFrame): The per-folder aggregates.
+        histogram (pd.DataFrame): The file size histogram.
+        dates (pd.DataFrame): The created date distribution.
+
+    Returns:
+        str: The path of the written report.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if fmt == 'csv':
+        stem, ext = os.path.splitext(output_path)
+        folders.to_csv(output_path, index=False)
+        histogram.to_csv(f"{stem}_size_histogram{ext or '.csv'}", index=False)
+        dates.to_csv(f"{stem}_created_dates{ext or '.csv'}", index=False)
+    elif fmt == 'json':
+        root = folders[folders['folder_parent_id'].isna()]
+        report = {
+            'summary': {
+                'folders': int(len(folders)),
+                'files': int(folders['file_count'].sum()),
+                'total_size': int(folders['size'].sum()),
+                'max_depth': int(folders['depth'].max()) if len(folders) else 0,
+                'root_folder_ids': [int(folder_id) for folder_id in root['folder_id']]
+            },
+            'folders': json.loads(folders.to_json(orient='records')),
+            'file_size_histogram': json.loads(histogram.to_json(orient='records')),
+            'created_date_distribution': json.loads(dates.to_json(orient='records'))
+        }
+        with open(output_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        raise ValueError(f"Unsupported report format: {fmt}. Expected 'csv' or 'json'")
+    return output_path
@@ -1,9 +1,12 @@
 import boto3
-import uuid
 import configparser
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, ClientError
-from datetime import datetime, timezone
 from logger import Logger
+from utils.cache_utils import ContentCache
+from utils.key_utils import KEY_LAYOUTS, make_s3_key, pick_bucket
+from utils.transfer_utils import TransferScheduler, ScheduledStream, classify_error_code
+from utils.metrics import registry, measured
 
 # Initialize logger
 logger = Logger.get_logger()
@@ -19,22 +22,74 @@ AWS_SECRET_ACCESS_KEY = config['AWSBucketS3']['aws_secret_access_key']
 AWS_REGION_NAME = config['AWSBucketS3']['aws_region_name']
 S3_BUCKET_NAME = config['AWSBucketS3']['s3_bucket_name']
 
+# Layout of new keys and the buckets new objects are sharded across; existing files keep their recorded key and bucket
+S3_KEY_LAYOUT = config.get('AWSBucketS3', 'key_layout', fallback='timestamp')
+S3_KEY_PREFIX_LENGTH = config.getint('AWSBucketS3', 'key_prefix_length', fallback=4)
+S3_SHARD_BUCKET_NAMES = [name.strip() for name in config.get('AWSBucketS3', 'shard_bucket_names', fallback='').split(',')
+                         if name.strip()]
+if S3_KEY_LAYOUT not in KEY_LAYOUTS:
+    raise ValueError(f"Unknown key_layout: {S3_KEY_LAYOUT}. Expected one of {', '.join(KEY_LAYOUTS)}")
+
+# Local content cache configuration, disabled unless a [cache] section enables it
+CACHE_ENABLED = config.getboolean('cache', 'enabled', fallback=False)
+CACHE_DIRECTORY = config.get('cache', 'directory', fallback='.cache/s3')
+CACHE_MAX_BYTES = config.getint('cache', 'max_bytes', fallback=1024 ** 3)
+
+# Transfer scheduler configuration, shared by every S3 request of the process
+TRANSFER_MIN_CONCURRENCY = config.getint('transfer', 'min_concurrency', fallback=1)
+TRANSFER_MAX_CONCURRENCY = config.getint('transfer', 'max_concurrency', fallback=64)
+TRANSFER_INITIAL_CONCURRENCY = config.getint('transfer', 'initial_concurrency', fallback=8)
+TRANSFER_MAX_BYTES_IN_FLIGHT = config.getint('transfer', 'max_bytes_in_flight', fallback=256 * 1024 ** 2)
+TRANSFER_MAX_ATTEMPTS = config.getint('transfer', 'max_attempts', fallback=5)
+TRANSFER_BASE_DELAY = config.getfloat('transfer', 'base_delay', fallback=0.1)
+TRANSFER_MAX_DELAY = config.getfloat('transfer', 'max_delay', fallback=20.0)
+TRANSFER_LATENCY_TOLERANCE = config.getfloat('transfer', 'latency_tolerance', fallback=3.0)
+TRANSFER_RETRY_BUDGET = config.getint('transfer', 'retry_budget', fallback=20)
+
+S3_BYTES_UPLOADED = registry.counter('s3_uploaded_bytes_total', "Bytes uploaded to S3.").labels()
+S3_BYTES_DOWNLOADED = registry.counter('s3_downloaded_bytes_total', "Bytes downloaded from S3, not counting cache hits.").labels()
+
+
+def _failed(result) -> bool:
+    # S3Utils methods log their errors and return None or False instead of raising
+    return result is None or result is False
+
+
 class S3Utils:
     """
     A utility class for handling S3 operations such as uploading, downloading, deleting files,
     generating pre-signed URLs, and checking S3 connection.
+
+    Object requests go through a shared TransferScheduler, which adapts the number of requests in
+    flight to throttling and latency, caps the bytes in flight and retries with jittered backoff.
+    The client's own retries are disabled so the scheduler sees every throttling response, which is
+    why every request that reaches S3, the connection check included, goes through the scheduler.
+    The client's connection pool is sized for the highest concurrency the scheduler allows.
     """
     s3_client = boto3.client(
         's3',
         aws_access_key_id=AWS_ACCESS_KEY_ID,
         aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_REGION_NAME
+        region_name=AWS_REGION_NAME,
+        config=Config(max_pool_connections=TRANSFER_MAX_CONCURRENCY, retries={'total_max_attempts': 1})
     )
+    scheduler = TransferScheduler(
+        min_concurrency=TRANSFER_MIN_CONCURRENCY,
+        max_concurrency=TRANSFER_MAX_CONCURRENCY,
+        initial_concurrency=TRANSFER_INITIAL_CONCURRENCY,
+        max_bytes_in_flight=TRANSFER_MAX_BYTES_IN_FLIGHT,
+        max_attempts=TRANSFER_MAX_ATTEMPTS,
+        base_delay=TRANSFER_BASE_DELAY,
+        max_delay=TRANSFER_MAX_DELAY,
+        latency_tolerance=TRANSFER_LATENCY_TOLERANCE,
+        retry_budget=TRANSFER_RETRY_BUDGET
+    )
+    content_cache = ContentCache(CACHE_DIRECTORY, CACHE_MAX_BYTES) if CACHE_ENABLED else None
 
     @staticmethod
     def generate_s3_key(file_name):
         """
-        Generate a unique S3 key for the file.
+        Generate a unique S3 key for the file, in the key_layout configured in config.ini.
         
         Args:
             file_name (str): The name of the file.
@@ -42,12 +97,24 @@ class S3Utils:
         Returns:
             str: A unique S3 key for the file.
         """
-        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
-        unique_id = str(uuid.uuid4())
-        return f"{timestamp}_{unique_id}_{file_name}"
+        return make_s3_key(file_name, S3_KEY_LAYOUT, S3_KEY_PREFIX_LENGTH)
+
+    @staticmethod
+    def bucket_for_key(file_s3_key):
+        """
+        Choose the bucket of a new object, to be recorded on its file.
+
+        Args:
+            file_s3_key (str): The S3 key of the new object.
+
+        Returns:
+            str: One of the shard_bucket_names, None when objects go to the default bucket.
+        """
+        return pick_bucket(file_s3_key, S3_SHARD_BUCKET_NAMES)
     
     @staticmethod
-    def upload_file_to_s3(file_content, file_name, file_s3_key):
+    @measured('S3Utils', failed=_failed)
+    def upload_file_to_s3(file_content, file_name, file_s3_key, bucket=None):
         """
         Upload a file to S3.
         
@@ -55,13 +122,16 @@ class S3Utils:
             file_content (bytes): The content of the file.
             file_name (str): The name of the file.
             file_s3_key (str): The S3 key for the file.
+            bucket (str, optional): The bucket recorded on the file. Defaults to the default bucket.
         
         Returns:
             str: The S3 key of the uploaded file if successful, None otherwise.
         """
         try:
             logger.info(f"Starting upload of file: {file_name} with key: {file_s3_key}")
-            S3Utils.s3_client.put_object(Bucket=S3_BUCKET_NAME, Key=file_s3_key, Body=file_content)
+            S3Utils.scheduler.call('put', S3Utils.s3_client.put_object, nbytes=len(file_content),
+                                   Bucket=bucket or S3_BUCKET_NAME, Key=file_s3_key, Body=file_content)
+            S3_BYTES_UPLOADED.inc(len(file_content))
             logger.info(f"File uploaded successfully: {file_name} with key: {file_s3_key}")
             return file_s3_key
         except NoCredentialsError:
@@ -72,37 +142,133 @@ class S3Utils:
             return None
 
     @staticmethod
-    def download_file_from_s3(file_name):
+    @measured('S3Utils', failed=_failed)
+    def download_file_from_s3(file_name, size=0, bucket=None):
         """
         Download a file from S3.
         
         Args:
             file_name (str): The S3 key of the file to be downloaded.
+            size (int, optional): The expected size, reserved against the bytes in flight. Defaults to 0.
+            bucket (str, optional): The bucket recorded on the file. Defaults to the default bucket.
         
         Returns:
             bytes: The content of the file if successful, None otherwise.
         """
+        def get_content():
+            # The body is read inside the scheduled call so a connection reset mid-body is retried too
+            return S3Utils.s3_client.get_object(Bucket=bucket or S3_BUCKET_NAME, Key=file_name)['Body'].read()
+
         try:
-            response = S3Utils.s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=file_name)
-            return response['Body'].read()
-        except (NoCredentialsError, ClientError) as e:
+            if S3Utils.content_cache is not None:
+                cached = S3Utils.content_cache.get(file_name)
+                if cached is not None:
+                    return cached
+            content = S3Utils.scheduler.call('get', get_content, nbytes=size)
+            S3_BYTES_DOWNLOADED.inc(len(content))
+            if S3Utils.content_cache is not None:
+                S3Utils.content_cache.put(file_name, content)
+            return content
+        except Exception as e:
             logger.error(f"Error downloading file: {str(e)}")
             return None
 
     @staticmethod
-    def delete_file_from_s3(file_name):
+    @measured('S3Utils', failed=_failed)
+    def download_fileobj_from_s3(file_s3_key, size=0, bucket=None):
+        """
+        Open a streaming download of a file from S3.
+
+        With the content cache enabled, a miss streams the object into the cache and the
+        returned stream reads the local copy. A stream read from S3 keeps its transfer slot
+        until it is closed, so callers must close it.
+        
+        Args:
+            file_s3_key (str): The S3 key of the file to be downloaded.
+            size (int, optional): The expected size, reserved against the bytes in flight. Defaults to 0.
+            bucket (str, optional): The bucket recorded on the file. Defaults to the default bucket.
+        
+        Returns:
+            StreamingBody: A readable stream of the object's content if successful, None otherwise.
+        """
+        try:
+            cache = S3Utils.content_cache
+            if cache is not None:
+                cached = cache.open(file_s3_key)
+                if cached is not None:
+                    return cached
+            response, release = S3Utils.scheduler.hold(
+                'get', S3Utils.s3_client.get_object, nbytes=size, Bucket=bucket or S3_BUCKET_NAME, Key=file_s3_key)
+            S3_BYTES_DOWNLOADED.inc(response.get('ContentLength', 0))
+            if cache is not None and response.get('ContentLength', 0) <= cache.max_bytes:
+                try:
+                    with response['Body'] as body:
+                        cache.put(file_s3_key, body)
+                finally:
+                    release()
+                cached = cache.open(file_s3_key)
+                if cached is not None:
+                    return cached
+                response, release = S3Utils.scheduler.hold(
+                    'get', S3Utils.s3_client.get_object, nbytes=size, Bucket=bucket or S3_BUCKET_NAME, Key=file_s3_key)
+                S3_BYTES_DOWNLOADED.inc(response.get('ContentLength', 0))
+            return ScheduledStream(response['Body'], release)
+        except Exception as e:
+            logger.error(f"Error downloading file: {str(e)}")
+            return None
+
+    @staticmethod
+    @measured('S3Utils', failed=_failed)
+    def copy_file_in_s3(source_s3_key, destination_s3_key, source_bucket=None, destination_bucket=None):
+        """
+        Copy an object inside S3 without passing its content through this process.
+
+        The managed copy issues a single CopyObject for small objects and parallel UploadPartCopy
+        requests for objects above the multipart threshold. Source and copy may be in different buckets.
+        
+        Args:
+            source_s3_key (str): The S3 key of the object to copy.
+            destination_s3_key (str): The S3 key of the copy.
+            source_bucket (str, optional): The bucket recorded on the source file. Defaults to the default bucket.
+            destination_bucket (str, optional): The bucket of the copy. Defaults to the default bucket.
+        
+        Returns:
+            str: The S3 key of the copy if successful, None otherwise.
+        """
+        try:
+            S3Utils.scheduler.call(
+                'copy', S3Utils.s3_client.copy,
+                CopySource={'Bucket': source_bucket or S3_BUCKET_NAME, 'Key': source_s3_key},
+                Bucket=destination_bucket or S3_BUCKET_NAME,
+                Key=destination_s3_key
+            )
+            logger.info(f"File copied successfully: {source_s3_key} to {destination_s3_key}")
+            return destination_s3_key
+        except NoCredentialsError:
+            logger.error("Credentials not available")
+            return None
+        except Exception as e:
+            logger.error(f"Error copying file: {source_s3_key}, Error: {str(e)}")
+            return None
+
+    @staticmethod
+    @measured('S3Utils', failed=_failed)
+    def delete_file_from_s3(file_name, bucket=None):
         """
         Delete a file from S3.
         
         Args:
             file_name (str): The S3 key of the file to be deleted.
+            bucket (str, optional): The bucket recorded on the file. Defaults to the default bucket.
         
         Returns:
             bool: True if the file was successfully deleted, False otherwise.
         """
         try:
             logger.info(f"Starting deletion of file: {file_name}")
-            response = S3Utils.s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=file_name)
+            if S3Utils.content_cache is not None:
+                S3Utils.content_cache.discard(file_name)
+            response = S3Utils.scheduler.call('delete', S3Utils.s3_client.delete_object, Bucket=bucket or S3_BUCKET_NAME, Key=file_name)
             logger.info(f"Delete response from S3: {response}")
 
             # Check if the file was actually deleted
@@ -128,13 +294,76 @@ class S3Utils:
             return False
 
     @staticmethod
-    def generate_presigned_url(s3_key, expiration=3600):
+    @measured('S3Utils', failed=bool)
+    def delete_files_from_s3(s3_keys, batch_size=1000, buckets=None):
+        """
+        Delete many objects from S3 with batched DeleteObjects requests, one series per bucket.
+
+        Args:
+            s3_keys (list): The S3 keys of the objects to delete.
+            batch_size (int, optional): Keys per request, at most 1000. Defaults to 1000.
+            buckets (list, optional): The bucket recorded on each file, in the order of s3_keys.
+                Defaults to the default bucket for every key.
+
+        Keys that a DeleteObjects response reports as throttled or failed transiently are sent again
+        through the scheduler, with backoff, until they are deleted or the attempts run out.
+
+        Returns:
+            list: The keys that could not be deleted; deleting a missing key counts as success.
+        """
+        by_bucket = {}
+        for s3_key, bucket in zip(s3_keys, buckets or [None] * len(s3_keys)):
+            by_bucket.setdefault(bucket or S3_BUCKET_NAME, []).append(s3_key)
+        batches = [(bucket, keys[start:start + batch_size])
+                   for bucket, keys in by_bucket.items() for start in range(0, len(keys), batch_size)]
+
+        failed = []
+        for bucket, batch in batches:
+            if S3Utils.content_cache is not None:
+                for s3_key in batch:
+                    S3Utils.content_cache.discard(s3_key)
+            remaining = list(batch)
+
+            def delete_remaining():
+                response = S3Utils.s3_client.delete_objects(
+                    Bucket=bucket,
+                    Delete={'Objects': [{'Key': s3_key} for s3_key in remaining], 'Quiet': True}
+                )
+                retry = []
+                for error in response.get('Errors', []):
+                    if classify_error_code(str(error.get('Code', ''))) == 'fatal':
+                        logger.error(f"Error deleting file: {error['Key']}, Error: {error.get('Code')} {error.get('Message')}")
+                        failed.append(error['Key'])
+                    else:
+                        retry.append(error)
+                remaining[:] = [error['Key'] for error in retry]
+                if retry:
+                    # Raised so the scheduler backs off and sends only these keys again
+                    raise ClientError({'Error': {'Code': retry[0].get('Code'), 'Message': f"{len(retry)} keys not deleted: "
+                                                 f"{retry[0].get('Message')}"}}, 'DeleteObjects')
+                return response
+
+            try:
+                S3Utils.scheduler.call('delete_objects', delete_remaining)
+            except NoCredentialsError:
+                logger.error("Credentials not available")
+                failed.extend(remaining)
+            except Exception as e:
+                logger.error(f"Error deleting {len(remaining)} files, Error: {str(e)}")
+                failed.extend(remaining)
+        logger.info(f"Deleted {len(s3_keys) - len(failed)} of {len(s3_keys)} files from S3")
+        return failed
+
+    @staticmethod
+    @measured('S3Utils', failed=_failed)
+    def generate_presigned_url(s3_key, expiration=3600, bucket=None):
         """
         Generate a pre-signed URL for an S3 object.
         
         Args:
             s3_key (str): The S3 key of the object.
             expiration (int): Time in seconds for the pre-signed URL to remain valid.
+            bucket (str, optional): The bucket recorded on the file. Defaults to the default bucket.
         
         Returns:
             str: The pre-signed URL if successful, None otherwise.
@@ -142,7 +371,7 @@ class S3Utils:
         try:
             url = S3Utils.s3_client.generate_presigned_url(
                 'get_object',
-                Params={'Bucket': S3_BUCKET_NAME, 'Key': s3_key},
+                Params={'Bucket': bucket or S3_BUCKET_NAME, 'Key': s3_key},
                 ExpiresIn=expiration
             )
             logger.info(f"Presigned URL generated: {url}")
@@ -152,16 +381,18 @@ class S3Utils:
             return None
 
     @staticmethod
+    @measured('S3Utils', failed=_failed)
     def check_s3_connection():
         """
-        Check the connection to the S3 bucket.
+        Check the connection to the S3 bucket and to every shard bucket.
         
         Returns:
             bool: True if connected successfully, False otherwise.
         """
         try:
             # Perform a simple operation to check connection, like listing objects in the bucket
-            S3Utils.s3_client.list_objects_v2(Bucket=S3_BUCKET_NAME)
+            for bucket in dict.fromkeys([S3_BUCKET_NAME] + S3_SHARD_BUCKET_NAMES):
+                S3Utils.scheduler.call('list', S3Utils.s3_client.list_objects_v2, Bucket=bucket, MaxKeys=1)
             logger.info("Connected to S3 successfully.")
             return True
         except (NoCredentialsError, ClientError) as e:
@@ -170,3 +401,6 @@ class S3Utils:
         except Exception as e:
             logger.error(f"Unexpected error connecting to S3: {str(e)}")
             return False
+
+
+registry.register_collector('s3_scheduler', S3Utils.scheduler.collect_metrics)
@@ -0,0 +1,124 @@
+import os
+import hashlib
+from datetime import datetime, timezone
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """
+    Compute the SHA-256 of a local file without reading it into memory at once.
+
+    Module level so that it can run in a process pool.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def walk_directory(root: str):
+    """
+    List the directories and files below a local directory.
+
+    Args:
+        root (str): The local directory.
+
+    Returns:
+        tuple: The set of relative directory paths (with '' for the root itself) and a dict mapping
+        each relative file path to its (absolute path, size, modification time as naive UTC datetime).
+    """
+    directories = {''}
+    files = {}
+    for current, dirnames, filenames in os.walk(root):
+        relative = os.path.relpath(current, root)
+        relative = '' if relative == '.' else relative.replace(os.sep, '/')
+        for dirname in dirnames:
+            directories.add(f"{relative}/{dirname}" if relative else dirname)
+        for filename in filenames:
+            path = os.path.join(current, filename)
+            stat = os.stat(path)
+            modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc).replace(tzinfo=None)
+            files[f"{relative}/{filename}" if relative else filename] = (path, stat.st_size, modified)
+    return directories, files
+
+
+def split_path(relative_path: str):
+    """
+    Split a relative path into its parent directory path and its name.
+
+    Args:
+        relative_path (str): A '/' separated relative path.
+
+    Returns:
+        tuple: The parent path ('' at the top level) and the last path component.
+    """
+    parent, _, name = relative_path.rpartition('/')
+    return parent, name
+
+
+def is_safe_name(name: str) -> bool:
+    """
+    Check that a folder or file name can be used as a single component of a local path or archive member.
+
+    Names are stored as given, so a name such as '..' or 'a/b' would otherwise resolve outside the
+    destination or into another directory.
+
+    Args:
+        name (str): The folder or file name.
+
+    Returns:
+        bool: False for an empty name, '.', '..', or a name containing a path separator or NUL.
+    """
+    return bool(name) and name not in ('.', '..') and not any(character in name for character in ('/', '\\', '\0'))
+
+
+def contained_path(root: str, relative_path: str) -> str:
+    """
+    Resolve a relative path below a local directory, following symbolic links, and make sure it stays there.
+
+    Args:
+        root (str): The local directory.
+        relative_path (str): A '/' separated relative path, '' for the directory itself.
+
+    Returns:
+        str: The resolved absolute path.
+
+    Raises:
+        ValueError: If the path resolves outside the directory.
+    """
+    real_root = os.path.realpath(root)
+    target = os.path.realpath(os.path.join(real_root, *relative_path.split('/')))
+    if os.path.commonpath([real_root, target]) != real_root:
+        raise ValueError(f"Path {relative_path!r} resolves outside {root}")
+    return target
+
+
+def changed_by_metadata(local_size: int, local_modified: datetime, stored_size: int, stored_created: datetime) -> bool:
+    """
+    Decide from size and modification time whether a local file differs from its stored copy.
+
+    The stored copy is considered current if it has the same size and was uploaded after the
+    local file was last modified.
+
+    Args:
+        local_size (int): The size of the local file.
+        local_modified (datetime): The modification time of the local file, naive UTC.
+        stored_size (int): The original size of the stored file.
+        stored_created (datetime): When the stored file was uploaded, naive UTC.
+
+    Returns:
+        bool: True if the file needs to be uploaded again.
+    """
+    if local_size != stored_size or stored_created is None:
+        return True
+    if stored_created.tzinfo is not None:
+        stored_created = stored_created.astimezone(timezone.utc).replace(tzinfo=None)
+    return local_modified > stored_created
@@ -0,0 +1,355 @@
+import configparser
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from logger import Logger
+
+logger = Logger.get_logger()
+
+# Read configuration
+config = configparser.ConfigParser()
+config.read('config/config.ini')
+
+# Tracing configuration, disabled unless a [tracing] section enables it
+TRACING_ENABLED = config.getboolean('tracing', 'enabled', fallback=False)
+TRACE_PATH = config.get('tracing', 'path', fallback='traces/trace.json')
+# Characters of each SQL statement kept on its span
+TRACE_STATEMENT_LENGTH = config.getint('tracing', 'statement_length', fallback=500)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """
+    A timed operation within a trace. Spans opened while another is current become its children.
+
+    Attributes:
+        name (str): What was done, e.g. 'FileController.delete_file' or 's3.delete'.
+        category (str): The layer, e.g. 'controller', 'service', 'sql' or 'storage'.
+        trace_id (int): The span ID of the root span of the trace.
+        span_id (int): The ID of the span, unique within the process.
+        parent_id (int): The span ID of the parent, None for a root span.
+        start_us (float): The wall clock start time in microseconds since the epoch.
+        duration_us (float): The duration in microseconds, set when the span ends.
+        thread_id (int): The thread that ran the span.
+        attributes (dict): Sizes, counts and other details of the operation.
+    """
+    __slots__ = ('name', 'category', 'trace_id', 'span_id', 'parent_id', 'start_us', 'duration_us', 'thread_id',
+                 'attributes', '_started')
+
+    def __init__(self, name: str, category: str, parent, attributes: dict):
+        self.name = name
+        self.category = category
+        self.span_id = next(_span_ids)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.start_us = time.time_ns() / 1000
+        self.duration_us = None
+        self.thread_id = threading.get_ident()
+        self.attributes = attributes
+        self._started = time.perf_counter()
+
+    def set(self, **attributes):
+        """
+        Add attributes to the span, e.g. a size known only at the end of the operation.
+        """
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration_us = (time.perf_counter() - self._started) * 1e6
+
+
+class _NoopSpan:
+    """
+    The span handed out while tracing is disabled.
+    """
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class ChromeTraceExporter:
+    """
+    Writes finished spans to a file in the Chrome Trace Event format, which chrome://tracing and
+    https://ui.perfetto.dev open directly.
+
+    Spans are appended as complete ('X') events as they finish, so the file is readable while the
+    process runs and after it crashes; the format allows the closing bracket of the array to be
+    missing. Each event carries trace_id, span_id and parent_span_id in its args, see load_trace.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('[\n')
+        self._file.flush()
+        self._pid = os.getpid()
+
+    def export(self, span: Span):
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': round(span.start_us, 1),
+            'dur': round(span.duration_us, 1),
+            'pid': self._pid,
+            'tid': span.thread_id,
+            # The IDs come last so an attribute such as a parent_id argument cannot hide them
+            'args': {**span.attributes, 'trace_id': span.trace_id, 'span_id': span.span_id, 'parent_span_id': span.parent_id}
+        }
+        line = json.dumps(event, default=str) + ',\n'
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.write('{}]\n')
+                self._file.close()
+
+
+class Tracer:
+    """
+    Creates spans and hands finished ones to an exporter; without an exporter every call is a no-op.
+
+    The current span is kept in a context variable, so nesting follows the call stack and is
+    separate per thread and per asyncio task. Work handed to another thread becomes part of the
+    trace only when wrapped with propagate.
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def span(self, name: str, category: str = 'app', **attributes):
+        """
+        Time a block as a span, a child of the current span if there is one.
+
+        Args:
+            name (str): What the block does.
+            category (str, optional): The layer. Defaults to 'app'.
+            **attributes: Details recorded on the span.
+
+        Returns:
+            A context manager yielding the Span, whose set method adds attributes.
+        """
+        return self.open(name, category, attributes)
+
+    @contextmanager
+    def open(self, name: str, category: str, attributes: dict):
+        """
+        Like span, with the attributes as a dictionary so their names cannot clash with the parameters.
+        """
+        exporter = self.exporter
+        if exporter is None:
+            yield NOOP_SPAN
+            return
+        span = Span(name, category, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes['error'] = f"{type(e).__name__}: {e}"[:200]
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+            exporter.export(span)
+
+
+tracer = Tracer()
+
+
+def configure(path: str = None) -> Tracer:
+    """
+    Enable tracing to a file, or disable it.
+
+    Args:
+        path (str, optional): The trace file, see ChromeTraceExporter. Defaults to None, which disables tracing.
+
+    Returns:
+        Tracer: The process wide tracer.
+    """
+    previous = tracer.exporter
+    tracer.exporter = ChromeTraceExporter(path) if path else None
+    if previous is not None:
+        previous.close()
+    if path:
+        logger.info(f"Tracing to {path}")
+    return tracer
+
+
+def span(name: str, category: str = 'app', **attributes):
+    """
+    Time a block as a span of the process wide tracer, see Tracer.span.
+    """
+    return tracer.span(name, category, **attributes)
+
+
+def current_span():
+    """
+    Returns:
+        Span: The innermost open span of the caller, None outside any span or while tracing is disabled.
+    """
+    return _current_span.get()
+
+
+def _simple_arguments(signature, args, kwargs) -> dict:
+    # Only IDs, names, flags and the like are recorded; contents and objects are left out
+    try:
+        bound = signature.bind_partial(*args, **kwargs)
+    except TypeError:
+        return {}
+    return {name: value for name, value in bound.arguments.items()
+            if isinstance(value, (int, float, bool)) or (isinstance(value, str) and len(value) <= 200)}
+
+
+def traced(category: str, name: str = None):
+    """
+    Decorate a function so every call is a span named after it, with its simple arguments as attributes.
+
+    Generator functions are timed until the generator is exhausted or closed.
+
+    Args:
+        category (str): The layer of the function.
+        name (str, optional): The span name. Defaults to the function's qualified name.
+    """
+    def decorator(function):
+        span_name = name or function.__qualname__
+        signature = inspect.signature(function)
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                if tracer.exporter is None:
+                    return (yield from function(*args, **kwargs))
+                with tracer.open(span_name, category, _simple_arguments(signature, args, kwargs)):
+                    return (yield from function(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if tracer.exporter is None:
+                return function(*args, **kwargs)
+            with tracer.open(span_name, category, _simple_arguments(signature, args, kwargs)):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_class(category: str):
+    """
+    Class decorator that traces every public method defined on the class, see traced.
+
+    Args:
+        category (str): The layer of the class, e.g. 'controller' or 'service'.
+    """
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if not attribute.startswith('_') and inspect.isfunction(value):
+                setattr(cls, attribute, traced(category, f"{cls.__name__}.{attribute}")(value))
+        return cls
+    return decorator
+
+
+def propagate(function):
+    """
+    Wrap a function handed to another thread, e.g. an executor, so its spans join the caller's trace.
+
+    Args:
+        function (callable): The function to run on the other thread.
+
+    Returns:
+        callable: The function bound to the caller's current span.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return wrapper
+
+
+def instrument_engine(engine):
+    """
+    Record every SQL statement an engine executes as a 'sql' span of the current trace.
+
+    Args:
+        engine (Engine): The engine to instrument.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        if tracer.exporter is not None:
+            connection.info.setdefault('trace_spans', []).append(
+                Span(f"sql.{statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'EMPTY'}", 'sql',
+                     _current_span.get(), {'statement': statement[:TRACE_STATEMENT_LENGTH], 'executemany': executemany}))
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        spans = connection.info.get('trace_spans')
+        exporter = tracer.exporter
+        if spans:
+            span = spans.pop()
+            if exporter is not None:
+                span.finish()
+                span.attributes['rowcount'] = cursor.rowcount
+                exporter.export(span)
+
+    @event.listens_for(engine, 'handle_error')
+    def _handle_error(context):
+        connection = context.connection
+        spans = connection.info.get('trace_spans') if connection is not None else None
+        exporter = tracer.exporter
+        if spans:
+            span = spans.pop()
+            if exporter is not None:
+                span.finish()
+                span.attributes['error'] = f"{type(context.original_exception).__name__}: {context.original_exception}"[:200]
+                exporter.export(span)
+
+
+def load_trace(path: str) -> list:
+    """
+    Read the events of a trace file written by ChromeTraceExporter, also while it is still being written.
+
+    Args:
+        path (str): The trace file.
+
+    Returns:
+        list: The span events in the order they finished.
+    """
+    with open(path, encoding='utf-8') as trace_file:
+        text = trace_file.read().rstrip()
+    if not text.endswith(']'):
+        text = text.rstrip(',') + ']'
+    return [event for event in json.loads(text) if event]
+
+
+if TRACING_ENABLED:
+    configure(TRACE_PATH)
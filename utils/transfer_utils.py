@@ -0,0 +1,361 @@
+import random
+import threading
+import time
+from botocore.exceptions import (ClientError, EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError,
+                                 ReadTimeoutError)
+from logger import Logger
+from utils import tracing
+from utils.metrics import registry
+
+logger = Logger.get_logger()
+
+# Error codes S3 answers with when a prefix or the account is over its request rate
+THROTTLE_ERROR_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+                        'TooManyRequestsException', 'ServiceUnavailable', '503'}
+# Transient server side failures, retried without lowering the concurrency
+TRANSIENT_ERROR_CODES = {'InternalError', 'RequestTimeout', 'RequestTimeTooSkewed', '500', '502', '504'}
+TRANSIENT_EXCEPTIONS = (EndpointConnectionError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError)
+
+# Weight of the newest sample in the smoothed latency of an operation
+LATENCY_SMOOTHING = 0.2
+# Successful requests of an operation before its latency is used as a congestion signal
+LATENCY_WARMUP = 20
+# Share of the gap to the smoothed latency that the latency baseline of an operation rises by per success
+BASELINE_DRIFT = 0.01
+# Requests up to this size form the smallest latency size class; each larger class spans a factor of 4
+SMALL_REQUEST_BYTES = 64 * 1024
+
+# S3 request type reported in the metrics for each scheduler operation, e.g. {type="PUT"}
+REQUEST_TYPES = {'put': 'PUT', 'get': 'GET', 'copy': 'COPY', 'delete': 'DELETE', 'delete_objects': 'DELETE', 'list': 'LIST'}
+
+S3_REQUESTS = registry.counter('s3_requests_total', "S3 request attempts, including retries.", ('type',))
+S3_REQUEST_ERRORS = registry.counter('s3_request_errors_total', "Failed S3 request attempts by error class.", ('type', 'kind'))
+S3_REQUEST_DURATION = registry.histogram('s3_request_duration_seconds', "Duration of S3 request attempts.", ('type',))
+
+
+def classify_error_code(code: str, status: int = 0) -> str:
+    """
+    Classify an S3 error code, such as that of a failed request or of one key of a DeleteObjects response.
+
+    Args:
+        code (str): The S3 error code, e.g. 'SlowDown'.
+        status (int, optional): The HTTP status of the response, 0 if unknown. Defaults to 0.
+
+    Returns:
+        str: 'throttle' for rate limiting, 'transient' for failures worth retrying, 'fatal' otherwise.
+    """
+    if code in THROTTLE_ERROR_CODES or status == 503:
+        return 'throttle'
+    if code in TRANSIENT_ERROR_CODES or status >= 500:
+        return 'transient'
+    return 'fatal'
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify a failed S3 request.
+
+    Args:
+        error (Exception): The exception raised by the client.
+
+    Returns:
+        str: 'throttle' for rate limiting, 'transient' for failures worth retrying, 'fatal' otherwise.
+    """
+    if isinstance(error, ClientError):
+        return classify_error_code(str(error.response.get('Error', {}).get('Code', '')),
+                                   error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0)
+    if isinstance(error, TRANSIENT_EXCEPTIONS):
+        return 'transient'
+    return 'fatal'
+
+
+def size_class(nbytes: int) -> int:
+    """
+    Group requests of similar size, so that the latency of large transfers is only compared with that
+    of transfers of about the same size.
+
+    Args:
+        nbytes (int): The bytes the request transfers.
+
+    Returns:
+        int: 0 up to SMALL_REQUEST_BYTES, then one more per factor of 4.
+    """
+    size_class, limit = 0, SMALL_REQUEST_BYTES
+    while nbytes > limit:
+        size_class += 1
+        limit *= 4
+    return size_class
+
+
+class TransferScheduler:
+    """
+    Admission control shared by all S3 requests of the process: an adaptive limit on requests in
+    flight, a cap on bytes in flight, and retries with jittered exponential backoff.
+
+    The concurrency limit follows AIMD: every success raises it by 1/limit, about one more request
+    per round of successes, and a throttling response (SlowDown, 503) or a smoothed latency rising
+    above latency_tolerance times a baseline halves it. The baseline follows the lowest latency seen
+    but drifts up while latency stays higher, so a lasting change, e.g. to a farther endpoint, does
+    not hold the limit down for good. Latency is tracked per operation and size class, so a large
+    transfer taking longer than small ones is not mistaken for congestion. At most one decrease
+    happens per smoothed round trip of small requests, so a burst of throttles from one round counts
+    once. A request that would push the bytes in flight over the cap waits unless nothing else is in
+    flight, so objects larger than the cap still go through one at a time.
+
+    Retries release their slot while backing off and draw on a retry budget that successes refill,
+    so a failing endpoint sees a trickle of retries rather than every worker retrying at once.
+
+    Attributes:
+        min_concurrency (int): The lowest concurrency limit.
+        max_concurrency (int): The highest concurrency limit; the client connection pool should be as large.
+        max_bytes_in_flight (int): The cap on bytes of requests in flight.
+        max_attempts (int): Attempts per request, including the first.
+        base_delay (float): Seconds of the first backoff, doubled per attempt.
+        max_delay (float): The longest backoff in seconds.
+        latency_tolerance (float): Smoothed latency over the baseline that counts as congestion, 0 to disable.
+    """
+
+    def __init__(self, min_concurrency: int = 1, max_concurrency: int = 64, initial_concurrency: int = 8,
+                 max_bytes_in_flight: int = 256 * 1024 * 1024, max_attempts: int = 5, base_delay: float = 0.1,
+                 max_delay: float = 20.0, latency_tolerance: float = 3.0, retry_budget: int = 20):
+        """
+        Initialize the scheduler.
+
+        Args:
+            min_concurrency (int, optional): The lowest concurrency limit. Defaults to 1.
+            max_concurrency (int, optional): The highest concurrency limit. Defaults to 64.
+            initial_concurrency (int, optional): The starting concurrency limit. Defaults to 8.
+            max_bytes_in_flight (int, optional): The cap on bytes in flight. Defaults to 256 MiB.
+            max_attempts (int, optional): Attempts per request, including the first. Defaults to 5.
+            base_delay (float, optional): Seconds of the first backoff. Defaults to 0.1.
+            max_delay (float, optional): The longest backoff in seconds. Defaults to 20.
+            latency_tolerance (float, optional): Latency ratio treated as congestion, 0 to disable. Defaults to 3.
+            retry_budget (int, optional): Retries available before successes must refill the budget. Defaults to 20.
+        """
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latency_tolerance = latency_tolerance
+        self.retry_budget = retry_budget
+
+        self._condition = threading.Condition()
+        self._limit = float(min(max(initial_concurrency, self.min_concurrency), self.max_concurrency))
+        self._in_flight = 0
+        self._bytes_in_flight = 0
+        self._retry_tokens = float(retry_budget)
+        self._last_decrease = 0.0
+        self._latency = {}
+        self._best_latency = {}
+        self._samples = {}
+        self._counters = {'requests': 0, 'retries': 0, 'throttles': 0, 'failures': 0}
+
+    def call(self, operation: str, fn, *args, nbytes: int = 0, **kwargs):
+        """
+        Run a request under the scheduler, retrying throttled and transient failures.
+
+        Args:
+            operation (str): The kind of request, e.g. 'put' or 'get'; latency is tracked per kind.
+            fn (callable): The request, called with args and kwargs; it must be safe to repeat.
+            nbytes (int, optional): The bytes the request transfers. Defaults to 0.
+
+        Returns:
+            The result of fn.
+
+        Raises:
+            Exception: The error of the last attempt, if the request did not succeed.
+        """
+        result, release = self.hold(operation, fn, *args, nbytes=nbytes, **kwargs)
+        release()
+        return result
+
+    def hold(self, operation: str, fn, *args, nbytes: int = 0, **kwargs):
+        """
+        Like call, but keep the request's slot and byte reservation after fn returns, for responses
+        whose body is streamed afterwards.
+
+        Args:
+            operation (str): The kind of request.
+            fn (callable): The request, called with args and kwargs; it must be safe to repeat.
+            nbytes (int, optional): The bytes the request and its streamed body transfer. Defaults to 0.
+
+        Returns:
+            tuple: The result of fn and a function to call once when the transfer is complete.
+
+        Raises:
+            Exception: The error of the last attempt, if the request did not succeed.
+        """
+        request_type = REQUEST_TYPES.get(operation, operation.upper())
+        requests = S3_REQUESTS.labels(request_type)
+        duration = S3_REQUEST_DURATION.labels(request_type)
+        attempt = 0
+        while True:
+            self._acquire(nbytes)
+            started = time.monotonic()
+            requests.inc()
+            error = None
+            succeeded = False
+            try:
+                with tracing.span(f"s3.{operation}", 'storage', bytes=nbytes, attempt=attempt + 1):
+                    result = fn(*args, **kwargs)
+                succeeded = True
+            except Exception as e:
+                error = e
+            finally:
+                # Also on KeyboardInterrupt and other BaseExceptions, which are not retried
+                if not succeeded:
+                    self._release(nbytes)
+
+            if error is not None:
+                duration.observe(time.monotonic() - started)
+                attempt += 1
+                kind = classify_error(error)
+                S3_REQUEST_ERRORS.labels(request_type, kind).inc()
+                if kind == 'throttle':
+                    self._on_throttle()
+                if kind == 'fatal' or attempt >= self.max_attempts or not self._take_retry_token():
+                    with self._condition:
+                        self._counters['failures'] += 1
+                    raise error
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                logger.warning(f"S3 {operation} failed ({kind}, attempt {attempt} of {self.max_attempts}), "
+                               f"retrying in {delay:.2f}s: {error}")
+                time.sleep(delay)
+                continue
+
+            latency = time.monotonic() - started
+            duration.observe(latency)
+            self._on_success((operation, size_class(nbytes)), latency)
+            released = []
+
+            def release():
+                if not released:
+                    released.append(True)
+                    self._release(nbytes)
+            return result, release
+
+    def stats(self) -> dict:
+        """
+        Return a snapshot of the scheduler's state and counters.
+
+        Returns:
+            dict: The current concurrency limit, requests and bytes in flight, and the number of
+            requests, retries, throttled responses and failed requests so far.
+        """
+        with self._condition:
+            return {
+                'concurrency_limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'bytes_in_flight': self._bytes_in_flight,
+                **self._counters
+            }
+
+    def collect_metrics(self) -> list:
+        """
+        Report the scheduler's state and counters as metric families, see MetricsRegistry.register_collector.
+
+        Returns:
+            list: The (name, kind, help, samples) tuples.
+        """
+        stats = self.stats()
+        return [
+            ('s3_concurrency_limit', 'gauge', "Current adaptive limit on S3 requests in flight.", [({}, stats['concurrency_limit'])]),
+            ('s3_requests_in_flight', 'gauge', "S3 requests in flight.", [({}, stats['in_flight'])]),
+            ('s3_bytes_in_flight', 'gauge', "Bytes reserved by S3 requests in flight.", [({}, stats['bytes_in_flight'])]),
+            ('s3_retries_total', 'counter', "S3 requests retried by the scheduler.", [({}, stats['retries'])]),
+            ('s3_throttles_total', 'counter', "Throttling responses from S3.", [({}, stats['throttles'])]),
+            ('s3_failures_total', 'counter', "S3 requests that failed after all attempts.", [({}, stats['failures'])])
+        ]
+
+    def _acquire(self, nbytes: int):
+        with self._condition:
+            while self._in_flight >= int(self._limit) or (
+                    self._in_flight and self._bytes_in_flight + nbytes > self.max_bytes_in_flight):
+                self._condition.wait()
+            self._in_flight += 1
+            self._bytes_in_flight += nbytes
+            self._counters['requests'] += 1
+
+    def _release(self, nbytes: int):
+        with self._condition:
+            self._in_flight -= 1
+            self._bytes_in_flight -= nbytes
+            self._condition.notify_all()
+
+    def _on_success(self, key: tuple, latency: float):
+        # key is the operation and the size class of the request
+        with self._condition:
+            smoothed = self._latency.get(key, latency)
+            smoothed += LATENCY_SMOOTHING * (latency - smoothed)
+            self._latency[key] = smoothed
+            self._samples[key] = self._samples.get(key, 0) + 1
+            best = self._best_latency.get(key, smoothed)
+            # A decaying minimum: it drops at once and drifts up, so a lasting rise becomes the new baseline
+            best = smoothed if smoothed < best else best + BASELINE_DRIFT * (smoothed - best)
+            self._best_latency[key] = best
+            self._retry_tokens = min(self.retry_budget, self._retry_tokens + 0.1)
+
+            if (self.latency_tolerance and self._samples[key] > LATENCY_WARMUP
+                    and smoothed > best * self.latency_tolerance):
+                operation, request_class = key
+                self._decrease(f"{operation} (size class {request_class}) latency {smoothed * 1000:.0f}ms "
+                               f"over {best * 1000:.0f}ms")
+            elif self._limit < self.max_concurrency:
+                self._limit = min(self.max_concurrency, self._limit + 1 / self._limit)
+                self._condition.notify_all()
+
+    def _on_throttle(self):
+        with self._condition:
+            self._counters['throttles'] += 1
+            self._decrease("throttled")
+
+    def _decrease(self, reason: str):
+        # Called with the condition held; one decrease per smoothed round trip of small requests, which
+        # unlike large transfers reflects how quickly S3 answers
+        now = time.monotonic()
+        window = max((latency for (_, request_class), latency in self._latency.items() if request_class == 0), default=0.0)
+        if now - self._last_decrease < max(window, 0.05):
+            return
+        self._last_decrease = now
+        previous = int(self._limit)
+        self._limit = max(self.min_concurrency, self._limit / 2)
+        if int(self._limit) != previous:
+            logger.info(f"S3 concurrency limit lowered from {previous} to {int(self._limit)}: {reason}")
+
+    def _take_retry_token(self) -> bool:
+        with self._condition:
+            if self._retry_tokens < 1:
+                return False
+            self._retry_tokens -= 1
+            self._counters['retries'] += 1
+            return True
+
+
+class ScheduledStream:
+    """
+    A readable stream whose transfer slot is released when it is closed, see TransferScheduler.hold.
+    """
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def read(self, *args, **kwargs):
+        return self._stream.read(*args, **kwargs)
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
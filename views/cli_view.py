@@ -2,6 +2,7 @@ from typing import List, Dict, Tuple
 from controllers.file_controller import FileController
 from controllers.folder_controller import FolderController
 from sqlalchemy.exc import IntegrityError, OperationalError, DataError
+from utils.profile_utils import ActionProfiler
 from logger import Logger
 
 logger = Logger.get_logger()
@@ -15,19 +16,22 @@ class CLIView:
         folder_controller (FolderController): The controller to manage folder operations.
         separator_length (int): The length of the separators used in the display.
         basic_actions (dict): A dictionary mapping user choices to corresponding actions.
+        profiler (ActionProfiler): Profiles every basic action when set, None otherwise.
     """
 
-    def __init__(self, file_controller: FileController, folder_controller: FolderController):
+    def __init__(self, file_controller: FileController, folder_controller: FolderController, profiler: ActionProfiler = None):
         """
         Initialize the CLIView with the given controllers.
 
         Args:
             file_controller (FileController): The controller to manage file operations.
             folder_controller (FolderController): The controller to manage folder operations.
+            profiler (ActionProfiler, optional): Writes a profile report per basic action. Defaults to None.
         """
         self.separator_length = 70
         self.file_controller = file_controller
         self.folder_controller = folder_controller
+        self.profiler = profiler
         self.basic_actions = {
             '1': ('Create folder', self.folder_controller.create_folder, self.get_folder_details, self.display_create_folder),
             '2': ('Delete folder', self.folder_controller.delete_folder, self.get_folder_id, self.display_delete_folder),
@@ -37,7 +41,18 @@ class CLIView:
             '6': ('Delete file', self.file_controller.delete_file, self.get_file_id, self.display_delete_file),
             '7': ('Move file', self.file_controller.move_file, self.get_file_move_details, self.display_move_file),
             '8': ('Get file details', self.file_controller.get_file_details, self.get_file_id, self.display_file_details),
-            '9': ('Calculate folder size', self.folder_controller.calculate_folder_size, self.get_folder_id, lambda size: print(f"Total size of folder and its subfolders: {size} bytes"))
+            '9': ('Calculate folder size', self.folder_controller.calculate_folder_size, self.get_folder_id, lambda size: print(f"Total size of folder and its subfolders: {size} bytes")),
+            '10': ('Search files', self.file_controller.search_files, self.get_search_details, self.display_search_files),
+            '11': ('Generate tree report', self.folder_controller.generate_tree_report, self.get_report_details, lambda path: print(f"Tree report written to: {path}")),
+            '12': ('Export metadata', self.folder_controller.export_metadata, self.get_export_details, self.display_export_paths),
+            '13': ('Download file', self.file_controller.download_file, self.get_download_details, lambda path: print(f"File downloaded to: {path}")),
+            '14': ('Sync local directory', self.folder_controller.sync_directory, self.get_sync_details, self.display_sync_summary),
+            '15': ('Download folder', self.folder_controller.download_folder, self.get_folder_download_details, self.display_folder_download),
+            '16': ('Copy folder', self.folder_controller.copy_folder, self.get_copy_folder_details, self.display_create_folder),
+            '17': ('Copy file', self.file_controller.copy_file, self.get_copy_file_details, self.display_create_file),
+            '18': ('Purge deleted folders', self.folder_controller.purge_deleted_folders, self.get_purge_details, self.display_purge_progress),
+            '19': ('Set folder quota', self.folder_controller.set_folder_quota, self.get_quota_details, lambda quota: self.display_folder_quota([quota])),
+            '20': ('Show folder quota', self.folder_controller.get_folder_quota, self.get_folder_id, self.display_folder_quota)
         }
 
     def display_basic_menu(self):
@@ -56,6 +71,17 @@ class CLIView:
         print("7. Move a file to a different folder")
         print("8. Retrieve file details (name, size, creation date)")
         print("9. Retrieve the total size of all files within a folder and its subfolders")
+        print("10. Search files by name (prefix, substring, glob or extension)")
+        print("11. Generate a size and file count report for the whole tree (CSV or JSON)")
+        print("12. Export folder and file metadata (CSV or Parquet)")
+        print("13. Download a file to a local path")
+        print("14. Sync a local directory into a folder (uploads new and changed files only)")
+        print("15. Download a folder to a local directory or a tar/zip archive")
+        print("16. Copy a folder and its contents under another folder")
+        print("17. Copy a file to another folder")
+        print("18. Purge deleted folders now (otherwise done in the background)")
+        print("19. Set or remove the size and file count quota of a folder")
+        print("20. Show the quotas that apply to a folder and their usage")
         print("0. Exit")
         print("=" * self.separator_length)
 
@@ -115,21 +141,89 @@ class CLIView:
         print(f"Created Date: {folder.folder_created_date}")
         print("=" * self.separator_length)
 
-    def display_delete_folder(self, deleted_items: List[Dict]):
+    def display_delete_folder(self, deleted: Dict):
         """
-        Display the details of all deleted folders and files.
+        Display the deleted folder.
 
         Args:
-            deleted_items (List[Dict]): A list of dictionaries representing the deleted folders and files.
+            deleted (Dict): The ID, name and deletion time of the deleted folder.
         """
         print("\n" + "=" * self.separator_length)
-        print(" Deleted Items ".center(self.separator_length, "="))
+        print(" Deleted Folder ".center(self.separator_length, "="))
         print("=" * self.separator_length)
-        for item in deleted_items:
-            if item['type'] == 'folder':
-                print(f"Deleted Folder: ID: {item['id']}, Name: {item['name']}")
-            elif item['type'] == 'file':
-                print(f"Deleted File: ID: {item['id']}, Name: {item['name']}, S3 Key: {item['s3_key']}")
+        print(f"ID: {deleted['Folder ID']}")
+        print(f"Name: {deleted['Folder Name']}")
+        print(f"Deleted At: {deleted['Deleted At']}")
+        print("Its subfolders and files are no longer visible and are purged in the background.")
+        print("=" * self.separator_length)
+
+    def get_purge_details(self) -> int:
+        """
+        Get the chunk size for purging deleted folders from the user.
+
+        Returns:
+            int: The number of folders and of files removed per chunk.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Purge Deleted Folders ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        batch_size = int(input("Enter chunk size [1000]: ").strip() or 1000)
+        print("=" * self.separator_length)
+        return batch_size
+
+    def display_purge_progress(self, chunks):
+        """
+        Display the summary of every purged chunk as it completes.
+
+        Args:
+            chunks (Iterator[Dict]): The chunk summaries of the purge.
+        """
+        totals = {'Folders Deleted': 0, 'Files Deleted': 0, 'Bytes Freed': 0}
+        for chunk in chunks:
+            for key in totals:
+                totals[key] += chunk[key]
+            status = 'done' if chunk['Done'] else f"{chunk['Failed Objects']} failed object(s), retried later" if chunk['Failed Objects'] else 'in progress'
+            print(f"Folder ID: {chunk['Folder ID']}: {chunk['Folders Deleted']} folder(s), {chunk['Files Deleted']} file(s), "
+                  f"{chunk['Bytes Freed']} bytes ({status})")
+        print("=" * self.separator_length)
+        print(f"Purged {totals['Folders Deleted']} folder(s), {totals['Files Deleted']} file(s), {totals['Bytes Freed']} bytes")
+        print("=" * self.separator_length)
+
+    def get_quota_details(self) -> Tuple[int, int, int]:
+        """
+        Get the folder ID and limits for setting a quota from the user.
+
+        Returns:
+            Tuple[int, int, int]: The folder ID, the byte limit and the file limit, None for no limit.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Set Folder Quota ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        folder_id = int(input("Enter folder ID: "))
+        max_bytes = input("Enter the byte limit (empty for no limit): ").strip()
+        max_files = input("Enter the file limit (empty for no limit): ").strip()
+        print("=" * self.separator_length)
+        return (folder_id, int(max_bytes) if max_bytes else None, int(max_files) if max_files else None)
+
+    def display_folder_quota(self, quotas: List[Dict]):
+        """
+        Display the limits and usage of quotas.
+
+        Args:
+            quotas (List[Dict]): The quotas, nearest folder first.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Folder Quotas ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        if not quotas:
+            print("No quota applies to this folder.")
+        for quota in quotas:
+            if quota['Used Bytes'] is None:
+                print(f"Folder ID: {quota['Folder ID']} ({quota['Folder Name']}): no quota")
+                continue
+            print(f"Folder ID: {quota['Folder ID']} ({quota['Folder Name']})")
+            print(f"  Bytes: {quota['Used Bytes']} used of {quota['Quota Bytes'] if quota['Quota Bytes'] is not None else 'unlimited'}")
+            print(f"  Files: {quota['Used Files']} used of {quota['Quota Files'] if quota['Quota Files'] is not None else 'unlimited'}")
         print("=" * self.separator_length)
 
     def display_move_folder(self, folder):
@@ -208,6 +302,36 @@ class CLIView:
         print("=" * self.separator_length)
         return (folder_id, new_parent_id)
 
+    def get_copy_folder_details(self) -> Tuple[int, int]:
+        """
+        Get the details for copying a folder from the user.
+
+        Returns:
+            Tuple[int, int]: A tuple containing the folder ID and the destination parent folder ID.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Copy Folder ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        folder_id = int(input("Enter folder ID: "))
+        dest_parent_id = int(input("Enter destination parent folder ID: "))
+        print("=" * self.separator_length)
+        return (folder_id, dest_parent_id)
+
+    def get_copy_file_details(self) -> Tuple[int, int]:
+        """
+        Get the details for copying a file from the user.
+
+        Returns:
+            Tuple[int, int]: A tuple containing the file ID and the destination folder ID.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Copy File ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        file_id = int(input("Enter file ID: "))
+        dest_folder_id = int(input("Enter destination folder ID: "))
+        print("=" * self.separator_length)
+        return (file_id, dest_folder_id)
+
     def get_file_id(self) -> int:
         """
         Get the file ID from the user.
@@ -222,6 +346,21 @@ class CLIView:
         print("=" * self.separator_length)
         return file_id
 
+    def get_download_details(self) -> Tuple[int, str]:
+        """
+        Get the details for downloading a file from the user.
+
+        Returns:
+            Tuple[int, str]: A tuple containing the file ID and the local path or directory to save it to.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Download File ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        file_id = int(input("Enter file ID: "))
+        local_path = input("Enter local path or directory [.]: ").strip() or '.'
+        print("=" * self.separator_length)
+        return (file_id, local_path)
+
     def get_file_details(self) -> Tuple[str, int, bytes]:
         """
         Get the details for creating a new file from the user.
@@ -253,6 +392,146 @@ class CLIView:
         print("=" * self.separator_length)
         return (name, folder_id, file_content)
 
+    def get_search_details(self) -> Tuple[str, str, int]:
+        """
+        Get the details for a file name search from the user.
+
+        Returns:
+            Tuple[str, str, int]: A tuple containing the search pattern, the search mode and the folder ID to search in.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Search Files ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        pattern = input("Enter search text (e.g. 'report', 'log_*.txt' or 'csv'): ")
+        mode = input("Enter search mode (prefix, substring, glob, extension) [substring]: ").strip() or 'substring'
+        folder_id = int(input("Enter folder ID to search in (0 for everywhere): "))
+        print("=" * self.separator_length)
+        return (pattern, mode, folder_id)
+
+    def display_search_files(self, files):
+        """
+        Display the files matching a search.
+
+        Args:
+            files (List[File]): The matching file objects.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Search Results ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        for file in files:
+            print(f"ID: {file.file_id}, Name: {file.file_name}, Size: {file.file_size} bytes, Folder ID: {file.folder_id}")
+        print(f"{len(files)} file(s) found")
+        print("=" * self.separator_length)
+
+    def get_report_details(self) -> Tuple[str, str]:
+        """
+        Get the output path and format for a tree report from the user.
+
+        Returns:
+            Tuple[str, str]: A tuple containing the output path and the report format.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Tree Report ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        fmt = input("Enter report format (csv, json) [csv]: ").strip() or 'csv'
+        output_path = input(f"Enter output path [tree_report.{fmt}]: ").strip() or f"tree_report.{fmt}"
+        print("=" * self.separator_length)
+        return (output_path, fmt)
+
+    def get_export_details(self) -> Tuple[str, str, int]:
+        """
+        Get the output directory, format and scope of a metadata export from the user.
+
+        Returns:
+            Tuple[str, str, int]: A tuple containing the output directory, the export format and the folder ID to export.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Export Metadata ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        output_dir = input("Enter output directory [export]: ").strip() or 'export'
+        fmt = input("Enter export format (csv, parquet) [csv]: ").strip() or 'csv'
+        folder_id = int(input("Enter folder ID to export (0 for the whole tree): "))
+        print("=" * self.separator_length)
+        return (output_dir, fmt, folder_id)
+
+    def display_export_paths(self, paths: Dict[str, str]):
+        """
+        Display the paths of a metadata export.
+
+        Args:
+            paths (Dict[str, str]): The paths of the written folder and file exports.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Metadata Exported ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        print(f"Folders: {paths['folders']}")
+        print(f"Files: {paths['files']}")
+        print("=" * self.separator_length)
+
+    def get_sync_details(self) -> Tuple[str, int, str, bool]:
+        """
+        Get the details for syncing a local directory into a folder from the user.
+
+        Returns:
+            Tuple[str, int, str, bool]: A tuple containing the local directory, the target folder ID,
+            the compare mode and whether to delete extra files and folders.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Sync Local Directory ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        local_dir = input("Enter local directory: ")
+        folder_id = int(input("Enter target folder ID: "))
+        compare = input("Compare files by (metadata, hash) [metadata]: ").strip() or 'metadata'
+        delete_extras = input("Delete files and folders that do not exist locally? (y/N): ").strip().lower() == 'y'
+        print("=" * self.separator_length)
+        return (local_dir, folder_id, compare, delete_extras)
+
+    def display_sync_summary(self, summary: Dict[str, int]):
+        """
+        Display the outcome of a directory sync.
+
+        Args:
+            summary (Dict[str, int]): Counts of created folders and uploaded, updated, unchanged, deleted and failed files.
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Sync Complete ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        for key, value in summary.items():
+            print(f"{key.replace('_', ' ').capitalize()}: {value}")
+        print("=" * self.separator_length)
+
+    def get_folder_download_details(self) -> Tuple[int, str, str]:
+        """
+        Get the details for downloading a folder from the user.
+
+        Returns:
+            Tuple[int, str, str]: A tuple containing the folder ID, the destination and the archive format (None for a directory).
+        """
+        print("\n" + "=" * self.separator_length)
+        print(" Download Folder ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        folder_id = int(input("Enter folder ID: "))
+        archive = input("Archive format (tar, zip, or empty for a directory): ").strip() or None
+        dest = input("Enter destination directory, or archive path ('-' for stdout): ")
+        print("=" * self.separator_length)
+        return (folder_id, dest, archive)
+
+    def display_folder_download(self, summary: Dict):
+        """
+        Display the outcome of a folder download.
+
+        Args:
+            summary (Dict): The destination and the number of folders, files and bytes written.
+        """
+        if summary['destination'] == '-':
+            return
+        print("\n" + "=" * self.separator_length)
+        print(" Folder Downloaded ".center(self.separator_length, "="))
+        print("=" * self.separator_length)
+        print(f"Destination: {summary['destination']}")
+        print(f"Folders: {summary['folders']}, Files: {summary['files']}, Bytes: {summary['bytes']}")
+        print("=" * self.separator_length)
+
     def display_delete_file(self, file):
         """
         Display the details of the deleted file.
@@ -316,6 +595,7 @@ class CLIView:
         print(f"ID: {file.file_id}")
         print(f"Name: {file.file_name}")
         print(f"Size: {file.file_size} bytes")
+        print(f"Stored Size: {file.file_stored_size or file.file_size} bytes ({file.file_codec or 'uncompressed'})")
         print(f"Created Date: {file.file_created_date}")
         print(f"S3 Key: {file.file_s3_key}")
         print(f"Folder ID: {file.folder_id}")
@@ -336,8 +616,10 @@ class CLIView:
 
                 basic_action = self.basic_actions.get(basic_choice)
                 if basic_action:
-                    _, controller_method, input_method, display_method = basic_action
+                    action_name, controller_method, input_method, display_method = basic_action
                     inputs = input_method()
+                    if self.profiler is not None:
+                        controller_method = self.profiler.wrap(action_name, controller_method)
                     result = controller_method(*inputs) if isinstance(inputs, tuple) else controller_method(inputs)
                     display_method(result)
                 else:
@@ -1,13 +1,21 @@
+import time
 import tkinter as tk
-from tkinter import simpledialog, scrolledtext, filedialog
+from tkinter import simpledialog, scrolledtext, filedialog, ttk
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Tuple
 from controllers.file_controller import FileController
 from controllers.folder_controller import FolderController
 from sqlalchemy.exc import IntegrityError, OperationalError, DataError
+from utils.profile_utils import ActionProfiler
 from logger import Logger
 
 logger = Logger.get_logger()
 
+# How often the main thread checks for finished background calls
+POLL_INTERVAL_MS = 100
+# Number of subfolders and of files loaded per expansion of a tree node
+TREE_PAGE_SIZE = 500
+
 class CustomInputDialog(simpledialog.Dialog):
     def __init__(self, parent, title=None, prompt=None):
         self.prompt = prompt
@@ -57,11 +65,22 @@ class CustomChoiceDialog(simpledialog.Dialog):
         self.result = self.choice_var.get()
 
 class GUIView:
-    def __init__(self, root, file_controller: FileController, folder_controller: FolderController):
+    def __init__(self, root, file_controller: FileController, folder_controller: FolderController, profiler: ActionProfiler = None):
         self.root = root
         self.file_controller = file_controller
         self.folder_controller = folder_controller
+        # Profiles every basic action when set; actions run one at a time on action_executor
+        self.profiler = profiler
         self.separator_length = 70 
+
+        # Controller calls run off the Tk main thread; actions run one at a time in submission order,
+        # while tree expansions use their own workers so browsing stays responsive during long actions
+        self.action_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gui-action')
+        self.tree_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='gui-tree')
+        self.jobs = []
+        self.polling = False
+        self.progress_running = False
+        self.tree_cursors = {}
         
         self.basic_actions = {
             'Create Folder': (self.folder_controller.create_folder, self.get_folder_details, self.display_create_folder),
@@ -72,7 +91,15 @@ class GUIView:
             'Delete File': (self.file_controller.delete_file, self.get_file_id, self.display_delete_file),
             'Move File': (self.file_controller.move_file, self.get_file_move_details, self.display_move_file),
             'Get File Details': (self.file_controller.get_file_details, self.get_file_id, self.display_file_details),
-            'Calculate Folder Size': (self.folder_controller.calculate_folder_size, self.get_folder_id, self.display_folder_size)
+            'Calculate Folder Size': (self.folder_controller.calculate_folder_size, self.get_folder_id, self.display_folder_size),
+            'Search Files': (self.file_controller.search_files, self.get_search_details, self.display_search_files),
+            'Generate Tree Report': (self.folder_controller.generate_tree_report, self.get_report_details, self.display_report_path),
+            'Export Metadata': (self.folder_controller.export_metadata, self.get_export_details, self.display_export_paths),
+            'Download File': (self.file_controller.download_file, self.get_download_details, self.display_download_path),
+            'Sync Local Directory': (self.folder_controller.sync_directory, self.get_sync_details, self.display_sync_summary),
+            'Download Folder': (self.folder_controller.download_folder, self.get_folder_download_details, self.display_folder_download),
+            'Copy Folder': (self.folder_controller.copy_folder, self.get_copy_folder_details, self.display_create_folder),
+            'Copy File': (self.file_controller.copy_file, self.get_copy_file_details, self.display_create_file)
         }
         
         self.create_widgets()
@@ -80,6 +107,19 @@ class GUIView:
     def create_widgets(self):
         self.root.title("Basic Folder and File Operations")
         self.root.geometry("1200x800")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.status_frame = tk.Frame(self.root)
+        self.status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=20, pady=(0, 10))
+
+        self.progress_bar = ttk.Progressbar(self.status_frame, mode='indeterminate', length=200)
+        self.progress_bar.pack(side=tk.LEFT)
+
+        self.status_label = tk.Label(self.status_frame, text="Ready", anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+
+        self.cancel_button = tk.Button(self.status_frame, text="Cancel", width=12, command=self.cancel_actions, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT)
         
         self.main_frame = tk.Frame(self.root)
         self.main_frame.pack(fill=tk.BOTH, expand=True)
@@ -93,43 +133,205 @@ class GUIView:
             btn.pack(pady=5)
             self.action_buttons.append(btn)
 
-        self.exit_button = tk.Button(self.menu_frame, text="Exit", width=30, command=self.root.quit)
+        self.exit_button = tk.Button(self.menu_frame, text="Exit", width=30, command=self.close)
         self.exit_button.pack(pady=5)
         
         self.result_frame = tk.Frame(self.main_frame)
         self.result_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=20, pady=20)
-        
-        self.result_label = tk.Label(self.result_frame, text="Results")
+
+        self.result_panes = ttk.PanedWindow(self.result_frame, orient=tk.VERTICAL)
+        self.result_panes.pack(fill=tk.BOTH, expand=True)
+
+        self.browser_frame = tk.Frame(self.result_panes)
+        self.browser_header = tk.Frame(self.browser_frame)
+        self.browser_header.pack(fill=tk.X)
+        tk.Label(self.browser_header, text="Browser").pack(side=tk.LEFT)
+        tk.Button(self.browser_header, text="Refresh", command=self.refresh_tree).pack(side=tk.RIGHT)
+
+        self.tree = ttk.Treeview(self.browser_frame, columns=('id', 'size'))
+        self.tree.heading('#0', text="Name")
+        self.tree.heading('id', text="ID")
+        self.tree.heading('size', text="Size (bytes)")
+        self.tree.column('id', width=100, stretch=False)
+        self.tree.column('size', width=150, stretch=False, anchor=tk.E)
+        self.tree_scrollbar = ttk.Scrollbar(self.browser_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.tree_scrollbar.set)
+        self.tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.tree.bind('<<TreeviewOpen>>', self.on_tree_open)
+        self.tree.bind('<Double-1>', self.on_tree_double_click)
+        self.result_panes.add(self.browser_frame, weight=1)
+
+        self.results_pane = tk.Frame(self.result_panes)
+        self.result_label = tk.Label(self.results_pane, text="Results")
         self.result_label.pack(anchor=tk.N)
 
-        self.result_box = scrolledtext.ScrolledText(self.result_frame, wrap=tk.WORD, width=80, height=40)
+        self.result_box = scrolledtext.ScrolledText(self.results_pane, wrap=tk.WORD, width=80, height=20)
         self.result_box.pack(fill=tk.BOTH, expand=True)
+        self.result_panes.add(self.results_pane, weight=1)
+
+        self.refresh_tree()
+
+    def close(self):
+        # Queued actions are dropped; a running controller call cannot be interrupted and finishes in the background
+        self.action_executor.shutdown(wait=False, cancel_futures=True)
+        self.tree_executor.shutdown(wait=False, cancel_futures=True)
+        self.root.quit()
+
+    def run_in_background(self, label: str, method, inputs, on_success, executor=None):
+        executor = executor or self.action_executor
+        args = inputs if isinstance(inputs, tuple) else (inputs,)
+        job = {
+            'label': label,
+            'future': executor.submit(method, *args),
+            'on_success': on_success,
+            'is_action': executor is self.action_executor,
+            'started': None,
+            'cancelled': False
+        }
+        self.jobs.append(job)
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_INTERVAL_MS, self.poll_jobs)
+        self.update_status()
+
+    def poll_jobs(self):
+        for job in list(self.jobs):
+            future = job['future']
+            if job['started'] is None and (future.running() or future.done()):
+                job['started'] = time.monotonic()
+            if not future.done():
+                continue
+            self.jobs.remove(job)
+            if job['cancelled'] or future.cancelled():
+                logger.info(f"Discarded result of cancelled action: {job['label']}")
+                continue
+            try:
+                job['on_success'](future.result())
+            except Exception as e:
+                self.display_error(e)
+        self.update_status()
+        if self.jobs:
+            self.root.after(POLL_INTERVAL_MS, self.poll_jobs)
+        else:
+            self.polling = False
+
+    def update_status(self):
+        actions = [job for job in self.jobs if job['is_action'] and not job['cancelled']]
+        if not actions:
+            self.progress_bar.stop()
+            self.progress_running = False
+            self.status_label.config(text="Ready")
+            self.cancel_button.config(state=tk.DISABLED)
+            return
+        running = actions[0]
+        elapsed = f" ({time.monotonic() - running['started']:.0f}s)" if running['started'] is not None else ""
+        queued = f", {len(actions) - 1} queued" if len(actions) > 1 else ""
+        self.status_label.config(text=f"Running: {running['label']}{elapsed}{queued}")
+        self.cancel_button.config(state=tk.NORMAL)
+        if not self.progress_running:
+            self.progress_bar.start(10)
+            self.progress_running = True
+
+    def cancel_actions(self):
+        for job in self.jobs:
+            if not job['is_action'] or job['cancelled']:
+                continue
+            job['cancelled'] = True
+            if job['future'].cancel():
+                self.result_box.insert(tk.END, f"Cancelled: {job['label']}\n\n")
+            else:
+                # Threads cannot be interrupted: the call completes, its transaction commits or rolls back on its own
+                self.result_box.insert(tk.END, f"Cancelled: {job['label']} (already running, it finishes in the background and its result is discarded)\n\n")
+        self.update_status()
+
+    def refresh_tree(self):
+        self.tree.delete(*self.tree.get_children())
+        self.tree_cursors.clear()
+        self.load_tree_page('', None)
+
+    def load_tree_page(self, parent_iid: str, folder_id: int):
+        folders_after, files_after = self.tree_cursors.get(parent_iid, (None, None))
+        self.run_in_background(
+            "Load folder",
+            self.folder_controller.list_children,
+            (folder_id, TREE_PAGE_SIZE, folders_after, files_after),
+            lambda page: self.populate_tree(parent_iid, folder_id, page),
+            executor=self.tree_executor
+        )
+
+    def populate_tree(self, parent_iid: str, folder_id: int, page: Dict):
+        if parent_iid and not self.tree.exists(parent_iid):
+            return
+        for placeholder in (f"{parent_iid}/loading", f"{parent_iid}/more"):
+            if self.tree.exists(placeholder):
+                self.tree.delete(placeholder)
+
+        folders_after, files_after = self.tree_cursors.get(parent_iid, (None, None))
+        for subfolder in page['Subfolders']:
+            iid = f"folder:{subfolder['Folder ID']}"
+            folders_after = subfolder['Folder Name']
+            if self.tree.exists(iid):
+                continue
+            self.tree.insert(parent_iid, tk.END, iid=iid, text=subfolder['Folder Name'], values=(subfolder['Folder ID'], ''))
+            if subfolder['Has Children']:
+                # A placeholder child makes the node expandable without loading its contents
+                self.tree.insert(iid, tk.END, iid=f"{iid}/loading", text="Loading...")
+        for file in page['Files']:
+            files_after = file['File Name']
+            if self.tree.exists(f"file:{file['File ID']}"):
+                continue
+            self.tree.insert(parent_iid, tk.END, iid=f"file:{file['File ID']}", text=file['File Name'], values=(file['File ID'], file['File Size']))
+        self.tree_cursors[parent_iid] = (folders_after, files_after)
+
+        if page['More Subfolders'] or page['More Files']:
+            self.tree.insert(parent_iid, tk.END, iid=f"{parent_iid}/more", text="Load more...", values=(folder_id if folder_id is not None else '', ''))
+
+    def on_tree_open(self, event):
+        iid = self.tree.focus()
+        if self.tree.exists(f"{iid}/loading") and iid not in self.tree_cursors:
+            self.tree_cursors[iid] = (None, None)
+            self.load_tree_page(iid, int(iid.split(':')[1]))
+
+    def on_tree_double_click(self, event):
+        iid = self.tree.identify_row(event.y)
+        if iid.endswith('/more'):
+            parent_iid = self.tree.parent(iid)
+            self.tree.item(iid, text="Loading...")
+            self.load_tree_page(parent_iid, int(parent_iid.split(':')[1]) if parent_iid else None)
+        elif iid.startswith('file:'):
+            self.run_in_background("Get File Details", self.file_controller.get_file_details, int(iid.split(':')[1]), self.display_file_details)
 
     def execute_action(self, action):
         try:
             controller_method, input_method, display_method = self.basic_actions[action]
             inputs = input_method()
-            result = controller_method(*inputs) if isinstance(inputs, tuple) else controller_method(inputs)
-            display_method(result)
-        except IntegrityError as e:
+            if self.profiler is not None:
+                controller_method = self.profiler.wrap(action, controller_method)
+            self.run_in_background(action, controller_method, inputs, display_method)
+        except Exception as e:
+            self.display_error(e)
+
+    def display_error(self, e: Exception):
+        if isinstance(e, IntegrityError):
             logger.error(f"Database integrity error: {str(e)}")
             self.result_box.insert(tk.END, f"Error: Database integrity error: {str(e)}\n")
-        except OperationalError as e:
+        elif isinstance(e, OperationalError):
             logger.error(f"Operational error: {str(e)}")
             self.result_box.insert(tk.END, f"Error: Operational error: {str(e)}\n")
-        except DataError as e:
+        elif isinstance(e, DataError):
             logger.error(f"Data error: {str(e)}")
             self.result_box.insert(tk.END, f"Error: Data error: {str(e)}\n")
-        except KeyError as e:
+        elif isinstance(e, KeyError):
             logger.error(f"Invalid action selected: {str(e)}")
             self.result_box.insert(tk.END, f"Error: Invalid action selected: {str(e)}\n")
-        except ValueError as e:
+        elif isinstance(e, ValueError):
             logger.error(f"Value error: {str(e)}")
             self.result_box.insert(tk.END, f"Error: Value error: {str(e)}\n")
-        except TypeError as e:
+        elif isinstance(e, TypeError):
             logger.error(f"Type error: {str(e)}")
             self.result_box.insert(tk.END, f"Error: Type error: {str(e)}\n")
-        except Exception as e:
+        else:
             logger.error(f"An unexpected error occurred: {str(e)}")
             self.result_box.insert(tk.END, f"Error: An unexpected error occurred: {str(e)}\n")
 
@@ -152,10 +354,67 @@ class GUIView:
         new_parent_id = CustomIntInputDialog(self.root, title="Move Folder", prompt="Enter new parent folder ID:").result
         return (folder_id, new_parent_id)
 
+    def get_copy_folder_details(self) -> Tuple[int, int]:
+        folder_id = CustomIntInputDialog(self.root, title="Copy Folder", prompt="Enter folder ID:").result
+        dest_parent_id = CustomIntInputDialog(self.root, title="Copy Folder", prompt="Enter destination parent folder ID:").result
+        return (folder_id, dest_parent_id)
+
+    def get_copy_file_details(self) -> Tuple[int, int]:
+        file_id = CustomIntInputDialog(self.root, title="Copy File", prompt="Enter file ID:").result
+        dest_folder_id = CustomIntInputDialog(self.root, title="Copy File", prompt="Enter destination folder ID:").result
+        return (file_id, dest_folder_id)
+
     def get_file_id(self) -> int:
         file_id = CustomIntInputDialog(self.root, title="Enter File ID", prompt="Enter file ID:").result
         return file_id
 
+    def get_search_details(self) -> Tuple[str, str, int]:
+        pattern = CustomInputDialog(self.root, title="Search Files", prompt="Enter search text (e.g. 'report', 'log_*.txt' or 'csv'):").result
+        mode = CustomChoiceDialog(
+            self.root,
+            title="Search Files",
+            prompt="How should the name match?",
+            choices=["substring", "prefix", "glob", "extension"]
+        ).result
+        folder_id = CustomIntInputDialog(self.root, title="Search Files", prompt="Enter folder ID to search in (0 for everywhere):").result
+        return (pattern, mode, folder_id)
+
+    def get_report_details(self) -> Tuple[str, str]:
+        fmt = CustomChoiceDialog(self.root, title="Tree Report", prompt="Report format:", choices=["csv", "json"]).result
+        output_path = filedialog.asksaveasfilename(title="Save tree report", defaultextension=f".{fmt}", initialfile=f"tree_report.{fmt}")
+        return (output_path, fmt)
+
+    def get_export_details(self) -> Tuple[str, str, int]:
+        output_dir = filedialog.askdirectory(title="Select export directory")
+        fmt = CustomChoiceDialog(self.root, title="Export Metadata", prompt="Export format:", choices=["csv", "parquet"]).result
+        folder_id = CustomIntInputDialog(self.root, title="Export Metadata", prompt="Enter folder ID to export (0 for the whole tree):").result
+        return (output_dir, fmt, folder_id)
+
+    def get_download_details(self) -> Tuple[int, str]:
+        file_id = CustomIntInputDialog(self.root, title="Download File", prompt="Enter file ID:").result
+        local_path = filedialog.askdirectory(title="Select download directory")
+        return (file_id, local_path)
+
+    def get_sync_details(self) -> Tuple[str, int, str, bool]:
+        local_dir = filedialog.askdirectory(title="Select directory to sync")
+        folder_id = CustomIntInputDialog(self.root, title="Sync Local Directory", prompt="Enter target folder ID:").result
+        compare = CustomChoiceDialog(self.root, title="Sync Local Directory", prompt="Compare files by:", choices=["metadata", "hash"]).result
+        delete_choice = CustomChoiceDialog(
+            self.root,
+            title="Sync Local Directory",
+            prompt="Delete files and folders that do not exist locally?",
+            choices=["Keep Extras", "Delete Extras"]
+        ).result
+        return (local_dir, folder_id, compare, delete_choice == "Delete Extras")
+
+    def get_folder_download_details(self) -> Tuple[int, str, str]:
+        folder_id = CustomIntInputDialog(self.root, title="Download Folder", prompt="Enter folder ID:").result
+        choice = CustomChoiceDialog(self.root, title="Download Folder", prompt="Download as:", choices=["Directory", "tar", "zip"]).result
+        if choice == "Directory":
+            return (folder_id, filedialog.askdirectory(title="Select destination directory"), None)
+        dest = filedialog.asksaveasfilename(title="Save archive", defaultextension=f".{choice}")
+        return (folder_id, dest, choice)
+
     def get_file_details(self) -> Tuple[str, int, bytes]:
         folder_id = CustomIntInputDialog(self.root, title="Create New File", prompt="Enter folder ID:").result
         
@@ -200,18 +459,12 @@ class GUIView:
         self.result_box.insert(tk.END, f"{'':<20} | {'Parent ID':<20}: {folder.folder_parent_id}\n")
         self.result_box.insert(tk.END, f"{'-' * 50}\n\n")
 
-    def display_delete_folder(self, deleted_items: List[Dict]):
-        self.result_box.insert(tk.END, f"{'Deleted Items':<20}\n")
-        for item in deleted_items:
-            if item['type'] == 'folder':
-                self.result_box.insert(tk.END, f"{'Folder':<20} | {'ID':<20}: {item['id']}\n")
-                self.result_box.insert(tk.END, f"{'':<20} | {'Name':<20}: {item['name']}\n")
-            elif item['type'] == 'file':
-                self.result_box.insert(tk.END, f"{'File':<20} | {'ID':<20}: {item['id']}\n")
-                self.result_box.insert(tk.END, f"{'':<20} | {'Name':<20}: {item['name']}\n")
-                self.result_box.insert(tk.END, f"{'':<20} | {'S3 Key':<20}: {item['s3_key']}\n")
-            self.result_box.insert(tk.END, f"{'-' * 50}\n")
-        self.result_box.insert(tk.END, f"\n")
+    def display_delete_folder(self, deleted: Dict):
+        self.result_box.insert(tk.END, f"{'Deleted Folder':<20} | {'ID':<20}: {deleted['Folder ID']}\n")
+        self.result_box.insert(tk.END, f"{'':<20} | {'Name':<20}: {deleted['Folder Name']}\n")
+        self.result_box.insert(tk.END, f"{'':<20} | {'Deleted At':<20}: {deleted['Deleted At']}\n")
+        self.result_box.insert(tk.END, f"{'':<20} | Contents are purged in the background\n")
+        self.result_box.insert(tk.END, f"{'-' * 50}\n\n")
 
     def display_move_folder(self, folder):
         self.result_box.insert(tk.END, f"{'Moved Folder':<20} | {'Name':<20}: {folder.folder_name}\n")
@@ -242,11 +495,42 @@ class GUIView:
         self.result_box.insert(tk.END, f"{'File Details':<20} | {'ID':<20}: {file.file_id}\n")
         self.result_box.insert(tk.END, f"{'':<20} | {'Name':<20}: {file.file_name}\n")
         self.result_box.insert(tk.END, f"{'':<20} | {'Size':<20}: {file.file_size} bytes\n")
+        self.result_box.insert(tk.END, f"{'':<20} | {'Stored Size':<20}: {file.file_stored_size or file.file_size} bytes ({file.file_codec or 'uncompressed'})\n")
         self.result_box.insert(tk.END, f"{'':<20} | {'Created Date':<20}: {file.file_created_date}\n")
         self.result_box.insert(tk.END, f"{'':<20} | {'S3 Key':<20}: {file.file_s3_key}\n")
         self.result_box.insert(tk.END, f"{'':<20} | {'Folder ID':<20}: {file.folder_id}\n")
         self.result_box.insert(tk.END, f"{'-' * 50}\n\n")
 
+    def display_search_files(self, files):
+        self.result_box.insert(tk.END, f"{'Search Results':<20} | {len(files)} file(s) found\n")
+        for file in files:
+            self.result_box.insert(tk.END, f"ID: {file.file_id:<10} | Name: {file.file_name:<30} | Size: {file.file_size} bytes | Folder ID: {file.folder_id}\n")
+        self.result_box.insert(tk.END, f"{'-' * 50}\n\n")
+
+    def display_report_path(self, path: str):
+        self.result_box.insert(tk.END, f"Tree report written to: {path}\n\n")
+
+    def display_export_paths(self, paths: Dict[str, str]):
+        self.result_box.insert(tk.END, f"{'Metadata Exported':<20} | {'Folders':<20}: {paths['folders']}\n")
+        self.result_box.insert(tk.END, f"{'':<20} | {'Files':<20}: {paths['files']}\n")
+        self.result_box.insert(tk.END, f"{'-' * 50}\n\n")
+
+    def display_download_path(self, path: str):
+        self.result_box.insert(tk.END, f"File downloaded to: {path}\n\n")
+
+    def display_sync_summary(self, summary: Dict[str, int]):
+        self.result_box.insert(tk.END, f"{'Sync Complete':<20}\n")
+        for key, value in summary.items():
+            self.result_box.insert(tk.END, f"{'':<20} | {key.replace('_', ' ').capitalize():<20}: {value}\n")
+        self.result_box.insert(tk.END, f"{'-' * 50}\n\n")
+
+    def display_folder_download(self, summary: Dict):
+        self.result_box.insert(tk.END, f"{'Folder Downloaded':<20} | {'Destination':<20}: {summary['destination']}\n")
+        self.result_box.insert(tk.END, f"{'':<20} | {'Folders':<20}: {summary['folders']}\n")
+        self.result_box.insert(tk.END, f"{'':<20} | {'Files':<20}: {summary['files']}\n")
+        self.result_box.insert(tk.END, f"{'':<20} | {'Bytes':<20}: {summary['bytes']}\n")
+        self.result_box.insert(tk.END, f"{'-' * 50}\n\n")
+
     def display_folder_size(self, size: int):
         self.result_box.insert(tk.END, f"Total size of folder and its subfolders: {size} bytes\n\n")
 